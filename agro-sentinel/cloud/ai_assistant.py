@@ -1,31 +1,29 @@
 import functions_framework
+import flask
 import logging
 import os
 import json
 import re
-from google.cloud import bigquery
+import time
 
-import vertexai
-try:
-    from vertexai.generative_models import GenerativeModel          # type: ignore[import] # >= 1.38
-except ImportError:                                                  # pragma: no cover
-    from vertexai.preview.generative_models import GenerativeModel  # type: ignore[import]
+import http_auth
+import intents
+import query_cache
+import query_runner
+import rollups
+import rules
+import sensor_registry
+from lazy import LazyClient, gcp_module
 
-try:
-    import firebase_admin                                            # type: ignore[import]
-    from firebase_admin import auth as firebase_auth                 # type: ignore[import]
-    _HAS_FIREBASE_ADMIN = True
-except ImportError:                                                  # pragma: no cover
-    _HAS_FIREBASE_ADMIN = False
-
-bq_client = bigquery.Client()
+# vertexai is imported on first use (_get_model), firebase_admin too (http_auth.py)
+bq_client = LazyClient(lambda: gcp_module("bigquery").Client(), "BigQuery client")
+db        = LazyClient(lambda: gcp_module("firestore").Client(), "Firestore client")
 
 # ── Config ────────────────────────────────────────────────────────────────────
-ALLOWED_ORIGIN  = os.environ.get('ALLOWED_ORIGIN', '')   # must be set in Terraform env vars
-REQUIRE_AUTH    = os.environ.get('REQUIRE_AUTH', 'true').lower() == 'true'
 MAX_QUERY_LEN   = 500
+MOCK_LATENCY_S  = float(os.environ.get('MOCK_LATENCY_S', 0))   # simulated round trip on MOCK_AI/MOCK_DB
 
-KNOWN_SENSOR_IDS = frozenset({'GH-AMB-01', 'GH-DUR-01', 'GH-CAY-01', 'GH-ORO-01', 'GH-TEN-01'})
+registry = sensor_registry.registry_from_env(db)
 
 # Blocks any SQL that isn't a plain SELECT (prevents prompt-injection → DDL attacks)
 _DDL_PATTERN = re.compile(
@@ -35,6 +33,8 @@ _DDL_PATTERN = re.compile(
     re.IGNORECASE,
 )
 
+# Thresholds are generated from rules.DEFAULT_RULES so they never drift from
+# what the ingest function actually alarms on.
 SCHEMA_CONTEXT = """
 BigQuery Table: `agro_sentinel_data.sensor_logs`
 Partitioned by DAY on `timestamp`.
@@ -53,68 +53,47 @@ Columns:
   soil_temp_c    FLOAT     — soil temperature °C
   battery_level  INTEGER   — battery %
   rssi_dbm       INTEGER   — WiFi signal dBm
+  reduction      STRING    — JSON, how the edge reduced each field; NULL or a
+                             missing key = raw sample. "deadband:<b>" = sent only
+                             when it moved more than <b> (the value holds until
+                             the next row). {"mode":"window","n":..,"min":..,
+                             "max":..,"mean":..} = the column is a window
+                             aggregate of n samples; weight averages by n.
+  seq            INTEGER   — per-sensor edge sequence number (NULL for readings
+                             from older gateways); with seq_epoch identifies a reading
+  seq_epoch      INTEGER   — changes when a gateway's buffer is replaced
+  ingested_at    TIMESTAMP — when the cloud received the reading (NULL for old rows)
 
-CRITICAL alarm thresholds:
-  temperature > 38 or < 10 °C
-  humidity < 25 %
-  co2_ppm > 1800 ppm
-  soil_moisture < 25 %
-  battery_level < 15 %
-  rssi_dbm < -90 dBm
+""" + rollups.SCHEMA_CONTEXT + "\n" + rules.describe() + "\n"
+
+
+def _schema_context() -> str:
+    """SCHEMA_CONTEXT plus the farm IDs currently in the sensor registry."""
+    return f"{SCHEMA_CONTEXT}\n{registry.describe()}\n"
 
-Known farm IDs: GH-AMB-01 (Ambato), GH-DUR-01 (Duran), GH-CAY-01 (Cayambe),
-                GH-ORO-01 (Machala), GH-TEN-01 (Tena)
-"""
 
 # ── Lazy singletons ───────────────────────────────────────────────────────────
-_model: GenerativeModel | None = None
-_firebase_app = None
+_model = None
 
 
-def _get_model() -> GenerativeModel:
+def _get_model():
     global _model
     if _model is None:
+        import vertexai
+        try:
+            from vertexai.generative_models import GenerativeModel          # type: ignore[import] # >= 1.38
+        except ImportError:                                                  # pragma: no cover
+            from vertexai.preview.generative_models import GenerativeModel  # type: ignore[import]
         vertexai.init(location=os.environ.get('VERTEX_LOCATION', 'us-central1'))
         _model = GenerativeModel("gemini-1.5-flash")
     return _model
 
 
-def _get_firebase_app():
-    global _firebase_app
-    if _firebase_app is None and _HAS_FIREBASE_ADMIN:
-        _firebase_app = firebase_admin.initialize_app()
-    return _firebase_app
-
-
-# ── Auth ──────────────────────────────────────────────────────────────────────
+# ── Auth and CORS (http_auth.py) ─────────────────────────────────────────────
 def _verify_token(request) -> bool:
-    if not REQUIRE_AUTH or os.environ.get('MOCK_AI') == 'true':
+    if os.environ.get('MOCK_AI') == 'true':
         return True
-    if not _HAS_FIREBASE_ADMIN:
-        logging.error("firebase-admin not installed; all requests rejected")
-        return False
-    auth_header = request.headers.get('Authorization', '')
-    if not auth_header.startswith('Bearer '):
-        return False
-    try:
-        _get_firebase_app()
-        firebase_auth.verify_id_token(auth_header[7:])
-        return True
-    except Exception as exc:
-        logging.warning(f"Token verification failed: {exc}")
-        return False
-
-
-# ── CORS ──────────────────────────────────────────────────────────────────────
-def _cors_headers() -> dict:
-    # Never reflect the request Origin — use only the explicitly configured value
-    origin = ALLOWED_ORIGIN if ALLOWED_ORIGIN else 'null'
-    return {
-        'Access-Control-Allow-Origin': origin,
-        'Access-Control-Allow-Methods': 'POST, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type, Authorization',
-        'Access-Control-Max-Age': '3600',
-    }
+    return http_auth.verify_request(request) is not None
 
 
 # ── SQL validation ────────────────────────────────────────────────────────────
@@ -141,10 +120,33 @@ def _validate_sql(sql: str) -> tuple[bool, str]:
     return True, cleaned
 
 
+# ── Generated SQL, reused for repeated questions (query_cache.py) ─────────────
+sql_cache = query_cache.cache_from_env(_validate_sql, db)
+
+# ── Dry-run cost guard, bytes-billed cap and result cache (query_runner.py) ───
+runner = query_runner.QueryRunner(bq_client)
+TOO_EXPENSIVE_ANSWER = ('Esa pregunta requiere revisar demasiados datos. '
+                        'Acota el periodo o el invernadero e inténtalo de nuevo.')
+UNSAFE_SQL_ANSWER    = ('No pude generar una consulta segura para esa pregunta. '
+                        'Intenta reformularla con más detalle.')
+
+
 # ── Main handler ──────────────────────────────────────────────────────────────
 @functions_framework.http
 def ask_ai(request):
-    cors = _cors_headers()
+    """
+    POST {"query", "location_id"?} → {"answer", "sql"}.
+
+    With `Accept: text/event-stream` or "stream": true in the body the answer
+    is streamed as server-sent events instead: `stage` events as the request
+    progresses (received, sql, rows), one `token` event per chunk of the
+    answer as the model writes it, then `done` with the same {"answer", "sql"}
+    as the buffered response. A question that cannot be answered ends with
+    `error` instead: {"error": <message for the user>, "reason"} with reason
+    too_expensive or unsafe_sql (the buffered response has the message as its
+    answer), or {"error": "Internal server error"}.
+    """
+    cors = http_auth.cors_headers()
 
     if request.method == 'OPTIONS':
         return ('', 204, cors)
@@ -167,26 +169,114 @@ def ask_ai(request):
         return ({'error': f"Query exceeds {MAX_QUERY_LEN} characters"}, 400, cors)
 
     if location_id is not None:
-        if not isinstance(location_id, str) or location_id not in KNOWN_SENSOR_IDS:
+        if not isinstance(location_id, str) or location_id not in registry:
             return ({'error': 'Invalid location_id'}, 400, cors)
 
-    # Safe to interpolate because location_id passed the allowlist check above
-    location_filter = f"AND sensor_id = '{location_id}'" if location_id else ""
+    stream = body.get('stream') is True or 'text/event-stream' in request.headers.get('Accept', '')
+    logging.info(f"AI query received (len={len(user_query)}, location={location_id}, stream={stream})")
 
-    logging.info(f"AI query received (len={len(user_query)}, location={location_id})")
+    if stream:
+        return flask.Response(_sse(_answer(user_query, location_id, stream=True)),
+                              mimetype='text/event-stream',
+                              headers={**cors, 'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    try:
+        for event, result in _answer(user_query, location_id, stream=False):
+            pass
+        if event == 'error':
+            result = {'answer': result['error'], 'sql': ''}
+        return (result, 200, cors)
+    except Exception:
+        # Never leak exception details to the client — log server-side only
+        logging.error("ask_ai unhandled error", exc_info=True)
+        return ({'error': 'Internal server error'}, 500, cors)
 
+
+def _sse(events):
+    """Format (event, data) pairs as server-sent events."""
     try:
-        model = _get_model()
+        for event, data in events:
+            yield f"event: {event}\ndata: {json.dumps(data, default=str, ensure_ascii=False)}\n\n"
+    except Exception:
+        logging.error("ask_ai unhandled error (stream)", exc_info=True)
+        yield f"event: error\ndata: {json.dumps({'error': 'Internal server error'})}\n\n"
 
-        # ── Step 1: text → SQL ─────────────────────────────────────────────────
-        sql_prompt = f"""You are a data analyst for Agro-Sentinel, an IoT greenhouse platform.
+
+def _fetch(sql: str, mock_rows) -> tuple[list[dict], str, int | None]:
+    """
+    Run validated SQL within the scan budget: (rows, SQL as run, window it
+    was narrowed to or None). Raises query_runner.QueryTooExpensive.
+    """
+    # Aggregates over sensor_logs are answered from the rollups (rollups.py)
+    sql = rollups.rewrite(sql) or sql
+    if os.environ.get('MOCK_DB') == 'true':
+        _mock_delay()
+        return mock_rows(), sql, None
+    result = runner.run(sql)
+    return result["rows"], result["sql"], result["window_days"]
+
+
+def _mock_delay(fraction: float = 1.0):
+    """Stand in for a model or BigQuery round trip on the MOCK_AI/MOCK_DB paths."""
+    if MOCK_LATENCY_S > 0:
+        time.sleep(MOCK_LATENCY_S * fraction)
+
+
+def _refusal(reason: str, answer: str) -> tuple[str, dict]:
+    logging.info(f"AI query refused ({reason})")
+    return 'error', {'error': answer, 'reason': reason}
+
+
+def _answer(user_query: str, location_id: str | None, stream: bool):
+    """
+    The question → SQL → rows → answer pipeline, as (event, data) pairs; the
+    last one is ("done", {"answer", "sql"}), or ("error", ...) from _refusal.
+    Token events only when streaming.
+    """
+    started = time.perf_counter()
+
+    def stage(name: str, **data):
+        return 'stage', {'stage': name, 'elapsed_ms': round((time.perf_counter() - started) * 1e3), **data}
+
+    yield stage('received')
+
+    # ── Step 0: common questions from templates, without the model (intents.py) ──
+    intent = intents.match(user_query, location_id)
+    if intent is not None:
+        logging.info(f"Intent fast path: {intent.name} (confidence {intent.confidence})")
+        # Templates are fixed shapes; validating anyway keeps one gate for all SQL
+        is_valid, sql = _validate_sql(intent.sql)
+        if is_valid:
+            yield stage('sql', cached=False, intent=intent.name)
+            try:
+                rows, sql, narrowed_days = _fetch(sql, lambda: intents.example_rows(intent))
+            except query_runner.QueryTooExpensive:
+                yield _refusal('too_expensive', TOO_EXPENSIVE_ANSWER)
+                return
+            yield stage('rows', rows=len(rows), narrowed_days=narrowed_days)
+            answer = intents.format_answer(intent, rows, narrowed_days)
+            if stream:
+                yield 'token', {'text': answer}
+            yield 'done', {'answer': answer, 'sql': sql}
+            return
+        logging.error(f"Intent template {intent.name} failed validation ({sql})")
+
+    # Safe to interpolate because location_id passed the allowlist check in ask_ai
+    location_filter = f"AND sensor_id = '{location_id}'" if location_id else ""
+    model = None if os.environ.get('MOCK_AI') == 'true' else _get_model()
+
+    # ── Step 1: text → SQL, unless this question was answered before ───────────
+    context   = _schema_context()
+    sql_query = sql_cache.get(user_query, location_id, context)
+    cached    = sql_query is not None
+    sql_prompt = f"""You are a data analyst for Agro-Sentinel, an IoT greenhouse platform.
 The user writes queries in Spanish or English. Respond with valid Standard SQL for BigQuery.
 
-{SCHEMA_CONTEXT}
+{context}
 
 Rules:
 - Return ONLY the SQL query. No markdown, no explanation, no semicolons.
 - Always include: WHERE timestamp > TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL 365 DAY) {location_filter}
+  (on the rollup tables, the same bound on hour, or DATE(...) of it on day).
 - Use CRITICAL alarm thresholds defined above for alarm/alert queries.
 - Do NOT use DDL (DROP, DELETE, INSERT, UPDATE, CREATE, ALTER, etc.).
 - If the question is conversational, return exactly: CONVERSATIONAL
@@ -195,38 +285,49 @@ Rules:
 User question: "{user_query}"
 """
 
-        if os.environ.get('MOCK_AI') == 'true':
-            sql_query = (
-                "SELECT MAX(temperature) as max_temp, MIN(temperature) as min_temp, "
-                "AVG(temperature) as avg_temp FROM `agro_sentinel_data.sensor_logs` "
-                f"WHERE timestamp > TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL 365 DAY) {location_filter}"
-            )
-        else:
-            response  = model.generate_content(sql_prompt)
-            sql_query = response.text.strip().replace("```sql", "").replace("```", "").strip()
-
+    if cached:
+        logging.info("SQL served from cache")
+    elif os.environ.get('MOCK_AI') == 'true':
+        _mock_delay()
+        sql_query = (
+            "SELECT MAX(temperature) as max_temp, MIN(temperature) as min_temp, "
+            "AVG(temperature) as avg_temp FROM `agro_sentinel_data.sensor_logs` "
+            f"WHERE timestamp > TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL 365 DAY) {location_filter}"
+        )
+    else:
+        response  = model.generate_content(sql_prompt)
+        sql_query = response.text.strip().replace("```sql", "").replace("```", "").strip()
         logging.info(f"Gemini returned SQL (len={len(sql_query)})")
 
-        if sql_query == 'CONVERSATIONAL':
-            return ({'answer': '¡Hola! Soy Agro-Sentinel AI. Pregúntame sobre temperatura, alarmas, humedad, CO2 o el estado del cultivo.', 'sql': ''}, 200, cors)
+    if sql_query == 'CONVERSATIONAL':
+        yield 'done', {'answer': '¡Hola! Soy Agro-Sentinel AI. Pregúntame sobre temperatura, alarmas, humedad, CO2 o el estado del cultivo.', 'sql': ''}
+        return
 
-        # ── SQL safety validation (blocks prompt-injection → DDL) ───────────────
-        is_valid, result = _validate_sql(sql_query)
-        if not is_valid:
-            logging.warning(f"SQL rejected ({result}): {sql_query[:200]}")
-            return ({'answer': 'No pude generar una consulta segura para esa pregunta. Intenta reformularla con más detalle.', 'sql': ''}, 200, cors)
+    # ── SQL safety validation (blocks prompt-injection → DDL) ───────────────────
+    is_valid, result = _validate_sql(sql_query)
+    if not is_valid:
+        logging.warning(f"SQL rejected ({result}): {sql_query[:200]}")
+        yield _refusal('unsafe_sql', UNSAFE_SQL_ANSWER)
+        return
 
-        validated_sql = result
+    validated_sql = result
+    if not cached:
+        sql_cache.put(user_query, location_id, context, validated_sql)
+    yield stage('sql', cached=cached)
 
-        # ── Step 2: execute SQL ─────────────────────────────────────────────────
-        if os.environ.get('MOCK_DB') == 'true':
-            rows = [{"max_temp": 34.2, "min_temp": 12.1, "avg_temp": 22.7}]
-        else:
-            job  = bq_client.query(validated_sql)
-            rows = [dict(row) for row in job]
-
-        # ── Step 3: rows → natural-language answer ──────────────────────────────
-        summary_prompt = f"""You are Agro-Sentinel AI, an assistant for greenhouse monitoring.
+    # ── Step 2: execute SQL within the scan budget ──────────────────────────────
+    try:
+        rows, validated_sql, narrowed_days = _fetch(
+            validated_sql, lambda: [{"max_temp": 34.2, "min_temp": 12.1, "avg_temp": 22.7}])
+    except query_runner.QueryTooExpensive:
+        yield _refusal('too_expensive', TOO_EXPENSIVE_ANSWER)
+        return
+    period_note = (f"\n- The data covers only the last {narrowed_days} days; say so briefly."
+                   if narrowed_days else "")
+    yield stage('rows', rows=len(rows), narrowed_days=narrowed_days)
+
+    # ── Step 3: rows → natural-language answer ──────────────────────────────────
+    summary_prompt = f"""You are Agro-Sentinel AI, an assistant for greenhouse monitoring.
 The user asked: "{user_query}"
 BigQuery result: {json.dumps(rows[:10], default=str)}
 
@@ -235,19 +336,32 @@ Instructions:
 - Be concise and professional. Use emojis sparingly.
 - Format numbers with units (°C, %, ppm, kPa, µmol/m²/s).
 - If the result is empty, say no data was found for the requested period.
-- Do NOT mention SQL, BigQuery, or technical implementation details.
+- Do NOT mention SQL, BigQuery, or technical implementation details.{period_note}
 """
 
-        if os.environ.get('MOCK_AI') == 'true':
-            v = rows[0]
-            final_answer = f"La temperatura máxima registrada fue **{v.get('max_temp')}°C**, mínima **{v.get('min_temp')}°C**, promedio **{v.get('avg_temp')}°C**."
-        else:
-            summary      = model.generate_content(summary_prompt)
-            final_answer = summary.text.strip()
-
-        return ({'answer': final_answer, 'sql': validated_sql}, 200, cors)
-
-    except Exception:
-        # Never leak exception details to the client — log server-side only
-        logging.error("ask_ai unhandled error", exc_info=True)
-        return ({'error': 'Internal server error'}, 500, cors)
+    if os.environ.get('MOCK_AI') == 'true':
+        v = rows[0]
+        mock_answer = f"La temperatura máxima registrada fue **{v.get('max_temp')}°C**, mínima **{v.get('min_temp')}°C**, promedio **{v.get('avg_temp')}°C**."
+        chunks = re.findall(r'\S+\s*', mock_answer) if stream else [mock_answer]
+        parts  = []
+        for chunk in chunks:
+            _mock_delay(1 / len(chunks))
+            parts.append(chunk)
+            if stream:
+                yield 'token', {'text': chunk}
+        final_answer = ''.join(parts).strip()
+    elif stream:
+        parts = []
+        for chunk in model.generate_content(summary_prompt, stream=True):
+            try:
+                text = chunk.text
+            except ValueError:          # a chunk without text (e.g. only safety ratings)
+                continue
+            parts.append(text)
+            yield 'token', {'text': text}
+        final_answer = ''.join(parts).strip()
+    else:
+        summary      = model.generate_content(summary_prompt)
+        final_answer = summary.text.strip()
+
+    yield 'done', {'answer': final_answer, 'sql': validated_sql}
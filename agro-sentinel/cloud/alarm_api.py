@@ -0,0 +1,59 @@
+import functions_framework
+import logging
+import re
+from datetime import datetime, timezone
+
+import alarms
+import http_auth
+from lazy import LazyClient, gcp_module
+
+db = LazyClient(lambda: gcp_module("firestore").Client(), "Firestore client")
+
+_SENSOR_ID_RE  = re.compile(r'^GH-[A-Z]{3}-\d{2}$')
+MAX_ALARM_ID_LEN = 200
+
+
+# ── Main handler ──────────────────────────────────────────────────────────────
+@functions_framework.http
+def acknowledge_alarm(request):
+    """
+    POST {"sensor_id", "alarm_id"} → {"acknowledged": <acknowledgement>}.
+
+    Records that the signed-in operator acknowledged a standing alarm
+    (alarms.record_acknowledgement). The ingest function applies it, and emits
+    the ACKNOWLEDGED event, with the sensor's next reading. 404 if the alarm
+    is not standing.
+    """
+    cors = http_auth.cors_headers()
+
+    if request.method == 'OPTIONS':
+        return ('', 204, cors)
+
+    claims = http_auth.verify_request(request)
+    if claims is None:
+        return ({'error': 'Unauthorized'}, 401, cors)
+
+    body = request.get_json(silent=True)
+    if not body:
+        return ({'error': 'Invalid JSON body'}, 400, cors)
+
+    # ── Input validation ───────────────────────────────────────────────────────
+    sensor_id = body.get('sensor_id')
+    alarm_id  = body.get('alarm_id')
+
+    if not isinstance(sensor_id, str) or not _SENSOR_ID_RE.match(sensor_id):
+        return ({'error': "Field 'sensor_id' must be a valid sensor ID"}, 400, cors)
+
+    if (not isinstance(alarm_id, str) or len(alarm_id) > MAX_ALARM_ID_LEN
+            or not alarm_id.startswith(f"{sensor_id}:")):
+        return ({'error': "Field 'alarm_id' must be an alarm of that sensor"}, 400, cors)
+
+    by = claims.get('uid') or claims.get('email') or 'anonymous'
+    ack, reason = alarms.record_acknowledgement(db, sensor_id, alarm_id, by, datetime.now(timezone.utc))
+    if ack is None:
+        return ({'error': f"Alarm {alarm_id} is {reason}"}, 404, cors)
+
+    logging.info(f"Alarm {alarm_id} acknowledged by {by}")
+    at = ack.get('acknowledged_at')
+    return ({'acknowledged': dict(ack, acknowledged_at=at.isoformat() if isinstance(at, datetime) else at)},
+            200, cors)
@@ -0,0 +1,381 @@
+"""
+Stateful ISA 18.2 alarm lifecycle on top of the per-reading rule conditions.
+
+rules.py answers "which limits does this reading breach" — a condition, true
+or false per reading. An alarm is an episode: it is raised once, may be
+acknowledged, and returns to normal once. Per sensor and (key, level, breach):
+
+    normal ──condition held ON_DELAY_S──▶ ACTIVE ──acknowledge()──▶ ACKNOWLEDGED
+       ▲                                     │                          │
+       └───── value back inside limit ± deadband for OFF_DELAY_S ◀──────┘
+
+  · Deadband (ISA 18.2 "alarm attributes"): a standing alarm only clears once
+    the value is back past its limit by DEADBAND[key], so a value hovering at
+    the limit does not raise, clear, raise on every reading. The values match
+    web/src/domain/alarms.ts.
+  · On/off delays filter single-reading spikes and dips; 0 s on, 60 s off by
+    default. An unmeasured value (None) never clears an alarm.
+  · Events (RAISED, ACKNOWLEDGED, CLEARED) are emitted on transitions only, so
+    alarm volume follows real episodes, not the message rate. Event ids are
+    deterministic, so a redelivered message rewrites the same event.
+  · Flood suppression: when a sensor raises more than FLOOD_THRESHOLD alarms in
+    FLOOD_WINDOW_S (ISA 18.2's "10 per 10 minutes"), one FLOOD_START event
+    replaces the individual ones until the rate falls to half the threshold;
+    FLOOD_END then reports how many were suppressed. The alarms themselves
+    keep their lifecycle throughout, only notifications collapse.
+
+Readings are applied in event time; one older than the last reading applied
+for its sensor does not move the state machine.
+
+State is per process, loaded on first use per sensor: with a `loader` the
+standing alarms come back from the sensor's Firestore state document
+(active_alerts), so a cold instance neither re-raises nor forgets them.
+Operators acknowledge through the acknowledge-alarm function (alarm_api.py),
+which records alarm_acks/<alarm id>; with an `ack_loader` the manager picks
+those up on first use and then every ALARM_ACK_POLL_S while the sensor has an
+unacknowledged alarm, and emits the ACKNOWLEDGED event itself.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+import rules
+
+ALARM_ON_DELAY_S  = float(os.environ.get('ALARM_ON_DELAY_S', 0))
+ALARM_OFF_DELAY_S = float(os.environ.get('ALARM_OFF_DELAY_S', 60))
+FLOOD_THRESHOLD   = int(os.environ.get('ALARM_FLOOD_THRESHOLD', 10))
+FLOOD_WINDOW_S    = float(os.environ.get('ALARM_FLOOD_WINDOW_S', 600))
+ALARM_ACK_POLL_S  = float(os.environ.get('ALARM_ACK_POLL_S', 30))
+ACK_COLLECTION    = "alarm_acks"
+
+# Per-key deadband in the key's own unit (web/src/domain/alarms.ts DEADBAND)
+DEADBAND = {
+    "temperature":   0.5,
+    "humidity":      2,
+    "vpd_kpa":       0.05,
+    "co2_ppm":       50,
+    "soil_moisture": 2,
+    "par_umol":      25,
+    "battery_level": 2,
+    "rssi_dbm":      3,
+}
+
+ACTIVE, ACKNOWLEDGED = "ACTIVE", "ACKNOWLEDGED"
+
+# Sort order of standing alarms: CRITICAL first, then rule order, HIGH before LOW
+_ORDER = {(level, key, breach): i for i, (level, key, breach) in enumerate(
+    (level, key, breach) for _, level in rules.LEVELS
+    for key in rules.ALERT_FIELDS for _, breach, _ in rules.SIDES)}
+
+
+def _iso(at: float) -> str:
+    return datetime.fromtimestamp(at, timezone.utc).isoformat()
+
+
+def _epoch(value) -> float | None:
+    """Epoch seconds from a Firestore timestamp (datetime) or an ISO string."""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp()
+
+
+class Alarm:
+    __slots__ = ("id", "sensor_id", "key", "level", "breach", "limit", "value", "peak",
+                 "state", "raised_at", "acknowledged_at", "clear_since")
+
+    def __init__(self, sensor_id: str, key: str, level: str, breach: str,
+                 limit: float, value: float, at: float):
+        self.id        = f"{sensor_id}:{key}:{level}:{breach}:{int(at)}"
+        self.sensor_id = sensor_id
+        self.key, self.level, self.breach = key, level, breach
+        self.limit     = limit
+        self.value     = self.peak = value
+        self.state     = ACTIVE
+        self.raised_at = at
+        self.acknowledged_at = None
+        self.clear_since     = None
+
+    @classmethod
+    def from_dict(cls, sensor_id: str, entry: dict) -> "Alarm | None":
+        """Rebuild a standing alarm from its active_alerts entry; None if malformed."""
+        raised_at = _epoch(entry.get("raised_at"))
+        if raised_at is None or not entry.get("id") or entry.get("breach") not in ("HIGH", "LOW"):
+            return None
+        alarm = cls(sensor_id, entry.get("key"), entry.get("level"), entry["breach"],
+                    entry.get("limit"), entry.get("value"), raised_at)
+        alarm.id   = entry["id"]
+        alarm.peak = entry.get("peak", alarm.value)
+        if entry.get("state") == ACKNOWLEDGED:
+            alarm.state = ACKNOWLEDGED
+            alarm.acknowledged_at = _epoch(entry.get("acknowledged_at"))
+        return alarm
+
+    def still_breached(self, value: float) -> bool:
+        """Inside the limit but within the deadband counts as still breached."""
+        deadband = DEADBAND.get(self.key, 0)
+        if self.breach == "HIGH":
+            return value > self.limit - deadband
+        return value < self.limit + deadband
+
+    def to_dict(self) -> dict:
+        """Firestore active_alerts entry; key/level/breach/value as before."""
+        return {"key": self.key, "level": self.level, "breach": self.breach,
+                "value": self.value, "peak": self.peak, "limit": self.limit,
+                "id": self.id, "state": self.state, "raised_at": _iso(self.raised_at),
+                "acknowledged_at": (_iso(self.acknowledged_at)
+                                    if self.acknowledged_at is not None else None)}
+
+    def event(self, kind: str, at: float) -> dict:
+        return {"id": f"{self.id}:{kind}", "event": kind, "alarm_id": self.id,
+                "sensor_id": self.sensor_id, "key": self.key, "level": self.level, "breach": self.breach,
+                "value": self.value, "peak": self.peak, "limit": self.limit, "at": _iso(at)}
+
+
+class _SensorAlarms:
+    __slots__ = ("alarms", "pending", "last_at", "raises", "flooding", "suppressed", "acks_polled")
+
+    def __init__(self, alarms=()):
+        self.alarms: dict[tuple, Alarm] = {(a.key, a.level, a.breach): a for a in alarms}
+        self.pending: dict[tuple, float] = {}    # condition → first seen, before ON_DELAY_S
+        self.last_at    = None
+        self.raises     = deque()                # raise times within FLOOD_WINDOW_S
+        self.flooding   = False
+        self.suppressed = 0
+        self.acks_polled = None                  # clock() of the last alarm_acks read
+
+    def unacknowledged(self) -> list[str]:
+        return [alarm.id for alarm in self.alarms.values() if alarm.state == ACTIVE]
+
+
+class AlarmManager:
+    """Alarm state for every sensor. Safe to share between threads."""
+
+    def __init__(self, on_delay_s: float = ALARM_ON_DELAY_S, off_delay_s: float = ALARM_OFF_DELAY_S,
+                 flood_threshold: int = FLOOD_THRESHOLD, flood_window_s: float = FLOOD_WINDOW_S,
+                 loader=None, ack_loader=None, ack_poll_s: float = ALARM_ACK_POLL_S,
+                 clock=time.monotonic):
+        self.on_delay_s      = on_delay_s
+        self.off_delay_s     = off_delay_s
+        self.flood_threshold = flood_threshold
+        self.flood_window_s  = flood_window_s
+        self.loader          = loader           # sensor_id → active_alerts entries
+        self.ack_loader      = ack_loader       # alarm ids → {alarm id: acknowledged at}
+        self.ack_poll_s      = ack_poll_s
+        self.clock           = clock
+        self._lock    = threading.Lock()
+        self._sensors: dict[str, _SensorAlarms] = {}
+        self._counters = dict.fromkeys(("readings", "out_of_order", "raised", "cleared",
+                                        "acknowledged", "floods", "suppressed", "loaded",
+                                        "load_errors"), 0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters,
+                        standing=sum(len(s.alarms) for s in self._sensors.values()))
+
+    def update(self, sensor_id: str, alerts: list, values: dict, limits: dict,
+               at: float) -> tuple[list, list]:
+        """
+        Apply one reading. `alerts` are its rule conditions (RuleTable.evaluate),
+        `values` its alert values by alert key, `limits` the sensor's
+        RuleTable.limits and `at` its event time in epoch seconds.
+
+        Returns (standing alarms as active_alerts entries, events to emit).
+        """
+        acks = self._sync(sensor_id)
+        with self._lock:
+            sensor = self._sensors[sensor_id]
+            events = self._apply_acks(sensor, acks)
+            self._counters["readings"] += 1
+            if sensor.last_at is not None and at < sensor.last_at:
+                self._counters["out_of_order"] += 1
+                return self._standing(sensor), events
+            sensor.last_at = at
+
+            conditions = {(a["key"], a["level"], a["breach"]): a["value"] for a in alerts}
+            for slot, alarm in list(sensor.alarms.items()):
+                value = values.get(alarm.key)
+                if slot in conditions:
+                    alarm.value = conditions[slot]
+                    alarm.peak  = (max if alarm.breach == "HIGH" else min)(alarm.peak, alarm.value)
+                    alarm.clear_since = None
+                    continue
+                if value is None or alarm.still_breached(value):
+                    # Not measured, or back inside the limit but within the deadband: hold
+                    if value is not None:
+                        alarm.value = value
+                    alarm.clear_since = None
+                    continue
+                alarm.value = value
+                if alarm.clear_since is None:
+                    alarm.clear_since = at
+                if at - alarm.clear_since >= self.off_delay_s:
+                    del sensor.alarms[slot]
+                    self._counters["cleared"] += 1
+                    events.append(alarm.event("CLEARED", at))
+
+            for slot in list(sensor.pending):
+                if slot not in conditions:
+                    del sensor.pending[slot]      # a spike shorter than ON_DELAY_S
+            for slot, value in conditions.items():
+                if slot in sensor.alarms:
+                    continue
+                first_seen = sensor.pending.setdefault(slot, at)
+                if at - first_seen < self.on_delay_s:
+                    continue
+                del sensor.pending[slot]
+                key, level, breach = slot
+                alarm = Alarm(sensor_id, key, level, breach, limits.get((level, key, breach)), value, at)
+                sensor.alarms[slot] = alarm
+                sensor.raises.append(at)
+                self._counters["raised"] += 1
+                events.append(alarm.event("RAISED", at))
+
+            return self._standing(sensor), self._flood_filter(sensor, sensor_id, events, at)
+
+    def _sync(self, sensor_id: str) -> dict:
+        """
+        Load the sensor's standing alarms on first use, and return the
+        acknowledgements recorded since the last poll. The Firestore reads
+        happen outside the lock.
+        """
+        with self._lock:
+            sensor = self._sensors.get(sensor_id)
+        if sensor is None:
+            restored = []
+            if self.loader is not None:
+                try:
+                    entries  = self.loader(sensor_id) or []
+                    restored = [a for a in (Alarm.from_dict(sensor_id, e) for e in entries) if a]
+                except Exception as exc:
+                    logging.warning(f"Could not load standing alarms for {sensor_id}: {exc}")
+                    with self._lock:
+                        self._counters["load_errors"] += 1
+            with self._lock:
+                sensor = self._sensors.setdefault(sensor_id, _SensorAlarms(restored))
+                self._counters["loaded"] += bool(restored)
+
+        now = self.clock()
+        with self._lock:
+            waiting = sensor.unacknowledged()
+            due = (self.ack_loader is not None and waiting
+                   and (sensor.acks_polled is None or now - sensor.acks_polled >= self.ack_poll_s))
+            if due:
+                sensor.acks_polled = now
+        if not due:
+            return {}
+        try:
+            return self.ack_loader(waiting)
+        except Exception as exc:
+            logging.warning(f"Could not read acknowledgements for {sensor_id}: {exc}")
+            return {}
+
+    def _apply_acks(self, sensor: _SensorAlarms, acks: dict) -> list:
+        """ACKNOWLEDGED events for `acks` ({alarm id: at}). Caller holds the lock."""
+        events = []
+        for alarm in sensor.alarms.values():
+            at = acks.get(alarm.id)
+            if at is not None and alarm.state == ACTIVE:
+                alarm.state, alarm.acknowledged_at = ACKNOWLEDGED, at
+                self._counters["acknowledged"] += 1
+                events.append(alarm.event("ACKNOWLEDGED", at))
+        return events
+
+    def acknowledge(self, sensor_id: str, alarm_id: str, at: float) -> dict | None:
+        """Mark a standing alarm acknowledged. Returns the event, or None if not standing."""
+        self._sync(sensor_id)
+        with self._lock:
+            events = self._apply_acks(self._sensors[sensor_id], {alarm_id: at})
+        return events[0] if events else None
+
+    def standing(self, sensor_id: str) -> list:
+        self._sync(sensor_id)
+        with self._lock:
+            return self._standing(self._sensors[sensor_id])
+
+    @staticmethod
+    def _standing(sensor: _SensorAlarms) -> list:
+        return [alarm.to_dict() for slot, alarm in
+                sorted(sensor.alarms.items(), key=lambda item: _ORDER.get(item[0], len(_ORDER)))]
+
+    def _flood_filter(self, sensor: _SensorAlarms, sensor_id: str, events: list, at: float) -> list:
+        """Collapse RAISED/CLEARED events into FLOOD_START/FLOOD_END while flooding."""
+        while sensor.raises and at - sensor.raises[0] > self.flood_window_s:
+            sensor.raises.popleft()
+        rate = len(sensor.raises)
+        out  = []
+        if not sensor.flooding and rate > self.flood_threshold:
+            sensor.flooding = True
+            self._counters["floods"] += 1
+            logging.warning(f"Alarm flood on {sensor_id}: {rate} alarms in {self.flood_window_s:.0f}s")
+            out.append({"id": f"{sensor_id}:FLOOD_START:{int(at)}", "event": "FLOOD_START",
+                        "sensor_id": sensor_id, "raised_in_window": rate,
+                        "standing": len(sensor.alarms), "at": _iso(at)})
+        if sensor.flooding:
+            kept = [e for e in events if e["event"] not in ("RAISED", "CLEARED")]
+            sensor.suppressed += len(events) - len(kept)
+            self._counters["suppressed"] += len(events) - len(kept)
+            out += kept
+            if rate <= self.flood_threshold // 2:
+                sensor.flooding = False
+                out.append({"id": f"{sensor_id}:FLOOD_END:{int(at)}", "event": "FLOOD_END",
+                            "sensor_id": sensor_id, "suppressed": sensor.suppressed,
+                            "standing": len(sensor.alarms), "at": _iso(at)})
+                sensor.suppressed = 0
+            return out
+        return out + events
+
+
+# ── Firestore persistence ─────────────────────────────────────────────────────
+def firestore_loader(db, collection: str = "greenhouses"):
+    """Standing alarms as last written to the sensor's state document."""
+    def load(sensor_id: str) -> list[dict]:
+        snapshot = db.collection(collection).document(sensor_id).get()
+        doc = snapshot.to_dict() if snapshot.exists else None
+        alerts = doc.get("active_alerts") if isinstance(doc, dict) else None
+        return [a for a in alerts if isinstance(a, dict)] if isinstance(alerts, list) else []
+    return load
+
+
+def firestore_ack_loader(db, collection: str = ACK_COLLECTION):
+    """{alarm id: acknowledged at} for the given alarms that have been acknowledged."""
+    def load(alarm_ids: list[str]) -> dict:
+        acks = {}
+        for alarm_id in alarm_ids:
+            snapshot = db.collection(collection).document(alarm_id).get()
+            doc = snapshot.to_dict() if snapshot.exists else None
+            at = _epoch(doc.get("acknowledged_at")) if isinstance(doc, dict) else None
+            if at is not None:
+                acks[alarm_id] = at
+        return acks
+    return load
+
+
+def record_acknowledgement(db, sensor_id: str, alarm_id: str, by: str, at: datetime,
+                           collection: str = "greenhouses") -> tuple[dict | None, str]:
+    """
+    Record an operator's acknowledgement of a standing alarm in alarm_acks.
+
+    Returns (the acknowledgement, "") or (None, why not). Acknowledging twice
+    keeps the first one. The ingest function applies it with the sensor's next
+    reading (AlarmManager ack_loader).
+    """
+    standing = {a.get("id"): a for a in firestore_loader(db, collection)(sensor_id)}
+    if alarm_id not in standing:
+        return None, "not standing"
+    ref = db.collection(ACK_COLLECTION).document(alarm_id)
+    snapshot = ref.get()
+    existing = snapshot.to_dict() if snapshot.exists else None
+    if isinstance(existing, dict):
+        return existing, ""
+    ack = {"alarm_id": alarm_id, "sensor_id": sensor_id, "acknowledged_at": at, "by": by}
+    ref.set(ack)
+    return ack, ""
@@ -0,0 +1,77 @@
+"""
+Sanitise / derive / alert benchmark: scalar _evaluate vs the NumPy batch path.
+
+    python bench_evaluate.py --readings 20000
+
+Both paths run on the same seeded readings (typical greenhouse values, with
+some missing, zero and out-of-range ones) and the results are checked to be
+identical before any timing is reported.
+"""
+import argparse
+import logging
+import os
+import random
+import time
+
+os.environ.setdefault('USE_MOCK_GCP', 'true')
+
+import main
+
+# Typical operating ranges, so alerts are the exception as in production
+TYPICAL = {
+    'temperature_c': (14.0, 32.0), 'humidity_rh': (50.0, 88.0), 'co2_ppm': (400.0, 1200.0),
+    'soil_moisture': (45.0, 80.0), 'par_umol': (200.0, 800.0), 'soil_ec': (1.0, 3.0),
+    'soil_temp_c': (12.0, 28.0), 'battery_level': (20.0, 100.0), 'rssi_dbm': (-85.0, -40.0),
+}
+
+
+def _readings(count: int, seed: int = 0) -> list[dict]:
+    rng     = random.Random(seed)
+    sensors = sorted(main.registry.ids())
+    out = []
+    for i in range(count):
+        reading = {"sensor_id": sensors[i % len(sensors)], "timestamp": "2026-10-01T12:00:00Z"}
+        for key, (lo, hi) in TYPICAL.items():
+            roll = rng.random()
+            reading[key] = (None if roll < 0.02 else 1e6 if roll < 0.025 else
+                            0.0 if roll < 0.03 else round(rng.uniform(lo, hi), 2))
+        out.append(reading)
+    return out
+
+
+def _time(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--readings", type=int, default=20000)
+    parser.add_argument("--repeat",   type=int, default=3)
+    args = parser.parse_args()
+    if main._load_vectorized() is None:
+        raise SystemExit("numpy is not installed — nothing to compare")
+    logging.disable(logging.CRITICAL)      # alert logging would dominate both paths
+
+    readings = _readings(args.readings)
+    scalar = [main._evaluate(r) for r in readings]
+    batch  = main._evaluate_batch(readings)
+    for a, b in zip(scalar, batch):
+        a[1].pop("last_update"), b[1].pop("last_update")
+        a[2].pop("ingested_at"), b[2].pop("ingested_at")      # wall clock, differs between runs
+    assert scalar == batch, "vectorised results differ from the scalar path"
+
+    before = _time(lambda: [main._evaluate(r) for r in readings], args.repeat)
+    after  = _time(lambda: main._evaluate_batch(readings), args.repeat)
+    print(f"{args.readings} readings, results identical")
+    print(f"scalar:     {args.readings / before:>10.0f} readings/s")
+    print(f"vectorised: {args.readings / after:>10.0f} readings/s")
+    print(f"speed-up: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main_()
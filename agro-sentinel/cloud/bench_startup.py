@@ -0,0 +1,118 @@
+"""
+Cold-start benchmark: import time and time to first response per entry point.
+
+    python bench_startup.py --runs 5
+    python bench_startup.py --importtime      # also list the slowest imports
+
+Every run is a fresh interpreter with the mock clients (USE_MOCK_GCP, MOCK_AI,
+MOCK_DB), so the numbers are the code's own start-up cost: module imports and
+client construction, not network. An entry point whose framework is not
+installed is reported and skipped. With MOCK_LATENCY_S set, each mocked model
+call and query takes that long, so ask_ai and ask_ai (stream) compare time to
+the whole answer against time to the first byte:
+
+    MOCK_LATENCY_S=0.5 python bench_startup.py --runs 3
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+_READING = {"sensor_id": "GH-AMB-01", "timestamp": "2026-10-01T12:00:00Z",
+            "temperature_c": 22.0, "humidity_rh": 70.0}
+
+# entry point → (module, code run for the first invocation)
+ENTRY_POINTS = {
+    "process_sensor_data": ("main", f"""
+import base64
+event = {{"data": base64.b64encode({json.dumps(_READING)!r}.encode()).decode()}}
+module.process_sensor_data(event, None)
+"""),
+    "process_thermal_image": ("thermal", """
+from types import SimpleNamespace
+module.process_thermal_image(SimpleNamespace(data={"bucket": "b", "name": "GH-AMB-01_2026-10-01.jpg",
+                                                   "timeCreated": "2026-10-01T12:00:00Z"}))
+"""),
+    "ask_ai": ("ai_assistant", """
+from types import SimpleNamespace
+request = SimpleNamespace(method="POST", headers={},
+                          get_json=lambda silent=False: {"query": "temperatura maxima"})
+module.ask_ai(request)
+"""),
+    # first call = time to the first server-sent event, not to the whole answer
+    "ask_ai (stream)": ("ai_assistant", """
+from types import SimpleNamespace
+request = SimpleNamespace(method="POST", headers={"Accept": "text/event-stream"},
+                          get_json=lambda silent=False: {"query": "temperatura maxima"})
+next(iter(module.ask_ai(request).response))
+"""),
+}
+
+_CHILD = """
+import importlib, json, logging, time
+logging.disable(logging.CRITICAL)
+t0 = time.perf_counter()
+module = importlib.import_module({module!r})
+t1 = time.perf_counter()
+{call}
+t2 = time.perf_counter()
+print(json.dumps({{"import_ms": (t1 - t0) * 1e3, "first_call_ms": (t2 - t1) * 1e3}}))
+"""
+
+
+def _run(module: str, call: str, importtime: bool = False) -> tuple[dict | None, str]:
+    env = dict(os.environ, USE_MOCK_GCP='true', MOCK_AI='true', MOCK_DB='true')
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + \
+          ["-c", _CHILD.format(module=module, call=call)]
+    proc = subprocess.run(cmd, cwd=HERE, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return None, proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "failed"
+    return json.loads(proc.stdout.strip().splitlines()[-1]), proc.stderr
+
+
+def _slowest_imports(stderr: str, top: int) -> list[tuple[int, str]]:
+    """(cumulative µs, module) from -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        if cumulative.strip().isdigit():
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--importtime", action="store_true")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'entry point':24} {'import ms':>10} {'first call ms':>14} {'total ms':>9}")
+    for name, (module, call) in ENTRY_POINTS.items():
+        results, error = [], None
+        for _ in range(args.runs):
+            result, error = _run(module, call)
+            if result is None:
+                break
+            results.append(result)
+        if not results:
+            print(f"{name:24} skipped: {error}")
+            continue
+        imp  = statistics.median(r["import_ms"] for r in results)
+        call_ms = statistics.median(r["first_call_ms"] for r in results)
+        print(f"{name:24} {imp:10.1f} {call_ms:14.1f} {imp + call_ms:9.1f}")
+        if args.importtime:
+            _, stderr = _run(module, call, importtime=True)
+            for cumulative, imported in _slowest_imports(stderr, args.top):
+                print(f"{'':26}{cumulative / 1e3:8.1f} ms  {imported}")
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,214 @@
+"""
+Buffered BigQuery streaming inserts with row-level retry and a local spill file.
+
+Rows are accumulated across messages and sent when the buffer reaches
+BQ_BUFFER_MAX_ROWS rows, BQ_BUFFER_MAX_BYTES of JSON or BQ_BUFFER_MAX_AGE_S
+seconds, whichever comes first. insert_rows_json reports failures per row, so
+only the rows BigQuery refused are sent again, with exponential backoff and
+full jitter, up to BQ_MAX_ATTEMPTS times; rows refused as invalid are logged
+and dropped. Rows that still did not land go to BQ_SPILL_PATH (JSON Lines)
+and are replayed after the next write in which every row landed.
+
+The ingest entry points in main.py do not buffer: they call write() with
+spill=False and leave a message unacked when its rows fail, so Pub/Sub
+redelivers it. add()/flush() and the spill file are for long-running
+producers without redelivery. There the buffer lives in process memory, and
+a process that stops loses what it had not flushed yet.
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+BQ_BUFFER_MAX_ROWS  = int(os.environ.get('BQ_BUFFER_MAX_ROWS', 500))
+BQ_BUFFER_MAX_BYTES = int(os.environ.get('BQ_BUFFER_MAX_BYTES', 5 * 1024 * 1024))
+BQ_BUFFER_MAX_AGE_S = float(os.environ.get('BQ_BUFFER_MAX_AGE_S', 2.0))
+BQ_MAX_ATTEMPTS     = int(os.environ.get('BQ_MAX_ATTEMPTS', 4))
+BQ_SPILL_PATH       = os.environ.get('BQ_SPILL_PATH')
+MIN_BACKOFF_S       = 0.2
+MAX_BACKOFF_S       = 5.0
+BQ_MAX_ROWS_PER_INSERT = 500     # BigQuery's recommended streaming request size
+
+# insert_rows_json error reasons that a retry cannot fix
+PERMANENT_REASONS = frozenset({"invalid", "invalidQuery", "notFound", "accessDenied"})
+
+
+def _reasons(error: dict) -> set:
+    return {e.get("reason") for e in error.get("errors", ()) if isinstance(e, dict)}
+
+
+class BigQueryWriter:
+    """Accumulates rows for one table. Safe to share between threads."""
+
+    def __init__(self, client, table_id, max_rows: int = BQ_BUFFER_MAX_ROWS,
+                 max_bytes: int = BQ_BUFFER_MAX_BYTES, max_age_s: float = BQ_BUFFER_MAX_AGE_S,
+                 max_attempts: int = BQ_MAX_ATTEMPTS, spill_path: str | None = BQ_SPILL_PATH,
+                 autoflush: bool = True, clock=time.monotonic, sleep=time.sleep,
+                 rng: random.Random | None = None, row_id=None):
+        self.client       = client
+        self.table_id     = table_id          # str, or a callable returning it
+        self.max_rows     = max_rows
+        self.max_bytes    = max_bytes
+        self.max_age_s    = max_age_s
+        self.max_attempts = max_attempts
+        self.spill_path   = spill_path
+        self.autoflush    = autoflush
+        self.clock        = clock
+        self.sleep        = sleep
+        self._rng         = rng or random.Random()
+        self.row_id       = row_id            # row → insertId, for BigQuery's own de-duplication
+        self._lock        = threading.Lock()     # buffer and counters
+        self._send_lock   = threading.Lock()     # one flush at a time, in order
+        self._buffer: list[dict] = []
+        self._bytes       = 0
+        self._oldest      = None
+        self._timer       = None
+        self._counters = dict.fromkeys(("buffered", "flushes", "requests", "inserted", "retried",
+                                        "invalid", "spilled", "replayed", "dropped"), 0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters, pending=len(self._buffer), pending_bytes=self._bytes)
+
+    def _table(self) -> str:
+        return self.table_id() if callable(self.table_id) else self.table_id
+
+    def _due(self) -> bool:
+        return bool(self._buffer) and (len(self._buffer) >= self.max_rows
+                                       or self._bytes >= self.max_bytes
+                                       or self.clock() - self._oldest >= self.max_age_s)
+
+    def add(self, rows: list[dict]) -> int:
+        """Buffer rows, flushing if a threshold is reached. Returns rows inserted by that flush."""
+        with self._lock:
+            if rows and not self._buffer:
+                self._oldest = self.clock()
+            for row in rows:
+                self._buffer.append(row)
+                self._bytes += len(json.dumps(row, default=str))
+            self._counters["buffered"] += len(rows)
+            due = self._due()
+            if self.autoflush and self._buffer and self._timer is None and not due:
+                # Rows must not wait for the next message when none comes
+                self._timer = threading.Timer(self.max_age_s, self._on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        return self.flush()[0] if due else 0
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        except Exception as exc:
+            logging.error(f"BigQuery timed flush failed: {exc}")
+
+    def flush_if_due(self) -> int:
+        with self._lock:
+            due = self._due()
+        return self.flush()[0] if due else 0
+
+    def flush(self, spill: bool = True) -> tuple[int, list[dict]]:
+        """Send everything buffered now. See write()."""
+        with self._lock:
+            rows, self._buffer, self._bytes, self._oldest = self._buffer, [], 0, None
+            if rows:
+                self._counters["flushes"] += 1
+        return self.write(rows, spill) if rows else (0, [])
+
+    def write(self, rows: list[dict], spill: bool = True) -> tuple[int, list[dict]]:
+        """
+        Send rows now, bypassing the buffer. Returns (rows inserted, rows still
+        failing after every attempt); rows BigQuery refused as invalid are in
+        neither.
+
+        Failing rows are spilled when `spill` is set; callers that can get the
+        rows redelivered (an unacked Pub/Sub batch) pass spill=False and
+        handle them themselves.
+        """
+        with self._send_lock:
+            inserted, failed = self._send(rows)
+            if failed and spill:
+                self._spill(failed)
+            elif not failed:
+                inserted += self._replay()
+            return inserted, failed
+
+    def _send(self, rows: list[dict]) -> tuple[int, list[dict]]:
+        table_id, inserted, failed = self._table(), 0, []
+        for i in range(0, len(rows), BQ_MAX_ROWS_PER_INSERT):
+            pending = rows[i:i + BQ_MAX_ROWS_PER_INSERT]
+            for attempt in range(1, self.max_attempts + 1):
+                if attempt > 1:
+                    ceiling = min(MAX_BACKOFF_S, MIN_BACKOFF_S * 2 ** (attempt - 2))
+                    self.sleep(self._rng.uniform(0, ceiling))
+                    self._count("retried", len(pending))
+                self._count("requests", 1)
+                try:
+                    errors = self.client.insert_rows_json(
+                        table_id, pending,
+                        row_ids=[self.row_id(row) for row in pending] if self.row_id else None)
+                except Exception as exc:
+                    logging.warning(f"BigQuery insert attempt {attempt} failed: {exc}")
+                    continue
+                retry = []
+                for error in errors or ():
+                    row = pending[error["index"]]
+                    if _reasons(error) & PERMANENT_REASONS:
+                        # Neither a retry nor a redelivery would change the answer
+                        logging.error(f"BigQuery rejected row {row.get('sensor_id')}: {error}")
+                        self._count("invalid", 1)
+                    else:
+                        retry.append(row)
+                inserted += len(pending) - len(errors or ())
+                pending = retry
+                if not pending:
+                    break
+            if pending:
+                logging.error(f"{len(pending)} rows still failing after {self.max_attempts} attempts")
+                failed += pending
+        self._count("inserted", inserted)
+        return inserted, failed
+
+    def _count(self, key: str, n: int):
+        with self._lock:
+            self._counters[key] += n
+
+    # ── Spill file ────────────────────────────────────────────────────────────
+    def _spill(self, rows: list[dict]):
+        if not self.spill_path:
+            logging.error(f"BigQuery: {len(rows)} rows dropped (no BQ_SPILL_PATH)")
+            self._count("dropped", len(rows))
+            return
+        try:
+            with open(self.spill_path, 'a', encoding='utf-8') as f:
+                for row in rows:
+                    f.write(json.dumps(row, default=str) + "\n")
+        except OSError as exc:
+            logging.error(f"BigQuery: {len(rows)} rows dropped, spill file not writable: {exc}")
+            self._count("dropped", len(rows))
+            return
+        logging.warning(f"BigQuery: {len(rows)} rows spilled to {self.spill_path}")
+        self._count("spilled", len(rows))
+
+    def _replay(self) -> int:
+        """Re-send spilled rows once BigQuery is taking writes again. Caller holds _send_lock."""
+        if not self.spill_path:
+            return 0
+        replaying = self.spill_path + ".replay"
+        # A .replay file left by an interrupted replay is picked up first
+        if not os.path.exists(replaying):
+            if not os.path.exists(self.spill_path):
+                return 0
+            os.replace(self.spill_path, replaying)
+        with open(replaying, encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        inserted, failed = self._send(rows)
+        if failed:
+            self._spill(failed)
+        os.remove(replaying)
+        self._count("replayed", inserted)
+        logging.info(f"BigQuery: replayed {inserted}/{len(rows)} spilled rows")
+        return inserted
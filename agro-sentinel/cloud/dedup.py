@@ -0,0 +1,94 @@
+"""
+Duplicate suppression on the edge's per-sensor sequence numbers.
+
+Pub/Sub delivers at least once, and the edge re-publishes a row when it
+crashes between publish and mark_synced, so the same reading can arrive more
+than once. Every edge reading carries `seq` (1, 2, 3… per sensor) and
+`seq_epoch` (drawn when the gateway's buffer first saw the sensor). Per sensor
+this module keeps the highest seq accepted and a bitmap of the DEDUP_WINDOW
+sequence numbers below it — 512 bytes for the default window — so a check is
+a shift and a mask, with no BigQuery lookup:
+
+    seq > high-water mark              new; the window slides up
+    within the window, bit clear       new (late, or redelivered after forget())
+    within the window, bit set         duplicate
+    below the window                   duplicate: the edge publishes each sensor
+                                       in order, so a reading this far behind
+                                       is a backlog replay
+
+A reading under a different epoch restarts the sensor's window (a replaced or
+wiped gateway starts again at seq 1). Readings without a seq (older gateways,
+direct HTTP posts) always pass.
+
+State is per process. Across instances, BigQuery's insertId (see
+main._insert_id) drops the duplicates that arrive within its own best-effort
+window of about a minute.
+"""
+import os
+import threading
+
+DEDUP_WINDOW = int(os.environ.get('DEDUP_WINDOW', 4096))
+
+
+class _SensorWindow:
+    __slots__ = ("epoch", "high", "bits")
+
+    def __init__(self, epoch, seq: int):
+        self.epoch = epoch
+        self.high  = seq
+        self.bits  = 1            # bit i set: seq high - i already accepted
+
+
+class Deduplicator:
+    """Per-sensor high-water mark and recent window. Safe to share between threads."""
+
+    def __init__(self, window: int = DEDUP_WINDOW):
+        self.window = window
+        self._mask  = (1 << window) - 1
+        self._lock  = threading.Lock()
+        self._sensors: dict[str, _SensorWindow] = {}
+        self._counters = dict.fromkeys(("checked", "duplicates", "behind_window", "epochs"), 0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters, sensors=len(self._sensors))
+
+    def accept(self, sensor_id: str, epoch, seq: int | None) -> bool:
+        """Record the reading and return True, or False if it was already accepted."""
+        if seq is None:
+            return True
+        with self._lock:
+            self._counters["checked"] += 1
+            window = self._sensors.get(sensor_id)
+            if window is None or window.epoch != epoch:
+                if window is not None:
+                    self._counters["epochs"] += 1
+                self._sensors[sensor_id] = _SensorWindow(epoch, seq)
+                return True
+            if seq > window.high:
+                window.bits = ((window.bits << (seq - window.high)) | 1) & self._mask
+                window.high = seq
+                return True
+            behind = window.high - seq
+            if behind >= self.window:
+                self._counters["behind_window"] += 1
+                self._counters["duplicates"] += 1
+                return False
+            bit = 1 << behind
+            if window.bits & bit:
+                self._counters["duplicates"] += 1
+                return False
+            window.bits |= bit
+            return True
+
+    def forget(self, sensor_id: str, epoch, seq: int | None):
+        """
+        Undo accept() for a reading that was not stored after all, so its
+        redelivery is let through.
+        """
+        if seq is None:
+            return
+        with self._lock:
+            window = self._sensors.get(sensor_id)
+            if window is not None and window.epoch == epoch and 0 <= window.high - seq < self.window:
+                window.bits &= ~(1 << (window.high - seq))
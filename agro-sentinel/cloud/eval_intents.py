@@ -0,0 +1,88 @@
+"""
+Offline evaluation of the intent fast path (intents.py) on intents_eval.jsonl.
+
+    python eval_intents.py
+    python eval_intents.py --min-confidence 0.6 --quiet
+
+Each line of the set is a question with the intent it should get, or null if
+it must fall back to Gemini, plus optionally the metrics, stats and days the
+match must fill. Reported:
+
+    coverage     questions with an expected intent that the fast path answers
+    precision    fast-path answers whose intent and slots are all right
+    wrong        answered but with the wrong intent or slots, including
+                 questions that should have fallen back — the costly error
+
+Exit status 1 if anything is wrong, so the set can gate vocabulary changes.
+"""
+import argparse
+import json
+import os
+import sys
+
+import intents
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load(path: str) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def check(case: dict, intent: intents.Intent | None) -> str | None:
+    """None if the match is right, else what is wrong with it."""
+    expected = case.get("intent")
+    if intent is None:
+        return "fallback" if expected else None
+    if intent.name != expected:
+        return f"intent {intent.name}, expected {expected}"
+    for slot in ("metrics", "stats"):
+        if slot in case and sorted(getattr(intent, slot)) != sorted(case[slot]):
+            return f"{slot} {list(getattr(intent, slot))}, expected {case[slot]}"
+    if "days" in case and intent.days != case["days"]:
+        return f"days {intent.days}, expected {case['days']}"
+    return None
+
+
+def evaluate(cases: list[dict], min_confidence: float = intents.INTENT_MIN_CONFIDENCE) -> dict:
+    results = {"cases": len(cases), "expected": 0, "answered": 0, "correct": 0,
+               "fallbacks": [], "wrong": []}
+    for case in cases:
+        intent = intents.match(case["query"], min_confidence=min_confidence)
+        problem = check(case, intent)
+        results["expected"] += bool(case.get("intent"))
+        if intent is not None:
+            results["answered"] += 1
+            results["correct"] += problem is None
+        if problem == "fallback":
+            results["fallbacks"].append(case["query"])
+        elif problem is not None:
+            results["wrong"].append((case["query"], problem))
+    results["coverage"]  = results["correct"] / results["expected"] if results["expected"] else 0.0
+    results["precision"] = results["correct"] / results["answered"] if results["answered"] else 0.0
+    return results
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--set", default=os.path.join(HERE, "intents_eval.jsonl"))
+    parser.add_argument("--min-confidence", type=float, default=intents.INTENT_MIN_CONFIDENCE)
+    parser.add_argument("--quiet", action="store_true", help="summary only")
+    args = parser.parse_args()
+
+    r = evaluate(load(args.set), args.min_confidence)
+    print(f"{r['cases']} questions, {r['expected']} with an intent, {r['answered']} answered "
+          f"by the fast path (min confidence {args.min_confidence})")
+    print(f"coverage  {r['coverage']:6.1%}")
+    print(f"precision {r['precision']:6.1%}")
+    if not args.quiet:
+        for query in r["fallbacks"]:
+            print(f"  fallback  {query}")
+        for query, problem in r["wrong"]:
+            print(f"  WRONG     {query}  ({problem})")
+    sys.exit(1 if r["wrong"] else 0)
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,128 @@
+"""
+Event-time bookkeeping for the real-time state documents.
+
+A gateway that reconnects drains its backlog oldest first, and Pub/Sub may
+deliver out of order, so arrival order says little about which reading is the
+newest. Per sensor this keeps the latest event time ingested: a reading older
+than that is late and only goes to BigQuery, never to greenhouses/<sensor_id>,
+alarms or the dashboard.
+
+The event time is the reading's own timestamp. One that cannot be parsed, or
+that is more than EVENT_MAX_CLOCK_SKEW_S in the future (a gateway with a wrong
+clock would otherwise freeze the sensor's state until that time comes round),
+is replaced by the time the reading was received.
+
+Lag (received − event time) is kept per sensor as a histogram over
+LAG_BUCKETS_S and logged as JSON every EVENT_LAG_LOG_S, one line that a
+log-based metric can pick up. Like the other ingest caches this is per
+process: a cold instance takes the first reading it sees for a sensor as the
+latest.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+EVENT_MAX_CLOCK_SKEW_S = float(os.environ.get('EVENT_MAX_CLOCK_SKEW_S', 300))
+EVENT_LAG_LOG_S        = float(os.environ.get('EVENT_LAG_LOG_S', 300))
+# Histogram upper bounds: 5 s … 1 day; anything later lands in the overflow bucket
+LAG_BUCKETS_S = (5, 30, 60, 300, 900, 3600, 6 * 3600, 86400)
+
+
+class _SensorLag:
+    __slots__ = ("latest", "counts", "late", "max_s")
+
+    def __init__(self):
+        self.latest = None
+        self.counts = [0] * (len(LAG_BUCKETS_S) + 1)
+        self.late   = 0
+        self.max_s  = 0.0
+
+    def quantile(self, q: float) -> float | None:
+        """Upper bound of the bucket holding the q-quantile; None past the last bound."""
+        rank, seen = q * sum(self.counts), 0
+        for bound, count in zip(LAG_BUCKETS_S, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+
+class EventTimeTracker:
+    """Latest event time and lag histogram per sensor. Safe to share between threads."""
+
+    def __init__(self, max_skew_s: float = EVENT_MAX_CLOCK_SKEW_S, log_every_s: float = EVENT_LAG_LOG_S,
+                 now=lambda: datetime.now(timezone.utc), clock=time.monotonic):
+        self.max_skew    = timedelta(seconds=max_skew_s)
+        self.log_every_s = log_every_s
+        self.now         = now
+        self.clock       = clock
+        self._lock       = threading.Lock()
+        self._sensors: dict[str, _SensorLag] = {}
+        self._logged_at  = clock()
+        self._counters = dict.fromkeys(("readings", "late", "untimed", "future"), 0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters, sensors=len(self._sensors))
+
+    def observe(self, sensor_id: str, event_at: datetime | None) -> tuple[datetime, bool]:
+        """
+        Record one reading. Returns (its event time, True if it is not older
+        than the latest one seen for the sensor). Ties count as the latest, so
+        the reading that arrived later wins.
+        """
+        received = self.now()
+        with self._lock:
+            self._counters["readings"] += 1
+            if event_at is None:
+                self._counters["untimed"] += 1
+                event_at = received
+            elif event_at > received + self.max_skew:
+                self._counters["future"] += 1
+                event_at = received
+            sensor = self._sensors.get(sensor_id)
+            if sensor is None:
+                sensor = self._sensors[sensor_id] = _SensorLag()
+            lag = max(0.0, (received - event_at).total_seconds())
+            sensor.counts[_bucket(lag)] += 1
+            sensor.max_s = max(sensor.max_s, lag)
+            if sensor.latest is not None and event_at < sensor.latest:
+                sensor.late += 1
+                self._counters["late"] += 1
+                return event_at, False
+            sensor.latest = event_at
+            return event_at, True
+
+    def latest(self, sensor_id: str) -> datetime | None:
+        with self._lock:
+            sensor = self._sensors.get(sensor_id)
+            return sensor.latest if sensor else None
+
+    def lag_summary(self) -> dict:
+        """Per sensor: readings, late ones, approximate p50/p95 and max lag in seconds, histogram."""
+        with self._lock:
+            return {sensor_id: {"readings": sum(s.counts), "late": s.late,
+                                "p50_s": s.quantile(0.5), "p95_s": s.quantile(0.95),
+                                "max_s": round(s.max_s, 1),
+                                "buckets": dict(zip([*map(str, LAG_BUCKETS_S), "inf"], s.counts))}
+                    for sensor_id, s in sorted(self._sensors.items())}
+
+    def maybe_log(self) -> bool:
+        """Log the lag summary if EVENT_LAG_LOG_S has passed since the last time."""
+        now = self.clock()
+        with self._lock:
+            if now - self._logged_at < self.log_every_s:
+                return False
+            self._logged_at = now
+        logging.info(f"Event-time lag: {json.dumps(self.lag_summary())}")
+        return True
+
+
+def _bucket(lag_s: float) -> int:
+    for i, bound in enumerate(LAG_BUCKETS_S):
+        if lag_s <= bound:
+            return i
+    return len(LAG_BUCKETS_S)
@@ -0,0 +1,58 @@
+"""
+Firebase ID token check and CORS headers for the HTTP functions (ask-ai,
+acknowledge-alarm).
+
+The functions are reachable by allUsers at the IAM level so browsers can call
+them; this is where callers are authenticated (VULN-03). firebase_admin is
+imported on first use.
+"""
+import logging
+import os
+from importlib.util import find_spec
+
+REQUIRE_AUTH   = os.environ.get('REQUIRE_AUTH', 'true').lower() == 'true'
+ALLOWED_ORIGIN = os.environ.get('ALLOWED_ORIGIN', '')   # must be set in Terraform env vars
+
+_HAS_FIREBASE_ADMIN = find_spec('firebase_admin') is not None
+_firebase_app = None
+
+
+def _get_firebase_app():
+    global _firebase_app
+    if _firebase_app is None and _HAS_FIREBASE_ADMIN:
+        import firebase_admin                                        # type: ignore[import]
+        _firebase_app = firebase_admin.initialize_app()
+    return _firebase_app
+
+
+def verify_request(request) -> dict | None:
+    """
+    The caller's decoded token claims, {} when REQUIRE_AUTH is off, or None if
+    the request must be rejected.
+    """
+    if not REQUIRE_AUTH:
+        return {}
+    if not _HAS_FIREBASE_ADMIN:
+        logging.error("firebase-admin not installed; all requests rejected")
+        return None
+    auth_header = request.headers.get('Authorization', '')
+    if not auth_header.startswith('Bearer '):
+        return None
+    try:
+        from firebase_admin import auth as firebase_auth             # type: ignore[import]
+        _get_firebase_app()
+        return firebase_auth.verify_id_token(auth_header[7:])
+    except Exception as exc:
+        logging.warning(f"Token verification failed: {exc}")
+        return None
+
+
+def cors_headers() -> dict:
+    # Never reflect the request Origin — use only the explicitly configured value
+    origin = ALLOWED_ORIGIN if ALLOWED_ORIGIN else 'null'
+    return {
+        'Access-Control-Allow-Origin': origin,
+        'Access-Control-Allow-Methods': 'POST, OPTIONS',
+        'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+        'Access-Control-Max-Age': '3600',
+    }
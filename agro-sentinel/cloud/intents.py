@@ -0,0 +1,341 @@
+"""
+Deterministic fast path for ask_ai's most common questions.
+
+Most traffic is a handful of questions — how are the greenhouses now, the
+max/min/mean of a metric over a period, how many readings crossed the default
+CRITICAL thresholds, which sensors have a low battery or a weak signal — and
+each one otherwise costs two Gemini round trips. match() recognises them in
+Spanish or English from a small vocabulary, fills a fixed SQL template (only
+known column names and integer day counts are ever interpolated, plus the
+location_id ask_ai has already checked against the registry), and
+format_answer() writes the answer from a template, so the request costs one
+BigQuery job.
+
+Matching is phrase-based on the normalized question (query_cache.normalize):
+vocabulary phrases fill slots (metric, stat, period, topic), common function
+words are ignored, and anything else is an unknown word. Confidence is the
+share of words explained; below INTENT_MIN_CONFIDENCE, or with words that ask
+for something the templates cannot express (per day, when, compare, between…),
+match() returns None and ask_ai falls back to Gemini.
+
+Coverage and precision are measured offline on intents_eval.jsonl:
+
+    python eval_intents.py                 # summary and every miss
+    python eval_intents.py --min-confidence 0.6
+"""
+import os
+import re
+from datetime import datetime
+from typing import NamedTuple
+
+import rules
+from query_cache import normalize
+
+INTENT_MIN_CONFIDENCE = float(os.environ.get('INTENT_MIN_CONFIDENCE', 0.75))
+DEFAULT_WINDOW_DAYS   = 365       # same period the Gemini prompt defaults to
+LATEST_WINDOW_DAYS    = 1         # current status / health: last reading within a day
+TABLE                 = "agro_sentinel_data.sensor_logs"
+
+# BigQuery column → (Spanish label, English label, unit, decimals)
+METRICS = {
+    "temperature":   ("temperatura", "temperature", "°C", 1),
+    "humidity":      ("humedad relativa", "relative humidity", "%", 1),
+    "soil_moisture": ("humedad del suelo", "soil moisture", "%", 1),
+    "co2_ppm":       ("CO2", "CO2", "ppm", 0),
+    "vpd_kpa":       ("VPD", "VPD", "kPa", 2),
+    "par_umol":      ("radiación PAR", "PAR radiation", "µmol/m²/s", 0),
+    "soil_ec":       ("conductividad del suelo", "soil EC", "mS/cm", 2),
+    "soil_temp_c":   ("temperatura del suelo", "soil temperature", "°C", 1),
+    "dew_point_c":   ("punto de rocío", "dew point", "°C", 1),
+    "battery_level": ("batería", "battery", "%", 0),
+}
+STATUS_METRICS = ("temperature", "humidity", "vpd_kpa", "co2_ppm", "soil_moisture")
+ALARM_METRICS  = tuple(key for key in rules.DEFAULT_RULES["critical"]
+                       if key in METRICS and key != "battery_level")
+# stat → (Spanish feminine, Spanish masculine, English)
+STATS = {"max": ("máxima", "máximo", "maximum"), "min": ("mínima", "mínimo", "minimum"),
+         "avg": ("media", "medio", "average")}
+_MASCULINE = {"co2_ppm", "vpd_kpa", "dew_point_c"}
+
+
+class Intent(NamedTuple):
+    name: str                   # status | aggregate | alarms | health
+    sql: str
+    metrics: tuple[str, ...]
+    stats: tuple[str, ...]
+    days: int
+    location_id: str | None
+    lang: str                   # es | en
+    confidence: float
+
+
+# ── Vocabulary ────────────────────────────────────────────────────────────────
+# (pattern, slot, value); earlier patterns win, so longer phrases
+# come before the words they contain. A callable value gets the match.
+_VOCAB = [
+    # metrics
+    (r"humedad (?:del |de )?suelo|soil moisture|soil humidity", "metric", "soil_moisture"),
+    (r"temperatura (?:del |de )?suelo|soil temp(?:erature)?", "metric", "soil_temp_c"),
+    (r"punto de rocio|dew ?point", "metric", "dew_point_c"),
+    (r"conductividad(?: electrica)?(?: del suelo)?|salinidad|soil ec|\bec\b", "metric", "soil_ec"),
+    (r"deficit de presion de vapor|vapou?r pressure deficit|\bvpd\b", "metric", "vpd_kpa"),
+    (r"dioxido de carbono|carbon dioxide|\bco2\b", "metric", "co2_ppm"),
+    (r"radiacion(?: par)?|\bpar\b|\bluz\b|\blight\b", "metric", "par_umol"),
+    (r"humedad(?: relativa)?|(?:relative )?humidity|\brh\b", "metric", "humidity"),
+    (r"temperaturas?|temperatures?|\btemp\b", "metric", "temperature"),
+    # topics
+    (r"(?:bater[ia]+s?|batter(?:y|ies)) (?:baja|bajas|low)|low batter(?:y|ies)|poca bateria|"
+     r"(?:senal|signal) (?:debil|weak|baja)|weak signal|mala senal|poor signal", "topic", "health"),
+    (r"(?:nivel(?:es)? de )?bater[ia]+s?|batter(?:y|ies)|\bsenal(?:es)?\b|signal|\brssi\b|\bwifi\b|cobertura",
+     "topic", "health"),
+    (r"alarmas?|alertas?|alarms?|alerts?|(?:umbral(?:es)? )?critic[oa]s?|critical(?: thresholds?)?|"
+     r"fuera de rango|out of range", "topic", "alarms"),
+    (r"estado actual|current (?:status|state|conditions)|ultimas? lecturas?|latest readings?|"
+     r"last readings?|como (?:esta|estan|va|van)|how (?:is|are)|"
+     r"\bestado\b|\bstatus\b|\bsituacion\b|\bcondiciones\b|\bconditions\b|\bahora(?: mismo)?\b|\bnow\b|"
+     r"\bactual(?:es|mente)?\b|\bcurrent(?:ly)?\b|\blatest\b|en este momento|right now",
+     "topic", "status"),
+    # stats
+    (r"maxim[oa]s?|\bmax\b|maximum|highest|mas alt[oa]s?|\bpico\b|\bpeak\b", "stat", "max"),
+    (r"minim[oa]s?|\bmin\b|minimum|lowest|mas baj[oa]s?", "stat", "min"),
+    (r"promedios?|\bmedi[oa]\b|average|\bavg\b|\bmean\b", "stat", "avg"),
+    (r"cuant[oa]s(?: veces)?|how many|how often|numero de|number of|\bcount\b", "count", True),
+    # periods
+    (r"(?:(?:en )?(?:los )?ultimos|(?:in |over |for )?(?:the )?(?:last|past)) (\d+) (?:dias|days)",
+     "days", lambda m: int(m.group(1))),
+    (r"\b(\d+) (?:dias|days)\b", "days", lambda m: int(m.group(1))),
+    (r"(?:(?:en )?las ultimas|(?:in |over |for )?(?:the )?(?:last|past)) 24 (?:horas|hours)", "days", 1),
+    (r"\bhoy\b|\btoday\b|\bhoy en dia\b", "days", 1),
+    (r"(?:(?:en )?(?:esta|la ultima)|(?:this|last|past|the last)) semana|(?:this|last|past|the last) week|"
+     r"\bsemana\b|\bweek\b|\bsemanal\b|\bweekly\b", "days", 7),
+    (r"(?:(?:en )?(?:este|el ultimo)|(?:this|last|past|the last)) mes|(?:this|last|past|the last) month|"
+     r"\bmes\b|\bmonth\b|\bmensual\b|\bmonthly\b", "days", 30),
+    (r"(?:(?:en )?(?:este|el ultimo)) ano|(?:this|last|past|the last) year|\bano\b|\byear\b", "days", 365),
+]
+_VOCAB = [(re.compile(pattern), slot, value) for pattern, slot, value in _VOCAB]
+
+# Ask for something the templates cannot express: a breakdown, a time of
+# occurrence, a comparison, a calendar period
+_UNSUPPORTED = re.compile(
+    r"\b(?:por|per|each|cada|by) (?:dia|day|hora|hour|semana|week|mes|month|sensor|invernadero|greenhouse|finca|farm)|"
+    r"\b(?:diari[oa]|daily|horari[oa]|hourly|cuando|when|donde|where|"
+    r"compar\w*|versus|vs|tendencia|trend|grafic\w*|chart|plot|entre|between|ayer|yesterday|antes|before|"
+    r"despues|after|desde|since|hasta|until|prediccion|forecast|por que|why|recomienda\w*|recommend\w*|"
+    r"deberia|should|no)\b")
+# Which sensor/greenhouse: only the health answer lists sensors
+_WHICH = re.compile(r"\b(?:which|que|cual(?:es)?) (?:invernaderos?|sensor(?:es)?|fincas?|greenhouses?|sensors?|farms?)\b")
+
+_SPANISH = frozenset(
+    "el la los las de del en que cual cuales es fue son fueron hay hubo dime muestra muestrame dame me "
+    "por favor este esta estos estas para con sin y o un una unos unas al lo se sus su cuanto cuanta "
+    "registrada registrado valor valores nivel niveles sensor sensores invernadero invernaderos finca "
+    "fincas lecturas lectura todos todas datos tiene tienen estan tengo".split())
+_ENGLISH = frozenset(
+    "the a an of in on at for is was are were what whats tell show give me please this these that those "
+    "and or to with without any all my our value values level levels sensor sensors greenhouse "
+    "greenhouses farm farms reading readings recorded data there been has have do does".split())
+_SPANISH_HINTS = ("temperatura", "humedad", "alarma", "alerta", "bateria", "senal", "estado", "hoy",
+                  "semana", "mes", "maxim", "minim", "promedio", "media", "cuant", "ultim", "como")
+
+
+# ── Matching ──────────────────────────────────────────────────────────────────
+def _scan(text: str) -> tuple[dict, int, list[str]]:
+    """(slot → values in order, words explained by vocabulary, unknown words)."""
+    slots, explained = {}, 0
+    for pattern, slot, value in _VOCAB:
+        for m in pattern.finditer(text):
+            slots.setdefault(slot, []).append(value(m) if callable(value) else value)
+            explained += len(m.group().split())
+        text = pattern.sub(" ", text)
+    words = text.split()
+    explained += sum(1 for w in words if w in _SPANISH or w in _ENGLISH)
+    return slots, explained, [w for w in words if w not in _SPANISH and w not in _ENGLISH]
+
+
+def _language(text: str) -> str:
+    words = text.split()
+    es = sum(w in _SPANISH or w.startswith(_SPANISH_HINTS) for w in words)
+    en = sum(w in _ENGLISH for w in words)
+    return "en" if en > es else "es"
+
+
+def _unique(values) -> tuple:
+    return tuple(dict.fromkeys(values))
+
+
+def match(query: str, location_id: str | None = None,
+          min_confidence: float = INTENT_MIN_CONFIDENCE) -> Intent | None:
+    """The question's intent with its SQL, or None to fall back to Gemini."""
+    text = normalize(query)
+    if not text or _UNSUPPORTED.search(text):
+        return None
+    slots, explained, unknown = _scan(text)
+    confidence = explained / (explained + len(unknown)) if explained else 0.0
+    if confidence < min_confidence:
+        return None
+
+    metrics = _unique(slots.get("metric", ()))
+    stats   = _unique(slots.get("stat", ()))
+    topics  = _unique(slots.get("topic", ()))
+    if "health" in topics:      # "estado de las baterías" is a health question
+        topics = tuple(t for t in topics if t != "status")
+    periods = _unique(slots.get("days", ()))
+    if len(topics) > 1 or len(periods) > 1:
+        return None
+    topic = topics[0] if topics else None
+    days  = periods[0] if periods else None
+    if _WHICH.search(text) and topic != "health":
+        return None
+
+    if topic == "health" and not stats and not days:
+        name, metrics, days = "health", (), LATEST_WINDOW_DAYS
+    elif topic == "alarms" and not stats:
+        if any(m not in ALARM_METRICS for m in metrics):
+            return None
+        name, days = "alarms", days or DEFAULT_WINDOW_DAYS
+        metrics = metrics or ALARM_METRICS
+    elif topic == "status" and not stats and not days:
+        name, days = "status", LATEST_WINDOW_DAYS
+        metrics = metrics or STATUS_METRICS
+    elif stats and metrics and topic is None and not slots.get("count"):
+        name, days = "aggregate", days or DEFAULT_WINDOW_DAYS
+    elif topic == "health" and stats and not metrics:
+        # "batería mínima esta semana" is an aggregate of battery_level
+        name, metrics, days = "aggregate", ("battery_level",), days or DEFAULT_WINDOW_DAYS
+    else:
+        return None
+
+    intent = Intent(name, "", metrics, stats, days, location_id, _language(text), round(confidence, 2))
+    return intent._replace(sql=_SQL[name](intent))
+
+
+# ── SQL templates ─────────────────────────────────────────────────────────────
+def _where(intent: Intent) -> str:
+    where = f"WHERE timestamp > TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL {int(intent.days)} DAY)"
+    return where + (f" AND sensor_id = '{intent.location_id}'" if intent.location_id else "")
+
+
+def _aggregate_sql(intent: Intent) -> str:
+    # ROUND/MIN/MAX/AVG and COUNT(*) over one window: rollups.rewrite() serves it from the rollups
+    cols = [f"ROUND({stat.upper()}({m}), {METRICS[m][3]}) AS {stat}_{m}"
+            for m in intent.metrics for stat in intent.stats]
+    return f"SELECT {', '.join(cols)}, COUNT(*) AS readings FROM `{TABLE}` {_where(intent)} LIMIT 1"
+
+
+def _alarms_sql(intent: Intent) -> str:
+    cols = [f"COUNTIF({rules.sql_condition(m)}) AS {m}" for m in intent.metrics]
+    return f"SELECT {', '.join(cols)}, COUNT(*) AS readings FROM `{TABLE}` {_where(intent)} LIMIT 1"
+
+
+def _latest_sql(intent: Intent, columns) -> str:
+    # Last reading per sensor within the window
+    return (f"SELECT sensor_id, timestamp, {', '.join(columns)} FROM `{TABLE}` {_where(intent)} "
+            f"QUALIFY ROW_NUMBER() OVER (PARTITION BY sensor_id ORDER BY timestamp DESC) = 1 "
+            f"ORDER BY sensor_id LIMIT 20")
+
+
+_SQL = {
+    "aggregate": _aggregate_sql,
+    "alarms":    _alarms_sql,
+    "status":    lambda intent: _latest_sql(intent, intent.metrics),
+    "health":    lambda intent: _latest_sql(intent, ("battery_level", "rssi_dbm")),
+}
+
+
+# ── Answers ───────────────────────────────────────────────────────────────────
+def _label(metric: str, lang: str) -> str:
+    return METRICS[metric][0 if lang == "es" else 1]
+
+
+def _value(metric: str, value) -> str:
+    decimals, unit = METRICS[metric][3], METRICS[metric][2]
+    return f"{value:.{decimals}f} {unit}" if isinstance(value, (int, float)) else str(value)
+
+
+def _period(intent: Intent, days: int) -> str:
+    where = (f" en {intent.location_id}" if intent.lang == "es" else f" at {intent.location_id}") \
+        if intent.location_id else ""
+    if intent.lang == "es":
+        return ("en las últimas 24 horas" if days == 1 else f"en los últimos {days} días") + where
+    return ("in the last 24 hours" if days == 1 else f"in the last {days} days") + where
+
+
+def _when(timestamp) -> str:
+    return f"{timestamp:%Y-%m-%d %H:%M} UTC" if isinstance(timestamp, datetime) else str(timestamp)
+
+
+def format_answer(intent: Intent, rows: list[dict], narrowed_days: int | None = None) -> str:
+    """The answer to the question, in its language, from the query's rows."""
+    es     = intent.lang == "es"
+    period = _period(intent, narrowed_days or intent.days)
+    if not rows or (intent.name in ("aggregate", "alarms") and not rows[0].get("readings")):
+        return f"No hay datos {period}." if es else f"No data was found {period}."
+    row = rows[0]
+
+    if intent.name == "aggregate":
+        parts = []
+        for m in intent.metrics:
+            label = _label(m, intent.lang)
+            for s in intent.stats:
+                value = row.get(f"{s}_{m}")
+                shown = f"**{_value(m, value)}**" if value is not None else ("sin datos" if es else "no data")
+                parts.append(f"{label} {STATS[s][1 if m in _MASCULINE else 0]} {shown}" if es else
+                             f"{STATS[s][2]} {label} {shown}")
+        text = "; ".join(parts)
+        return (f"{text[0].upper()}{text[1:]} {period} ({row['readings']} lecturas)." if es else
+                f"{text[0].upper()}{text[1:]} {period} ({row['readings']} readings).")
+
+    if intent.name == "alarms":
+        counts = [(m, row.get(m) or 0) for m in intent.metrics]
+        total  = sum(n for _, n in counts)
+        if total == 0:
+            return (f"No hubo lecturas fuera de los umbrales críticos {period}." if es else
+                    f"No readings crossed the critical thresholds {period}.")
+        detail = ", ".join(f"{_label(m, intent.lang)} {n}" for m, n in counts if n)
+        return (f"{period[0].upper()}{period[1:]} hubo **{total}** lecturas fuera de los umbrales críticos "
+                f"(de {row['readings']}): {detail}." if es else
+                f"{period[0].upper()}{period[1:]}, **{total}** readings crossed the critical thresholds "
+                f"(out of {row['readings']}): {detail}.")
+
+    if intent.name == "status":
+        lines = []
+        for r in rows:
+            values = ", ".join(f"{_label(m, intent.lang)} {_value(m, r[m])}"
+                               for m in intent.metrics if r.get(m) is not None)
+            lines.append(f"**{r['sensor_id']}** ({_when(r['timestamp'])}): {values or '—'}")
+        return ("Últimas lecturas:\n" if es else "Latest readings:\n") + "\n".join(lines)
+
+    # health
+    battery_min = rules.DEFAULT_RULES["critical"]["battery_level"]["min"]
+    rssi_min    = rules.DEFAULT_RULES["critical"]["rssi_dbm"]["min"]
+    low  = [f"{r['sensor_id']} ({r['battery_level']} %)" for r in rows
+            if r.get("battery_level") is not None and r["battery_level"] < battery_min]
+    weak = [f"{r['sensor_id']} ({r['rssi_dbm']} dBm)" for r in rows
+            if r.get("rssi_dbm") is not None and r["rssi_dbm"] < rssi_min]
+    if not low and not weak:
+        return (f"Batería y señal correctas en todos los sensores con lecturas recientes ({len(rows)})." if es else
+                f"Battery and signal are fine on every sensor reporting recently ({len(rows)}).")
+    parts = []
+    if low:
+        parts.append(("Batería baja: " if es else "Low battery: ") + ", ".join(low) + ".")
+    if weak:
+        parts.append(("Señal débil: " if es else "Weak signal: ") + ", ".join(weak) + ".")
+    return " ".join(parts)
+
+
+def example_rows(intent: Intent) -> list[dict]:
+    """Plausible rows for the intent's query, for the MOCK_DB path."""
+    if intent.name == "aggregate":
+        sample = {"max": 34.2, "min": 12.1, "avg": 22.7}
+        return [{**{f"{s}_{m}": sample[s] for m in intent.metrics for s in intent.stats}, "readings": 1440}]
+    if intent.name == "alarms":
+        return [{**{m: 0 for m in intent.metrics}, intent.metrics[0]: 3, "readings": 1440}]
+    now = datetime(2026, 10, 1, 12, 0)
+    if intent.name == "status":
+        sample = {"temperature": 22.4, "humidity": 71.0, "vpd_kpa": 0.82, "co2_ppm": 640,
+                  "soil_moisture": 58.0, "par_umol": 420, "soil_ec": 1.2, "soil_temp_c": 19.5,
+                  "dew_point_c": 16.9, "battery_level": 87}
+        return [{"sensor_id": intent.location_id or "GH-AMB-01", "timestamp": now,
+                 **{m: sample[m] for m in intent.metrics}}]
+    return [{"sensor_id": intent.location_id or "GH-AMB-01", "timestamp": now,
+             "battery_level": 87, "rssi_dbm": -61}]
@@ -0,0 +1,108 @@
+"""
+Last known value of every field, per sensor, for partial readings.
+
+With edge reduction on (edge/src/reduction.py), a record carries only the
+fields that moved: a deadband field that held still, or a window that has not
+closed, is simply absent. Evaluated as-is, such a record would read
+as "temperature unknown": VPD and dew point come out null, rules on the missing
+fields stop firing, and the state writer overwrites the dashboard values with
+None.
+
+LastKnown fills an absent field with the newest value the sensor sent for it,
+as long as that value is at most CARRY_FORWARD_MAX_AGE_S older than the reading,
+so a channel that really went silent still shows up as missing. A field sent as
+null is a measurement that failed and stays null; main.py only merges readings
+that carry a reduction tag at all. The first
+reading of a sensor in this process is filled from its Firestore state
+document, so a cold start does not null everything either.
+
+Filled fields are listed under CARRIED_KEY in the merged reading. Derived
+values and rules use them; the BigQuery row stores only what was measured.
+"""
+import logging
+import os
+import threading
+from datetime import datetime
+
+CARRY_FORWARD_MAX_AGE_S = float(os.environ.get('CARRY_FORWARD_MAX_AGE_S', 1800))
+CARRIED_KEY             = "_carried"
+
+
+def firestore_loader(db, fields: dict[str, str], collection: str = "greenhouses"):
+    """
+    Seed values from a sensor's state document. `fields` maps reading keys to
+    state document keys (temperature_c -> temperature).
+    """
+    def load(sensor_id: str) -> tuple[dict, float | None]:
+        snapshot = db.collection(collection).document(sensor_id).get()
+        doc = snapshot.to_dict() if snapshot.exists else None
+        if not isinstance(doc, dict):
+            return {}, None
+        at = doc.get("last_update")
+        at = at.timestamp() if isinstance(at, datetime) else None
+        return {key: doc[name] for key, name in fields.items() if doc.get(name) is not None}, at
+    return load
+
+
+class LastKnown:
+    def __init__(self, fields, loader=None, max_age_s: float = CARRY_FORWARD_MAX_AGE_S):
+        self.fields    = tuple(fields)
+        self.loader    = loader
+        self.max_age_s = max_age_s
+        self._lock     = threading.Lock()
+        self._values: dict[str, dict[str, tuple[object, float]]] = {}   # sensor -> key -> (value, at)
+        self._counters = dict.fromkeys(("readings", "partial", "fields_carried", "fields_stale",
+                                        "seeded", "seed_errors"), 0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters, sensors=len(self._values))
+
+    def _seed(self, sensor_id: str) -> dict:
+        values = {}
+        if self.loader is not None:
+            try:
+                seeded, at = self.loader(sensor_id)
+            except Exception as exc:
+                logging.warning(f"Could not load last known values for {sensor_id}: {exc}")
+                self._counters["seed_errors"] += 1
+            else:
+                if at is not None:
+                    values = {key: (value, at) for key, value in seeded.items() if key in self.fields}
+                    self._counters["seeded"] += bool(values)
+        return values
+
+    def merge(self, sensor_id: str, reading: dict, at: float, fill: bool = True) -> dict:
+        """
+        The reading with its absent fields filled in, or the reading itself if
+        nothing was filled (always, with `fill` False). Non-null fields become
+        the sensor's last known values, unless a newer reading already set
+        them; null ones stay null.
+        """
+        with self._lock:
+            known = self._values.get(sensor_id)
+        if known is None:
+            seeded = self._seed(sensor_id)      # outside the lock: a Firestore read
+            with self._lock:
+                known = self._values.setdefault(sensor_id, seeded)
+
+        with self._lock:
+            c = self._counters
+            c["readings"] += 1
+            carried = {}
+            for key in self.fields:
+                if key in reading:
+                    value = reading[key]
+                    if value is not None and (key not in known or known[key][1] <= at):
+                        known[key] = (value, at)
+                elif fill and key in known:
+                    last, last_at = known[key]
+                    if abs(at - last_at) <= self.max_age_s:
+                        carried[key] = last
+                    else:
+                        c["fields_stale"] += 1
+            if not carried:
+                return reading
+            c["partial"] += 1
+            c["fields_carried"] += len(carried)
+        return {**reading, **carried, CARRIED_KEY: frozenset(carried)}
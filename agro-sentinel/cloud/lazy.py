@@ -0,0 +1,67 @@
+"""
+Deferred imports and clients for the Cloud Functions entry points.
+
+A cold start pays for every import and client constructor at module level,
+before the first request is even looked at; the google-cloud and vertexai
+packages alone take the better part of a second to import. Clients are
+wrapped in LazyClient, which imports and builds them on first use and then
+keeps them for every later invocation on the same instance. Module-level names
+such as main.bq_client and main.db stay in place, so callers and tests are
+unchanged.
+
+    python bench_startup.py      # import time and first response per entry point
+"""
+import importlib
+import logging
+import os
+import threading
+
+
+def gcp_module(name: str):
+    """
+    google.cloud.<name>, or mock_gcp when USE_MOCK_GCP is set or the library
+    is not installed.
+    """
+    if os.environ.get('USE_MOCK_GCP') == 'true':
+        import mock_gcp
+        return mock_gcp
+    try:
+        return importlib.import_module(f"google.cloud.{name}")
+    except ImportError:
+        import mock_gcp
+        logging.info(f"Using MOCK GCP Clients (google.cloud.{name} not installed)")
+        return mock_gcp
+
+
+class LazyClient:
+    """
+    Stands in for a client that is built by `factory` on first attribute
+    access. Safe to share between threads; the factory runs once.
+    """
+
+    def __init__(self, factory, name: str = "client"):
+        self._factory = factory
+        self._name    = name
+        self._client  = None
+        self._lock    = threading.Lock()
+
+    def _get(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+                    logging.info(f"{self._name} initialised")
+        return self._client
+
+    @property
+    def initialised(self) -> bool:
+        return self._client is not None
+
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        return getattr(self._get(), attr)
+
+    def __repr__(self):
+        state = "initialised" if self.initialised else "not initialised"
+        return f"<LazyClient {self._name} ({state})>"
@@ -8,26 +8,43 @@ import hashlib
 import re
 from datetime import datetime, timezone
 
-if os.environ.get('USE_MOCK_GCP') == 'true':
-    import mock_gcp as bigquery
-    import mock_gcp as firestore
-    logging.info("Using MOCK GCP Clients")
-else:
-    try:
-        from google.cloud import bigquery
-        from google.cloud import firestore
-    except ImportError:
-        import mock_gcp as bigquery
-        import mock_gcp as firestore
-        logging.info("Using MOCK GCP Clients (ImportError)")
-
+import alarms
+import envelope
+import rules
+import sensor_registry
+from alarms import AlarmManager
+from bq_writer import BigQueryWriter
+from dedup import Deduplicator
+from event_time import EventTimeTracker
+from last_known import CARRIED_KEY, LastKnown, firestore_loader
+from lazy import LazyClient, gcp_module
+from state_writer import FIRESTORE_MAX_BATCH, StateWriter
+
+# ── Clients: imported and built on first use, then reused (lazy.py) ───────────
 project_id = os.environ.get('PROJECT_ID')
-bq_client  = bigquery.Client(project=project_id)
-db         = firestore.Client(project=project_id)
-
-# ── Sensor ID allowlist (VULN-07) ─────────────────────────────────────────────
-KNOWN_SENSOR_IDS = frozenset({'GH-AMB-01', 'GH-DUR-01', 'GH-CAY-01', 'GH-ORO-01', 'GH-TEN-01'})
-_SENSOR_ID_RE    = re.compile(r'^GH-[A-Z]{3}-\d{2}$')
+bq_client  = LazyClient(lambda: gcp_module("bigquery").Client(project=project_id), "BigQuery client")
+db         = LazyClient(lambda: gcp_module("firestore").Client(project=project_id), "Firestore client")
+
+# NumPy is only needed for large batches; imported by _load_vectorized()
+np = vectorized = None
+_vectorized_loaded = False
+
+
+def _load_vectorized():
+    """vectorized.py, imported on first use; None when numpy is missing (scalar path)."""
+    global np, vectorized, _vectorized_loaded
+    if not _vectorized_loaded:
+        _vectorized_loaded = True
+        try:
+            import numpy as np
+            import vectorized
+        except ImportError:
+            np = vectorized = None
+    return vectorized
+
+# ── Sensor ID allowlist (VULN-07): registry kept in memory (sensor_registry.py)
+registry      = sensor_registry.registry_from_env(db)
+_SENSOR_ID_RE = re.compile(r'^GH-[A-Z]{3}-\d{2}$')
 
 # ── Physically plausible value ranges (VULN-16) ───────────────────────────────
 VALID_RANGES = {
@@ -42,25 +59,34 @@ VALID_RANGES = {
     'rssi_dbm':      (-120.0,   0.0),
 }
 
-# ── ISA 18.2 — CRITICAL thresholds ────────────────────────────────────────────
-CRITICAL = {
-    "temperature":   {"min": 10,  "max": 38},
-    "humidity":      {"min": 25,  "max": 98},
-    "vpd_kpa":       {"min": 0.2, "max": 2.0},
-    "co2_ppm":       {"min": 300, "max": 1800},
-    "soil_moisture": {"min": 25,  "max": 92},
-    "battery_level": {"min": 15,  "max": None},
-    "rssi_dbm":      {"min": -90, "max": None},
-}
+# ── ISA 18.2 alert rules ──────────────────────────────────────────────────────
+# Defaults live in rules.py; per-crop and per-sensor overrides are reloaded from
+# ALERT_RULES_PATH or Firestore config/alert_rules without a redeploy, and
+# per-sensor thresholds from the sensor registry.
+CRITICAL    = rules.DEFAULT_RULES["critical"]
+WARNING     = rules.DEFAULT_RULES["warning"]
+rule_engine = rules.engine_from_env(db, registry)
 
-WARNING = {
-    "temperature":   {"min": 15,  "max": 30},
-    "humidity":      {"min": 50,  "max": 85},
-    "vpd_kpa":       {"min": 0.4, "max": 1.2},
-    "co2_ppm":       {"min": 400, "max": 1200},
-    "soil_moisture": {"min": 45,  "max": 80},
-    "par_umol":      {"min": 200, "max": 800},
-}
+# ── Alarm lifecycle: deadband, delays, flood suppression (alarms.py) ──────────
+# Standing alarms and operator acknowledgements are read back from Firestore
+alarm_manager = AlarmManager(loader=alarms.firestore_loader(db), ack_loader=alarms.firestore_ack_loader(db))
+
+# ── Firestore state: changed fields only, coalesced per sensor (state_writer.py)
+state_writer = StateWriter(db)
+
+# ── Duplicate readings: edge sequence numbers, checked in memory (dedup.py) ──
+deduplicator = Deduplicator()
+
+# ── Late readings: history only, never real-time state (event_time.py) ──────
+event_clock = EventTimeTracker()
+
+# ── Partial readings (edge reduction): absent fields carried forward (last_known.py)
+_STATE_NAMES  = {'temperature_c': 'temperature', 'humidity_rh': 'humidity'}
+carry_forward = LastKnown(VALID_RANGES, firestore_loader(
+    db, {key: _STATE_NAMES.get(key, key) for key in VALID_RANGES}))
+
+# ── BigQuery rows: batched inserts, failed rows retried (bq_writer.py) ───────
+bq_writer = BigQueryWriter(bq_client, lambda: _bq_table(), row_id=lambda row: _insert_id(row))
 
 
 def _sanitize_float(value, key: str):
@@ -84,6 +110,36 @@ def _sanitize_int(value, key: str):
     return int(v) if v is not None else None
 
 
+# ── Edge reduction tag (edge/src/reduction.py) ─────────────────────────────────
+# Says per field whether the value is a raw sample, a deadband-filtered one or a
+# window aggregate. Stored verbatim as JSON so queries can weight window means by
+# their sample count; anything malformed is dropped rather than trusted.
+_MAX_REDUCTION_BYTES = 2048
+
+
+def _sanitize_seq(value) -> int | None:
+    """Edge sequence number or epoch: a non-negative integer that fits BigQuery's INT64."""
+    if value is None or isinstance(value, bool):
+        return None
+    if not isinstance(value, int) or not 0 <= value < 2 ** 63:
+        logging.warning(f"Malformed sequence number {value!r} — discarded")
+        return None
+    return value
+
+
+def _sanitize_reduction(value) -> str | None:
+    if not value:
+        return None
+    if not isinstance(value, dict) or not all(k in VALID_RANGES for k in value):
+        logging.warning(f"Malformed reduction tag {value!r} — discarded")
+        return None
+    encoded = json.dumps(value, separators=(',', ':'), sort_keys=True)
+    if len(encoded) > _MAX_REDUCTION_BYTES:
+        logging.warning(f"Reduction tag of {len(encoded)} bytes — discarded")
+        return None
+    return encoded
+
+
 def calculate_vpd(T, RH):
     try:
         svp = 0.61078 * math.exp((17.27 * T) / (T + 237.3))
@@ -101,25 +157,14 @@ def calculate_dew_point(T, RH):
         return None
 
 
-def _check_threshold(value, key, thresholds, level):
-    if value is None:
-        return []
-    t = thresholds.get(key, {})
-    alerts = []
-    if t.get("max") is not None and value > t["max"]:
-        alerts.append({"key": key, "level": level, "value": value, "breach": "HIGH"})
-    if t.get("min") is not None and value < t["min"]:
-        alerts.append({"key": key, "level": level, "value": value, "breach": "LOW"})
-    return alerts
-
-
 # ── HMAC signature verification (VULN-07) ─────────────────────────────────────
-def _verify_hmac(payload_bytes: bytes, signature: str | None) -> bool:
+def _verify_hmac(payload_bytes: bytes, signature: str | None, secret: str | None = None) -> bool:
     """
-    Verifies HMAC-SHA256 signature from the Pub/Sub message attribute 'x_signature'.
-    Skipped if HMAC_SECRET env var is not set (development/mock).
+    Verifies HMAC-SHA256 signature from the Pub/Sub message attribute 'x_signature'
+    with the device's own key if it has one, else HMAC_SECRET.
+    Skipped if neither is set (development/mock).
     """
-    secret = os.environ.get('HMAC_SECRET', '')
+    secret = secret or os.environ.get('HMAC_SECRET', '')
     if not secret:
         return True   # Not configured — development mode, allow through with warning
     if not signature:
@@ -130,8 +175,15 @@ def _verify_hmac(payload_bytes: bytes, signature: str | None) -> bool:
     return hmac.compare_digest(expected, signature)
 
 
-def process_sensor_data(event, context):
-    """Triggered from a message on a Cloud Pub/Sub topic."""
+def _decode_event(event) -> list[dict] | None:
+    """
+    Decode one Pub/Sub message into the readings it carries.
+
+    Accepts both the legacy single-reading JSON object and the multi-reading
+    envelope (envelope.py). The HMAC covers the message bytes as published, so
+    it is checked once per message, before decompression. Returns None if the
+    message is rejected.
+    """
     raw_bytes = None
     try:
         if hasattr(event, 'data'):
@@ -149,94 +201,403 @@ def process_sensor_data(event, context):
         elif hasattr(event, 'attributes'):
             attributes = event.attributes or {}
 
-        signature = attributes.get('x_signature')
-        if not _verify_hmac(raw_bytes, signature):
+        # A device with its own key names itself in the 'sensor_id' attribute
+        device     = attributes.get('sensor_id')
+        device_key = registry.hmac_key(device) if device else None
+        signature  = attributes.get('x_signature')
+        if not _verify_hmac(raw_bytes, signature, device_key):
             logging.error("HMAC verification failed — message rejected")
-            return
+            return None
+
+        if envelope.is_envelope(raw_bytes):
+            readings = envelope.unpack(raw_bytes)
+            logging.info(f"Processing envelope of {len(readings)} readings")
+        else:
+            data = json.loads(raw_bytes.decode('utf-8'))
+            if not isinstance(data, dict):
+                raise ValueError("message is not a JSON object")
+            readings = [data]
+            logging.info(f"Processing sensor_id={data.get('sensor_id')}")
 
-        data = json.loads(raw_bytes.decode('utf-8'))
-        logging.info(f"Processing sensor_id={data.get('sensor_id')}")
+        # A device key only vouches for that device's own readings
+        if device_key and any(r.get('sensor_id') != device for r in readings):
+            logging.error(f"Message signed with {device}'s key carries other sensors — rejected")
+            return None
 
     except Exception as e:
         logging.error(f"Error decoding message: {e}")
+        return None
+    return readings
+
+
+def _fill_partial(readings: list[dict]) -> list[dict]:
+    """
+    Each reduced reading merged over its sensor's last known values
+    (last_known.py), so a record that carries only the fields that changed is
+    evaluated as a whole. Unreduced readings are complete: a field missing
+    there is a dropout and stays missing.
+    """
+    now, filled = datetime.now(timezone.utc), []
+    for data in readings:
+        sensor_id = data.get("sensor_id")
+        if not isinstance(sensor_id, str) or sensor_id not in registry:
+            filled.append(data)           # rejected by _evaluate
+            continue
+        at = _event_time(data)
+        filled.append(carry_forward.merge(sensor_id, data, (now if at is _EPOCH else at).timestamp(),
+                                          fill=bool(data.get("reduction"))))
+    return filled
+
+
+def process_sensor_data(event, context):
+    """
+    Triggered from a message on a Cloud Pub/Sub topic.
+
+    Returning acks the message, so its rows are written to BigQuery before
+    that, not buffered: an instance can be scaled in with its buffer. If any
+    row still fails after bq_writer's retries, this raises and Pub/Sub
+    redelivers the message (retry_policy in terraform/main.tf); the rows that
+    did land are then dropped as duplicates.
+    """
+    readings = _decode_event(event)
+    if readings is None:
+        return
+    readings = _fill_partial(readings)
+    accepted = []
+    for data in readings:
+        evaluated = _evaluate(data)
+        if evaluated is None:
+            continue
+        sensor_id, state, row = evaluated
+        if not deduplicator.accept(sensor_id, row["seq_epoch"], row["seq"]):
+            logging.info(f"Duplicate reading {_insert_id(row)} dropped")
+            continue
+        accepted.append(evaluated)
+    if not accepted:
         return
 
+    rows = [row for _, _, row in accepted]
+    live, latest, late = _order_by_event_time(accepted)
+    try:
+        events = []
+        for sensor_id, state, row in live:
+            events += _apply_alarms(sensor_id, state, row)
+        _emit_alarm_events(events)
+        inserted, failed = bq_writer.write(rows, spill=False)
+    except Exception:
+        _forget(rows)
+        raise
+    if failed:
+        _forget(failed)
+        raise RuntimeError(f"{len(failed)} of {len(rows)} rows not written to BigQuery — "
+                           f"leaving the message for redelivery")
+    for sensor_id, state in latest.items():
+        state_writer.offer(sensor_id, state)
+    # Nothing guarantees this instance another message (or any CPU) before the
+    # sensor's next reading, so coalesced changes are written now
+    state_writer.flush(force=True)
+    logging.info(f"Inserted {inserted} rows ({late} late) for {', '.join(latest) or '-'}")
+    event_clock.maybe_log()
+
+
+def _order_by_event_time(accepted: list[tuple]) -> tuple[list, dict, int]:
+    """
+    Put accepted (sensor_id, state, row) readings in event time and check them
+    against the latest reading each sensor has had (event_time.py). Every
+    state's last_update becomes its reading's event time.
+
+    Returns (readings that are not late, oldest first; the newest state per
+    sensor, the only one to reach Firestore; how many readings were late).
+    """
+    timed = [(_event_time(row), sensor_id, state, row) for sensor_id, state, row in accepted]
+    # Untimed readings are stamped on receipt, so they sort last; the sort is
+    # stable, so ties keep arrival order and the later arrival wins
+    timed.sort(key=lambda t: (t[0] is _EPOCH, t[0]))
+    live, latest, late = [], {}, 0
+    for at, sensor_id, state, row in timed:
+        at, newest = event_clock.observe(sensor_id, None if at is _EPOCH else at)
+        state["last_update"] = at
+        if newest:
+            live.append((sensor_id, state, row))
+            latest[sensor_id] = state
+        else:
+            late += 1
+    return live, latest, late
+
+
+def _apply_alarms(sensor_id: str, state: dict, row: dict) -> list:
+    """
+    Replace the state's per-reading conditions with the sensor's standing
+    alarms, and status with their worst level. Returns the alarm events.
+    """
+    standing, events = alarm_manager.update(
+        sensor_id, state["active_alerts"], state, rule_engine.table_for(sensor_id).limits,
+        state["last_update"].timestamp())
+    levels = {alarm["level"] for alarm in standing}
+    state["active_alerts"] = standing
+    state["status"] = ("CRITICAL" if "CRITICAL" in levels
+                       else ("WARNING" if "WARNING" in levels else "OK"))
+    return events
+
+
+def _emit_alarm_events(events: list):
+    """Log alarm transitions and record them in Firestore alarm_events."""
+    for i in range(0, len(events), FIRESTORE_MAX_BATCH):
+        batch = db.batch()
+        for event in events[i:i + FIRESTORE_MAX_BATCH]:
+            logging.warning(f"🚨 ALARM {event['event']} {event['sensor_id']}: {event}")
+            batch.set(db.collection("alarm_events").document(event["id"]), event)
+        batch.commit()
+
+
+def _bq_table() -> str:
+    return os.environ.get('BQ_TABLE', "agro_sentinel_data.sensor_logs")
+
+
+def _insert_id(row: dict) -> str:
+    """BigQuery insertId: the edge's sequence number, else sensor and timestamp."""
+    if row.get("seq") is not None:
+        return f"{row['sensor_id']}:{row['seq_epoch']}:{row['seq']}"
+    return f"{row['sensor_id']}:{row['timestamp']}"
+
+
+def _accept_sensor(data: dict) -> str | None:
     # ── Sensor ID validation (VULN-07) ─────────────────────────────────────────
     sensor_id = data.get("sensor_id", "")
-    if not _SENSOR_ID_RE.match(sensor_id) or sensor_id not in KNOWN_SENSOR_IDS:
+    if not _SENSOR_ID_RE.match(sensor_id) or sensor_id not in registry:
         logging.error(f"Unknown or malformed sensor_id '{sensor_id}' — rejected")
-        return
+        return None
+    return sensor_id
+
+
+_INT_FIELDS = frozenset({'battery_level', 'rssi_dbm'})
+
+
+def _evaluate(data: dict) -> tuple[str, dict, dict] | None:
+    """
+    Validate and enrich one reading without writing anything.
+
+    Returns (sensor_id, Firestore state, BigQuery row), or None if rejected.
+    """
+    sensor_id = _accept_sensor(data)
+    if sensor_id is None:
+        return None
 
     # ── Sanitize + validate all numeric fields (VULN-16) ──────────────────────
-    temp      = _sanitize_float(data.get('temperature_c'), 'temperature_c')
-    humidity  = _sanitize_float(data.get('humidity_rh'),   'humidity_rh')
-    co2       = _sanitize_float(data.get('co2_ppm'),       'co2_ppm')
-    soil      = _sanitize_float(data.get('soil_moisture'),  'soil_moisture')
-    par       = _sanitize_float(data.get('par_umol'),       'par_umol')
-    soil_ec   = _sanitize_float(data.get('soil_ec'),        'soil_ec')
-    soil_temp = _sanitize_float(data.get('soil_temp_c'),    'soil_temp_c')
-    battery   = _sanitize_int(data.get('battery_level'),    'battery_level')
-    rssi      = _sanitize_int(data.get('rssi_dbm'),         'rssi_dbm')
-
-    vpd        = calculate_vpd(temp, humidity)       if temp and humidity else None
-    dew_point  = calculate_dew_point(temp, humidity) if temp and humidity else None
+    v = {key: (_sanitize_int if key in _INT_FIELDS else _sanitize_float)(data.get(key), key)
+         for key in VALID_RANGES}
+    temp, humidity = v['temperature_c'], v['humidity_rh']
+
+    v['vpd_kpa']     = calculate_vpd(temp, humidity)       if temp and humidity else None
+    v['dew_point_c'] = calculate_dew_point(temp, humidity) if temp and humidity else None
 
     # ── Alerting (ISA 18.2) ────────────────────────────────────────────────────
-    critical_alerts, warning_alerts = [], []
-    for key, val in [("temperature", temp), ("humidity", humidity), ("vpd_kpa", vpd),
-                     ("co2_ppm", co2), ("soil_moisture", soil),
-                     ("battery_level", battery), ("rssi_dbm", rssi)]:
-        critical_alerts += _check_threshold(val, key, CRITICAL, "CRITICAL")
-    for key, val in [("temperature", temp), ("humidity", humidity), ("vpd_kpa", vpd),
-                     ("co2_ppm", co2), ("soil_moisture", soil), ("par_umol", par)]:
-        warning_alerts += _check_threshold(val, key, WARNING, "WARNING")
-
-    botrytis_risk = ("HIGH" if (temp and humidity and 15 <= temp <= 25 and humidity > 85)
-                     else "LOW")
+    critical_alerts, warning_alerts, compounds = rule_engine.evaluate(sensor_id, v)
+    return _assemble(sensor_id, data, v, critical_alerts, warning_alerts, compounds)
+
+
+def _assemble(sensor_id: str, data: dict, v: dict, critical_alerts: list,
+              warning_alerts: list, compounds: dict,
+              now: datetime | None = None) -> tuple[str, dict, dict]:
+    """
+    Build the Firestore state and BigQuery row from evaluated values `v`.
+
+    Fields carried forward into a partial reading (_fill_partial) count for
+    derived values, rules and state, but the row stores only what was measured.
+    """
+    now = now or datetime.now(timezone.utc)
     all_alerts = critical_alerts + warning_alerts
-    if all_alerts:
-        logging.warning(f"🚨 ALERTS for {sensor_id}: {all_alerts}")
+    carried = data.get(CARRIED_KEY)
+    m = {key: None if key in carried else v[key] for key in VALID_RANGES} if carried else v
 
     # ── Firestore (real-time state) ────────────────────────────────────────────
-    db.collection("greenhouses").document(sensor_id).set({
-        "last_update":   datetime.now(timezone.utc),
-        "temperature":   temp,
-        "humidity":      humidity,
-        "vpd_kpa":       vpd,
-        "co2_ppm":       co2,
-        "soil_moisture": soil,
-        "par_umol":      par,
-        "soil_ec":       soil_ec,
-        "soil_temp_c":   soil_temp,
-        "battery_level": battery,
-        "rssi_dbm":      rssi,
-        "dew_point_c":   dew_point,
-        "botrytis_risk": botrytis_risk,
+    state = {
+        "last_update":   now,
+        "temperature":   v['temperature_c'],
+        "humidity":      v['humidity_rh'],
+        "vpd_kpa":       v['vpd_kpa'],
+        "co2_ppm":       v['co2_ppm'],
+        "soil_moisture": v['soil_moisture'],
+        "par_umol":      v['par_umol'],
+        "soil_ec":       v['soil_ec'],
+        "soil_temp_c":   v['soil_temp_c'],
+        "battery_level": v['battery_level'],
+        "rssi_dbm":      v['rssi_dbm'],
+        "dew_point_c":   v['dew_point_c'],
+        **compounds,                              # botrytis_risk, per-crop extras
         "status":        ("CRITICAL" if critical_alerts
                           else ("WARNING" if warning_alerts else "OK")),
-        "active_alerts": all_alerts,
-    }, merge=True)
+        "active_alerts": all_alerts,             # conditions; _apply_alarms latches them
+    }
 
     # ── BigQuery (historical) ──────────────────────────────────────────────────
-    table_id = os.environ.get('BQ_TABLE', "agro_sentinel_data.sensor_logs")
     row = {
         "sensor_id":     sensor_id,
-        "timestamp":     data.get('timestamp') or datetime.now(timezone.utc).isoformat(),
-        "temperature":   temp,
-        "humidity":      humidity,
-        "soil_moisture": soil,
-        "co2_ppm":       co2,
-        "par_umol":      par,
-        "soil_ec":       soil_ec,
-        "vpd_kpa":       vpd,
-        "dew_point_c":   dew_point,
-        "soil_temp_c":   soil_temp,
-        "battery_level": battery,
-        "rssi_dbm":      rssi,
+        "timestamp":     data.get('timestamp') or now.isoformat(),
+        "temperature":   m['temperature_c'],
+        "humidity":      m['humidity_rh'],
+        "soil_moisture": m['soil_moisture'],
+        "co2_ppm":       m['co2_ppm'],
+        "par_umol":      m['par_umol'],
+        "soil_ec":       m['soil_ec'],
+        "vpd_kpa":       v['vpd_kpa'],
+        "dew_point_c":   v['dew_point_c'],
+        "soil_temp_c":   m['soil_temp_c'],
+        "battery_level": m['battery_level'],
+        "rssi_dbm":      m['rssi_dbm'],
+        "reduction":     _sanitize_reduction(data.get('reduction')),
+        "seq":           _sanitize_seq(data.get('seq')),
+        "seq_epoch":     _sanitize_seq(data.get('seq_epoch')),
+        "ingested_at":   now.isoformat(),      # late rows re-aggregate their rollup buckets
     }
+    return sensor_id, state, row
+
+
+def _evaluate_batch(readings: list[dict]) -> list[tuple[str, dict, dict] | None]:
+    """
+    _evaluate for many readings, column-wise with NumPy when it pays off.
+
+    Same results as [_evaluate(r) for r in readings] (see vectorized.py).
+    """
+    if len(readings) < VECTORIZE_MIN_BATCH or _load_vectorized() is None:
+        return [_evaluate(r) for r in readings]
+    results: list = [None] * len(readings)
+    index, accepted, row_table = [], [], []
+    tables, slot_of = {}, {}          # distinct RuleTables; sensor_id -> table slot
+    for i, data in enumerate(readings):
+        sensor_id = _accept_sensor(data)
+        if sensor_id is None:
+            continue
+        index.append(i)
+        accepted.append((sensor_id, data))
+        slot = slot_of.get(sensor_id)
+        if slot is None:
+            table = rule_engine.table_for(sensor_id)
+            slot = slot_of[sensor_id] = tables.setdefault(id(table), (len(tables), table))[0]
+        row_table.append(slot)
+    if not accepted:
+        return results
+
+    cols = {key: vectorized.sanitize([data.get(key) for _, data in accepted], key, VALID_RANGES,
+                                     as_int=key in _INT_FIELDS)
+            for key in VALID_RANGES}
+    temp, humidity = cols['temperature_c'], cols['humidity_rh']
+    cols['vpd_kpa']     = vectorized.vpd(temp, humidity, calculate_vpd)
+    cols['dew_point_c'] = vectorized.dew_point(temp, humidity, calculate_dew_point)
+    values   = {key: vectorized.to_list(col, as_int=key in _INT_FIELDS) for key, col in cols.items()}
+    critical, warning, compounds = vectorized.evaluate_rules(
+        cols, values, [table for _, table in tables.values()], np.array(row_table))
+
+    keys, now = list(values), datetime.now(timezone.utc)
+    for j, ((sensor_id, data), row_values) in enumerate(zip(accepted, zip(*values.values()))):
+        results[index[j]] = _assemble(sensor_id, data, dict(zip(keys, row_values)),
+                                      critical[j], warning[j], compounds[j], now)
+    return results
+
+
+# ── Batch ingestion ───────────────────────────────────────────────────────────
+# One BigQuery streaming call and one Firestore batched write per batch, instead
+# of one of each per reading. The state writer only sees each sensor's newest
+# state: older readings in the same batch would be overwritten milliseconds later.
+VECTORIZE_MIN_BATCH    = 32      # below this the NumPy setup costs more than it saves
+_EPOCH = datetime.min.replace(tzinfo=timezone.utc)
+
+
+def _event_time(row: dict) -> datetime:
+    """Reading time for ordering; _EPOCH when the timestamp cannot be parsed."""
+    try:
+        ts = datetime.fromisoformat(str(row.get("timestamp")).replace('Z', '+00:00'))
+    except ValueError:
+        return _EPOCH
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
 
-    errors = bq_client.insert_rows_json(table_id, [row])
-    if errors:
-        logging.error(f"BigQuery insert errors: {errors}")
+def process_sensor_batch(events: list, context=None) -> dict:
+    """
+    Ingest many Pub/Sub messages in one pass (pull subscriber, batched push).
+
+    Every message is decoded and validated exactly as process_sensor_data does;
+    rejected messages and readings are counted and skipped, and so are readings
+    already ingested (dedup.py). Late readings are stored in BigQuery only, and
+    each sensor's state is written once, from its newest reading. Errors from
+    the BigQuery or Firestore clients
+    propagate, so the caller can retry the batch.
+    """
+    stats = dict.fromkeys(("messages", "rejected_messages", "readings", "rejected_readings",
+                           "duplicates", "late_readings", "rows_inserted", "rows_failed",
+                           "sensors_updated"), 0)
+    readings = []
+    for event in events:
+        stats["messages"] += 1
+        decoded = _decode_event(event)
+        if decoded is None:
+            stats["rejected_messages"] += 1
+            continue
+        readings += decoded
+    stats["readings"] = len(readings)
+    readings = _fill_partial(readings)
+
+    rows, accepted = [], []
+    for evaluated in _evaluate_batch(readings):
+        if evaluated is None:
+            stats["rejected_readings"] += 1
+            continue
+        sensor_id, state, row = evaluated
+        if not deduplicator.accept(sensor_id, row["seq_epoch"], row["seq"]):
+            stats["duplicates"] += 1
+            continue
+        rows.append(row)
+        accepted.append(evaluated)
+    live, latest, stats["late_readings"] = _order_by_event_time(accepted)
+
+    try:
+        # Alarms advance in event time
+        events = []
+        for sensor_id, state, row in live:
+            events += _apply_alarms(sensor_id, state, row)
+        _emit_alarm_events(events)
+        stats["alarm_events"] = len(events)
+
+        # Not spilled: the caller retries the batch (drain_subscription leaves it unacked)
+        inserted, failed = bq_writer.write(rows, spill=False)
+    except Exception:
+        _forget(rows)
+        raise
+    stats["rows_inserted"], stats["rows_failed"] = inserted, len(failed)
+    # Left for redelivery, which must not be taken for duplicates
+    _forget(failed)
+    stats["sensors_updated"] = state_writer.offer_many(latest)
+    logging.info(f"Batch ingested: {stats}")
+    event_clock.maybe_log()
+    return stats
+
+
+def _forget(rows: list[dict]):
+    for row in rows:
+        deduplicator.forget(row["sensor_id"], row["seq_epoch"], row["seq"])
+
+
+def drain_subscription(subscriber, subscription_path: str, max_messages: int = 1000) -> dict:
+    """
+    Pull one batch from a Pub/Sub subscription and ingest it with process_sensor_batch.
+
+    Rejected messages are acked (a retry cannot fix a bad signature). If any
+    row was still failing after bq_writer's retries, the whole batch is left
+    unacked for redelivery; the rows that did succeed are then dropped as
+    duplicates when they carry an edge sequence number.
+    """
+    response = subscriber.pull(request={"subscription": subscription_path,
+                                        "max_messages": max_messages})
+    received = list(response.received_messages)
+    if not received:
+        return {"messages": 0}
+    events = [{"data":       base64.b64encode(m.message.data).decode(),
+               "attributes": dict(m.message.attributes)} for m in received]
+    stats = process_sensor_batch(events)
+    if stats["rows_failed"]:
+        logging.error(f"{stats['rows_failed']} rows failed — leaving {len(received)} messages for redelivery")
     else:
-        logging.info(f"Inserted row for {sensor_id}. VPD={vpd} botrytis={botrytis_risk}")
+        subscriber.acknowledge(request={"subscription": subscription_path,
+                                        "ack_ids": [m.ack_id for m in received]})
+    state_writer.flush()
+    return stats
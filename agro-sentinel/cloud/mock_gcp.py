@@ -1,3 +1,8 @@
+import random
+import time
+
+SERVER_TIMESTAMP = "SERVER_TIMESTAMP"
+
 class Client:
     def __init__(self, *args, **kwargs):
         pass
@@ -10,11 +15,93 @@ class Client:
         
     def set(self, data, merge=False):
         print(f"[MOCK Firestore] Setting doc data: {data}")
+
+    def update(self, data):
+        print(f"[MOCK Firestore] Updating doc data: {data}")
+
+    def get(self):
+        return DocumentSnapshot(None)
+
+    def batch(self):
+        return WriteBatch()
+
+    def bucket(self, name):
+        return Bucket(name)
         
-    def insert_rows_json(self, table_id, rows):
+    def insert_rows_json(self, table_id, rows, row_ids=None):
         print(f"[MOCK BigQuery] Inserting into {table_id}: {rows}")
         return [] # Return empty list means no errors
 
+    def query(self, sql, job_config=None):
+        print(f"[MOCK BigQuery] Query: {sql}")
+        return QueryJob()
+
+class QueryJobConfig:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+class QueryJob:
+    total_bytes_processed = 0
+    total_bytes_billed = 0
+
+    def result(self, max_results=None, page_size=None):
+        return iter([])
+
+class DocumentSnapshot:
+    def __init__(self, data):
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return self._data
+
+class WriteBatch:
+    def __init__(self):
+        self.writes = []
+
+    def set(self, ref, data, merge=False):
+        self.writes.append((ref, data, merge))
+
+    def commit(self):
+        print(f"[MOCK Firestore] Committing batch of {len(self.writes)} writes")
+        return []
+
+class InMemoryBigQuery:
+    """
+    BigQuery stand-in that keeps rows in memory and can misbehave on purpose:
+    `latency_s` per insert call, `row_failure_rate` of rows answered with a
+    retryable backendError, and `unavailable` to make every call raise. A row
+    whose insertId (row_ids) was stored before is acknowledged but not stored
+    again, as BigQuery does within its de-duplication window.
+    """
+    def __init__(self, latency_s=0.0, row_failure_rate=0.0, seed=0, invalid=None):
+        self.latency_s = latency_s
+        self.row_failure_rate = row_failure_rate
+        self.invalid = invalid or (lambda row: False)   # rows refused as "invalid"
+        self.unavailable = False
+        self.tables = {}
+        self.calls = 0
+        self.insert_ids = set()
+        self._rng = random.Random(seed)
+
+    def insert_rows_json(self, table_id, rows, row_ids=None):
+        self.calls += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        if self.unavailable:
+            raise ConnectionError("[MOCK BigQuery] service unavailable")
+        errors, stored = [], self.tables.setdefault(table_id, [])
+        for index, row in enumerate(rows):
+            if self.invalid(row):
+                errors.append({"index": index, "errors": [{"reason": "invalid", "message": "bad row"}]})
+            elif self._rng.random() < self.row_failure_rate:
+                errors.append({"index": index, "errors": [{"reason": "backendError", "message": "retry"}]})
+            elif not row_ids or row_ids[index] not in self.insert_ids:
+                stored.append(row)
+                if row_ids:
+                    self.insert_ids.add(row_ids[index])
+        return errors
+
 class StorageClient:
     def __init__(self, *args, **kwargs): pass
     def bucket(self, name): return Bucket(name)
@@ -0,0 +1,171 @@
+"""
+Cache of generated SQL for ask_ai, keyed by the question.
+
+Users ask the same few dozen questions over and over; each one otherwise costs
+a Gemini round trip of a few seconds just to produce SQL that was produced
+before. The key is the normalized question (case, accents, punctuation and
+spacing folded, so "¿Temperatura máxima hoy?" and "temperatura maxima hoy"
+match) plus location_id, under a fingerprint of the prompt context: when
+SCHEMA_CONTEXT, the alarm rules or the registered farms change, the
+fingerprint changes and old entries are simply never looked up again.
+AI_SQL_CACHE_VERSION can be bumped to drop everything by hand.
+
+Only SQL that passes the validator (ai_assistant._validate_sql) is stored,
+and SQL read back from the shared backend is validated again before use.
+Entries live for AI_SQL_CACHE_TTL_S; the in-process LRU holds at most
+AI_SQL_CACHE_MAX_ENTRIES. With AI_SQL_CACHE_SHARED, misses fall through to the
+Firestore collection ai_sql_cache so warm instances share hits; give that
+collection a TTL policy on `expires_at` so expired documents are deleted.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+AI_SQL_CACHE_MAX_ENTRIES = int(os.environ.get('AI_SQL_CACHE_MAX_ENTRIES', 512))
+AI_SQL_CACHE_TTL_S       = float(os.environ.get('AI_SQL_CACHE_TTL_S', 24 * 3600))
+AI_SQL_CACHE_SHARED      = os.environ.get('AI_SQL_CACHE_SHARED', 'false').lower() == 'true'
+AI_SQL_CACHE_COLLECTION  = os.environ.get('AI_SQL_CACHE_COLLECTION', 'ai_sql_cache')
+AI_SQL_CACHE_VERSION     = os.environ.get('AI_SQL_CACHE_VERSION', '1')
+
+_NON_WORD = re.compile(r'[^\w]+')
+
+
+def normalize(query: str) -> str:
+    """Case-, accent- and punctuation-insensitive form of a question."""
+    text = unicodedata.normalize('NFKD', query.casefold())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(_NON_WORD.sub(' ', text).split())
+
+
+def fingerprint(context: str) -> str:
+    """Short digest of the prompt context the SQL was generated from."""
+    return hashlib.sha256(f"{AI_SQL_CACHE_VERSION}\n{context}".encode()).hexdigest()[:16]
+
+
+class FirestoreBackend:
+    """Shared entries, one document per key."""
+
+    def __init__(self, db, collection: str = AI_SQL_CACHE_COLLECTION):
+        self.db         = db
+        self.collection = collection
+
+    def get(self, key: str) -> dict | None:
+        snapshot = self.db.collection(self.collection).document(key).get()
+        return snapshot.to_dict() if snapshot.exists else None
+
+    def set(self, key: str, entry: dict):
+        self.db.collection(self.collection).document(key).set(entry)
+
+
+class QueryCache:
+    """LRU of validated SQL with a TTL and an optional shared backend. Safe to share between threads."""
+
+    def __init__(self, validate, max_entries: int = AI_SQL_CACHE_MAX_ENTRIES,
+                 ttl_s: float = AI_SQL_CACHE_TTL_S, backend=None, clock=time.monotonic,
+                 now=lambda: datetime.now(timezone.utc)):
+        self.validate    = validate            # sql → (ok, cleaned sql or reason)
+        self.max_entries = max_entries
+        self.ttl_s       = ttl_s
+        self.backend     = backend
+        self.clock       = clock
+        self.now         = now
+        self._lock       = threading.Lock()
+        self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._counters = dict.fromkeys(("hits", "shared_hits", "misses", "stores", "rejected",
+                                        "expired", "evictions", "backend_errors"), 0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters, entries=len(self._entries))
+
+    @staticmethod
+    def key(query: str, location_id: str | None, context: str) -> str:
+        raw = f"{fingerprint(context)}|{location_id or '*'}|{normalize(query)}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, query: str, location_id: str | None, context: str) -> str | None:
+        """Cached SQL for the question, or None."""
+        key = self.key(query, location_id, context)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self.clock() < entry[1]:
+                    self._entries.move_to_end(key)
+                    self._counters["hits"] += 1
+                    return entry[0]
+                del self._entries[key]
+                self._counters["expired"] += 1
+        sql = self._get_shared(key)
+        with self._lock:
+            self._counters["shared_hits" if sql else "misses"] += 1
+        return sql
+
+    def _get_shared(self, key: str) -> str | None:
+        if self.backend is None:
+            return None
+        try:
+            entry = self.backend.get(key)
+        except Exception as exc:
+            logging.warning(f"SQL cache backend read failed: {exc}")
+            self._count("backend_errors")
+            return None
+        if not entry or entry.get("expires_at") is None or entry["expires_at"] <= self.now():
+            return None
+        ok, sql = self.validate(str(entry.get("sql", "")))
+        if not ok:
+            logging.warning(f"SQL cache entry {key[:12]} failed validation ({sql}) — ignored")
+            self._count("rejected")
+            return None
+        remaining = (entry["expires_at"] - self.now()).total_seconds()
+        self._store_local(key, sql, min(self.ttl_s, remaining))
+        return sql
+
+    def put(self, query: str, location_id: str | None, context: str, sql: str) -> bool:
+        """Store SQL for the question if it validates. Returns True if stored."""
+        ok, cleaned = self.validate(sql)
+        if not ok:
+            self._count("rejected")
+            return False
+        key = self.key(query, location_id, context)
+        self._store_local(key, cleaned, self.ttl_s)
+        self._count("stores")
+        if self.backend is not None:
+            try:
+                self.backend.set(key, {"sql": cleaned, "query": normalize(query),
+                                       "location_id": location_id,
+                                       "expires_at": self.now() + timedelta(seconds=self.ttl_s)})
+            except Exception as exc:
+                logging.warning(f"SQL cache backend write failed: {exc}")
+                self._count("backend_errors")
+        return True
+
+    def clear(self):
+        """Drop every local entry (shared ones are left to their TTL; see AI_SQL_CACHE_VERSION)."""
+        with self._lock:
+            self._entries.clear()
+
+    def _store_local(self, key: str, sql: str, ttl_s: float):
+        with self._lock:
+            self._entries[key] = (sql, self.clock() + ttl_s)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def _count(self, key: str):
+        with self._lock:
+            self._counters[key] += 1
+
+
+def cache_from_env(validate, db=None) -> QueryCache:
+    """In-process cache, backed by Firestore when AI_SQL_CACHE_SHARED is set and not mocked."""
+    backend = None
+    if AI_SQL_CACHE_SHARED and db is not None and os.environ.get('USE_MOCK_GCP') != 'true':
+        backend = FirestoreBackend(db)
+    return QueryCache(validate, backend=backend)
@@ -0,0 +1,146 @@
+"""
+Cost-guarded execution of ask_ai's validated SQL.
+
+The generated SQL is a plain SELECT, but nothing bounded what it read: the
+prompt asks for a 365-day window and sensor_logs is partitioned by day, so one
+broad question scans a year of data for every user who asks it. Here:
+
+  · a dry run first estimates the bytes the query would scan. Over
+    AI_QUERY_BYTES_BUDGET, the query's TIMESTAMP_SUB(CURRENT_TIMESTAMP(),
+    INTERVAL n DAY) window is narrowed to 90, 30, 7 and then 1 day until it fits
+    (the answer then says which period it covers); a query that still does not
+    fit, or has no such window, is refused with QueryTooExpensive;
+  · the real job runs with maximum_bytes_billed = AI_MAX_BYTES_BILLED, so
+    BigQuery itself refuses anything the estimate got wrong;
+  · only AI_RESULT_MAX_ROWS rows are fetched, one page, instead of the whole
+    result — the summary prompt never uses more;
+  · results are cached per validated SQL and AI_RESULT_CACHE_BUCKET_S time
+    bucket, so the same question asked by many users within a bucket runs once.
+    Relative windows (CURRENT_TIMESTAMP()) make an answer at most one bucket old.
+
+The result cache is per process.
+"""
+import itertools
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from lazy import gcp_module
+
+AI_QUERY_BYTES_BUDGET       = int(os.environ.get('AI_QUERY_BYTES_BUDGET', 256 * 1024 ** 2))
+AI_MAX_BYTES_BILLED         = int(os.environ.get('AI_MAX_BYTES_BILLED', 1024 ** 3))
+AI_RESULT_MAX_ROWS          = int(os.environ.get('AI_RESULT_MAX_ROWS', 10))
+AI_RESULT_CACHE_BUCKET_S    = float(os.environ.get('AI_RESULT_CACHE_BUCKET_S', 300))
+AI_RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('AI_RESULT_CACHE_MAX_ENTRIES', 256))
+NARROWER_WINDOWS_DAYS       = (90, 30, 7, 1)
+
+_WINDOW = re.compile(r'(TIMESTAMP_SUB\s*\(\s*CURRENT_TIMESTAMP\s*\(\s*\)\s*,\s*INTERVAL\s+)(\d+)(\s+DAY\s*\))',
+                     re.IGNORECASE)
+
+
+class QueryTooExpensive(Exception):
+    def __init__(self, estimated_bytes: int, budget: int):
+        super().__init__(f"query would scan {estimated_bytes} bytes (budget {budget})")
+        self.estimated_bytes = estimated_bytes
+
+
+def window_days(sql: str) -> int | None:
+    """Widest relative day window in the query, or None if it has none."""
+    days = [int(m.group(2)) for m in _WINDOW.finditer(sql)]
+    return max(days) if days else None
+
+
+def narrow_window(sql: str, days: int) -> str:
+    """The query with every relative day window capped at `days`."""
+    return _WINDOW.sub(lambda m: f"{m.group(1)}{min(int(m.group(2)), days)}{m.group(3)}", sql)
+
+
+def _job_config(**kwargs):
+    return gcp_module("bigquery").QueryJobConfig(**kwargs)
+
+
+class QueryRunner:
+    """Dry run, bounded execution and a result cache. Safe to share between threads."""
+
+    def __init__(self, client, bytes_budget: int = AI_QUERY_BYTES_BUDGET,
+                 max_bytes_billed: int = AI_MAX_BYTES_BILLED, max_rows: int = AI_RESULT_MAX_ROWS,
+                 bucket_s: float = AI_RESULT_CACHE_BUCKET_S,
+                 max_entries: int = AI_RESULT_CACHE_MAX_ENTRIES,
+                 job_config=_job_config, clock=time.time):
+        self.client           = client
+        self.bytes_budget     = bytes_budget
+        self.max_bytes_billed = max_bytes_billed
+        self.max_rows         = max_rows
+        self.bucket_s         = bucket_s
+        self.max_entries      = max_entries
+        self.job_config       = job_config
+        self.clock            = clock
+        self._lock            = threading.Lock()
+        self._results: OrderedDict[tuple, dict] = OrderedDict()
+        self._counters = dict.fromkeys(("hits", "misses", "dry_runs", "narrowed", "refused",
+                                        "bytes_estimated", "bytes_billed"), 0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters, entries=len(self._results))
+
+    def run(self, sql: str) -> dict:
+        """
+        Run validated SQL. Returns {"rows", "sql" (as run), "window_days" (set
+        when the window was narrowed), "cached"}; raises QueryTooExpensive.
+        """
+        key = (sql, int(self.clock() // self.bucket_s))
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+                self._counters["hits"] += 1
+                return dict(result, cached=True)
+            self._counters["misses"] += 1
+
+        run_sql, narrowed = self._fit(sql)
+        job = self.client.query(run_sql, job_config=self.job_config(
+            maximum_bytes_billed=self.max_bytes_billed))
+        rows = [dict(row) for row in itertools.islice(
+            job.result(max_results=self.max_rows, page_size=self.max_rows), self.max_rows)]
+        result = {"rows": rows, "sql": run_sql, "window_days": narrowed}
+        with self._lock:
+            self._counters["bytes_billed"] += getattr(job, "total_bytes_billed", None) or 0
+            self._results[key] = result
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+        return dict(result, cached=False)
+
+    def _fit(self, sql: str) -> tuple[str, int | None]:
+        """The query, narrowed if needed, that fits the budget, and the window it was narrowed to."""
+        estimated = self._dry_run(sql)
+        if estimated <= self.bytes_budget:
+            return sql, None
+        current = window_days(sql)
+        for days in NARROWER_WINDOWS_DAYS:
+            if current is None or days >= current:
+                continue
+            candidate = narrow_window(sql, days)
+            estimated = self._dry_run(candidate)
+            if estimated <= self.bytes_budget:
+                logging.info(f"AI query narrowed from {current} to {days} days ({estimated} bytes)")
+                self._count("narrowed")
+                return candidate, days
+        logging.warning(f"AI query refused: {estimated} bytes over the {self.bytes_budget} budget")
+        self._count("refused")
+        raise QueryTooExpensive(estimated, self.bytes_budget)
+
+    def _dry_run(self, sql: str) -> int:
+        job = self.client.query(sql, job_config=self.job_config(dry_run=True, use_query_cache=False))
+        estimated = job.total_bytes_processed or 0
+        with self._lock:
+            self._counters["dry_runs"] += 1
+            self._counters["bytes_estimated"] += estimated
+        return estimated
+
+    def _count(self, key: str):
+        with self._lock:
+            self._counters[key] += 1
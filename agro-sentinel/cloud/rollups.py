@@ -0,0 +1,327 @@
+"""
+Hourly and daily per-sensor rollups of sensor_logs, and the query rewriter
+that answers aggregate questions from them.
+
+Most questions are aggregates — max/min/avg per sensor, per day, over weeks or
+months — and scanning sensor_logs for them reads every raw row of the window.
+Two tables hold one row per sensor and hour (sensor_rollup_hourly) or UTC day
+(sensor_rollup_daily), with, per metric, <m>_min, <m>_max, <m>_sum and
+<m>_count (mean = SUM(<m>_sum) / SUM(<m>_count)), the number of readings, and
+<key>_critical_s: seconds spent beyond the default CRITICAL thresholds
+(rules.DEFAULT_RULES), each reading holding until the next one of its sensor,
+at most ROLLUP_MAX_GAP_S.
+
+Refresh: a BigQuery scheduled query (terraform/main.tf) runs refresh_sql()
+every hour. It re-aggregates the hours of the last ROLLUP_LOOKBACK_HOURS from
+sensor_logs with MERGE, then the days those hours fall in. A gateway that was
+offline delivers its backlog late, dated before that window: the hours (per
+sensor) of rows that arrived within the lookback, by ingested_at, are
+re-aggregated too, as far back as ROLLUP_LATE_DAYS. Anything older, or rows
+written before ingested_at existed, is folded in by hand:
+
+    python rollups.py --since 2026-01-01          # backfill from that date
+    python rollups.py --sql > ../terraform/sql/refresh_rollups.sql
+
+After changing metrics or thresholds, regenerate the SQL file and the table
+schemas in terraform (test_rollups.py checks both).
+
+rewrite() turns an eligible query on sensor_logs — MIN/MAX/AVG/COUNT(*),
+grouped by nothing, sensor_id and/or DATE(timestamp), filtered by a
+relative day window and optionally one sensor_id — into the same query over
+the rollups. Buckets are whole, so the partial bucket at the start of the
+window and the recent ones the last refresh may not have covered yet
+(ROLLUP_FRESHNESS_HOURS) are read from sensor_logs: the answer is exact,
+and only a day or two of partitions is scanned instead of the whole window.
+"""
+import argparse
+import os
+import re
+from datetime import datetime, timezone
+
+import rules
+
+DATASET                = "agro_sentinel_data"
+RAW_TABLE              = f"{DATASET}.sensor_logs"
+HOURLY_TABLE           = f"{DATASET}.sensor_rollup_hourly"
+DAILY_TABLE            = f"{DATASET}.sensor_rollup_daily"
+ROLLUP_LOOKBACK_HOURS  = int(os.environ.get('ROLLUP_LOOKBACK_HOURS', 72))
+ROLLUP_FRESHNESS_HOURS = int(os.environ.get('ROLLUP_FRESHNESS_HOURS', 2))
+ROLLUP_LATE_DAYS       = int(os.environ.get('ROLLUP_LATE_DAYS', 31))   # how far back late rows are looked for
+ROLLUP_MAX_GAP_S       = 900      # a silent sensor's last value counts for at most 15 min
+ROLLUP_MIN_WINDOW_DAYS = 2        # shorter windows are cheap enough on the raw table
+HOURLY_MAX_WINDOW_DAYS = 7        # up to a week from the hourly rollup, beyond from the daily
+
+# sensor_logs columns aggregated; alert keys are the same names
+METRICS = ("temperature", "humidity", "vpd_kpa", "co2_ppm", "soil_moisture",
+           "par_umol", "soil_ec", "soil_temp_c", "dew_point_c", "battery_level")
+CRITICAL_KEYS = tuple(key for key in rules.DEFAULT_RULES["critical"] if key in METRICS)
+
+
+def columns(granularity: str) -> list[tuple[str, str, str]]:
+    """(name, BigQuery type, mode) of a rollup table, in order."""
+    bucket = ("hour", "TIMESTAMP") if granularity == "hourly" else ("day", "DATE")
+    cols = [("sensor_id", "STRING", "REQUIRED"), (*bucket, "REQUIRED"),
+            ("readings", "INTEGER", "REQUIRED")]
+    for m in METRICS:
+        cols += [(f"{m}_min", "FLOAT", "NULLABLE"), (f"{m}_max", "FLOAT", "NULLABLE"),
+                 (f"{m}_sum", "FLOAT", "NULLABLE"), (f"{m}_count", "INTEGER", "NULLABLE")]
+    cols += [(f"{k}_critical_s", "INTEGER", "NULLABLE") for k in CRITICAL_KEYS]
+    return cols + [("updated_at", "TIMESTAMP", "NULLABLE")]
+
+
+# ── Refresh ───────────────────────────────────────────────────────────────────
+def _merge(table: str, bucket: str, source: str) -> str:
+    names = [name for name, _, _ in columns("hourly" if bucket == "hour" else "daily")
+             if name != "updated_at"]
+    updates = ",\n    ".join(f"{n} = S.{n}" for n in names[2:])
+    return (f"MERGE `{table}` T\nUSING (\n{source}\n) S\n"
+            f"ON T.sensor_id = S.sensor_id AND T.{bucket} = S.{bucket} AND T.{bucket} >= first_{bucket}\n"
+            f"WHEN MATCHED THEN UPDATE SET\n    {updates},\n    updated_at = CURRENT_TIMESTAMP()\n"
+            f"WHEN NOT MATCHED THEN INSERT ({', '.join(names)}, updated_at)\n"
+            f"  VALUES ({', '.join(names)}, CURRENT_TIMESTAMP());")
+
+
+def _late(hours: int) -> str:
+    """Row r falls in a late bucket, or in the `hours` - 1 hours after one."""
+    return ("EXISTS (SELECT 1 FROM UNNEST(late_hours) l WHERE l.sensor_id = r.sensor_id\n"
+            f"        AND r.timestamp >= l.hour AND r.timestamp < TIMESTAMP_ADD(l.hour, INTERVAL {hours} HOUR))")
+
+
+def refresh_sql(since: str = f"TIMESTAMP_SUB(run_at, INTERVAL {ROLLUP_LOOKBACK_HOURS} HOUR)",
+                now: str = "@run_time") -> str:
+    """
+    BigQuery script re-aggregating every hour from `since` (a TIMESTAMP
+    expression) on, and the hours of rows ingested since then but dated earlier.
+    """
+    hourly_aggs = []
+    for m in METRICS:
+        hourly_aggs += [f"MIN({m}) AS {m}_min", f"MAX({m}) AS {m}_max",
+                        f"SUM({m}) AS {m}_sum", f"COUNT({m}) AS {m}_count"]
+    hourly_aggs += [f"SUM(IF({rules.sql_condition(k)}, dwell_s, 0)) AS {k}_critical_s"
+                    for k in CRITICAL_KEYS]
+    hourly = (
+        "  SELECT sensor_id, TIMESTAMP_TRUNC(timestamp, HOUR) AS hour, COUNT(*) AS readings,\n    "
+        + ",\n    ".join(hourly_aggs) + "\n"
+        "  FROM (\n"
+        "    SELECT *, LEAST(IFNULL(TIMESTAMP_DIFF(\n"
+        "        LEAD(timestamp) OVER (PARTITION BY sensor_id ORDER BY timestamp), timestamp, SECOND), 0),\n"
+        f"        {ROLLUP_MAX_GAP_S}) AS dwell_s\n"
+        f"    FROM `{RAW_TABLE}` r\n"
+        # A late hour's last reading dwells until the first one of the next hour
+        f"    WHERE timestamp >= first_hour AND (timestamp >= since_hour OR {_late(2)})\n"
+        "  ) r\n"
+        f"  WHERE timestamp >= since_hour OR {_late(1)}\n"
+        "  GROUP BY sensor_id, hour"
+    )
+    daily_aggs = ["SUM(readings) AS readings"]
+    for m in METRICS:
+        daily_aggs += [f"MIN({m}_min) AS {m}_min", f"MAX({m}_max) AS {m}_max",
+                       f"SUM({m}_sum) AS {m}_sum", f"SUM({m}_count) AS {m}_count"]
+    daily_aggs += [f"SUM({k}_critical_s) AS {k}_critical_s" for k in CRITICAL_KEYS]
+    daily = (
+        "  SELECT sensor_id, DATE(hour) AS day,\n    " + ",\n    ".join(daily_aggs) + "\n"
+        f"  FROM `{HOURLY_TABLE}`\n"
+        "  WHERE hour >= TIMESTAMP(first_day) AND (hour >= TIMESTAMP(since_day) OR DATE(hour) IN UNNEST(late_days))\n"
+        "  GROUP BY sensor_id, day"
+    )
+    return (f"-- Generated by cloud/rollups.py — do not edit; regenerate with `python rollups.py --sql`\n"
+            f"DECLARE run_at TIMESTAMP DEFAULT {now};\n"
+            f"DECLARE since_hour TIMESTAMP DEFAULT TIMESTAMP_TRUNC({since}, HOUR);\n"
+            f"DECLARE since_day DATE DEFAULT DATE(since_hour);\n"
+            f"-- Buckets before since_hour that received rows during the lookback\n"
+            f"DECLARE late_hours ARRAY<STRUCT<sensor_id STRING, hour TIMESTAMP>> DEFAULT ARRAY(\n"
+            f"  SELECT DISTINCT AS STRUCT sensor_id, TIMESTAMP_TRUNC(timestamp, HOUR) AS hour\n"
+            f"  FROM `{RAW_TABLE}`\n"
+            f"  WHERE timestamp >= TIMESTAMP_SUB(run_at, INTERVAL {ROLLUP_LATE_DAYS} DAY)\n"
+            f"    AND timestamp < since_hour\n"
+            f"    AND ingested_at >= TIMESTAMP_SUB(run_at, INTERVAL {ROLLUP_LOOKBACK_HOURS} HOUR));\n"
+            f"DECLARE late_days ARRAY<DATE> DEFAULT ARRAY(SELECT DISTINCT DATE(hour) FROM UNNEST(late_hours));\n"
+            f"DECLARE first_hour TIMESTAMP DEFAULT LEAST(since_hour,\n"
+            f"  IFNULL((SELECT MIN(hour) FROM UNNEST(late_hours)), since_hour));\n"
+            f"DECLARE first_day DATE DEFAULT DATE(first_hour);\n\n"
+            f"{_merge(HOURLY_TABLE, 'hour', hourly)}\n\n{_merge(DAILY_TABLE, 'day', daily)}\n")
+
+
+def refresh(client, since: datetime):
+    """Re-aggregate every hour from `since` on (backfill)."""
+    stamp = since.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S+00')
+    client.query(refresh_sql(f"TIMESTAMP '{stamp}'", now="CURRENT_TIMESTAMP()")).result()
+
+
+# ── Query rewriting ───────────────────────────────────────────────────────────
+_QUERY = re.compile(
+    r"^SELECT\s+(?P<select>.+?)\s+FROM\s+`?(?:[\w-]+\.)?" + re.escape(RAW_TABLE) + r"`?"
+    r"\s+WHERE\s+(?P<where>.+?)"
+    r"(?:\s+GROUP\s+BY\s+(?P<group>.+?))?"
+    r"(?:\s+ORDER\s+BY\s+(?P<order>.+?))?"
+    r"(?:\s+LIMIT\s+(?P<limit>\d+))?$",
+    re.IGNORECASE | re.DOTALL)
+_AGG     = re.compile(r"^(?P<round>ROUND\(\s*)?(?P<fn>MIN|MAX|AVG)\(\s*(?P<col>\w+)\s*\)"
+                      r"(?(round)\s*,\s*(?P<digits>\d+)\s*\))(?:\s+AS\s+(?P<alias>\w+))?$", re.IGNORECASE)
+_COUNT   = re.compile(r"^COUNT\(\s*\*\s*\)(?:\s+AS\s+(?P<alias>\w+))?$", re.IGNORECASE)
+_SENSOR  = re.compile(r"^sensor_id$", re.IGNORECASE)
+_DAY     = re.compile(r"^DATE\(\s*timestamp\s*\)(?:\s+AS\s+(?P<alias>\w+))?$", re.IGNORECASE)
+_WINDOW  = re.compile(r"^timestamp\s*(?P<op>>=?)\s*TIMESTAMP_SUB\(\s*CURRENT_TIMESTAMP\(\s*\)\s*,"
+                      r"\s*INTERVAL\s+(?P<days>\d+)\s+DAY\s*\)$", re.IGNORECASE)
+_SENSOR_EQ = re.compile(r"^sensor_id\s*=\s*'(?P<id>[A-Z0-9-]+)'$", re.IGNORECASE)
+_ORDER   = re.compile(r"^(?P<name>\w+)(?:\s+(?:ASC|DESC))?$", re.IGNORECASE)
+
+
+def _split(text: str, sep: str) -> list[str]:
+    """Split on `sep` (a regex) outside parentheses and quotes."""
+    parts, depth, quoted, start = [], 0, False, 0
+    pattern = re.compile(sep, re.IGNORECASE)
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if ch == "'":
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and (m := pattern.match(text, i)):
+            parts.append(text[start:i].strip())
+            i = start = m.end()
+            continue
+        i += 1
+    parts.append(text[start:].strip())
+    return parts
+
+
+def rewrite(sql: str) -> str | None:
+    """The query over the rollups, or None if it is not eligible."""
+    m = _QUERY.match(" ".join(sql.split()))
+    if not m:
+        return None
+
+    # ── WHERE: one relative window, optionally one sensor ─────────────────────
+    window, sensor = None, None
+    for cond in _split(m["where"], r"\s+AND\s+"):
+        cond = cond.strip()
+        while cond.startswith("(") and cond.endswith(")"):
+            cond = cond[1:-1].strip()
+        if (w := _WINDOW.match(cond)) and window is None:
+            window = w
+        elif (s := _SENSOR_EQ.match(cond)) and sensor is None:
+            sensor = s["id"]
+        else:
+            return None
+    if window is None or int(window["days"]) < ROLLUP_MIN_WINDOW_DAYS:
+        return None
+
+    # ── SELECT: aggregates of known metrics, sensor_id, DATE(timestamp) ───────
+    items, keys, names, needed = [], set(), set(), set()
+    day_alias, aggregates = None, 0
+    for item in _split(m["select"], r","):
+        if a := _AGG.match(item):
+            col, fn = a["col"].lower(), a["fn"].upper()
+            if col not in METRICS:
+                return None
+            expr = {"MIN": f"MIN({col}_min)", "MAX": f"MAX({col}_max)",
+                    "AVG": f"SAFE_DIVIDE(SUM({col}_sum), SUM({col}_count))"}[fn]
+            if a["round"]:
+                expr = f"ROUND({expr}, {a['digits']})"
+            alias = a["alias"] or f"{fn.lower()}_{col}"
+            needed.add(col)
+            aggregates += 1
+        elif c := _COUNT.match(item):
+            expr, alias = "SUM(readings)", c["alias"] or "readings"
+            aggregates += 1
+        elif _SENSOR.match(item):
+            expr, alias = "sensor_id", "sensor_id"
+            keys.add("sensor_id")
+        elif d := _DAY.match(item):
+            expr, alias = "day", d["alias"] or "day"
+            day_alias = alias.lower()
+            keys.add("day")
+        else:
+            return None
+        items.append(expr if alias == expr else f"{expr} AS {alias}")
+        names.add(alias.lower())
+    if not aggregates:
+        return None
+
+    # ── GROUP BY / ORDER BY: only the keys and output names ───────────────────
+    group = set()
+    for g in (_split(m["group"], r",") if m["group"] else []):
+        g = "".join(g.lower().split())
+        if g == "sensor_id":
+            group.add("sensor_id")
+        elif g in ("date(timestamp)", day_alias):
+            group.add("day")
+        else:
+            return None
+    if group != keys:
+        return None
+    order = []
+    for o in (_split(m["order"], r",") if m["order"] else []):
+        if not (om := _ORDER.match(o)) or om["name"].lower() not in names:
+            return None
+        order.append(o)
+
+    # ── Buckets from the rollup, partial and recent ones from sensor_logs ─────
+    days  = int(window["days"])
+    unit  = "HOUR" if days <= HOURLY_MAX_WINDOW_DAYS else "DAY"
+    start = f"TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL {days} DAY)"
+    head  = f"TIMESTAMP_ADD(TIMESTAMP_TRUNC({start}, {unit}), INTERVAL 1 {unit})"
+    tail  = (f"TIMESTAMP_TRUNC(TIMESTAMP_SUB(CURRENT_TIMESTAMP(), "
+             f"INTERVAL {ROLLUP_FRESHNESS_HOURS} HOUR), {unit})")
+    only  = f" AND sensor_id = '{sensor}'" if sensor else ""
+    cols  = sorted(needed)
+    rollup_cols = [f"{c}_{s}" for c in cols for s in ("min", "max", "sum", "count")]
+    raw_cols = [x for c in cols for x in (f"{c} AS {c}_min", f"{c} AS {c}_max", f"{c} AS {c}_sum",
+                                          f"IF({c} IS NULL, 0, 1) AS {c}_count")]
+    if unit == "HOUR":
+        rollup = (f"SELECT sensor_id, DATE(hour) AS day, readings{''.join(', ' + c for c in rollup_cols)}\n"
+                  f"    FROM `{HOURLY_TABLE}`\n"
+                  f"    WHERE hour >= {head} AND hour < {tail}{only}")
+    else:
+        rollup = (f"SELECT sensor_id, day, readings{''.join(', ' + c for c in rollup_cols)}\n"
+                  f"    FROM `{DAILY_TABLE}`\n"
+                  f"    WHERE day >= DATE({head}) AND day < DATE({tail}){only}")
+    # Two raw ranges, each a constant range on timestamp so both prune partitions;
+    # LEAST() keeps them disjoint when the window is shorter than one bucket
+    raw = (f"SELECT sensor_id, DATE(timestamp) AS day, 1 AS readings{''.join(', ' + c for c in raw_cols)}\n"
+           f"    FROM `{RAW_TABLE}`\n    WHERE timestamp {window['op']} {start}")
+    head_raw = f"{raw}\n      AND timestamp < LEAST({head}, {tail}){only}"
+    tail_raw = f"{raw}\n      AND timestamp >= {tail}{only}"
+    out = (f"WITH buckets AS (\n    {rollup}\n    UNION ALL\n    {head_raw}\n    UNION ALL\n    {tail_raw}\n)\n"
+           f"SELECT {', '.join(items)}\nFROM buckets")
+    if keys:
+        out += f"\nGROUP BY {', '.join(sorted(keys))}"
+    if order:
+        out += f"\nORDER BY {', '.join(order)}"
+    if m["limit"]:
+        out += f"\nLIMIT {m['limit']}"
+    return out
+
+
+SCHEMA_CONTEXT = f"""
+Rollup tables — prefer them for aggregates over more than a couple of days:
+  `{HOURLY_TABLE}`  one row per sensor_id and hour (TIMESTAMP, UTC), partitioned by DAY on hour
+  `{DAILY_TABLE}`   one row per sensor_id and day (DATE, UTC), partitioned by MONTH on day
+Columns: sensor_id, hour | day, readings (row count), and for each of
+  {', '.join(METRICS)}:
+  <metric>_min, <metric>_max, <metric>_sum, <metric>_count (non-null readings).
+  Mean = SUM(<metric>_sum) / SUM(<metric>_count); never average pre-averaged values.
+  {', '.join(f'{k}_critical_s' for k in CRITICAL_KEYS)}:
+  seconds beyond the default CRITICAL thresholds.
+The rollups trail sensor_logs by up to {ROLLUP_FRESHNESS_HOURS} hours; use sensor_logs for the last hours.
+Filter rollups on hour (TIMESTAMP) or day (DATE) instead of timestamp.
+"""
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sql", action="store_true", help="print the scheduled refresh script")
+    parser.add_argument("--since", help="backfill from this ISO date or timestamp")
+    args = parser.parse_args()
+    if args.sql:
+        print(refresh_sql(), end="")
+    elif args.since:
+        from lazy import gcp_module
+        since = datetime.fromisoformat(args.since)
+        refresh(gcp_module("bigquery").Client(), since if since.tzinfo else since.replace(tzinfo=timezone.utc))
+    else:
+        parser.print_help()
@@ -0,0 +1,292 @@
+"""
+Alert threshold rules (ISA 18.2), compiled once per rule set.
+
+A rule set has three parts:
+
+    critical / warning   {alert key: {"min": x, "max": y}}, None = unbounded
+    compound             [{"name": state key, "when": [[field, op, value], ...],
+                           "then": value if all hold, "else": value otherwise}]
+
+The defaults below apply everywhere. A rules document (ALERT_RULES_PATH, or the
+Firestore document config/alert_rules) can override them per crop and per
+sensor, key by key:
+
+    {"crops":   {"cacao":     {"critical": {"temperature": {"max": 35}}}},
+     "sensors": {"GH-TEN-01": {"crop": "cacao",
+                               "warning":  {"humidity": {"min": 60}}}}}
+
+Effective rules are defaults ← crop ← sensor. Each distinct effective set is
+compiled into a flat, ordered tuple of checks, and every sensor points at its
+table, so evaluating a reading is one dict lookup and one pass over the checks
+however many crops and sensors are configured. The rules document is re-read
+every RULES_TTL_S; a document that fails to load or compile leaves the previous
+rules in force.
+"""
+import json
+import logging
+import operator
+import os
+import threading
+import time
+
+RULES_PATH  = os.environ.get('ALERT_RULES_PATH')
+RULES_TTL_S = float(os.environ.get('ALERT_RULES_TTL_S', 60))
+
+# Alert key → reading field it is checked against, in alert order
+ALERT_FIELDS = {
+    "temperature":   "temperature_c",
+    "humidity":      "humidity_rh",
+    "vpd_kpa":       "vpd_kpa",
+    "co2_ppm":       "co2_ppm",
+    "soil_moisture": "soil_moisture",
+    "par_umol":      "par_umol",
+    "battery_level": "battery_level",
+    "rssi_dbm":      "rssi_dbm",
+}
+LEVELS = (("critical", "CRITICAL"), ("warning", "WARNING"))
+SIDES  = (("max", "HIGH", operator.gt), ("min", "LOW", operator.lt))
+OPS    = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le,
+          "==": operator.eq, "!=": operator.ne}
+
+DEFAULT_RULES = {
+    "critical": {
+        "temperature":   {"min": 10,  "max": 38},
+        "humidity":      {"min": 25,  "max": 98},
+        "vpd_kpa":       {"min": 0.2, "max": 2.0},
+        "co2_ppm":       {"min": 300, "max": 1800},
+        "soil_moisture": {"min": 25,  "max": 92},
+        "battery_level": {"min": 15,  "max": None},
+        "rssi_dbm":      {"min": -90, "max": None},
+    },
+    "warning": {
+        "temperature":   {"min": 15,  "max": 30},
+        "humidity":      {"min": 50,  "max": 85},
+        "vpd_kpa":       {"min": 0.4, "max": 1.2},
+        "co2_ppm":       {"min": 400, "max": 1200},
+        "soil_moisture": {"min": 45,  "max": 80},
+        "par_umol":      {"min": 200, "max": 800},
+    },
+    "compound": [
+        # Botrytis cinerea thrives at 15–25 °C with RH above 85 %
+        {"name": "botrytis_risk", "then": "HIGH", "else": "LOW",
+         "when": [["temperature_c", ">=", 15], ["temperature_c", "<=", 25],
+                  ["humidity_rh", ">", 85]]},
+    ],
+}
+
+
+class RuleTable:
+    """One compiled rule set."""
+
+    __slots__ = ("name", "checks", "compounds", "limits")
+
+    def __init__(self, name: str, rules: dict):
+        self.name = name
+        checks, limits = [], {}
+        for section, level in LEVELS:
+            thresholds = rules.get(section, {})
+            unknown = set(thresholds) - set(ALERT_FIELDS)
+            if unknown:
+                raise ValueError(f"{name}: unknown alert keys {sorted(unknown)}")
+            for key, field in ALERT_FIELDS.items():
+                for side, breach, op in SIDES:
+                    limit = thresholds.get(key, {}).get(side)
+                    if limit is None:
+                        continue
+                    limit = float(limit)
+                    limits[(level, key, breach)] = limit
+                    checks.append((field, op, limit, {"key": key, "level": level, "breach": breach}))
+        self.checks = tuple(checks)
+        self.limits = limits
+        self.compounds = tuple(
+            (c["name"], c.get("then", True), c.get("else", False),
+             tuple((field, OPS[op], float(value)) for field, op, value in c["when"]))
+            for c in rules.get("compound", ()))
+
+    def evaluate(self, values: dict) -> tuple[list, list, dict]:
+        """
+        (critical alerts, warning alerts, compound results) for one reading.
+
+        `values` maps reading fields to sanitised values; None never matches.
+        """
+        alerts = {"CRITICAL": [], "WARNING": []}
+        for field, op, limit, template in self.checks:
+            value = values.get(field)
+            if value is not None and op(value, limit):
+                alerts[template["level"]].append({**template, "value": value})
+        compounds = {}
+        for name, then, otherwise, conditions in self.compounds:
+            hit = True
+            for field, op, limit in conditions:
+                value = values.get(field)
+                if value is None or not op(value, limit):
+                    hit = False
+                    break
+            compounds[name] = then if hit else otherwise
+        return alerts["CRITICAL"], alerts["WARNING"], compounds
+
+
+def _merge(base: dict, override: dict) -> dict:
+    """defaults ← override, per alert key and per compound name."""
+    merged = {}
+    for section, _ in LEVELS:
+        merged[section] = {key: dict(limits) for key, limits in base.get(section, {}).items()}
+        for key, limits in override.get(section, {}).items():
+            merged[section].setdefault(key, {}).update(limits)
+    compounds = {c["name"]: c for c in base.get("compound", ())}
+    for c in override.get("compound", ()):
+        if c.get("when") is None:
+            compounds.pop(c["name"], None)       # {"name": ..., "when": null} disables
+        else:
+            compounds[c["name"]] = c
+    merged["compound"] = list(compounds.values())
+    return merged
+
+
+def compile_rules(document: dict | None) -> tuple[RuleTable, dict[str, RuleTable]]:
+    """(default table, {sensor_id: table}) for a rules document."""
+    document = document or {}
+    base     = _merge(DEFAULT_RULES, document.get("default", {}))
+    default  = RuleTable("default", base)
+    crops    = {crop: _merge(base, rules) for crop, rules in document.get("crops", {}).items()}
+    tables, by_sensor = {}, {}
+    for sensor_id, rules in document.get("sensors", {}).items():
+        crop = rules.get("crop")
+        if crop is not None and crop not in crops:
+            raise ValueError(f"{sensor_id}: unknown crop '{crop}'")
+        effective = _merge(crops.get(crop, base), rules)
+        # Sensors with identical effective rules share one table
+        signature = json.dumps(effective, sort_keys=True)
+        if signature not in tables:
+            tables[signature] = RuleTable(f"{crop or 'default'}/{sensor_id}", effective)
+        by_sensor[sensor_id] = tables[signature]
+    return default, by_sensor
+
+
+def file_loader(path: str):
+    def load() -> dict:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    return load
+
+
+def firestore_loader(db, collection: str = "config", document: str = "alert_rules"):
+    def load() -> dict | None:
+        snapshot = db.collection(collection).document(document).get()
+        return snapshot.to_dict() if snapshot.exists else None
+    return load
+
+
+class RuleEngine:
+    """Compiled rules with periodic reload. Safe to share between threads."""
+
+    def __init__(self, loader=None, ttl_s: float = RULES_TTL_S, clock=time.monotonic):
+        self.loader = loader
+        self.ttl_s  = ttl_s
+        self.clock  = clock
+        self._lock  = threading.Lock()
+        self._compiled = compile_rules(None)
+        self._loaded_at = None
+        self.version = 0
+
+    def reload(self) -> bool:
+        """Load and compile the rules document now. Returns False (rules unchanged) on error."""
+        self._loaded_at = self.clock()
+        if self.loader is None:
+            return True
+        try:
+            compiled = compile_rules(self.loader())
+        except Exception as exc:
+            logging.error(f"Alert rules not reloaded, keeping version {self.version}: {exc}")
+            return False
+        self._compiled = compiled
+        self.version += 1
+        logging.info(f"Alert rules version {self.version} loaded "
+                     f"({len(compiled[1])} sensor overrides)")
+        return True
+
+    def _current(self) -> tuple[RuleTable, dict[str, RuleTable]]:
+        if self._loaded_at is None or self.clock() - self._loaded_at >= self.ttl_s:
+            # One thread reloads; the others keep evaluating with the old tables
+            if self._lock.acquire(blocking=False):
+                try:
+                    self.reload()
+                finally:
+                    self._lock.release()
+        return self._compiled
+
+    def table_for(self, sensor_id: str) -> RuleTable:
+        default, by_sensor = self._current()
+        return by_sensor.get(sensor_id, default)
+
+    def evaluate(self, sensor_id: str, values: dict) -> tuple[list, list, dict]:
+        return self.table_for(sensor_id).evaluate(values)
+
+
+# Reading field → BigQuery column, where they differ
+_BQ_COLUMNS = {"temperature_c": "temperature", "humidity_rh": "humidity"}
+
+
+def describe(rules: dict = DEFAULT_RULES) -> str:
+    """Human/LLM-readable summary of a rule set in BigQuery column names (ai_assistant.SCHEMA_CONTEXT)."""
+    lines = ["Default alarm rules (some sensors have per-crop overrides):"]
+    for section, level in LEVELS:
+        lines.append(f"{level} alarm thresholds:")
+        for key, limits in rules.get(section, {}).items():
+            parts = []
+            if limits.get("max") is not None:
+                parts.append(f"> {limits['max']}")
+            if limits.get("min") is not None:
+                parts.append(f"< {limits['min']}")
+            lines.append(f"  {key} {' or '.join(parts)}")
+    for c in rules.get("compound", ()):
+        cond = " AND ".join(f"{_BQ_COLUMNS.get(field, field)} {op} {value}"
+                            for field, op, value in c["when"])
+        lines.append(f"{c['name']} = '{c.get('then')}' when {cond}")
+    return "\n".join(lines)
+
+
+def sql_condition(key: str, section: str = "critical", rules: dict = DEFAULT_RULES) -> str | None:
+    """BigQuery condition that holds when `key` is beyond its thresholds, or None if it has none."""
+    limits = rules.get(section, {}).get(key, {})
+    column = _BQ_COLUMNS.get(ALERT_FIELDS.get(key, key), key)
+    parts  = [f"{column} {op} {limits[side]}" for side, op in (("max", ">"), ("min", "<"))
+              if limits.get(side) is not None]
+    return " OR ".join(parts) or None
+
+
+def with_registry(loader, registry):
+    """
+    `loader` plus the crop and thresholds each sensor has in the sensor
+    registry (sensor_registry.py). An entry in the rules document's "sensors"
+    section takes precedence; a registry crop the document does not define is
+    ignored rather than failing the whole load.
+    """
+    def load() -> dict:
+        document = dict((loader() if loader else None) or {})
+        crops    = document.get("crops", {})
+        sensors  = dict(document.get("sensors", {}))
+        for sensor_id, overrides in registry.rule_overrides().items():
+            if sensor_id in sensors:
+                continue
+            if overrides.get("crop") is not None and overrides["crop"] not in crops:
+                logging.warning(f"{sensor_id}: registry crop '{overrides['crop']}' has no rules")
+                overrides = {k: v for k, v in overrides.items() if k != "crop"}
+            sensors[sensor_id] = overrides
+        document["sensors"] = sensors
+        return document
+    return load
+
+
+def engine_from_env(db=None, registry=None) -> RuleEngine:
+    """
+    ALERT_RULES_PATH if set, else Firestore config/alert_rules if a client is
+    given; with per-sensor thresholds from `registry` layered on top.
+    """
+    if RULES_PATH:
+        loader = file_loader(RULES_PATH)
+    else:
+        loader = firestore_loader(db) if db is not None else None
+    if registry is not None:
+        loader = with_registry(loader, registry)
+    return RuleEngine(loader)
@@ -0,0 +1,259 @@
+"""
+Sensor registry shared by the ingest, thermal and AI functions.
+
+Replaces the KNOWN_SENSOR_IDS literal that each function carried. A sensor is
+one document in the Firestore collection `sensors` (or one entry of the JSON
+file at SENSOR_REGISTRY_PATH), keyed by sensor_id:
+
+    {"location": "Ambato", "crop": "cacao", "active": true,
+     "hmac_key": "...",                              # optional, per device
+     "thresholds": {"warning": {"humidity": {"min": 60}}},   # rules.py format
+     "updated_at": <timestamp>}
+
+Warm instances keep the registry in memory, so a membership check is one
+lookup in a frozenset and the ingest path never reads the store per message.
+The registry is refreshed every SENSOR_REGISTRY_TTL_S: only documents whose
+updated_at moved are read, and the whole collection is re-read every
+SENSOR_REGISTRY_FULL_RELOAD_S. With SENSOR_REGISTRY_LISTEN a Firestore
+snapshot listener pushes changes as they happen instead; it loads the registry
+at start-up, so it suits the long-running drain worker more than a function. An unknown ID triggers an early refresh
+at most once per SENSOR_REGISTRY_MISS_REFRESH_S, so a new greenhouse is
+accepted within seconds without letting unknown IDs drive store reads.
+Deactivate a sensor with "active": false; a load that fails keeps the previous
+registry in force.
+
+Without a store (local development, USE_MOCK_GCP) the registry is
+DEFAULT_SENSORS, the five greenhouses that used to be hard-coded. So is an
+empty collection, with a warning, so that a fresh deployment does not reject
+every reading. Every refresh is then a full reload, and the first document
+added replaces the defaults. Seed the collection with them once:
+
+    python sensor_registry.py --seed
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+REGISTRY_PATH           = os.environ.get('SENSOR_REGISTRY_PATH')
+REGISTRY_COLLECTION     = os.environ.get('SENSOR_REGISTRY_COLLECTION', 'sensors')
+REGISTRY_TTL_S          = float(os.environ.get('SENSOR_REGISTRY_TTL_S', 300))
+REGISTRY_FULL_RELOAD_S  = float(os.environ.get('SENSOR_REGISTRY_FULL_RELOAD_S', 3600))
+REGISTRY_MISS_REFRESH_S = float(os.environ.get('SENSOR_REGISTRY_MISS_REFRESH_S', 30))
+REGISTRY_LISTEN         = os.environ.get('SENSOR_REGISTRY_LISTEN', 'false').lower() == 'true'
+DESCRIBE_MAX_SENSORS    = 25
+
+DEFAULT_SENSORS = {
+    "GH-AMB-01": {"location": "Ambato"},
+    "GH-DUR-01": {"location": "Duran"},
+    "GH-CAY-01": {"location": "Cayambe"},
+    "GH-ORO-01": {"location": "Machala"},
+    "GH-TEN-01": {"location": "Tena"},
+}
+
+
+def file_loader(path: str):
+    def load(since=None) -> dict:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    return load
+
+
+def firestore_loader(db, collection: str = REGISTRY_COLLECTION):
+    """All documents, or with `since` only those updated after it."""
+    def load(since=None) -> dict:
+        query = db.collection(collection)
+        if since is not None:
+            query = query.where("updated_at", ">", since)
+        return {doc.id: doc.to_dict() for doc in query.stream()}
+    return load
+
+
+class SensorRegistry:
+    """In-memory sensor registry with periodic refresh. Safe to share between threads."""
+
+    def __init__(self, loader=None, ttl_s: float = REGISTRY_TTL_S,
+                 full_reload_s: float = REGISTRY_FULL_RELOAD_S,
+                 miss_refresh_s: float = REGISTRY_MISS_REFRESH_S, clock=time.monotonic):
+        self.loader         = loader
+        self.ttl_s          = ttl_s
+        self.full_reload_s  = full_reload_s
+        self.miss_refresh_s = miss_refresh_s
+        self.clock          = clock
+        self._lock          = threading.Lock()
+        self._sensors: dict[str, dict] = {}
+        self._ids           = frozenset()
+        self._loaded_at     = None
+        self._full_at       = None
+        self._since         = None          # wall-clock start of the last successful load
+        self._listener      = None
+        self._fallback      = False         # empty store: serving DEFAULT_SENSORS
+        self.version        = 0
+        if loader is None:
+            self._apply(DEFAULT_SENSORS, full=True)
+
+    # ── Loading ───────────────────────────────────────────────────────────────
+    def _apply(self, changes: dict, full: bool):
+        """Swap in a new snapshot; readers see either the old one or the new one."""
+        sensors = {} if full else dict(self._sensors)
+        for sensor_id, meta in changes.items():
+            if meta is None or meta.get("active", True) is False:
+                sensors.pop(sensor_id, None)
+            else:
+                sensors[sensor_id] = dict(meta)
+        self._sensors, self._ids = sensors, frozenset(sensors)
+        self.version += 1
+
+    def reload(self, full: bool | None = None) -> bool:
+        """Refresh from the store now. Returns False (registry unchanged) on error."""
+        now = self.clock()
+        self._loaded_at = now
+        if self.loader is None:
+            return True
+        if full is None:
+            full = (self._fallback or self._full_at is None
+                    or now - self._full_at >= self.full_reload_s)
+        started = datetime.now(timezone.utc)
+        try:
+            changes = self.loader(None if full else self._since)
+        except Exception as exc:
+            logging.error(f"Sensor registry not reloaded, keeping version {self.version}: {exc}")
+            return False
+        if full:
+            changes = self._or_defaults(changes)
+        self._apply(changes, full)
+        self._since = started
+        if full:
+            self._full_at = now
+        if full or changes:
+            logging.info(f"Sensor registry version {self.version}: {len(self._ids)} sensors "
+                         f"({'full' if full else len(changes)} {'reload' if full else 'changed'})")
+        return True
+
+    def _or_defaults(self, loaded: dict) -> dict:
+        """A full load, or DEFAULT_SENSORS if the store has no documents at all."""
+        if loaded:
+            self._fallback = False
+            return loaded
+        if not self._fallback:
+            logging.warning(f"Sensor registry is empty — using the {len(DEFAULT_SENSORS)} default "
+                            f"sensors until it is seeded (python sensor_registry.py --seed)")
+        self._fallback = True
+        return DEFAULT_SENSORS
+
+    def _refresh(self, older_than: float):
+        if self._listener is not None and self._loaded_at is not None:
+            return                                   # pushed by the snapshot listener
+        if self._loaded_at is None or self.clock() - self._loaded_at >= older_than:
+            # One thread reloads; the others keep using the current snapshot
+            if self._lock.acquire(blocking=False):
+                try:
+                    self.reload()
+                finally:
+                    self._lock.release()
+
+    def listen(self, db, collection: str = REGISTRY_COLLECTION) -> bool:
+        """
+        Follow the collection with a Firestore snapshot listener instead of
+        polling. Returns False if the client cannot listen (mock, REST).
+        """
+        ref = db.collection(collection)
+        if not hasattr(ref, "on_snapshot"):
+            return False
+
+        def on_snapshot(docs, changes, read_time):
+            with self._lock:
+                if self._fallback or not docs:
+                    self._apply(self._or_defaults({doc.id: doc.to_dict() for doc in docs}), full=True)
+                else:
+                    self._apply({c.document.id: (None if c.type.name == "REMOVED"
+                                                 else c.document.to_dict())
+                                 for c in changes}, full=False)
+                self._loaded_at = self.clock()
+
+        self.reload(full=True)
+        self._listener = ref.on_snapshot(on_snapshot)
+        return True
+
+    # ── Lookups ───────────────────────────────────────────────────────────────
+    def __contains__(self, sensor_id) -> bool:
+        self._refresh(self.ttl_s)
+        if sensor_id in self._ids:
+            return True
+        # A greenhouse added since the last refresh: look again, rate-limited
+        self._refresh(self.miss_refresh_s)
+        return sensor_id in self._ids
+
+    def ids(self) -> frozenset:
+        self._refresh(self.ttl_s)
+        return self._ids
+
+    def get(self, sensor_id: str) -> dict | None:
+        self._refresh(self.ttl_s)
+        return self._sensors.get(sensor_id)
+
+    def hmac_key(self, sensor_id: str) -> str | None:
+        meta = self.get(sensor_id)
+        return meta.get("hmac_key") if meta else None
+
+    def rule_overrides(self) -> dict:
+        """Per-sensor crop and thresholds as a rules.py "sensors" section."""
+        self._refresh(self.ttl_s)
+        overrides = {}
+        for sensor_id, meta in self._sensors.items():
+            rules = dict(meta.get("thresholds") or {})
+            if meta.get("crop"):
+                rules["crop"] = meta["crop"]
+            if rules:
+                overrides[sensor_id] = rules
+        return overrides
+
+    def describe(self, limit: int = DESCRIBE_MAX_SENSORS) -> str:
+        """Known farm IDs for ai_assistant's schema context, capped at `limit`."""
+        self._refresh(self.ttl_s)
+        sensors = self._sensors
+        ids = sorted(sensors)
+        shown = [f"{sid} ({sensors[sid]['location']})" if sensors[sid].get("location")
+                 else sid for sid in ids[:limit]]
+        more = f", and {len(ids) - limit} more" if len(ids) > limit else ""
+        return f"Known farm IDs: {', '.join(shown)}{more}"
+
+
+def registry_from_env(db=None) -> SensorRegistry:
+    """SENSOR_REGISTRY_PATH if set, else the Firestore collection unless mocked, else the defaults."""
+    if REGISTRY_PATH:
+        return SensorRegistry(file_loader(REGISTRY_PATH))
+    if db is not None and os.environ.get('USE_MOCK_GCP') != 'true':
+        registry = SensorRegistry(firestore_loader(db))
+        if REGISTRY_LISTEN:
+            registry.listen(db)
+        return registry
+    return SensorRegistry()
+
+
+def seed(db, sensors: dict = DEFAULT_SENSORS, collection: str = REGISTRY_COLLECTION) -> list[str]:
+    """Create the documents of `sensors` that the collection lacks. Returns the IDs created."""
+    created = []
+    for sensor_id, meta in sensors.items():
+        ref = db.collection(collection).document(sensor_id)
+        if ref.get().exists:
+            continue
+        ref.set({**meta, "active": True, "updated_at": datetime.now(timezone.utc)})
+        created.append(sensor_id)
+    return created
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seed", action="store_true",
+                        help=f"add the default sensors missing from the `{REGISTRY_COLLECTION}` collection")
+    args = parser.parse_args()
+    if args.seed:
+        from lazy import gcp_module
+        created = seed(gcp_module("firestore").Client())
+        print(f"Seeded {len(created)} sensors: {', '.join(created) or 'none missing'}")
+    else:
+        parser.print_help()
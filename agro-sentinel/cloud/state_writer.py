@@ -0,0 +1,160 @@
+"""
+Change-aware writer for the per-sensor Firestore state documents.
+
+Writing the whole greenhouses/<sensor_id> document for every reading costs one
+Firestore write and one snapshot to every open dashboard, even when nothing a
+dashboard shows has changed. This keeps, per sensor, what the document already
+holds and:
+
+  · writes only the fields that changed (merge=True);
+  · writes at once when status, an alert (key, level, breach) or a field in
+    URGENT_FIELDS changes;
+  · otherwise coalesces changes and writes them at most once per
+    STATE_MIN_INTERVAL_S, with the sensor's next reading or flush(). Only
+    long-running workers coalesce (process_sensor_batch, drain_subscription,
+    which flush every pass); the per-message function flushes before it
+    returns, so it only saves the writes of unchanged readings;
+  · refreshes last_update at least every STATE_HEARTBEAT_S, so "sensor silent"
+    stays detectable on the dashboard while values hold still. last_update is
+    the event time of the newest reading offered (main._order_by_event_time),
+    also when coalesced changes are flushed later.
+
+The cache is per process: a cold start or a second instance writes the full
+document on its first reading per sensor, which is never wrong, only extra.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+STATE_MIN_INTERVAL_S = float(os.environ.get('STATE_MIN_INTERVAL_S', 30))
+STATE_HEARTBEAT_S    = float(os.environ.get('STATE_HEARTBEAT_S', 300))
+URGENT_FIELDS        = frozenset({"status", "botrytis_risk"})
+FIRESTORE_MAX_BATCH  = 500     # Firestore's limit of writes per batch
+
+_MISSING = object()
+
+
+def _alert_set(alerts) -> frozenset:
+    """What makes an alert transition; the breaching value itself changes every reading."""
+    return frozenset((a.get("key"), a.get("level"), a.get("breach")) for a in alerts or ())
+
+
+class StateWriter:
+    def __init__(self, db, collection: str = "greenhouses",
+                 min_interval_s: float = STATE_MIN_INTERVAL_S,
+                 heartbeat_s: float = STATE_HEARTBEAT_S, clock=time.monotonic):
+        self.db             = db
+        self.collection     = collection
+        self.min_interval_s = min_interval_s
+        self.heartbeat_s    = heartbeat_s
+        self.clock          = clock
+        self._lock          = threading.Lock()
+        self._stored: dict[str, dict]     = {}   # what Firestore holds, per sensor
+        self._pending: dict[str, dict]    = {}   # changed fields not yet written
+        self._written_at: dict[str, float] = {}
+        self._last_update: dict[str, object] = {}   # newest last_update offered, per sensor
+        self._counters = dict.fromkeys(("offered", "written", "urgent", "heartbeats",
+                                        "coalesced", "skipped_unchanged", "fields_written"), 0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters, sensors=len(self._stored),
+                        pending=sum(1 for p in self._pending.values() if p))
+
+    def _plan(self, sensor_id: str, state: dict, now: float) -> dict | None:
+        """Fields to write for this reading now, or None. Caller holds the lock."""
+        c = self._counters
+        c["offered"] += 1
+        stored  = self._stored.get(sensor_id)
+        pending = self._pending.setdefault(sensor_id, {})
+        if "last_update" in state:
+            self._last_update[sensor_id] = state["last_update"]
+        if stored is None:
+            # First sighting in this process: write everything
+            return dict(state)
+
+        changed = {k: v for k, v in state.items()
+                   if k != "last_update" and stored.get(k, _MISSING) != v}
+        pending.update(changed)
+        urgent = (any(k in URGENT_FIELDS for k in changed)
+                  or ("active_alerts" in changed
+                      and _alert_set(changed["active_alerts"]) != _alert_set(stored.get("active_alerts"))))
+        age = now - self._written_at[sensor_id]
+        if urgent:
+            c["urgent"] += 1
+        elif pending and age >= self.min_interval_s:
+            pass
+        elif age >= self.heartbeat_s:
+            c["heartbeats"] += 1
+        elif changed:
+            c["coalesced"] += 1
+            return None
+        else:
+            c["skipped_unchanged"] += 1
+            return None
+        fields = dict(pending)
+        if "last_update" in state:
+            fields["last_update"] = state["last_update"]
+        return fields
+
+    def _commit(self, sensor_id: str, fields: dict, now: float):
+        self._stored.setdefault(sensor_id, {}).update(fields)
+        pending = self._pending.setdefault(sensor_id, {})
+        for key, value in fields.items():
+            # A concurrent reading may have queued a newer value meanwhile
+            if pending.get(key, _MISSING) is value:
+                del pending[key]
+        self._written_at[sensor_id] = now
+        self._counters["written"] += 1
+        self._counters["fields_written"] += len(fields)
+
+    def offer(self, sensor_id: str, state: dict) -> bool:
+        """Apply one reading's state document. Returns True if it was written now."""
+        now = self.clock()
+        with self._lock:
+            fields = self._plan(sensor_id, state, now)
+        if fields is None:
+            return False
+        self.db.collection(self.collection).document(sensor_id).set(fields, merge=True)
+        with self._lock:
+            self._commit(sensor_id, fields, now)
+        return True
+
+    def offer_many(self, states: dict[str, dict]) -> int:
+        """offer() for many sensors, written with Firestore batched writes. Returns writes made."""
+        now = self.clock()
+        with self._lock:
+            plans = [(sid, f) for sid, st in states.items()
+                     if (f := self._plan(sid, st, now)) is not None]
+        self._write_batched(plans, now)
+        if plans:
+            logging.info(f"State writer: {len(plans)}/{len(states)} sensor documents written")
+        return len(plans)
+
+    def flush(self, force: bool = False) -> int:
+        """
+        Write coalesced changes whose interval has passed (all of them with
+        `force`). For long-running workers, whose sensors may fall silent with
+        changes still pending.
+        """
+        now = self.clock()
+        stamp = datetime.now(timezone.utc)
+        with self._lock:
+            plans = [(sid, {**pending, "last_update": self._last_update.get(sid, stamp)})
+                     for sid, pending in self._pending.items()
+                     if pending and (force or now - self._written_at[sid] >= self.min_interval_s)]
+        self._write_batched(plans, now)
+        return len(plans)
+
+    def _write_batched(self, plans: list[tuple[str, dict]], now: float):
+        for i in range(0, len(plans), FIRESTORE_MAX_BATCH):
+            chunk = plans[i:i + FIRESTORE_MAX_BATCH]
+            batch = self.db.batch()
+            for sensor_id, fields in chunk:
+                batch.set(self.db.collection(self.collection).document(sensor_id), fields, merge=True)
+            batch.commit()
+            with self._lock:
+                for sensor_id, fields in chunk:
+                    self._commit(sensor_id, fields, now)
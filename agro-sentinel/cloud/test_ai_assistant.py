@@ -0,0 +1,115 @@
+import json
+import os
+import unittest
+from importlib.util import find_spec
+from types import SimpleNamespace
+from unittest.mock import patch
+
+os.environ['USE_MOCK_GCP'] = 'true'
+
+import query_runner
+
+HAS_DEPS = bool(find_spec("functions_framework") and find_spec("flask"))
+
+
+def _request(query: str, stream: bool = False, location_id: str | None = None):
+    body = {"query": query}
+    if location_id:
+        body["location_id"] = location_id
+    headers = {"Accept": "text/event-stream"} if stream else {}
+    return SimpleNamespace(method="POST", headers=headers, get_json=lambda silent=False: body)
+
+
+def _events(text: str) -> list[tuple[str, dict]]:
+    """Parse a server-sent event stream, checking its framing on the way."""
+    assert text.endswith("\n\n"), "stream must end with a blank line"
+    events = []
+    for block in text[:-2].split("\n\n"):
+        lines = block.split("\n")
+        assert len(lines) == 2, f"one event and one data line per message: {block!r}"
+        assert lines[0].startswith("event: ") and lines[1].startswith("data: "), block
+        events.append((lines[0][len("event: "):], json.loads(lines[1][len("data: "):])))
+    return events
+
+
+@unittest.skipUnless(HAS_DEPS, "functions-framework / flask not installed")
+class TestAskAi(unittest.TestCase):
+    """ask_ai on the MOCK_AI / MOCK_DB path, buffered and streamed."""
+
+    def setUp(self):
+        import ai_assistant
+        self.ai = ai_assistant
+        patcher = patch.dict(os.environ, {"MOCK_AI": "true", "MOCK_DB": "true"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(ai_assistant, "MOCK_LATENCY_S", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _buffered(self, query: str, **kwargs) -> tuple[dict, int]:
+        body, status, _ = self.ai.ask_ai(_request(query, **kwargs))
+        return body, status
+
+    def _streamed(self, query: str, **kwargs) -> list[tuple[str, dict]]:
+        response = self.ai.ask_ai(_request(query, stream=True, **kwargs))
+        self.assertEqual(response.mimetype, "text/event-stream")
+        self.assertEqual(response.headers["Cache-Control"], "no-cache")
+        return _events(response.get_data(as_text=True))
+
+    def _no_intent(self):
+        return patch.object(self.ai.intents, "match", return_value=None)
+
+    def test_stream_ends_with_the_buffered_answer(self):
+        with self._no_intent():
+            buffered, status = self._buffered("¿Cómo va el invernadero?")
+            events = self._streamed("¿Cómo va el invernadero?")
+        self.assertEqual(status, 200)
+
+        names = [name for name, _ in events]
+        self.assertEqual([data["stage"] for name, data in events if name == "stage"], ["received", "sql", "rows"])
+        self.assertEqual(names[:3], ["stage", "stage", "stage"])
+        self.assertEqual(names[-1], "done")
+        self.assertGreater(names.count("token"), 1)              # one per chunk of the answer
+        self.assertEqual(set(names[3:-1]), {"token"})
+
+        done = events[-1][1]
+        self.assertEqual(done, buffered)
+        self.assertEqual("".join(data["text"] for name, data in events if name == "token").strip(),
+                         buffered["answer"])
+
+    def test_intent_fast_path_streams_the_same_answer(self):
+        buffered, _ = self._buffered("temperatura maxima")
+        events = self._streamed("temperatura maxima")
+        stages = [data for name, data in events if name == "stage"]
+        self.assertEqual(stages[1]["intent"], "aggregate")
+        self.assertEqual([name for name, _ in events][-2:], ["token", "done"])
+        self.assertEqual(events[-1][1], buffered)
+
+    def test_too_expensive_query_is_an_error_event(self):
+        expensive = query_runner.QueryTooExpensive(10 ** 12, 2 ** 28)
+        with self._no_intent(), patch.object(self.ai, "_fetch", side_effect=expensive):
+            events = self._streamed("temperatura de todo el histórico")
+            buffered, status = self._buffered("temperatura de todo el histórico")
+        self.assertEqual(events[-1], ("error", {"error": self.ai.TOO_EXPENSIVE_ANSWER,
+                                                "reason": "too_expensive"}))
+        self.assertNotIn("done", [name for name, _ in events])
+        self.assertEqual((buffered, status), ({"answer": self.ai.TOO_EXPENSIVE_ANSWER, "sql": ""}, 200))
+
+    def test_rejected_sql_is_an_error_event(self):
+        with self._no_intent(), patch.object(self.ai.sql_cache, "get", return_value="DELETE FROM x"):
+            events = self._streamed("borra todo")
+            buffered, _ = self._buffered("borra todo")
+        self.assertEqual([name for name, _ in events], ["stage", "error"])
+        self.assertEqual(events[-1][1]["reason"], "unsafe_sql")
+        self.assertEqual(buffered, {"answer": self.ai.UNSAFE_SQL_ANSWER, "sql": ""})
+
+    def test_unexpected_failure_is_an_error_event_without_details(self):
+        with self._no_intent(), patch.object(self.ai, "_fetch", side_effect=RuntimeError("secret")):
+            events = self._streamed("¿Cómo va el invernadero?")
+            buffered, status = self._buffered("¿Cómo va el invernadero?")
+        self.assertEqual(events[-1], ("error", {"error": "Internal server error"}))
+        self.assertEqual((buffered, status), ({"error": "Internal server error"}, 500))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,207 @@
+import unittest
+from datetime import datetime, timezone
+from importlib.util import find_spec
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import alarms
+import rules
+from alarms import AlarmManager
+
+LIMITS = rules.RuleTable("default", rules.DEFAULT_RULES).limits
+
+
+def _conditions(temperature):
+    """Rule conditions for a reading with only a temperature."""
+    critical, warning, _ = rules.RuleTable("default", rules.DEFAULT_RULES).evaluate(
+        {"temperature_c": temperature})
+    return critical + warning
+
+
+class TestAlarmManager(unittest.TestCase):
+    def setUp(self):
+        self.manager = AlarmManager(on_delay_s=0, off_delay_s=60, flood_threshold=4, flood_window_s=600)
+
+    def _update(self, temperature, at, sensor_id="GH-AMB-01"):
+        return self.manager.update(sensor_id, _conditions(temperature),
+                                   {"temperature": temperature}, LIMITS, at)
+
+    def test_hovering_at_the_limit_raises_once(self):
+        events = []
+        for i, temperature in enumerate([30.2, 29.9, 30.1, 29.7, 30.3, 29.8] * 5):
+            events += self._update(temperature, i * 10)[1]
+        self.assertEqual([e["event"] for e in events], ["RAISED"])
+        standing, _ = self._update(29.8, 400)
+        self.assertEqual([(a["key"], a["level"], a["peak"]) for a in standing],
+                         [("temperature", "WARNING", 30.3)])
+
+    def test_clears_after_deadband_and_off_delay(self):
+        self._update(31.0, 0)
+        self.assertEqual(self._update(29.0, 10)[1], [])          # clear pending
+        self.assertEqual(self._update(30.5, 20)[1], [])          # breached again: restarts
+        self.assertEqual(self._update(29.0, 30)[1], [])
+        standing, events = self._update(29.0, 90)
+        self.assertEqual((standing, [e["event"] for e in events]), ([], ["CLEARED"]))
+
+    def test_on_delay_filters_spikes(self):
+        self.manager.on_delay_s = 30
+        self.assertEqual(self._update(31.0, 0)[1], [])
+        self.assertEqual(self._update(25.0, 10)[1], [])
+        self._update(31.0, 20)
+        standing, events = self._update(31.0, 50)
+        self.assertEqual([e["event"] for e in events], ["RAISED"])
+
+    def test_acknowledge_and_status_per_level(self):
+        standing, events = self._update(39.0, 0)
+        self.assertEqual([(a["level"], a["state"]) for a in standing],
+                         [("CRITICAL", "ACTIVE"), ("WARNING", "ACTIVE")])
+        event = self.manager.acknowledge("GH-AMB-01", standing[0]["id"], 5)
+        self.assertEqual(event["event"], "ACKNOWLEDGED")
+        self.assertIsNone(self.manager.acknowledge("GH-AMB-01", standing[0]["id"], 6))
+        standing, _ = self._update(37.0, 10)        # critical held by the deadband
+        self.assertEqual(standing[0]["state"], "ACKNOWLEDGED")
+
+    def test_out_of_order_reading_does_not_move_state(self):
+        self._update(31.0, 100)
+        standing, events = self._update(20.0, 50)
+        self.assertEqual((len(standing), events), (1, []))
+        self.assertEqual(self.manager.stats()["out_of_order"], 1)
+
+    def test_flood_collapses_into_one_event(self):
+        kinds = []
+        for i in range(30):      # chattering past every deadband and delay
+            kinds += [e["event"] for e in self._update(39.0 if i % 3 == 0 else 20.0, i * 61)[1]]
+        self.assertEqual(kinds.count("FLOOD_START"), 1)
+        self.assertLess(kinds.count("RAISED"), 5)
+        self.assertGreater(self.manager.stats()["suppressed"], 0)
+
+        kinds = [e["event"] for e in self._update(20.0, 5000)[1]]
+        self.assertEqual(kinds, ["FLOOD_END"])
+
+
+class _Firestore:
+    """Just enough of a Firestore client: documents in nested dicts."""
+
+    def __init__(self):
+        self.docs: dict[str, dict] = {}
+
+    def collection(self, name):
+        return SimpleNamespace(document=lambda doc_id: _Document(self.docs.setdefault(name, {}), doc_id))
+
+
+class _Document:
+    def __init__(self, docs, doc_id):
+        self.docs, self.id = docs, doc_id
+
+    def get(self):
+        data = self.docs.get(self.id)
+        return SimpleNamespace(exists=data is not None, to_dict=lambda: data)
+
+    def set(self, data, merge=False):
+        self.docs[self.id] = {**self.docs.get(self.id, {}), **data} if merge else dict(data)
+
+
+class TestAlarmPersistence(unittest.TestCase):
+    def setUp(self):
+        self.db = _Firestore()
+        self.now = 0.0
+
+    def _manager(self):
+        return AlarmManager(on_delay_s=0, off_delay_s=60, loader=alarms.firestore_loader(self.db),
+                            ack_loader=alarms.firestore_ack_loader(self.db), ack_poll_s=30,
+                            clock=lambda: self.now)
+
+    def _update(self, manager, temperature, at):
+        standing, events = manager.update("GH-AMB-01", _conditions(temperature),
+                                          {"temperature": temperature}, LIMITS, at)
+        # What main.py writes to the state document
+        self.db.collection("greenhouses").document("GH-AMB-01").set({"active_alerts": standing}, merge=True)
+        return standing, events
+
+    def test_cold_instance_restores_standing_alarms(self):
+        standing, events = self._update(self._manager(), 39.0, 0)
+        self.assertEqual([e["event"] for e in events], ["RAISED", "RAISED"])
+
+        cold = self._manager()
+        restored, events = self._update(cold, 39.5, 10)
+        self.assertEqual(events, [])                                  # not raised again
+        self.assertEqual([a["id"] for a in restored], [a["id"] for a in standing])
+        self.assertEqual(restored[0]["peak"], 39.5)
+        self.assertEqual(cold.stats()["loaded"], 1)
+
+        _, events = self._update(cold, 20.0, 100)
+        _, events = self._update(cold, 20.0, 200)
+        self.assertEqual([e["event"] for e in events], ["CLEARED", "CLEARED"])
+
+    def test_recorded_acknowledgement_is_applied_on_next_reading(self):
+        manager = self._manager()
+        standing, _ = self._update(manager, 31.0, 0)
+        alarm_id = standing[0]["id"]
+        self.now = 1                     # first poll: nothing recorded yet
+        self._update(manager, 31.0, 1)
+
+        at = datetime.fromtimestamp(5, timezone.utc)
+        ack, _ = alarms.record_acknowledgement(self.db, "GH-AMB-01", alarm_id, "op-1", at)
+        self.assertEqual(ack["by"], "op-1")
+        again, _ = alarms.record_acknowledgement(self.db, "GH-AMB-01", alarm_id, "op-2",
+                                                 datetime.fromtimestamp(9, timezone.utc))
+        self.assertEqual(again["by"], "op-1")                         # first one kept
+        self.assertEqual(alarms.record_acknowledgement(self.db, "GH-AMB-01", "GH-AMB-01:nope", "op-1", at),
+                         (None, "not standing"))
+
+        self.now = 10                    # polled at 1, not due yet
+        standing, events = self._update(manager, 31.0, 10)
+        self.assertEqual((standing[0]["state"], events), ("ACTIVE", []))
+        self.now = 31
+        standing, events = self._update(manager, 31.0, 31)
+        self.assertEqual([(e["event"], e["at"]) for e in events], [("ACKNOWLEDGED", alarms._iso(5))])
+        self.assertEqual(standing[0]["state"], "ACKNOWLEDGED")
+
+        # A cold instance reads the acknowledged state back
+        restored, events = self._update(self._manager(), 31.0, 40)
+        self.assertEqual((restored[0]["state"], events), ("ACKNOWLEDGED", []))
+
+    def test_load_failure_starts_empty(self):
+        def broken(sensor_id):
+            raise ConnectionError("firestore unavailable")
+
+        manager = AlarmManager(loader=broken)
+        standing, events = manager.update("GH-AMB-01", _conditions(31.0), {"temperature": 31.0}, LIMITS, 0)
+        self.assertEqual([e["event"] for e in events], ["RAISED"])
+        self.assertEqual(manager.stats()["load_errors"], 1)
+
+
+@unittest.skipUnless(find_spec("functions_framework"), "functions-framework not installed")
+class TestAcknowledgeEndpoint(unittest.TestCase):
+    def setUp(self):
+        import alarm_api
+        self.api = alarm_api
+        self.db = _Firestore()
+        self.db.collection("greenhouses").document("GH-AMB-01").set(
+            {"active_alerts": [{"id": "GH-AMB-01:temperature:WARNING:HIGH:0"}]})
+        for target, value in (("db", self.db),):
+            patcher = patch.object(alarm_api, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _post(self, body, claims={"uid": "op-1"}):
+        request = SimpleNamespace(method="POST", headers={}, get_json=lambda silent=False: body)
+        with patch.object(self.api.http_auth, "verify_request", return_value=claims):
+            return self.api.acknowledge_alarm(request)
+
+    def test_acknowledges_standing_alarm(self):
+        body, status, _ = self._post({"sensor_id": "GH-AMB-01",
+                                      "alarm_id": "GH-AMB-01:temperature:WARNING:HIGH:0"})
+        self.assertEqual((status, body["acknowledged"]["by"]), (200, "op-1"))
+        self.assertIn("GH-AMB-01:temperature:WARNING:HIGH:0", self.db.docs[alarms.ACK_COLLECTION])
+
+    def test_rejects_unauthenticated_and_bad_input(self):
+        alarm_id = "GH-AMB-01:temperature:WARNING:HIGH:0"
+        self.assertEqual(self._post({"sensor_id": "GH-AMB-01", "alarm_id": alarm_id}, claims=None)[1], 401)
+        self.assertEqual(self._post({"sensor_id": "GH-DUR-01", "alarm_id": alarm_id})[1], 400)
+        self.assertEqual(self._post({"sensor_id": "GH-AMB-01", "alarm_id": "GH-AMB-01:x"})[1], 404)
+        self.assertNotIn(alarms.ACK_COLLECTION, self.db.docs)
+
+
+if __name__ == "__main__":
+    unittest.main()
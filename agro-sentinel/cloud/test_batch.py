@@ -0,0 +1,215 @@
+import base64
+import json
+import os
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+os.environ['USE_MOCK_GCP'] = 'true'
+
+import envelope
+import main
+from alarms import AlarmManager
+from bq_writer import BigQueryWriter
+from dedup import Deduplicator
+from event_time import EventTimeTracker
+from last_known import LastKnown
+from state_writer import StateWriter
+
+
+def _reading(sensor_id="GH-AMB-01", temp=22.0, ts="2026-10-01T12:00:00Z"):
+    return {"sensor_id": sensor_id, "timestamp": ts, "temperature_c": temp, "humidity_rh": 70.0}
+
+
+def _event(data: bytes) -> dict:
+    return {"data": base64.b64encode(data).decode()}
+
+
+class TestBatchIngest(unittest.TestCase):
+    def setUp(self):
+        insert = patch.object(main.bq_client, "insert_rows_json", return_value=[])
+        self.insert = insert.start()
+        self.addCleanup(insert.stop)
+        db = patch.object(main, "db")
+        self.db = db.start()
+        self.addCleanup(db.stop)
+        collections = {"greenhouses": MagicMock()}
+        collections["greenhouses"].document.side_effect = lambda sensor_id: sensor_id
+        self.db.collection.side_effect = lambda name: collections.setdefault(name, MagicMock())
+        writer = patch.object(main, "state_writer", StateWriter(self.db))
+        writer.start()
+        self.addCleanup(writer.stop)
+        bq = patch.object(main, "bq_writer", BigQueryWriter(main.bq_client, "t", autoflush=False,
+                                                            sleep=lambda s: None,
+                                                            row_id=main._insert_id))
+        bq.start()
+        self.addCleanup(bq.stop)
+        alarms = patch.object(main, "alarm_manager", AlarmManager())
+        alarms.start()
+        self.addCleanup(alarms.stop)
+        dedup = patch.object(main, "deduplicator", Deduplicator())
+        dedup.start()
+        self.addCleanup(dedup.stop)
+        clock = patch.object(main, "event_clock", EventTimeTracker())
+        clock.start()
+        self.addCleanup(clock.stop)
+        known = patch.object(main, "carry_forward", LastKnown(main.VALID_RANGES))
+        known.start()
+        self.addCleanup(known.stop)
+
+    def _state_writes(self) -> dict:
+        batch = self.db.batch.return_value
+        return {c.args[0]: c.args[1] for c in batch.set.call_args_list if isinstance(c.args[0], str)}
+
+    def test_one_insert_and_latest_state_per_sensor(self):
+        events = [_event(json.dumps(_reading(temp=20.0, ts="2026-10-01T12:00:05Z")).encode()),
+                  _event(json.dumps(_reading(temp=21.0, ts="2026-10-01T12:00:00Z")).encode()),
+                  _event(envelope.pack([_reading("GH-DUR-01", 30.0), _reading("GH-DUR-01", 31.0)])),
+                  _event(b"not json"),
+                  _event(json.dumps(_reading("GH-XXX-99")).encode())]
+        stats = main.process_sensor_batch(events)
+
+        self.assertEqual(self.insert.call_count, 1)
+        self.assertEqual(len(self.insert.call_args.args[1]), 4)
+        states = self._state_writes()
+        self.assertEqual(states["GH-AMB-01"]["temperature"], 20.0)
+        self.assertEqual(states["GH-DUR-01"]["temperature"], 31.0)
+        self.assertEqual(states["GH-DUR-01"]["status"], "WARNING")
+        self.assertEqual(len(states), 2)
+        self.assertEqual((stats["messages"], stats["rejected_messages"], stats["readings"],
+                          stats["rejected_readings"], stats["rows_inserted"], stats["sensors_updated"]),
+                         (5, 1, 5, 1, 4, 2))
+
+    def test_large_batches_are_chunked(self):
+        readings = [_reading(temp=20.0 + i % 10) for i in range(1200)]
+        events = [_event(envelope.pack(readings[i:i + 100])) for i in range(0, 1200, 100)]
+        main.process_sensor_batch(events)
+        self.assertEqual([len(c.args[1]) for c in self.insert.call_args_list], [500, 500, 200])
+
+    def test_drain_acks_only_when_every_row_landed(self):
+        message = SimpleNamespace(data=json.dumps(_reading()).encode(), attributes={})
+        subscriber = MagicMock()
+        subscriber.pull.return_value.received_messages = [SimpleNamespace(ack_id="a1", message=message)]
+
+        main.drain_subscription(subscriber, "projects/p/subscriptions/s")
+        self.assertEqual(subscriber.acknowledge.call_args.kwargs["request"]["ack_ids"], ["a1"])
+
+        subscriber.acknowledge.reset_mock()
+        self.insert.return_value = [{"index": 0, "errors": ["backend error"]}]
+        stats = main.drain_subscription(subscriber, "projects/p/subscriptions/s")
+        self.assertEqual(stats["rows_failed"], 1)
+        subscriber.acknowledge.assert_not_called()
+
+    def test_late_readings_reach_bigquery_only(self):
+        main.process_sensor_batch([_event(json.dumps(_reading(temp=25.0, ts="2026-10-01T12:00:00Z")).encode())])
+        backlog = [_reading(temp=20.0 + i, ts=f"2026-10-01T0{i}:00:00Z") for i in range(5)]
+        self.db.batch.return_value.reset_mock()
+        stats = main.process_sensor_batch([_event(envelope.pack(backlog))])
+        self.assertEqual((stats["late_readings"], stats["rows_inserted"], stats["sensors_updated"]), (5, 5, 0))
+        self.assertEqual(self._state_writes(), {})
+        # Arrival time is kept, so the rollup refresh re-aggregates their hours
+        rows = self.insert.call_args.args[1]
+        self.assertTrue(all(row["ingested_at"] > "2026-10-02" for row in rows))
+
+        # One message of a backlog: only its newest reading becomes state
+        backlog = [_reading(temp=20.0 + i, ts=f"2026-10-02T0{i}:00:00Z") for i in reversed(range(5))]
+        with patch.object(main.state_writer, "offer") as offer:
+            main.process_sensor_data(_event(envelope.pack(backlog)), None)
+        self.assertEqual(offer.call_count, 1)
+        state = offer.call_args.args[1]
+        self.assertEqual((state["temperature"], state["last_update"].isoformat()),
+                         (24.0, "2026-10-02T04:00:00+00:00"))
+        self.assertEqual(main.event_clock.stats()["late"], 5)
+
+    def test_redelivered_readings_are_dropped_except_failed_ones(self):
+        readings = [dict(_reading(), seq=seq, seq_epoch=7) for seq in (1, 2, 3)]
+        self.insert.side_effect = lambda table, rows, row_ids: [
+            {"index": i, "errors": ["backend error"]} for i, row in enumerate(rows) if row["seq"] == 3]
+        stats = main.process_sensor_batch([_event(envelope.pack(readings))])
+        self.assertEqual((stats["duplicates"], stats["rows_inserted"], stats["rows_failed"]), (0, 2, 1))
+        self.assertEqual(self.insert.call_args_list[0].kwargs["row_ids"],
+                         ["GH-AMB-01:7:1", "GH-AMB-01:7:2", "GH-AMB-01:7:3"])
+
+        self.insert.side_effect = None
+        stats = main.process_sensor_batch([_event(envelope.pack(readings + readings[:1]))])
+        self.assertEqual((stats["duplicates"], stats["rows_inserted"]), (3, 1))
+        self.assertEqual(self.insert.call_args.args[1][0]["seq"], 3)
+
+    def test_partial_reading_keeps_the_other_fields(self):
+        full = dict(_reading(temp=30.0, ts="2026-10-01T12:00:00Z"), co2_ppm=600.0)
+        main.process_sensor_batch([_event(json.dumps(full).encode())])
+        self.db.batch.return_value.reset_mock()
+
+        # Edge reduction: only humidity moved, the rest is left out
+        partial = {"sensor_id": "GH-AMB-01", "timestamp": "2026-10-01T12:01:00Z", "humidity_rh": 90.0,
+                   "reduction": {"humidity_rh": "deadband:1.0"}}
+        main.process_sensor_batch([_event(json.dumps(partial).encode())])
+
+        row = self.insert.call_args.args[1][0]
+        self.assertEqual(row["vpd_kpa"], main.calculate_vpd(30.0, 90.0))
+        self.assertEqual(row["dew_point_c"], main.calculate_dew_point(30.0, 90.0))
+        self.assertEqual((row["humidity"], row["temperature"], row["co2_ppm"]), (90.0, None, None))
+
+        # Only what changed reaches Firestore: no None over temperature or CO2
+        written = self._state_writes()["GH-AMB-01"]
+        self.assertNotIn("temperature", written)
+        self.assertNotIn("co2_ppm", written)
+        self.assertEqual((written["humidity"], written["vpd_kpa"]), (90.0, row["vpd_kpa"]))
+        self.assertIn("humidity", {a["key"] for a in written["active_alerts"]})
+
+        # Per-message path does the same
+        partial.update(timestamp="2026-10-01T12:02:00Z", humidity_rh=91.0)
+        with patch.object(main.state_writer, "offer") as offer:
+            main.process_sensor_data(_event(json.dumps(partial).encode()), None)
+        state = offer.call_args.args[1]
+        self.assertEqual((state["temperature"], state["co2_ppm"]), (30.0, 600.0))
+
+    def test_unreduced_dropout_is_not_filled(self):
+        full = dict(_reading(temp=30.0, ts="2026-10-01T12:00:00Z"), co2_ppm=600.0)
+        main.process_sensor_batch([_event(json.dumps(full).encode())])
+
+        # A raw reading is complete: a null or absent field is a sensor fault
+        dropout = {"sensor_id": "GH-AMB-01", "timestamp": "2026-10-01T12:01:00Z",
+                   "temperature_c": None, "humidity_rh": 90.0}
+        main.process_sensor_batch([_event(json.dumps(dropout).encode())])
+        row = self.insert.call_args.args[1][0]
+        self.assertEqual((row["temperature"], row["co2_ppm"], row["vpd_kpa"]), (None, None, None))
+
+        # Explicit null in a reduced record stays null too
+        reduced = dict(dropout, timestamp="2026-10-01T12:02:00Z",
+                       reduction={"humidity_rh": "deadband:1.0", "temperature_c": "missing"})
+        main.process_sensor_batch([_event(json.dumps(reduced).encode())])
+        row = self.insert.call_args.args[1][0]
+        self.assertEqual((row["temperature"], row["vpd_kpa"]), (None, None))
+        self.assertEqual(main.carry_forward.stats()["fields_carried"], 1)      # co2_ppm only
+
+    def test_per_message_path_does_not_leave_changes_pending(self):
+        db = MagicMock()
+        with patch.object(main, "state_writer", StateWriter(db)):
+            for i, temp in enumerate((22.0, 22.4)):
+                reading = _reading(temp=temp, ts=f"2026-10-01T12:00:0{i}Z")
+                main.process_sensor_data(_event(json.dumps(reading).encode()), None)
+            self.assertEqual(main.state_writer.stats()["pending"], 0)
+        # The second reading's change is within STATE_MIN_INTERVAL_S, yet written
+        self.assertEqual(db.batch.return_value.set.call_args.args[1]["temperature"], 22.4)
+    def test_per_message_failure_raises_for_redelivery(self):
+        reading = dict(_reading(), seq=1, seq_epoch=7)
+        self.insert.return_value = [{"index": 0, "errors": ["backend error"]}]
+        with self.assertRaises(RuntimeError):
+            main.process_sensor_data(_event(json.dumps(reading).encode()), None)
+        self.assertEqual(main.bq_writer.stats()["pending"], 0)      # nothing left behind in memory
+
+        self.insert.return_value = []
+        self.insert.side_effect = ConnectionError("unavailable")
+        with self.assertRaises(RuntimeError):
+            main.process_sensor_data(_event(json.dumps(reading).encode()), None)
+
+        # The redelivered message is not taken for a duplicate
+        self.insert.side_effect = None
+        with patch.object(main, "state_writer", StateWriter(MagicMock())):
+            main.process_sensor_data(_event(json.dumps(reading).encode()), None)
+        self.assertEqual(self.insert.call_args.args[1][0]["seq"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
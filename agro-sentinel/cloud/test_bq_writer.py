@@ -0,0 +1,87 @@
+import json
+import os
+import tempfile
+import unittest
+
+from bq_writer import BigQueryWriter
+from mock_gcp import InMemoryBigQuery
+
+TABLE = "agro_sentinel_data.sensor_logs"
+
+
+def _rows(n, start=0):
+    return [{"sensor_id": "GH-AMB-01", "seq": i} for i in range(start, start + n)]
+
+
+class TestBigQueryWriter(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.bq = InMemoryBigQuery()
+        self.spill = os.path.join(tempfile.mkdtemp(), "spill.jsonl")
+        self.sleeps = []
+
+    def _writer(self, **kwargs):
+        kwargs.setdefault("spill_path", self.spill)
+        return BigQueryWriter(self.bq, TABLE, autoflush=False, clock=lambda: self.now,
+                              sleep=self.sleeps.append, **kwargs)
+
+    def _stored(self):
+        return [r["seq"] for r in self.bq.tables.get(TABLE, [])]
+
+    def test_flushes_on_rows_bytes_and_age(self):
+        writer = self._writer(max_rows=10, max_bytes=10**6, max_age_s=5)
+        writer.add(_rows(9))
+        self.assertEqual(self.bq.calls, 0)
+        writer.add(_rows(1, 9))
+        self.assertEqual((self.bq.calls, len(self._stored())), (1, 10))
+
+        writer.add(_rows(1, 10))
+        self.now = 4.9
+        self.assertEqual(writer.flush_if_due(), 0)
+        self.now = 5
+        self.assertEqual(writer.flush_if_due(), 1)
+
+        small = self._writer(max_rows=1000, max_bytes=100)
+        small.add(_rows(4, 20))
+        self.assertEqual(small.stats()["pending"], 0)
+
+    def test_only_failed_rows_are_retried(self):
+        self.bq.row_failure_rate = 0.3
+        writer = self._writer(max_attempts=10)
+        inserted, failed = writer.write(_rows(1200))
+        self.assertEqual((inserted, failed), (1200, []))
+        self.assertEqual(sorted(self._stored()), list(range(1200)))   # no duplicates
+        self.assertTrue(self.sleeps)
+        self.assertGreater(writer.stats()["retried"], 0)
+
+    def test_invalid_rows_are_dropped_not_retried(self):
+        self.bq.invalid = lambda row: row["seq"] == 3
+        writer = self._writer()
+        self.assertEqual(writer.write(_rows(5)), (4, []))
+        self.assertEqual((self.bq.calls, writer.stats()["invalid"]), (1, 1))
+
+    def test_outage_spills_and_replays(self):
+        writer = self._writer(max_attempts=2)
+        self.bq.unavailable = True
+        writer.add(_rows(3))
+        inserted, failed = writer.flush()
+        self.assertEqual((inserted, len(failed)), (0, 3))
+        with open(self.spill) as f:
+            self.assertEqual([json.loads(line)["seq"] for line in f], [0, 1, 2])
+
+        self.bq.unavailable = False
+        self.assertEqual(writer.write(_rows(2, 3)), (5, []))
+        self.assertEqual(self._stored(), [3, 4, 0, 1, 2])
+        self.assertFalse(os.path.exists(self.spill))
+        self.assertEqual(writer.stats()["replayed"], 3)
+
+    def test_without_spill_failed_rows_are_returned(self):
+        self.bq.unavailable = True
+        writer = self._writer(max_attempts=1)
+        inserted, failed = writer.write(_rows(2), spill=False)
+        self.assertEqual((inserted, [r["seq"] for r in failed]), (0, [0, 1]))
+        self.assertFalse(os.path.exists(self.spill))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+
+from dedup import Deduplicator
+
+
+class TestDeduplicator(unittest.TestCase):
+    def setUp(self):
+        self.dedup = Deduplicator(window=8)
+
+    def _accepted(self, seqs, epoch=1, sensor_id="GH-AMB-01"):
+        return [seq for seq in seqs if self.dedup.accept(sensor_id, epoch, seq)]
+
+    def test_replayed_backlog_is_dropped(self):
+        self.assertEqual(self._accepted(range(1, 6)), [1, 2, 3, 4, 5])
+        self.assertEqual(self._accepted(range(3, 9)), [6, 7, 8])
+        self.assertEqual(self.dedup.stats()["duplicates"], 3)
+
+    def test_late_reading_inside_the_window_is_kept(self):
+        self.assertEqual(self._accepted([1, 2, 5, 4, 3, 4]), [1, 2, 5, 4, 3])
+
+    def test_reading_behind_the_window_is_dropped(self):
+        self._accepted([1, 20])
+        self.assertEqual(self._accepted([5, 13]), [13])
+        self.assertEqual(self.dedup.stats()["behind_window"], 1)
+
+    def test_new_epoch_and_sensors_are_independent(self):
+        self._accepted([1, 2, 3])
+        self.assertEqual(self._accepted([1, 2], sensor_id="GH-DUR-01"), [1, 2])
+        self.assertEqual(self._accepted([1, 2], epoch=2), [1, 2])
+        self.assertEqual(self.dedup.stats()["epochs"], 1)
+
+    def test_forget_lets_a_redelivery_through(self):
+        self._accepted([1, 2, 3])
+        self.dedup.forget("GH-AMB-01", 1, 2)
+        self.assertEqual(self._accepted([1, 2, 3]), [2])
+
+    def test_readings_without_seq_pass(self):
+        self.assertEqual([self.dedup.accept("GH-AMB-01", None, None) for _ in range(3)], [True] * 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
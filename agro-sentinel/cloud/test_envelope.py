@@ -0,0 +1,115 @@
+import base64
+import hashlib
+import hmac
+import importlib.util
+import json
+import os
+import unittest
+from unittest.mock import patch
+
+os.environ['USE_MOCK_GCP'] = 'true'
+
+import envelope
+import main
+from bq_writer import BigQueryWriter
+from last_known import LastKnown
+
+
+def _reading(sensor_id="GH-AMB-01", temp=22.0):
+    return {"sensor_id": sensor_id, "timestamp": "2026-10-01T12:00:00Z",
+            "temperature_c": temp, "humidity_rh": 70.0}
+
+
+def _event(data: bytes, secret: str = "") -> dict:
+    event = {"data": base64.b64encode(data).decode()}
+    if secret:
+        event["attributes"] = {"x_signature": hmac.new(secret.encode(), data, hashlib.sha256).hexdigest()}
+    return event
+
+
+class TestEnvelopeIngest(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(main.bq_client, "insert_rows_json", return_value=[])
+        self.insert = patcher.start()
+        self.addCleanup(patcher.stop)
+        # Unbuffered, so every reading is inserted before process_sensor_data returns
+        writer = patch.object(main, "bq_writer", BigQueryWriter(main.bq_client, "t", max_rows=1,
+                                                                autoflush=False))
+        writer.start()
+        self.addCleanup(writer.stop)
+        known = patch.object(main, "carry_forward", LastKnown(main.VALID_RANGES))
+        known.start()
+        self.addCleanup(known.stop)
+
+    def _inserted(self):
+        return [row for call in self.insert.call_args_list for row in call.args[1]]
+
+    def test_legacy_single_reading_still_accepted(self):
+        main.process_sensor_data(_event(json.dumps(_reading()).encode()), None)
+        self.assertEqual([r["temperature"] for r in self._inserted()], [22.0])
+
+    def test_envelope_processes_every_reading(self):
+        readings = [_reading(temp=20.0 + i) for i in range(5)] + [_reading("GH-DUR-01", 30.0)]
+        main.process_sensor_data(_event(envelope.pack(readings)), None)
+        rows = self._inserted()
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[-1]["sensor_id"], "GH-DUR-01")
+
+    def test_one_signature_covers_the_envelope(self):
+        data = envelope.pack([_reading(), _reading(temp=23.0)])
+        with patch.dict(os.environ, {"HMAC_SECRET": "s3cret"}):
+            main.process_sensor_data(_event(data, "s3cret"), None)
+            self.assertEqual(len(self._inserted()), 2)
+
+            tampered = data[:-1] + bytes([data[-1] ^ 1])
+            event = _event(data, "s3cret")
+            event["data"] = base64.b64encode(tampered).decode()
+            main.process_sensor_data(event, None)
+            self.assertEqual(len(self._inserted()), 2)
+
+    def test_reduction_tag_stored_as_json(self):
+        reading = dict(_reading(), reduction={"temperature_c": "deadband:0.2"})
+        bad     = dict(_reading(), reduction={"not_a_field": 1})
+        main.process_sensor_data(_event(envelope.pack([reading, bad])), None)
+        rows = self._inserted()
+        self.assertEqual(json.loads(rows[0]["reduction"]), {"temperature_c": "deadband:0.2"})
+        self.assertIsNone(rows[1]["reduction"])
+
+    def test_corrupt_envelope_is_rejected(self):
+        main.process_sensor_data(_event(envelope.MAGIC + b"\x01\x01garbage"), None)
+        self.assertEqual(self._inserted(), [])
+
+
+EDGE_ENVELOPE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "edge", "src", "envelope.py")
+
+
+@unittest.skipUnless(os.path.exists(EDGE_ENVELOPE), "edge sources not checked out next to cloud/")
+class TestEdgeParity(unittest.TestCase):
+    """The gateway and the function deploy separately, each with its own copy."""
+
+    @classmethod
+    def setUpClass(cls):
+        spec = importlib.util.spec_from_file_location("edge_envelope", EDGE_ENVELOPE)
+        cls.edge = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(cls.edge)
+
+    def test_same_wire_constants(self):
+        for name in ("MAGIC", "VERSION", "CODEC_IDENTITY", "CODEC_ZLIB",
+                     "MAX_READINGS", "MAX_DECODED_BYTES"):
+            self.assertEqual(getattr(self.edge, name), getattr(envelope, name), name)
+
+    def test_same_code_apart_from_docstring(self):
+        def code(path):
+            with open(path, encoding="utf-8") as f:
+                return f.read().split('"""', 2)[2]
+        self.assertEqual(code(EDGE_ENVELOPE), code(envelope.__file__))
+
+    def test_edge_packs_what_cloud_unpacks(self):
+        readings = [_reading(temp=20.0 + i) for i in range(20)]
+        for compress in (True, False):
+            self.assertEqual(envelope.unpack(self.edge.pack(readings, compress=compress)), readings)
+            self.assertEqual(self.edge.unpack(envelope.pack(readings, compress=compress)), readings)
+
+
+if __name__ == '__main__':
+    unittest.main()
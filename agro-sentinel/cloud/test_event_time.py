@@ -0,0 +1,47 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from event_time import EventTimeTracker
+
+NOW = datetime(2026, 10, 1, 12, 0, tzinfo=timezone.utc)
+
+
+class TestEventTimeTracker(unittest.TestCase):
+    def setUp(self):
+        self.tick = 0.0
+        self.tracker = EventTimeTracker(max_skew_s=300, log_every_s=60,
+                                        now=lambda: NOW, clock=lambda: self.tick)
+
+    def _observe(self, minutes_ago, sensor_id="GH-AMB-01"):
+        return self.tracker.observe(sensor_id, NOW - timedelta(minutes=minutes_ago))[1]
+
+    def test_older_than_latest_is_late(self):
+        self.assertEqual([self._observe(m) for m in (10, 5, 8, 5, 1)], [True, True, False, True, True])
+        self.assertTrue(self._observe(60, sensor_id="GH-DUR-01"))
+        self.assertEqual(self.tracker.stats()["late"], 1)
+
+    def test_untimed_and_future_readings_use_receive_time(self):
+        self.assertEqual(self.tracker.observe("GH-AMB-01", None), (NOW, True))
+        self.assertEqual(self.tracker.observe("GH-AMB-01", NOW + timedelta(days=1)), (NOW, True))
+        self.assertTrue(self._observe(-2))                   # within the allowed skew
+        self.assertEqual((self.tracker.stats()["untimed"], self.tracker.stats()["future"]), (1, 1))
+
+    def test_lag_histogram_per_sensor(self):
+        for minutes in (0, 0, 0, 2, 3 * 24 * 60):
+            self._observe(minutes)
+        summary = self.tracker.lag_summary()["GH-AMB-01"]
+        self.assertEqual((summary["readings"], summary["p50_s"], summary["p95_s"]), (5, 5, None))
+        self.assertEqual((summary["buckets"]["5"], summary["buckets"]["300"], summary["buckets"]["inf"]), (3, 1, 1))
+        self.assertEqual(summary["max_s"], 3 * 86400)
+
+    def test_summary_logged_at_most_once_per_interval(self):
+        self._observe(1)
+        self.assertFalse(self.tracker.maybe_log())
+        self.tick = 61
+        with self.assertLogs(level="INFO"):
+            self.assertTrue(self.tracker.maybe_log())
+        self.assertFalse(self.tracker.maybe_log())
+
+
+if __name__ == "__main__":
+    unittest.main()
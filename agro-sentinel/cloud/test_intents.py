@@ -0,0 +1,65 @@
+import re
+import unittest
+from datetime import datetime
+
+import eval_intents
+import intents
+import rollups
+
+
+class TestMatch(unittest.TestCase):
+    def test_eval_set(self):
+        results = eval_intents.evaluate(eval_intents.load(
+            f"{eval_intents.HERE}/intents_eval.jsonl"))
+        self.assertEqual(results["wrong"], [])
+        self.assertGreaterEqual(results["coverage"], 0.9)
+
+    def test_aggregate_slots_and_sql(self):
+        intent = intents.match("¿Cuál fue la temperatura máxima esta semana?", "GH-AMB-01")
+        self.assertEqual((intent.name, intent.metrics, intent.stats, intent.days, intent.lang),
+                         ("aggregate", ("temperature",), ("max",), 7, "es"))
+        self.assertIn("ROUND(MAX(temperature), 1) AS max_temperature", intent.sql)
+        self.assertIn("INTERVAL 7 DAY) AND sensor_id = 'GH-AMB-01'", intent.sql)
+        # Served from the rollups
+        self.assertIn(rollups.HOURLY_TABLE, rollups.rewrite(intent.sql))
+
+    def test_low_confidence_falls_back(self):
+        self.assertIsNone(intents.match("temperatura maxima del invernadero de tomates grandes"))
+        self.assertIsNotNone(intents.match("temperatura maxima del invernadero de tomates grandes",
+                                           min_confidence=0.3))
+
+    def test_templates_are_plain_selects_with_a_limit(self):
+        for case in eval_intents.load(f"{eval_intents.HERE}/intents_eval.jsonl"):
+            intent = intents.match(case["query"], "GH-AMB-01")
+            if intent is None:
+                continue
+            self.assertTrue(intent.sql.startswith("SELECT "), intent.sql)
+            self.assertRegex(intent.sql, r"\bLIMIT \d+$")
+            self.assertNotRegex(intent.sql, re.compile(r"\b(DROP|DELETE|INSERT|UPDATE|MERGE|SET)\b", re.I))
+
+
+class TestFormat(unittest.TestCase):
+    def test_aggregate_in_both_languages(self):
+        es = intents.match("CO2 máximo y mínimo hoy")
+        self.assertEqual(intents.format_answer(es, [{"max_co2_ppm": 1250.0, "min_co2_ppm": 410.0, "readings": 96}]),
+                         "CO2 máximo **1250 ppm**; CO2 mínimo **410 ppm** en las últimas 24 horas (96 lecturas).")
+        en = intents.match("average humidity this month")
+        self.assertEqual(intents.format_answer(en, [{"avg_humidity": 71.04, "readings": 2880}], narrowed_days=7),
+                         "Average relative humidity **71.0 %** in the last 7 days (2880 readings).")
+
+    def test_no_data(self):
+        intent = intents.match("alarmas esta semana", "GH-AMB-01")
+        self.assertEqual(intents.format_answer(intent, [{"temperature": 0, "readings": 0}]),
+                         "No hay datos en los últimos 7 días en GH-AMB-01.")
+
+    def test_health_lists_low_battery_and_weak_signal(self):
+        intent = intents.match("Which sensors have low battery?")
+        now = datetime(2026, 10, 1, 12, 0)
+        rows = [{"sensor_id": "GH-AMB-01", "timestamp": now, "battery_level": 9, "rssi_dbm": -60},
+                {"sensor_id": "GH-TEN-01", "timestamp": now, "battery_level": 80, "rssi_dbm": -95}]
+        self.assertEqual(intents.format_answer(intent, rows),
+                         "Low battery: GH-AMB-01 (9 %). Weak signal: GH-TEN-01 (-95 dBm).")
+
+
+if __name__ == "__main__":
+    unittest.main()
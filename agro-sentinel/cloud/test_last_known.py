@@ -0,0 +1,72 @@
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import MagicMock
+
+from last_known import CARRIED_KEY, LastKnown, firestore_loader
+
+FIELDS = ("temperature_c", "humidity_rh", "co2_ppm")
+
+
+class TestLastKnown(unittest.TestCase):
+    def test_absent_fields_are_carried_forward(self):
+        known = LastKnown(FIELDS, max_age_s=600)
+        full = {"sensor_id": "GH-AMB-01", "temperature_c": 22.0, "humidity_rh": 70.0}
+        self.assertIs(known.merge("GH-AMB-01", full, at=0), full)
+
+        merged = known.merge("GH-AMB-01", {"humidity_rh": 75.0}, at=60)
+        self.assertEqual(merged, {"humidity_rh": 75.0, "temperature_c": 22.0,
+                                  CARRIED_KEY: frozenset({"temperature_c"})})
+        self.assertEqual(known.merge("GH-AMB-01", {}, at=120)["humidity_rh"], 75.0)
+
+    def test_null_fields_stay_null(self):
+        known = LastKnown(FIELDS, max_age_s=600)
+        known.merge("GH-AMB-01", {"temperature_c": 22.0, "humidity_rh": 70.0}, at=0)
+        dropout = {"temperature_c": None, "humidity_rh": 71.0}
+        self.assertIs(known.merge("GH-AMB-01", dropout, at=60), dropout)
+        self.assertEqual(known.merge("GH-AMB-01", {}, at=120)["temperature_c"], 22.0)   # not forgotten
+
+    def test_values_are_recorded_without_filling(self):
+        known = LastKnown(FIELDS, max_age_s=600)
+        known.merge("GH-AMB-01", {"temperature_c": 22.0}, at=0, fill=False)
+        self.assertEqual(known.merge("GH-AMB-01", {"humidity_rh": 70.0}, at=60, fill=False),
+                         {"humidity_rh": 70.0})
+        self.assertEqual(known.merge("GH-AMB-01", {}, at=120)["temperature_c"], 22.0)
+
+    def test_stale_values_are_not_carried(self):
+        known = LastKnown(FIELDS, max_age_s=600)
+        known.merge("GH-AMB-01", {"temperature_c": 22.0}, at=0)
+        self.assertEqual(known.merge("GH-AMB-01", {"humidity_rh": 70.0}, at=601), {"humidity_rh": 70.0})
+        self.assertEqual(known.stats()["fields_stale"], 1)
+
+    def test_late_reading_does_not_replace_newer_value(self):
+        known = LastKnown(FIELDS)
+        known.merge("GH-AMB-01", {"temperature_c": 25.0}, at=100)
+        known.merge("GH-AMB-01", {"temperature_c": 20.0}, at=50)
+        self.assertEqual(known.merge("GH-AMB-01", {}, at=110)["temperature_c"], 25.0)
+
+    def test_first_reading_is_filled_from_firestore_state(self):
+        db = MagicMock()
+        db.collection.return_value.document.return_value.get.return_value.to_dict.return_value = {
+            "temperature": 21.5, "humidity": None, "status": "OK",
+            "last_update": datetime.fromtimestamp(1000, timezone.utc)}
+        known = LastKnown(FIELDS, firestore_loader(db, {"temperature_c": "temperature",
+                                                        "humidity_rh": "humidity"}))
+        merged = known.merge("GH-AMB-01", {"humidity_rh": 70.0}, at=1060)
+        self.assertEqual(merged["temperature_c"], 21.5)
+        db.collection.return_value.document.assert_called_once_with("GH-AMB-01")
+
+        known.merge("GH-AMB-01", {"humidity_rh": 71.0}, at=1120)
+        db.collection.return_value.document.assert_called_once()     # loaded once per sensor
+        self.assertEqual(known.stats()["seeded"], 1)
+
+    def test_seed_failure_is_not_fatal(self):
+        def broken(sensor_id):
+            raise ConnectionError("firestore unavailable")
+
+        known = LastKnown(FIELDS, broken)
+        self.assertEqual(known.merge("GH-AMB-01", {"humidity_rh": 70.0}, at=0), {"humidity_rh": 70.0})
+        self.assertEqual(known.stats()["seed_errors"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+import unittest
+from unittest.mock import patch
+
+from lazy import LazyClient
+
+
+class Client:
+    def ping(self):
+        return "pong"
+
+
+class TestLazyClient(unittest.TestCase):
+    def test_built_once_on_first_use(self):
+        built = []
+        client = LazyClient(lambda: built.append(1) or Client(), "test client")
+        self.assertFalse(client.initialised)
+        self.assertEqual((client.ping(), client.ping()), ("pong", "pong"))
+        self.assertEqual(built, [1])
+
+    def test_attributes_can_be_patched(self):
+        client = LazyClient(Client)
+        with patch.object(client, "ping", return_value="patched"):
+            self.assertEqual(client.ping(), "patched")
+        self.assertEqual(client.ping(), "pong")
+
+    def test_importing_main_builds_no_client_and_skips_numpy(self):
+        code = ("import sys, main; "
+                "print(main.bq_client.initialised, main.db.initialised, 'numpy' in sys.modules)")
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)),
+                             env=dict(os.environ, USE_MOCK_GCP='true'), check=True).stdout
+        self.assertEqual(out.split(), ["False", "False", "False"])
+
+
+if __name__ == "__main__":
+    unittest.main()
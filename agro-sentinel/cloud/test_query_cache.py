@@ -0,0 +1,85 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from query_cache import QueryCache, normalize
+
+SQL = "SELECT MAX(temperature) FROM `agro_sentinel_data.sensor_logs`"
+
+
+def _validate(sql):
+    if not sql.upper().startswith("SELECT"):
+        return False, "Only SELECT statements are permitted"
+    return True, sql if "LIMIT" in sql else sql + " LIMIT 100"
+
+
+class DictBackend:
+    def __init__(self):
+        self.docs = {}
+
+    def get(self, key):
+        return self.docs.get(key)
+
+    def set(self, key, entry):
+        self.docs[key] = entry
+
+
+class TestQueryCache(unittest.TestCase):
+    def setUp(self):
+        self.tick = 0.0
+        self.now = datetime(2026, 10, 1, tzinfo=timezone.utc)
+        self.backend = DictBackend()
+        self.cache = self._cache()
+
+    def _cache(self, **kwargs):
+        return QueryCache(_validate, max_entries=2, ttl_s=60, backend=self.backend,
+                          clock=lambda: self.tick, now=lambda: self.now, **kwargs)
+
+    def test_normalized_question_hits(self):
+        self.assertEqual(normalize("¿Temperatura  MÁXIMA hoy?"), "temperatura maxima hoy")
+        self.assertIsNone(self.cache.get("temperatura maxima hoy", None, "ctx"))
+        self.assertTrue(self.cache.put("temperatura maxima hoy", None, "ctx", SQL))
+        self.assertEqual(self.cache.get("¿Temperatura máxima hoy?", None, "ctx"), SQL + " LIMIT 100")
+        self.assertIsNone(self.cache.get("temperatura maxima hoy", "GH-AMB-01", "ctx"))
+        self.assertEqual((self.cache.stats()["hits"], self.cache.stats()["misses"]), (1, 2))
+
+    def test_only_valid_sql_is_stored(self):
+        self.assertFalse(self.cache.put("borra todo", None, "ctx", "DROP TABLE x"))
+        self.assertIsNone(self.cache.get("borra todo", None, "ctx"))
+        self.assertEqual(self.backend.docs, {})
+
+    def test_lru_eviction_and_ttl(self):
+        for q in ("a", "b"):
+            self.cache.put(q, None, "ctx", SQL)
+        self.cache.get("a", None, "ctx")
+        self.cache.put("c", None, "ctx", SQL)
+        self.cache.backend = None
+        self.assertIsNone(self.cache.get("b", None, "ctx"))            # least recently used
+        self.assertIsNotNone(self.cache.get("a", None, "ctx"))
+        self.tick = 61
+        self.assertIsNone(self.cache.get("a", None, "ctx"))
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+    def test_shared_backend_serves_other_instances(self):
+        self.cache.put("co2 esta semana", None, "ctx", SQL)
+        other = self._cache()
+        self.assertEqual(other.get("CO2 esta semana", None, "ctx"), SQL + " LIMIT 100")
+        self.assertEqual(other.stats()["shared_hits"], 1)
+
+        # Tampered or expired shared entries are not used
+        key = QueryCache.key("co2 esta semana", None, "ctx")
+        self.backend.docs[key]["sql"] = "DELETE FROM x"
+        self.assertIsNone(self._cache().get("co2 esta semana", None, "ctx"))
+        self.now += timedelta(seconds=61)
+        self.backend.docs[key]["sql"] = SQL
+        self.assertIsNone(self._cache().get("co2 esta semana", None, "ctx"))
+
+    def test_schema_change_invalidates(self):
+        self.cache.put("temperatura maxima hoy", None, "schema v1", SQL)
+        self.assertIsNone(self.cache.get("temperatura maxima hoy", None, "schema v2"))
+        self.cache.clear()
+        self.cache.backend = None
+        self.assertIsNone(self.cache.get("temperatura maxima hoy", None, "schema v1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
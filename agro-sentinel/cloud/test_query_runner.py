@@ -0,0 +1,80 @@
+import unittest
+from types import SimpleNamespace
+
+from query_runner import QueryRunner, QueryTooExpensive, narrow_window, window_days
+
+SQL = ("SELECT sensor_id, temperature FROM `agro_sentinel_data.sensor_logs` "
+       "WHERE timestamp > TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL 365 DAY) LIMIT 100")
+MB = 1024 ** 2
+
+
+class FakeBigQuery:
+    """Scans 1 MB per day of window; returns 100 rows."""
+
+    def __init__(self):
+        self.jobs = []
+
+    def query(self, sql, job_config):
+        self.jobs.append((sql, job_config))
+        days = window_days(sql) or 10_000
+        fetched = []
+
+        def result(max_results=None, page_size=None):
+            for i in range(100):
+                if max_results is not None and i >= max_results:
+                    return
+                fetched.append(i)
+                yield {"n": i}
+
+        self.fetched = fetched
+        return SimpleNamespace(total_bytes_processed=days * MB, total_bytes_billed=days * MB,
+                               result=result)
+
+
+class TestQueryRunner(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.bq = FakeBigQuery()
+        self.runner = QueryRunner(self.bq, bytes_budget=400 * MB, max_bytes_billed=500 * MB,
+                                  max_rows=10, bucket_s=300, job_config=SimpleNamespace,
+                                  clock=lambda: self.now)
+
+    def test_within_budget_runs_capped_and_fetches_only_what_is_needed(self):
+        result = self.runner.run(SQL)
+        self.assertEqual((len(result["rows"]), result["window_days"], result["cached"]), (10, None, False))
+        dry, real = self.bq.jobs
+        self.assertTrue(dry[1].dry_run)
+        self.assertEqual(real[1].maximum_bytes_billed, 500 * MB)
+        self.assertEqual(len(self.bq.fetched), 10)
+
+    def test_over_budget_narrows_the_window(self):
+        self.runner.bytes_budget = 50 * MB
+        result = self.runner.run(SQL)
+        self.assertEqual(result["window_days"], 30)
+        self.assertIn("INTERVAL 30 DAY", result["sql"])
+        self.assertEqual(window_days(self.bq.jobs[-1][0]), 30)
+        self.assertEqual(self.runner.stats()["narrowed"], 1)
+
+    def test_refused_when_nothing_fits(self):
+        self.runner.bytes_budget = MB // 2
+        with self.assertRaises(QueryTooExpensive):
+            self.runner.run(SQL)
+        with self.assertRaises(QueryTooExpensive):
+            self.runner.run("SELECT COUNT(*) FROM `agro_sentinel_data.sensor_logs`")
+        self.assertFalse(any(not getattr(cfg, "dry_run", False) for _, cfg in self.bq.jobs))
+
+    def test_results_cached_per_time_bucket(self):
+        self.runner.run(SQL)
+        self.assertTrue(self.runner.run(SQL)["cached"])
+        self.now = 301
+        self.assertFalse(self.runner.run(SQL)["cached"])
+        self.assertEqual(len(self.bq.jobs), 4)
+
+    def test_narrow_window_only_lowers(self):
+        sql = SQL.replace("365", "3")
+        self.assertEqual(narrow_window(sql, 30), sql)
+        self.assertEqual(window_days(narrow_window(SQL, 7)), 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import json
+import os
+import re
+import unittest
+
+import rollups
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TERRAFORM = os.path.join(HERE, "..", "terraform")
+
+
+def _window(days: int, extra: str = "") -> str:
+    return f"WHERE timestamp > TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL {days} DAY){extra}"
+
+
+class TestGenerated(unittest.TestCase):
+    def test_checked_in_refresh_sql_is_current(self):
+        with open(os.path.join(TERRAFORM, "sql", "refresh_rollups.sql"), encoding="utf-8") as f:
+            self.assertEqual(f.read(), rollups.refresh_sql(),
+                             "regenerate with: python rollups.py --sql > ../terraform/sql/refresh_rollups.sql")
+
+    def test_terraform_schemas_match_columns(self):
+        with open(os.path.join(TERRAFORM, "main.tf"), encoding="utf-8") as f:
+            tf = f.read()
+        for granularity in ("hourly", "daily"):
+            block = re.search(rf'"sensor_rollup_{granularity}" {{.*?<<EOF\n(.*?)\nEOF', tf, re.DOTALL)
+            schema = [(c["name"], c["type"], c["mode"]) for c in json.loads(block.group(1))]
+            self.assertEqual(schema, rollups.columns(granularity))
+
+    def test_critical_dwell_only_for_stored_metrics(self):
+        self.assertIn("temperature", rollups.CRITICAL_KEYS)
+        self.assertNotIn("rssi_dbm", rollups.CRITICAL_KEYS)
+        self.assertIn("battery_level < 15", rollups.refresh_sql())
+
+    def test_late_rows_refresh_their_buckets(self):
+        sql = rollups.refresh_sql()
+        late = re.search(r"DECLARE late_hours .*?;\n", sql, re.DOTALL).group(0)
+        self.assertIn("timestamp < since_hour", late)
+        self.assertIn(f"ingested_at >= TIMESTAMP_SUB(run_at, INTERVAL {rollups.ROLLUP_LOOKBACK_HOURS} HOUR)", late)
+        self.assertIn(f"INTERVAL {rollups.ROLLUP_LATE_DAYS} DAY", late)       # bounded scan
+        # Both merges cover the late buckets, and only them besides the lookback
+        self.assertIn("T.hour >= first_hour", sql)
+        self.assertIn("T.day >= first_day", sql)
+        self.assertIn("DATE(hour) IN UNNEST(late_days)", sql)
+        self.assertEqual(sql.count("FROM UNNEST(late_hours) l WHERE l.sensor_id = r.sensor_id"), 2)
+
+    def test_backfill_runs_without_scheduler_parameters(self):
+        class Client:
+            def query(self, sql):
+                self.sql = sql
+                return self
+
+            def result(self):
+                return []
+
+        client = Client()
+        rollups.refresh(client, rollups.datetime(2026, 1, 1, tzinfo=rollups.timezone.utc))
+        self.assertNotIn("@run_time", client.sql)
+        self.assertIn("TIMESTAMP_TRUNC(TIMESTAMP '2026-01-01 00:00:00+00', HOUR)", client.sql)
+
+
+class TestRewrite(unittest.TestCase):
+    def test_long_window_reads_daily_rollup_and_raw_edges(self):
+        where = _window(30, " AND sensor_id = 'GH-AMB-01'")
+        sql = rollups.rewrite(
+            "SELECT MAX(temperature) as max_temp, ROUND(AVG(temperature), 1) as avg_temp, COUNT(*) AS n "
+            f"FROM `agro_sentinel_data.sensor_logs` {where} LIMIT 100")
+        self.assertIn(f"FROM `{rollups.DAILY_TABLE}`", sql)
+        self.assertIn("MAX(temperature_max) AS max_temp", sql)
+        self.assertIn("ROUND(SAFE_DIVIDE(SUM(temperature_sum), SUM(temperature_count)), 1) AS avg_temp", sql)
+        self.assertIn("SUM(readings) AS n", sql)
+        # Raw rows only for the partial first day and the not-yet-rolled-up tail
+        self.assertEqual(sql.count(f"FROM `{rollups.RAW_TABLE}`"), 2)
+        self.assertEqual(sql.count("sensor_id = 'GH-AMB-01'"), 3)
+        self.assertTrue(sql.endswith("LIMIT 100"))
+
+    def test_week_window_reads_hourly_rollup_grouped_by_day(self):
+        sql = rollups.rewrite(
+            "SELECT DATE(timestamp) AS fecha, sensor_id, MIN(humidity) AS h FROM agro_sentinel_data.sensor_logs "
+            f"{_window(7)} GROUP BY fecha, sensor_id ORDER BY fecha DESC LIMIT 20")
+        self.assertIn(f"FROM `{rollups.HOURLY_TABLE}`", sql)
+        self.assertIn("day AS fecha", sql)
+        self.assertIn("GROUP BY day, sensor_id", sql)
+        self.assertIn("ORDER BY fecha DESC", sql)
+
+    def test_ineligible_queries_are_left_alone(self):
+        table = "FROM `agro_sentinel_data.sensor_logs`"
+        for sql in (
+            f"SELECT MAX(temperature) {table} {_window(1)} LIMIT 100",            # short window
+            f"SELECT * {table} {_window(30)} LIMIT 20",                           # not an aggregate
+            f"SELECT sensor_id, temperature {table} {_window(30)} LIMIT 20",
+            f"SELECT MAX(rssi_dbm) {table} {_window(30)} LIMIT 100",              # not rolled up
+            f"SELECT MAX(temperature) {table} {_window(30, ' OR sensor_id = 1')} LIMIT 100",
+            f"SELECT MAX(temperature) {table} {_window(30, ' AND temperature > 30')} LIMIT 100",
+            f"SELECT sensor_id, MAX(temperature) {table} {_window(30)} LIMIT 100",  # ungrouped key
+            f"SELECT MAX(temperature) {table} WHERE DATE(timestamp) = CURRENT_DATE() LIMIT 100",
+        ):
+            self.assertIsNone(rollups.rewrite(sql), sql)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import random
+import unittest
+from unittest.mock import patch
+
+os.environ['USE_MOCK_GCP'] = 'true'
+
+import main
+import rules
+
+DOCUMENT = {
+    "crops": {"cacao": {"critical": {"temperature": {"max": 35}},
+                        "compound": [{"name": "botrytis_risk", "when": None}]}},
+    "sensors": {
+        "GH-TEN-01": {"crop": "cacao", "warning": {"humidity": {"min": 60}}},
+        "GH-ORO-01": {"crop": "cacao"},
+        "GH-CAY-01": {"compound": [{"name": "frost_risk", "then": "HIGH", "else": "LOW",
+                                    "when": [["temperature_c", "<", 4]]}]},
+    },
+}
+
+
+class TestRuleEngine(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.document = DOCUMENT
+        self.engine = rules.RuleEngine(lambda: self.document, ttl_s=60, clock=lambda: self.now)
+
+    def test_defaults_match_the_original_thresholds(self):
+        critical, warning, compounds = self.engine.evaluate(
+            "GH-AMB-01", {"temperature_c": 39.0, "humidity_rh": 90.0, "battery_level": 10})
+        self.assertEqual([(a["key"], a["breach"]) for a in critical],
+                         [("temperature", "HIGH"), ("battery_level", "LOW")])
+        self.assertEqual([(a["key"], a["breach"]) for a in warning],
+                         [("temperature", "HIGH"), ("humidity", "HIGH")])
+        self.assertEqual(compounds, {"botrytis_risk": "LOW"})
+
+    def test_crop_and_sensor_overrides(self):
+        reading = {"temperature_c": 36.0, "humidity_rh": 55.0}
+        critical, warning, compounds = self.engine.evaluate("GH-TEN-01", reading)
+        self.assertEqual([a["key"] for a in critical], ["temperature"])
+        self.assertIn(("humidity", "LOW"), [(a["key"], a["breach"]) for a in warning])
+        self.assertEqual(compounds, {})
+
+        critical, _, _ = self.engine.evaluate("GH-AMB-01", reading)
+        self.assertEqual(critical, [])
+        _, _, compounds = self.engine.evaluate("GH-CAY-01", {"temperature_c": 3.0})
+        self.assertEqual(compounds, {"botrytis_risk": "LOW", "frost_risk": "HIGH"})
+
+    def test_identical_effective_rules_share_a_table(self):
+        self.assertIs(self.engine.table_for("GH-ORO-01"), self.engine.table_for("GH-ORO-01"))
+        default, by_sensor = rules.compile_rules({"sensors": {"GH-A": {"crop": "c"}, "GH-B": {"crop": "c"}},
+                                                  "crops": {"c": {"warning": {"par_umol": {"max": 900}}}}})
+        self.assertIs(by_sensor["GH-A"], by_sensor["GH-B"])
+
+    def test_reload_after_ttl_and_keep_last_good(self):
+        self.engine.evaluate("GH-AMB-01", {})
+        self.assertEqual(self.engine.version, 1)
+
+        self.document = {"sensors": {"GH-AMB-01": {"critical": {"nonsense": {"max": 1}}}}}
+        self.now = 30
+        self.engine.evaluate("GH-AMB-01", {})
+        self.assertEqual(self.engine.version, 1)
+
+        self.now = 61
+        self.engine.evaluate("GH-AMB-01", {})
+        self.assertEqual(self.engine.version, 1)          # bad document rejected
+        critical, _, _ = self.engine.evaluate("GH-TEN-01", {"temperature_c": 36.0})
+        self.assertEqual(len(critical), 1)                 # previous rules still apply
+
+    def test_vectorised_path_honours_per_sensor_rules(self):
+        engine = rules.RuleEngine(lambda: DOCUMENT)
+        rng = random.Random(5)
+        readings = [{"sensor_id": rng.choice(sorted(main.registry.ids())),
+                     "timestamp": "2026-10-01T12:00:00Z",
+                     "temperature_c": rng.uniform(0, 40), "humidity_rh": rng.uniform(30, 99)}
+                    for _ in range(500)]
+        with patch.object(main, "rule_engine", engine):
+            scalar = [main._evaluate(r) for r in readings]
+            batch  = main._evaluate_batch(readings)
+        for a, b in zip(scalar, batch):
+            a[1].pop("last_update"), b[1].pop("last_update")
+            a[2].pop("ingested_at"), b[2].pop("ingested_at")
+        self.assertEqual(batch, scalar)
+
+    def test_schema_context_is_generated_from_rules(self):
+        text = rules.describe()
+        self.assertIn("temperature > 38 or < 10", text)
+        self.assertIn("botrytis_risk = 'HIGH' when temperature >= 15", text)
+
+    def test_sql_condition(self):
+        self.assertEqual(rules.sql_condition("temperature"), "temperature > 38 OR temperature < 10")
+        self.assertEqual(rules.sql_condition("battery_level"), "battery_level < 15")
+        self.assertIsNone(rules.sql_condition("par_umol"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+
+os.environ['USE_MOCK_GCP'] = 'true'
+
+import main
+import rules
+import sensor_registry
+from sensor_registry import SensorRegistry
+
+
+class FakeStore:
+    """Sensor documents with an update counter standing in for updated_at."""
+
+    def __init__(self, docs):
+        self.docs  = {sid: (0, meta) for sid, meta in docs.items()}
+        self.clock = 0
+        self.loads = []
+
+    def put(self, sensor_id, meta):
+        self.clock += 1
+        self.docs[sensor_id] = (self.clock, meta)
+
+    def load(self, since=None):
+        self.loads.append(since)
+        cutoff = -1 if since is None else self.loads_at
+        self.loads_at = self.clock
+        return {sid: meta for sid, (at, meta) in self.docs.items() if at > cutoff}
+
+
+class TestSensorRegistry(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.store = FakeStore({"GH-AMB-01": {"location": "Ambato"},
+                                "GH-DUR-01": {"location": "Duran", "crop": "cacao",
+                                              "thresholds": {"warning": {"humidity": {"min": 60}}}}})
+        self.registry = SensorRegistry(self.store.load, ttl_s=300, full_reload_s=3600,
+                                       miss_refresh_s=30, clock=lambda: self.now)
+
+    def test_membership_is_served_from_memory(self):
+        for _ in range(1000):
+            self.assertIn("GH-AMB-01", self.registry)
+        self.assertEqual(len(self.store.loads), 1)
+
+    def test_incremental_refresh_and_deactivation(self):
+        self.assertNotIn("GH-TEN-01", self.registry)
+        self.store.put("GH-TEN-01", {"location": "Tena"})
+        self.store.put("GH-AMB-01", {"location": "Ambato", "active": False})
+        self.now = 301
+        self.assertIn("GH-TEN-01", self.registry)
+        self.assertNotIn("GH-AMB-01", self.registry)
+        self.assertIsNotNone(self.store.loads[-1])          # only changed documents read
+
+    def test_unknown_ids_refresh_at_most_once_per_interval(self):
+        self.assertIn("GH-AMB-01", self.registry)
+        self.now = 31
+        for i in range(100):
+            self.assertNotIn(f"GH-XXX-{i % 100:02d}", self.registry)
+        self.assertEqual(len(self.store.loads), 2)
+
+        self.store.put("GH-CAY-01", {"location": "Cayambe"})
+        self.now = 62
+        self.assertIn("GH-CAY-01", self.registry)
+
+    def test_failed_load_keeps_previous_registry(self):
+        self.assertIn("GH-AMB-01", self.registry)
+        self.registry.loader = lambda since=None: 1 / 0
+        self.now = 301
+        self.assertIn("GH-AMB-01", self.registry)
+
+    def test_thresholds_feed_the_rule_engine(self):
+        engine = rules.RuleEngine(rules.with_registry(lambda: None, self.registry))
+        _, warning, _ = engine.evaluate("GH-DUR-01", {"humidity_rh": 55.0})
+        self.assertIn(("humidity", "LOW"), [(a["key"], a["breach"]) for a in warning])
+        _, warning, _ = engine.evaluate("GH-AMB-01", {"humidity_rh": 55.0})
+        self.assertEqual(warning, [])
+
+    def test_describe_is_capped(self):
+        for i in range(40):
+            self.store.put(f"GH-NEW-{i:02d}", {})
+        self.now = 301
+        text = self.registry.describe(limit=5)
+        self.assertIn("GH-AMB-01 (Ambato)", text)
+        self.assertTrue(text.endswith("and 37 more"))
+
+    def test_empty_store_serves_the_defaults_until_seeded(self):
+        store = FakeStore({})
+        registry = SensorRegistry(store.load, ttl_s=300, full_reload_s=3600,
+                                  miss_refresh_s=30, clock=lambda: self.now)
+        with self.assertLogs(level="WARNING"):
+            self.assertIn("GH-AMB-01", registry)
+        self.assertEqual(registry.ids(), frozenset(sensor_registry.DEFAULT_SENSORS))
+
+        store.put("GH-NEW-01", {"location": "Quito"})
+        self.now = 301
+        self.assertEqual(registry.ids(), {"GH-NEW-01"})         # the store takes over whole
+        self.assertEqual(store.loads, [None, None])              # full reloads while empty
+
+    def test_seed_creates_only_missing_documents(self):
+        docs = {"GH-AMB-01": {"location": "Ambato", "hmac_key": "k"}}
+
+        def document(sensor_id):
+            ref = MagicMock()
+            ref.get.return_value.exists = sensor_id in docs
+            ref.set.side_effect = lambda data: docs.__setitem__(sensor_id, data)
+            return ref
+
+        db = MagicMock()
+        db.collection.return_value.document.side_effect = document
+        created = sensor_registry.seed(db)
+        self.assertEqual(sorted(created), sorted(set(sensor_registry.DEFAULT_SENSORS) - {"GH-AMB-01"}))
+        self.assertEqual(docs["GH-AMB-01"], {"location": "Ambato", "hmac_key": "k"})   # left alone
+        self.assertTrue(docs["GH-TEN-01"]["active"])
+        self.assertEqual(sensor_registry.seed(db), [])
+
+
+class TestDeviceKeys(unittest.TestCase):
+    def setUp(self):
+        registry = SensorRegistry(lambda since=None: {"GH-AMB-01": {"hmac_key": "amb-key"},
+                                                      "GH-DUR-01": {}})
+        patcher = patch.object(main, "registry", registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _event(self, readings, key, device):
+        data = json.dumps(readings[0]).encode()
+        return {"data": base64.b64encode(data).decode(),
+                "attributes": {"sensor_id": device,
+                               "x_signature": hmac.new(key.encode(), data, hashlib.sha256).hexdigest()}}
+
+    def test_device_key_verifies_its_own_readings_only(self):
+        reading = {"sensor_id": "GH-AMB-01", "temperature_c": 20.0}
+        self.assertIsNotNone(main._decode_event(self._event([reading], "amb-key", "GH-AMB-01")))
+        self.assertIsNone(main._decode_event(self._event([reading], "wrong", "GH-AMB-01")))
+
+        other = {"sensor_id": "GH-DUR-01", "temperature_c": 20.0}
+        self.assertIsNone(main._decode_event(self._event([other], "amb-key", "GH-AMB-01")))
+
+
+if __name__ == "__main__":
+    unittest.main()
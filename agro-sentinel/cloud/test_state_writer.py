@@ -0,0 +1,72 @@
+import unittest
+from unittest.mock import MagicMock
+
+from state_writer import StateWriter
+
+
+def _state(temp=22.0, status="OK", alerts=(), last_update=0):
+    return {"last_update": last_update, "temperature": temp, "humidity": 70.0,
+            "status": status, "botrytis_risk": "LOW", "active_alerts": list(alerts)}
+
+
+class TestStateWriter(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.db = MagicMock()
+        self.doc = self.db.collection.return_value.document.return_value
+        self.writer = StateWriter(self.db, min_interval_s=30, heartbeat_s=300,
+                                  clock=lambda: self.now)
+
+    def _written(self):
+        return [c.args[0] for c in self.doc.set.call_args_list]
+
+    def test_first_reading_writes_full_document(self):
+        self.assertTrue(self.writer.offer("GH-AMB-01", _state()))
+        self.assertEqual(self._written()[0], _state())
+
+    def test_unchanged_is_skipped_and_changes_coalesced(self):
+        self.writer.offer("GH-AMB-01", _state())
+        self.now = 5
+        self.assertFalse(self.writer.offer("GH-AMB-01", _state(last_update=5)))
+        self.now = 10
+        self.assertFalse(self.writer.offer("GH-AMB-01", _state(temp=22.4, last_update=10)))
+        self.now = 31
+        self.assertTrue(self.writer.offer("GH-AMB-01", _state(temp=22.4, last_update=31)))
+        self.assertEqual(self._written()[-1], {"temperature": 22.4, "last_update": 31})
+
+        stats = self.writer.stats()
+        self.assertEqual((stats["written"], stats["skipped_unchanged"], stats["coalesced"]), (2, 1, 1))
+
+    def test_status_and_alert_transitions_write_immediately(self):
+        alert = {"key": "temperature", "level": "CRITICAL", "value": 39.0, "breach": "HIGH"}
+        self.writer.offer("GH-AMB-01", _state())
+        self.now = 1
+        self.assertTrue(self.writer.offer("GH-AMB-01", _state(39.0, "CRITICAL", [alert])))
+        self.now = 2
+        # Same alert, new value: not a transition
+        moved = dict(alert, value=39.5)
+        self.assertFalse(self.writer.offer("GH-AMB-01", _state(39.5, "CRITICAL", [moved])))
+        self.now = 3
+        self.assertTrue(self.writer.offer("GH-AMB-01", _state(25.0, "OK")))
+        self.assertEqual(self.writer.stats()["urgent"], 2)
+
+    def test_heartbeat_refreshes_last_update(self):
+        self.writer.offer("GH-AMB-01", _state())
+        self.now = 301
+        self.assertTrue(self.writer.offer("GH-AMB-01", _state(last_update=301)))
+        self.assertEqual(self._written()[-1], {"last_update": 301})
+
+    def test_flush_writes_due_pending_changes(self):
+        self.writer.offer_many({"GH-AMB-01": _state(), "GH-DUR-01": _state()})
+        self.now = 10
+        self.writer.offer_many({"GH-AMB-01": _state(temp=23.0)})
+        self.assertEqual(self.writer.flush(), 0)
+        self.now = 40
+        self.assertEqual(self.writer.flush(), 1)
+        batch = self.db.batch.return_value
+        self.assertEqual(batch.set.call_args.args[1]["temperature"], 23.0)
+        self.assertEqual(self.writer.stats()["pending"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
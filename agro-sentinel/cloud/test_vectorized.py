@@ -0,0 +1,77 @@
+import os
+import random
+import unittest
+
+os.environ['USE_MOCK_GCP'] = 'true'
+
+import numpy as np
+
+import main
+import vectorized
+
+SENSORS = sorted(main.registry.ids())
+
+
+def _random_reading(rng: random.Random) -> dict:
+    reading = {"sensor_id": rng.choice(SENSORS), "timestamp": "2026-10-01T12:00:00Z"}
+    for key, (lo, hi) in main.VALID_RANGES.items():
+        roll = rng.random()
+        if roll < 0.05:
+            continue
+        elif roll < 0.08:
+            reading[key] = None
+        elif roll < 0.10:
+            reading[key] = hi * 2 + 1
+        elif roll < 0.12:
+            reading[key] = 0.0
+        elif roll < 0.13:
+            reading[key] = f"{rng.uniform(lo, hi):.3f}"
+        else:
+            reading[key] = rng.uniform(lo, hi)
+    return reading
+
+
+def _comparable(results):
+    for r in results:
+        if r is not None:
+            r[1].pop("last_update")
+            r[2].pop("ingested_at")
+    return results
+
+
+class TestVectorizedMatchesScalar(unittest.TestCase):
+    def assertSameAsScalar(self, readings):
+        scalar = _comparable([main._evaluate(r) for r in readings])
+        batch  = _comparable(main._evaluate_batch(readings))
+        self.assertEqual(batch, scalar)
+
+    def test_random_readings(self):
+        rng = random.Random(12)
+        self.assertSameAsScalar([_random_reading(rng) for _ in range(3000)])
+
+    def test_edge_cases(self):
+        base = {"sensor_id": "GH-AMB-01", "timestamp": "2026-10-01T12:00:00Z"}
+        cases = [
+            {"temperature_c": 0.0, "humidity_rh": 90.0},               # zero quirk: no VPD
+            {"temperature_c": 20.0, "humidity_rh": 0.0},
+            {"temperature_c": "abc", "humidity_rh": [1, 2]},
+            {"temperature_c": float("nan"), "co2_ppm": float("inf")},
+            {"temperature_c": True, "humidity_rh": 86.0},
+            {"battery_level": 14.99999, "rssi_dbm": -90.5},             # int truncation
+            {"battery_level": 15.00004, "rssi_dbm": -90.00005},
+            {"temperature_c": 21.00005, "humidity_rh": 85.00005},       # rounding boundary
+            {"temperature_c": -50.0, "humidity_rh": 100.0, "co2_ppm": 10000.0},
+            {"sensor_id": "GH-XXX-01", "temperature_c": 20.0},
+        ]
+        self.assertSameAsScalar([{**base, **c} for c in cases] * 4)
+
+    def test_rounding_matches_python_round(self):
+        rng = np.random.default_rng(3)
+        values = np.concatenate([rng.uniform(-100, 100, 20000),
+                                 np.arange(-10000, 10000) / 1e4 + 0.00005])
+        rounded = vectorized.round_like_python(values, 4)
+        self.assertEqual(rounded.tolist(), [round(v, 4) for v in values.tolist()])
+
+
+if __name__ == "__main__":
+    unittest.main()
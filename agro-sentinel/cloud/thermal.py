@@ -3,38 +3,43 @@ import logging
 import re
 import os
 
-if os.environ.get('USE_MOCK_GCP') == 'true':
-    import mock_gcp as firestore
-    import mock_gcp as storage
-    class MockGenerativeModel:
-        def __init__(self, model_name): pass
-    model = MockGenerativeModel("gemini-pro-vision")
-    db = firestore.Client()
-    storage_client = storage.StorageClient()
-else:
-    try:
-        from google.cloud import firestore
-        from google.cloud import storage
-        import vertexai
+import sensor_registry
+from lazy import LazyClient, gcp_module
+
+# Built on first use and reused across invocations (lazy.py)
+db             = LazyClient(lambda: gcp_module("firestore").Client(), "Firestore client")
+storage_client = LazyClient(lambda: gcp_module("storage").Client(), "Storage client")
+_model = None
+
+
+class MockGenerativeModel:
+    def __init__(self, model_name): pass
+
+
+def _get_model():
+    """Vision model, initialised on the first image rather than at import."""
+    global _model
+    if _model is None:
+        if os.environ.get('USE_MOCK_GCP') == 'true':
+            _model = MockGenerativeModel("gemini-pro-vision")
+            return _model
         try:
-            from vertexai.generative_models import GenerativeModel          # type: ignore[import]
+            import vertexai
+            try:
+                from vertexai.generative_models import GenerativeModel          # type: ignore[import]
+            except ImportError:
+                from vertexai.preview.generative_models import GenerativeModel  # type: ignore[import]
         except ImportError:
-            from vertexai.preview.generative_models import GenerativeModel  # type: ignore[import]
-        db = firestore.Client()
-        storage_client = storage.Client()
+            logging.warning("vertexai not installed, no vision model")
+            return None
         vertexai.init(location="us-central1")
-        model = GenerativeModel("gemini-pro-vision")
-    except ImportError:
-        import mock_gcp as firestore
-        import mock_gcp as storage
-        logging.warning("GCP libraries not found, using mocks")
-        db = firestore.Client()
-        storage_client = storage.Client()
-        model = None
-
-# Allowlist of valid sensor ID patterns (VULN-09)
-_SENSOR_ID_RE    = re.compile(r'^GH-[A-Z]{3}-\d{2}$')
-KNOWN_SENSOR_IDS = frozenset({'GH-AMB-01', 'GH-DUR-01', 'GH-CAY-01', 'GH-ORO-01', 'GH-TEN-01'})
+        _model = GenerativeModel("gemini-pro-vision")
+    return _model
+
+
+# Allowlist of valid sensor ID patterns (VULN-09); known IDs come from the registry
+_SENSOR_ID_RE = re.compile(r'^GH-[A-Z]{3}-\d{2}$')
+registry      = sensor_registry.registry_from_env(db)
 
 ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
 
@@ -46,7 +51,7 @@ def _extract_sensor_id(file_name: str) -> str | None:
     """
     base = file_name.rsplit('/', 1)[-1]   # strip any path prefix
     segment = base.split('_')[0]          # take the first underscore-delimited segment
-    if _SENSOR_ID_RE.match(segment) and segment in KNOWN_SENSOR_IDS:
+    if _SENSOR_ID_RE.match(segment) and segment in registry:
         return segment
     logging.warning(f"Unrecognised sensor_id '{segment}' extracted from '{file_name}' — rejected")
     return None
@@ -95,7 +100,7 @@ def process_thermal_image(cloud_event):
            .set({
                "image_uri": f"gs://{bucket_name}/{file_name}",
                "analysis":  analysis_result,
-               "created_at": firestore.SERVER_TIMESTAMP,
+               "created_at": gcp_module("firestore").SERVER_TIMESTAMP,
            }))
 
         # Update parent greenhouse document if anomaly found
@@ -104,7 +109,7 @@ def process_thermal_image(cloud_event):
                .document(sensor_id)
                .update({
                    "thermal_alert":      True,
-                   "last_thermal_check": firestore.SERVER_TIMESTAMP,
+                   "last_thermal_check": gcp_module("firestore").SERVER_TIMESTAMP,
                }))
 
     except Exception as e:
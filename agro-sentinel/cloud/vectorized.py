@@ -0,0 +1,153 @@
+"""
+Columnar (NumPy) version of the per-reading hot path in main.py.
+
+main._evaluate sanitises, derives and checks alert rules (rules.py) one reading
+at a time; this does the same for a whole batch with one array operation per
+field. Results
+are identical to the scalar path, value for value, including its quirks:
+
+  · a zero temperature or humidity yields no VPD / dew point (`temp and
+    humidity` in main.py, PIPELINE_STATUS.md §4);
+  · integer fields are truncated after rounding, like int(round(v, 4)).
+
+NumPy's rounding and exp/log can differ from Python's in the last bit. That only
+matters when a value sits on a rounding boundary, so those few elements are
+recomputed with the scalar function.
+
+The only behavioural difference: discarded values are logged once per field
+per batch instead of once per value.
+"""
+import logging
+
+import numpy as np
+
+import rules
+
+# Distance from a .5 boundary (in units of the last kept digit) below which the
+# array result is not trusted and the scalar path decides.
+_ROUNDING_GUARD = 1e-6
+
+
+def to_column(values: list) -> np.ndarray:
+    """float64 column; None and non-numeric values become NaN. Converts like float()."""
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        out = np.full(len(values), np.nan)
+        for i, v in enumerate(values):
+            if v is None:
+                continue
+            try:
+                out[i] = float(v)
+            except (TypeError, ValueError):
+                pass
+        return out
+
+
+def round_like_python(values: np.ndarray, ndigits: int, scalar=None) -> np.ndarray:
+    """
+    np.round that agrees with round(v, ndigits) for every element.
+
+    `scalar(i)` recomputes element i exactly where the array result is in doubt;
+    by default that is Python's round on the array value.
+    """
+    scale  = 10.0 ** ndigits
+    scaled = values * scale
+    out    = np.rint(scaled) / scale
+    with np.errstate(invalid='ignore'):
+        doubtful = np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) < _ROUNDING_GUARD
+    for i in np.flatnonzero(doubtful):
+        out[i] = scalar(i) if scalar else round(float(values[i]), ndigits)
+    return out
+
+
+def sanitize(values: list, key: str, valid_ranges: dict, as_int: bool = False) -> np.ndarray:
+    """
+    Vector _sanitize_float (_sanitize_int with `as_int`): NaN wherever the
+    scalar path returns None.
+    """
+    column = to_column(values)
+    lo, hi = valid_ranges[key]
+    with np.errstate(invalid='ignore'):
+        valid = (column >= lo) & (column <= hi)
+    discarded = len(values) - int(valid.sum()) - values.count(None)
+    if discarded:
+        logging.warning(f"{discarded} non-numeric or out-of-range {key} values "
+                        f"(allowed {lo}–{hi}) — discarded")
+    rounded = round_like_python(np.where(valid, column, 0.0), 4)
+    return np.where(valid, np.trunc(rounded) if as_int else rounded, np.nan)
+
+
+def _present(column: np.ndarray) -> np.ndarray:
+    """Truthiness of a sanitised value, as `if value` sees it: not None and not 0."""
+    return ~np.isnan(column) & (column != 0)
+
+
+def vpd(temp: np.ndarray, rh: np.ndarray, scalar) -> np.ndarray:
+    """Vector calculate_vpd, NaN where the scalar path yields None."""
+    ok = _present(temp) & _present(rh)
+    t, h = np.where(ok, temp, 0.0), np.where(ok, rh, 0.0)
+    svp = 0.61078 * np.exp((17.27 * t) / (t + 237.3))
+    raw = np.maximum(0, svp - svp * (h / 100.0))
+    out = round_like_python(raw, 3, lambda i: scalar(float(t[i]), float(h[i])))
+    return np.where(ok, out, np.nan)
+
+
+def dew_point(temp: np.ndarray, rh: np.ndarray, scalar) -> np.ndarray:
+    """Vector calculate_dew_point, NaN where the scalar path yields None."""
+    ok = _present(temp) & _present(rh)
+    t, h = np.where(ok, temp, 0.0), np.where(ok, rh, 100.0)
+    a, b  = 17.27, 237.7
+    alpha = ((a * t) / (b + t)) + np.log(h / 100.0)
+    out   = round_like_python((b * alpha) / (a - alpha), 2,
+                              lambda i: scalar(float(t[i]), float(h[i])))
+    return np.where(ok, out, np.nan)
+
+
+def evaluate_rules(columns: dict, values: dict, tables: list, row_table: np.ndarray):
+    """
+    RuleTable.evaluate for every row: (critical lists, warning lists, compound dicts).
+
+    `tables` are the distinct RuleTables in the batch and `row_table[i]` the
+    index of row i's table. Each (level, key, side) slot is checked once for the
+    whole batch against a per-row limit column, in the order the scalar checks
+    run, so every row's alerts come out in the same order.
+    """
+    n = len(row_table)
+    out = {"CRITICAL": [[] for _ in range(n)], "WARNING": [[] for _ in range(n)]}
+    for _, level in rules.LEVELS:
+        for key, field in rules.ALERT_FIELDS.items():
+            for _, breach, op in rules.SIDES:
+                by_table = np.array([t.limits.get((level, key, breach), np.nan) for t in tables])
+                if np.isnan(by_table).all():
+                    continue
+                with np.errstate(invalid='ignore'):
+                    mask = op(columns[field], by_table[row_table])
+                for i in np.flatnonzero(mask).tolist():
+                    out[level][i].append({"key": key, "level": level, "breach": breach,
+                                          "value": values[field][i]})
+
+    compounds = [None] * n
+    for k, table in enumerate(tables):
+        rows = np.flatnonzero(row_table == k)
+        results = {}
+        for name, then, otherwise, conditions in table.compounds:
+            hit = np.ones(len(rows), bool)
+            for field, op, limit in conditions:
+                column = columns[field][rows]
+                with np.errstate(invalid='ignore'):
+                    hit &= ~np.isnan(column) & op(column, limit)
+            results[name] = np.where(hit, then, otherwise).tolist() if len(rows) else []
+        names = list(results)
+        for j, i in enumerate(rows.tolist()):
+            compounds[i] = {name: results[name][j] for name in names}
+    return out["CRITICAL"], out["WARNING"], compounds
+
+
+def to_list(column: np.ndarray, as_int: bool = False) -> list:
+    """Python values with None for NaN, as the scalar path returns them."""
+    missing = np.isnan(column)
+    if as_int:
+        ints = np.where(missing, 0, column).astype(np.int64).tolist()
+        return [None if m else v for v, m in zip(ints, missing.tolist())]
+    return [None if m else v for v, m in zip(column.tolist(), missing.tolist())]
@@ -0,0 +1,108 @@
+"""
+Insert throughput / latency benchmark for the edge buffer.
+
+Compares the original connect-insert-commit-close path against the persistent
+WAL connection manager with group commit in src/database.py:
+
+    python bench_buffer.py --threads 4 --rows 2000
+
+Each producer thread inserts `--rows` readings as fast as it can, like a capture
+thread with no sleep. Reports rows/s and p50/p99 per-insert latency.
+"""
+import argparse
+import json
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from src import database
+
+PAYLOAD = {"temperature_c": 24.3, "humidity_rh": 71.2, "co2_ppm": 612.0,
+           "soil_moisture": 38.5, "battery_level": 96.0}
+
+
+def _legacy_insert(path: str, sensor_id: str, payload: dict):
+    # Verbatim shape of the pre-connection-manager buffer_reading()
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    ts = datetime.now(timezone.utc).isoformat()
+    c.execute(
+        "INSERT INTO readings (sensor_id, payload, timestamp) VALUES (?, ?, ?)",
+        (sensor_id, json.dumps(payload), ts),
+    )
+    conn.commit()
+    conn.close()
+
+
+def _legacy_setup(path: str):
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS readings (
+            id         INTEGER PRIMARY KEY AUTOINCREMENT,
+            sensor_id  TEXT    NOT NULL,
+            payload    TEXT    NOT NULL,
+            timestamp  TEXT    NOT NULL,
+            synced     INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_unsynced ON readings (synced, id)')
+    conn.commit()
+    conn.close()
+
+
+def _run(insert, threads: int, rows: int) -> dict:
+    latencies: list[float] = []
+    lock = threading.Lock()
+
+    def producer(n: int):
+        local = []
+        for _ in range(rows):
+            t0 = time.perf_counter()
+            insert(f"GH-BEN-{n:02d}", PAYLOAD)
+            local.append(time.perf_counter() - t0)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=producer, args=(i,)) for i in range(threads)]
+    t0 = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - t0
+
+    latencies.sort()
+    return {
+        "rows_per_s": len(latencies) / elapsed,
+        "p50_ms":     statistics.median(latencies) * 1000,
+        "p99_ms":     latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--rows",    type=int, default=2000, help="rows per thread")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = str(Path(tmp) / "legacy.db")
+        _legacy_setup(legacy_path)
+        before = _run(lambda s, p: _legacy_insert(legacy_path, s, p), args.threads, args.rows)
+
+        database.init_db(str(Path(tmp) / "managed.db"))
+        after = _run(database.buffer_reading, args.threads, args.rows)
+        database.close_db()
+
+    print(f"{'':10}{'rows/s':>12}{'p50 ms':>10}{'p99 ms':>10}")
+    for label, r in (("before", before), ("after", after)):
+        print(f"{label:10}{r['rows_per_s']:>12.0f}{r['p50_ms']:>10.3f}{r['p99_ms']:>10.3f}")
+    print(f"speed-up: {after['rows_per_s'] / before['rows_per_s']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
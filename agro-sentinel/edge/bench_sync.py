@@ -0,0 +1,75 @@
+"""
+Backlog drain benchmark for sync_to_cloud, offline.
+
+Fills a scratch buffer with `--rows` seeded readings from simulator.FleetGenerator
+and drains it through the fake publisher in src/mock_pubsub.py with a simulated
+round trip:
+
+    python bench_sync.py --rows 2000 --latency-ms 150
+
+"before" is the original loop: one reading per message, waiting on every
+future (window=1, envelope size 1). "after" is the pipelined publisher with the
+configured window and envelope size.
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from unittest.mock import patch
+
+os.environ.setdefault('GCP_PROJECT_ID', 'bench')
+os.environ['USE_MOCK_PUBSUB'] = 'true'
+
+from simulator import FleetGenerator
+from src import database, sync
+
+SENSORS = ["GH-AMB-01", "GH-DUR-01", "GH-CAY-01", "GH-ORO-01", "GH-TEN-01"]
+START   = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def _readings(rows: int) -> list[tuple[str, dict]]:
+    steps   = -(-rows // len(SENSORS))
+    fleet   = FleetGenerator(len(SENSORS), seed=0, sensor_ids=SENSORS)
+    records = [r for batch in fleet.batches(START, START + timedelta(minutes=steps), step_s=60)
+               for r in batch.records()]
+    return [(r.pop("sensor_id"), r) for r in records[:rows]]
+
+
+def _drain(rows: int, latency_s: float, window: int, envelope_size: int) -> float:
+    with tempfile.TemporaryDirectory() as tmp, patch.object(sync, "ENVELOPE_SIZE", envelope_size):
+        database.init_db(str(Path(tmp) / "edge_buffer.db"))
+        database.buffer_readings(_readings(rows))
+
+        publisher = sync.make_publisher(latency_s=latency_s, jitter_s=latency_s / 5, seed=0)
+        topic     = publisher.topic_path("bench", "sensors")
+        synced, t0 = 0, time.perf_counter()
+        while synced < rows:
+            synced += sync.sync_to_cloud(publisher, topic, window=window, budget_s=3600).synced
+        elapsed = time.perf_counter() - t0
+        database.close_db()
+    return rows / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows",       type=int,   default=2000)
+    parser.add_argument("--latency-ms", type=float, default=150.0)
+    parser.add_argument("--window",     type=int,   default=sync.PUBLISH_WINDOW)
+    args = parser.parse_args()
+    latency = args.latency_ms / 1000
+
+    # The sequential baseline is one round trip per row; cap its sample so the
+    # benchmark finishes in seconds, then report the rate.
+    before = _drain(min(args.rows, int(5 / latency) or 1), latency, window=1, envelope_size=1)
+    after  = _drain(args.rows, latency, window=args.window, envelope_size=sync.ENVELOPE_SIZE)
+
+    print(f"round trip {args.latency_ms:.0f} ms, {args.rows} rows")
+    print(f"before (window=1, 1 reading/msg): {before:>10.1f} rows/s")
+    print(f"after  (window={args.window}, {sync.ENVELOPE_SIZE} readings/msg): {after:>10.1f} rows/s")
+    print(f"speed-up: {after / before:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
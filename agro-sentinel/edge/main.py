@@ -3,6 +3,7 @@ import time
 from src.database import init_db
 from src.capture import simulate_sensors
 from src.sync import start_sync_agent
+from src.retention import start_retention_agent
 
 def main():
     print("--- Cognitex Industrial Edge Agent v1.0 ---\n")
@@ -19,6 +20,11 @@ def main():
     # uploads data to GCP whenever connection is available
     sync_thread = threading.Thread(target=start_sync_agent, args=(5,), daemon=True)
     sync_thread.start()
+
+    # 4. Retention (bounded disk usage on the SD card)
+    # deletes/archives synced rows, returns free pages, enforces EDGE_DISK_QUOTA_MB
+    retention_thread = threading.Thread(target=start_retention_agent, args=(300,), daemon=True)
+    retention_thread.start()
     
     # Keep main thread alive
     try:
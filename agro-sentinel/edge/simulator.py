@@ -3,59 +3,239 @@ import math
 import json
 from datetime import datetime, timezone
 
+try:
+    import numpy as np
+except ImportError:       # gateways don't ship numpy; only FleetGenerator needs it
+    np = None
+
+# ── Greenhouse climate model ───────────────────────────────────────────────────
+# Shared by the single-greenhouse simulator and the fleet generator, so a
+# benchmark fed by one looks like the other.
+BASE_TEMP     = 20.0
+BASE_HUMIDITY = 60.0
+BASE_CO2      = 450.0     # Ambient CO2
+TEMP_SWING    = 5.0
+HUMIDITY_SWING = -5.0     # Humidity often inverse to temperature
+PAR_PEAK      = 2000.0
+CO2_DAY, CO2_NIGHT = -50.0, 20.0
+
+
+def _phase(hour):
+    """Day/night cycle angle: sin() is 0 at 06:00 and 18:00, +1 at noon, -1 at midnight."""
+    return (hour - 6) * math.pi / 12
+
+
 class GreenhouseSimulator:
-    def __init__(self, greenhouse_id="GH-001"):
+    """
+    One greenhouse, one reading per call.
+
+    Pass `seed` for a reproducible sequence and `clock` (a callable returning an
+    aware datetime) to run on simulated time instead of the wall clock.
+    """
+
+    def __init__(self, greenhouse_id="GH-001", seed=None, clock=None):
         self.greenhouse_id = greenhouse_id
-        self.base_temp = 20.0
-        self.base_humidity = 60.0
-        self.base_co2 = 450.0 # Ambient CO2
+        self.base_temp = BASE_TEMP
+        self.base_humidity = BASE_HUMIDITY
+        self.base_co2 = BASE_CO2
         self.base_par = 0.0   # Night time start
-        
-    def get_data(self):
+        self.rng = random.Random(seed)
+        self.clock = clock or (lambda: datetime.now().astimezone())
+
+    def get_data(self, at=None):
         """Simulate sensor readings with realistic fluctuations."""
-        # Simulate day/night cycle for temperature using sine wave based on current hour
-        current_hour = datetime.now().hour
+        now = at or self.clock()
+        # Simulate day/night cycle for temperature using sine wave based on the
+        # local hour of `now`
+        current_hour = now.hour + now.minute / 60
         is_day = 6 <= current_hour <= 18
-        
+        cycle = math.sin(_phase(current_hour))
+        rng = self.rng
+
         # Temperature Logic
-        temp_fluctuation = 5 * math.sin((current_hour - 6) * math.pi / 12) 
-        noise_temp = random.uniform(-0.5, 0.5)
-        temperature = self.base_temp + temp_fluctuation + noise_temp
+        temperature = self.base_temp + TEMP_SWING * cycle + rng.uniform(-0.5, 0.5)
 
         # Humidity often inverse to temperature
-        humidity_fluctuation = -5 * math.sin((current_hour - 6) * math.pi / 12)
-        noise_hum = random.uniform(-2, 2)
-        humidity = max(0, min(100, self.base_humidity + humidity_fluctuation + noise_hum))
+        humidity = max(0, min(100, self.base_humidity + HUMIDITY_SWING * cycle + rng.uniform(-2, 2)))
 
         # CO2 Logic: Plants consume CO2 during day (drop) and respire at night (rise)
         # However, greenhouses often supplement CO2 during day. Let's simulate depletion without enrichment.
-        co2_variation = -50 if is_day else 20
-        co2_noise = random.uniform(-10, 10)
-        co2 = max(300, self.base_co2 + co2_variation + co2_noise)
+        co2_variation = CO2_DAY if is_day else CO2_NIGHT
+        co2 = max(300, self.base_co2 + co2_variation + rng.uniform(-10, 10))
 
         # PAR (Light) Logic: High during day (parabolic), zero at night
         if is_day:
              # Peak at noon (hour 12)
-             par_intensity = 2000 * math.sin((current_hour - 6) * math.pi / 12)
-             par = max(0, par_intensity + random.uniform(-50, 50))
+             par = max(0, PAR_PEAK * cycle + rng.uniform(-50, 50))
         else:
              par = 0
 
         # Soil EC: Very stable
-        soil_ec = random.uniform(1.2, 1.8) # dS/m standard for substrates
+        soil_ec = rng.uniform(1.2, 1.8) # dS/m standard for substrates
 
         return {
             "sensor_id": self.greenhouse_id,
-            "timestamp": datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
+            "timestamp": now.astimezone(timezone.utc).isoformat().replace('+00:00', 'Z'),
             "temperature_c": round(temperature, 2),
             "humidity_rh": round(humidity, 2),
-            "soil_moisture": round(random.uniform(30, 45), 1),
+            "soil_moisture": round(rng.uniform(30, 45), 1),
             "co2_ppm": round(co2, 0),
             "par_umol": round(par, 0),
             "soil_ec": round(soil_ec, 2),
-            "battery_level": round(random.uniform(90, 100), 1)
+            "battery_level": round(rng.uniform(90, 100), 1)
         }
 
+
+# ── Fleet-scale generator ──────────────────────────────────────────────────────
+# Fault codes in FleetBatch.faults
+FAULT_NONE, FAULT_SPIKE, FAULT_DROPOUT, FAULT_STUCK, FAULT_OUT_OF_RANGE = range(5)
+
+# Values no physical sensor reports; the cloud's VALID_RANGES must reject them.
+_OUT_OF_RANGE = {"temperature_c": 150.0, "humidity_rh": 130.0, "soil_moisture": -5.0,
+                 "co2_ppm": 20000.0, "par_umol": 9000.0, "soil_ec": 50.0, "battery_level": 140.0}
+_SPIKE_SCALE  = {"temperature_c": 8.0, "humidity_rh": 20.0, "soil_moisture": 15.0,
+                 "co2_ppm": 600.0, "par_umol": 800.0, "soil_ec": 1.5, "battery_level": 0.0}
+
+
+def fleet_ids(count: int) -> list[str]:
+    """`count` ids in the cloud's GH-XXX-NN format: GH-AAA-00 … GH-AAA-99, GH-AAB-00 …"""
+    ids = []
+    for i in range(count):
+        site, n = divmod(i, 100)
+        letters = "".join(chr(65 + (site // 26 ** k) % 26) for k in (2, 1, 0))
+        ids.append(f"GH-{letters}-{n:02d}")
+    return ids
+
+
+class FaultSpec:
+    """Per-sample probabilities of each injected fault (stuck: per sensor per chunk)."""
+
+    def __init__(self, spike=0.0, dropout=0.0, stuck=0.0, out_of_range=0.0):
+        self.spike, self.dropout, self.stuck, self.out_of_range = spike, dropout, stuck, out_of_range
+
+
+class FleetBatch:
+    """
+    One chunk of fleet data, column-wise, time-major: row k is step k // n of
+    greenhouse k % n. Dropped-out values are NaN.
+    """
+
+    def __init__(self, sensor_ids, timestamps, fields: dict, faults: dict):
+        self.sensor_ids = sensor_ids        # (rows,) str
+        self.timestamps = timestamps        # (rows,) datetime64[s], UTC
+        self.fields     = fields            # name -> (rows,) float64
+        self.faults     = faults            # name -> (rows,) uint8 fault code
+
+    def __len__(self):
+        return len(self.sensor_ids)
+
+    def records(self) -> list[dict]:
+        """Plain dicts in the Pub/Sub payload schema (NaN → None), for buffer/sync/cloud benches."""
+        stamps  = np.datetime_as_string(self.timestamps, unit='s')
+        columns = {name: [None if math.isnan(v) else v for v in values.tolist()]
+                   for name, values in self.fields.items()}
+        return [{"sensor_id": sid, "timestamp": f"{ts}Z",
+                 **{name: col[i] for name, col in columns.items()}}
+                for i, (sid, ts) in enumerate(zip(self.sensor_ids.tolist(), stamps.tolist()))]
+
+
+class FleetGenerator:
+    """
+    Seeded, vectorised readings for thousands of greenhouses over any time range.
+
+    Uses the GreenhouseSimulator climate model, plus a fixed per-site offset so
+    greenhouses differ from each other. Output depends only on (seed, fleet
+    size, start, step, chunking), never on the wall clock. `start` must be an
+    aware datetime; its timezone sets the greenhouses' local day.
+
+        gen = FleetGenerator(5000, seed=42, faults=FaultSpec(dropout=0.01))
+        for batch in gen.batches(start, start + timedelta(days=30), step_s=300):
+            ...
+    """
+
+    def __init__(self, greenhouses: int, seed: int = 0, faults: FaultSpec | None = None,
+                 sensor_ids: list[str] | None = None):
+        if np is None:
+            raise ImportError("FleetGenerator requires numpy (pip install numpy)")
+        self.sensor_ids = np.array(sensor_ids or fleet_ids(greenhouses))
+        if len(self.sensor_ids) != greenhouses:
+            raise ValueError(f"{greenhouses} greenhouses but {len(self.sensor_ids)} sensor ids")
+        self.n      = greenhouses
+        self.seed   = seed
+        self.faults = faults or FaultSpec()
+        site = np.random.default_rng([seed, 0])
+        self.temp_offset     = site.normal(0.0, 2.0, greenhouses)
+        self.humidity_offset = site.normal(0.0, 5.0, greenhouses)
+        self.battery_start   = site.uniform(90, 100, greenhouses)
+
+    def batches(self, start: datetime, end: datetime, step_s: float = 60.0,
+                chunk_steps: int | None = None):
+        """Yield FleetBatch chunks covering [start, end) every `step_s` seconds."""
+        total = int((end - start).total_seconds() // step_s)
+        chunk_steps = chunk_steps or max(1, 1_000_000 // self.n)
+        for first in range(0, total, chunk_steps):
+            steps = min(chunk_steps, total - first)
+            yield self._chunk(start, first, steps, step_s)
+
+    def _chunk(self, start: datetime, first: int, steps: int, step_s: float) -> FleetBatch:
+        rng   = np.random.default_rng([self.seed, 1, first])
+        shape = (steps, self.n)
+        secs  = (first + np.arange(steps)) * step_s
+        # Hour of day in start's own timezone; timestamps are emitted in UTC
+        hour  = (start.hour + start.minute / 60 + start.second / 3600 + secs / 3600) % 24
+        cycle = np.sin(_phase(hour))[:, None]
+        is_day = ((hour >= 6) & (hour <= 18))[:, None]
+
+        temperature = (BASE_TEMP + self.temp_offset + TEMP_SWING * cycle
+                       + rng.uniform(-0.5, 0.5, shape))
+        humidity = np.clip(BASE_HUMIDITY + self.humidity_offset + HUMIDITY_SWING * cycle
+                           + rng.uniform(-2, 2, shape), 0, 100)
+        co2 = np.maximum(300, BASE_CO2 + np.where(is_day, CO2_DAY, CO2_NIGHT)
+                         + rng.uniform(-10, 10, shape))
+        par = np.where(is_day, np.maximum(0, PAR_PEAK * cycle + rng.uniform(-50, 50, shape)), 0.0)
+        # Slow drain, about 1 %/day, instead of white noise
+        battery = np.clip(self.battery_start - secs[:, None] / 86400, 0, 100)
+
+        fields = {
+            "temperature_c": np.round(temperature, 2),
+            "humidity_rh":   np.round(humidity, 2),
+            "soil_moisture": np.round(rng.uniform(30, 45, shape), 1),
+            "co2_ppm":       np.round(co2, 0),
+            "par_umol":      np.round(par, 0),
+            "soil_ec":       np.round(rng.uniform(1.2, 1.8, shape), 2),
+            "battery_level": np.round(battery, 1),
+        }
+        faults = {name: self._inject(rng, name, values) for name, values in fields.items()}
+
+        t0     = start.astimezone(timezone.utc).replace(tzinfo=None)
+        stamps = np.datetime64(t0, 's') + np.round(secs).astype('int64').astype('timedelta64[s]')
+        return FleetBatch(np.tile(self.sensor_ids, steps), np.repeat(stamps, self.n),
+                          {k: v.ravel() for k, v in fields.items()},
+                          {k: v.ravel() for k, v in faults.items()})
+
+    def _inject(self, rng, name: str, values):
+        """Apply faults to `values` in place; return the fault code of every sample."""
+        spec  = self.faults
+        codes = np.zeros(values.shape, dtype=np.uint8)
+        if spec.stuck:
+            stuck = rng.random(values.shape[1]) < spec.stuck
+            values[:, stuck] = values[0, stuck]
+            codes[:, stuck] = FAULT_STUCK
+        if spec.spike:
+            mask = rng.random(values.shape) < spec.spike
+            values[mask] += _SPIKE_SCALE[name] * rng.choice((-1.0, 1.0), mask.sum())
+            codes[mask] = FAULT_SPIKE
+        if spec.out_of_range:
+            mask = rng.random(values.shape) < spec.out_of_range
+            values[mask] = _OUT_OF_RANGE[name]
+            codes[mask] = FAULT_OUT_OF_RANGE
+        if spec.dropout:
+            mask = rng.random(values.shape) < spec.dropout
+            values[mask] = np.nan
+            codes[mask] = FAULT_DROPOUT
+        return codes
+
+
 if __name__ == "__main__":
     sim = GreenhouseSimulator()
     print(json.dumps(sim.get_data(), indent=2))
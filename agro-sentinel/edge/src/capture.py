@@ -1,22 +1,172 @@
 import random
 import time
-from .database import buffer_reading
+import queue
+import logging
+import threading
+from . import scheduler
+from .database import buffer_readings
+from .reduction import BREACH_LIMITS, Reducer, breached
 
 SENSORS = [
-    {"id": "temp_01", "min": 20.0, "max": 35.0},
-    {"id": "humid_01", "min": 40.0, "max": 80.0},
-    {"id": "soil_01", "min": 300, "max": 800},
+    {"id": "temp_01",  "field": "temperature_c", "min": 20.0, "max": 35.0},
+    {"id": "humid_01", "field": "humidity_rh",   "min": 40.0, "max": 80.0},
+    {"id": "soil_01",  "field": "soil_moisture", "min": 30.0, "max": 45.0},
 ]
 
+QUEUE_TICKS    = 64        # ticks held between acquisition and storage
+MAX_BATCH_ROWS = 5000      # rows the storage stage folds into one transaction
+
+
+class SimulatedChannel:
+    """Driver for one mock channel. A real driver reads GPIO / Modbus here."""
+
+    def __init__(self, sensor_id: str, field: str, lo: float, hi: float):
+        self.sensor_id, self.field, self.lo, self.hi = sensor_id, field, lo, hi
+
+    def read(self) -> tuple[str, dict]:
+        # Simulate value with some jitter
+        return self.sensor_id, {self.field: round(random.uniform(self.lo, self.hi), 2)}
+
+
+class CapturePipeline:
+    """
+    Acquisition → bounded queue → storage.
+
+    The acquisition thread polls every driver once per tick and enqueues the
+    whole tick as one item, so queue cost does not grow with the channel count.
+    The storage thread commits everything queued — whole ticks only — in one
+    transaction. When storage falls behind and the queue is full, the oldest
+    tick is shed: fresh data is worth more than stale, and the sampling clock
+    never stalls on SQLite.
+
+    With a `reducer` (see reduction.py) the storage thread reduces each batch
+    before committing it; `stored` then counts the records kept.
+
+    Once a batch holding a value outside BREACH_LIMITS is committed, the sync
+    agent is woken so the alarm does not wait for its idle tick. Only the first
+    breaching sample of a (sensor, field) wakes it, not every sample while the
+    breach lasts.
+    """
+
+    def __init__(self, drivers: list, interval: float = 1.0, queue_ticks: int = QUEUE_TICKS,
+                 store=buffer_readings, reducer: Reducer | None = None,
+                 breach_limits: dict = BREACH_LIMITS):
+        self.drivers  = drivers
+        self.interval = interval
+        self.store    = store
+        self.reducer  = reducer
+        self.breach_limits = breach_limits
+        self._breaching: set[tuple[str, str]] = set()     # storage thread only
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_ticks)
+        self._lock    = threading.Lock()
+        self._stats   = {"ticks": 0, "samples": 0, "read_errors": 0, "stored": 0,
+                         "dropped": 0, "store_errors": 0, "commits": 0,
+                         "queue_high_water": 0, "last_commit_ms": 0.0}
+
+    def stats(self) -> dict:
+        """Counters for monitoring backpressure; a copy, safe to log."""
+        with self._lock:
+            return dict(self._stats, queue_depth=self._queue.qsize())
+
+    def _count(self, **deltas):
+        with self._lock:
+            for key, n in deltas.items():
+                self._stats[key] += n
+
+    def capture_tick(self):
+        """Poll every driver once and enqueue the tick."""
+        samples = []
+        for driver in self.drivers:
+            try:
+                samples.append(driver.read())
+            except Exception as exc:
+                self._count(read_errors=1)
+                logging.warning(f"Driver {getattr(driver, 'sensor_id', driver)} read failed: {exc}")
+        while True:
+            try:
+                self._queue.put_nowait(samples)
+                break
+            except queue.Full:
+                try:
+                    shed = self._queue.get_nowait()
+                    self._count(dropped=len(shed))
+                except queue.Empty:
+                    pass
+        with self._lock:
+            self._stats["ticks"] += 1
+            self._stats["samples"] += len(samples)
+            self._stats["queue_high_water"] = max(self._stats["queue_high_water"], self._queue.qsize())
+
+    def store_pending(self, block: bool = True, timeout: float | None = None) -> int:
+        """Commit every queued tick (up to MAX_BATCH_ROWS) in one transaction."""
+        try:
+            batch = list(self._queue.get(block=block, timeout=timeout))
+        except queue.Empty:
+            return 0
+        while len(batch) < MAX_BATCH_ROWS:
+            try:
+                batch += self._queue.get_nowait()
+            except queue.Empty:
+                break
+        if self.reducer is not None:
+            batch = self.reducer.reduce(batch)
+        if not batch:
+            return 0
+        t0 = time.perf_counter()
+        try:
+            self.store(batch)
+        except Exception as exc:
+            self._count(store_errors=1, dropped=len(batch))
+            logging.error(f"Failed to store {len(batch)} samples: {exc}")
+            return 0
+        with self._lock:
+            self._stats["stored"] += len(batch)
+            self._stats["commits"] += 1
+            self._stats["last_commit_ms"] = (time.perf_counter() - t0) * 1000
+        self._wake_on_breach(batch)
+        return len(batch)
+
+    def _wake_on_breach(self, batch: list[tuple[str, dict]]):
+        new = []
+        for sensor_id, payload in batch:
+            for field, value in payload.items():
+                key = (sensor_id, field)
+                if breached(field, value, self.breach_limits):
+                    if key not in self._breaching:
+                        self._breaching.add(key)
+                        new.append(f"{sensor_id} {field}={value}")
+                else:
+                    self._breaching.discard(key)
+        if new:
+            logging.warning(f"{', '.join(new)} outside limits — syncing now")
+            scheduler.request_sync()
+
+    def _acquire_loop(self):
+        next_tick = time.monotonic()
+        while True:
+            self.capture_tick()
+            next_tick += self.interval
+            time.sleep(max(0.0, next_tick - time.monotonic()))
+
+    def _store_loop(self):
+        while True:
+            self.store_pending()
+
+    def start(self):
+        threading.Thread(target=self._store_loop, name="capture-store", daemon=True).start()
+        threading.Thread(target=self._acquire_loop, name="capture-acquire", daemon=True).start()
+
+
 def simulate_sensors(interval=1):
     """Continuously generate mock sensor data."""
     print("Starting Sensor Simulation...")
+    drivers  = [SimulatedChannel(s["id"], s["field"], s["min"], s["max"]) for s in SENSORS]
+    pipeline = CapturePipeline(drivers, interval=interval, reducer=Reducer.from_env())
+    pipeline.start()
+    dropped = 0
     while True:
-        for sensor in SENSORS:
-            # Simulate value with some jitter
-            val = round(random.uniform(sensor["min"], sensor["max"]), 2)
-            
-            # Write to local DB (Offline First)
-            buffer_reading(sensor["id"], val)
-            
-        time.sleep(interval)
+        time.sleep(60)
+        stats = pipeline.stats()
+        if stats["dropped"] > dropped:
+            logging.warning(f"Capture storage falling behind: {stats}")
+            dropped = stats["dropped"]
@@ -1,5 +1,9 @@
+import os
+import queue
 import sqlite3
 import json
+import threading
+from concurrent.futures import Future
 from pathlib import Path
 from datetime import datetime, timezone
 
@@ -9,60 +13,444 @@ from datetime import datetime, timezone
 _BASE_DIR = Path(__file__).resolve().parent.parent   # agro-sentinel/edge/
 DB_PATH   = str(_BASE_DIR / "data" / "edge_buffer.db")
 
+# ── Durability / throughput tuning ─────────────────────────────────────────────
+# WAL + synchronous=NORMAL survives a process crash without an fsync per commit;
+# only a power cut can lose the last few commits. Set EDGE_SQLITE_SYNCHRONOUS=FULL
+# on gateways without a UPS if that window is not acceptable.
+SYNCHRONOUS      = os.environ.get('EDGE_SQLITE_SYNCHRONOUS', 'NORMAL').upper()
+BUSY_TIMEOUT_MS  = 5000
+GROUP_COMMIT_MAX = 512      # max queued write jobs folded into one transaction
 
-def init_db():
+# ── Reading schema ─────────────────────────────────────────────────────────────
+# Known sensor fields get a typed column each; anything else a driver sends lands
+# in `extra` as JSON (NULL for the common case of no unknown keys). Names are the
+# Cloud Function's schema, so a row maps 1:1 onto a Pub/Sub payload. Aliases are
+# resolved once, at write time, with `is None` checks: `or` would turn a flat
+# battery (0.0) into null (PIPELINE_STATUS.md §3).
+#   (column, SQLite type, accepted aliases)
+READING_FIELDS = (
+    ("temperature_c", "REAL",    ("temperature",)),
+    ("humidity_rh",   "REAL",    ("humidity",)),
+    ("co2_ppm",       "REAL",    ("co2",)),
+    ("soil_moisture", "REAL",    ()),
+    ("par_umol",      "REAL",    ("par",)),
+    ("soil_ec",       "REAL",    ()),
+    ("soil_temp_c",   "REAL",    ("soil_temp",)),
+    ("battery_level", "REAL",    ("battery",)),
+    ("rssi_dbm",      "INTEGER", ("rssi",)),
+)
+FIELD_NAMES = tuple(name for name, _, _ in READING_FIELDS)
+
+# PRAGMA user_version: 0 = fresh file or the original JSON-blob table, 2 = typed,
+# 3 = partial unsynced index + incremental auto-vacuum, 4 = per-sensor sequence numbers.
+SCHEMA_VERSION = 4
+
+_RESERVED_KEYS = frozenset({"sensor_id", "timestamp"})
+_ALIASES = {alias: name for name, _, aliases in READING_FIELDS for alias in aliases}
+
+_CREATE_READINGS_SQL = f"""
+    CREATE TABLE IF NOT EXISTS {{table}} (
+        id         INTEGER PRIMARY KEY AUTOINCREMENT,
+        sensor_id  TEXT    NOT NULL,
+        timestamp  TEXT    NOT NULL,
+        {", ".join(f"{name} {kind}" for name, kind, _ in READING_FIELDS)},
+        extra      TEXT,
+        synced     INTEGER NOT NULL DEFAULT 0,
+        seq        INTEGER
+    )
+"""
+
+# ── Sequence numbers ───────────────────────────────────────────────────────────
+# Every reading gets seq = last_seq + 1 for its sensor, assigned by the writer in
+# the same transaction as the INSERT, so a rolled-back group gives its numbers
+# back. The cloud drops a (sensor_id, epoch, seq) it has already ingested, which
+# makes a re-publish after a crash between publish and mark_synced harmless.
+# `epoch` is drawn at random when a sensor is first seen: a replaced or wiped
+# buffer restarts at seq 1 under a new epoch instead of looking like a replay.
+_CREATE_SEQUENCES_SQL = """
+    CREATE TABLE IF NOT EXISTS sequences (
+        sensor_id  TEXT    PRIMARY KEY,
+        epoch      INTEGER NOT NULL,
+        last_seq   INTEGER NOT NULL
+    ) WITHOUT ROWID
+"""
+_NEXT_SEQ_SQL = (
+    "INSERT INTO sequences (sensor_id, epoch, last_seq) VALUES (?, abs(random() % 2147483647), 1) "
+    "ON CONFLICT (sensor_id) DO UPDATE SET last_seq = last_seq + 1 RETURNING last_seq"
+)
+# RETURNING needs SQLite 3.35; Debian bullseye (Raspberry Pi OS 11) ships 3.34.
+# There the number is taken in three statements, still inside the writer's
+# transaction, so a rolled-back group gives it back all the same.
+HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+_NEW_SEQUENCE_SQL = (
+    "INSERT OR IGNORE INTO sequences (sensor_id, epoch, last_seq) "
+    "VALUES (?, abs(random() % 2147483647), 0)"
+)
+_BUMP_SEQ_SQL = "UPDATE sequences SET last_seq = last_seq + 1 WHERE sensor_id = ?"
+_LAST_SEQ_SQL = "SELECT last_seq FROM sequences WHERE sensor_id = ?"
+_COLUMNS = ("sensor_id", "timestamp", *FIELD_NAMES, "extra")
+_INSERT_SQL = (
+    f"INSERT INTO readings ({', '.join(_COLUMNS)}, seq) "
+    f"VALUES ({', '.join('?' * len(_COLUMNS))}, ?)"
+)
+_MARK_SYNCED_SQL = "UPDATE readings SET synced = 1 WHERE id = ?"
+_SELECT_UNSYNCED_SQL = (
+    f"SELECT r.id, r.sensor_id, r.timestamp, {', '.join('r.' + n for n in FIELD_NAMES)}, "
+    "r.seq, s.epoch, r.extra FROM readings r LEFT JOIN sequences s ON s.sensor_id = r.sensor_id "
+    "WHERE r.synced = 0 AND r.id > ? ORDER BY r.id LIMIT ?"
+)
+_MIGRATION_CHUNK = 5000
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    """Open a connection with the pragmas every buffer connection needs."""
+    # isolation_level=None: transactions are explicit (BEGIN/COMMIT in the writer),
+    # so the sqlite3 module never opens one behind our back.
+    conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False,
+                           timeout=BUSY_TIMEOUT_MS / 1000)
+    conn.execute("PRAGMA journal_mode=WAL")
+    if SYNCHRONOUS not in ('OFF', 'NORMAL', 'FULL', 'EXTRA'):
+        raise ValueError(f"Invalid EDGE_SQLITE_SYNCHRONOUS={SYNCHRONOUS!r}")
+    conn.execute(f"PRAGMA synchronous={SYNCHRONOUS}")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    return conn
+
+
+class _GroupCommitWriter(threading.Thread):
+    """
+    Single writer thread that owns the write connection.
+
+    Callers submit `fn(conn)` jobs and get a Future back. Every job already queued
+    when the writer wakes up runs inside ONE transaction, so N concurrent inserts
+    cost one commit instead of N. If any job in a group fails, the group is rolled
+    back and replayed one job per transaction so a bad row cannot take its
+    neighbours down with it.
+
+    Jobs submitted with `own_transaction=True` (ATTACH, checkpoints, multi-step
+    retention moves) run alone, outside any group, and manage their own
+    transactions.
+    """
+
+    _STOP = object()
+
+    def __init__(self, path: str):
+        super().__init__(name="edge-db-writer", daemon=True)
+        self._conn  = _connect(path)
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+
+    def submit(self, fn, own_transaction: bool = False) -> Future:
+        future: Future = Future()
+        self._queue.put((fn, future, own_transaction))
+        return future
+
+    def stop(self):
+        self._queue.put(self._STOP)
+        self.join()
+        self._conn.close()
+
+    def run(self):
+        pending = None
+        while True:
+            item, pending = pending or self._queue.get(), None
+            if item is self._STOP:
+                return
+            if item[2]:
+                self._run_alone(item)
+                continue
+            group = [item]
+            while len(group) < GROUP_COMMIT_MAX:
+                try:
+                    nxt = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is self._STOP or nxt[2]:
+                    pending = nxt
+                    break
+                group.append(nxt)
+            self._commit_group(group)
+
+    def _run_alone(self, job):
+        fn, future, _ = job
+        try:
+            result = fn(self._conn)
+        except Exception as exc:
+            if self._conn.in_transaction:
+                self._conn.execute("ROLLBACK")
+            future.set_exception(exc)
+        else:
+            future.set_result(result)
+
+    def _commit_group(self, group: list):
+        conn = self._conn
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            results = [fn(conn) for fn, _, _ in group]
+            conn.execute("COMMIT")
+        except Exception as exc:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            if len(group) > 1:
+                for job in group:
+                    self._commit_group([job])
+            else:
+                future = group[0][1]
+                future.set_exception(exc)
+            return
+        for (_, future, _), result in zip(group, results):
+            future.set_result(result)
+
+
+class BufferDB:
+    """
+    Long-lived connection manager for the edge buffer.
+
+    One group-commit writer thread serialises all writes; every reading thread
+    (e.g. the sync agent) gets its own connection, which in WAL mode never blocks
+    the writer and is never blocked by it.
+    """
+
+    def __init__(self, path: str = DB_PATH):
+        self.path    = path
+        self._local  = threading.local()
+        self._readers: list[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        self._writer = _GroupCommitWriter(path)
+        self._writer.start()
+
+    def write(self, fn, own_transaction: bool = False) -> Future:
+        """Queue `fn(conn)` for the next group commit (or alone, see the writer)."""
+        return self._writer.submit(fn, own_transaction)
+
+    def reader(self) -> sqlite3.Connection:
+        """Per-thread read connection, opened on first use and then reused."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = _connect(self.path)
+            conn.execute("PRAGMA query_only=ON")
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    def close(self):
+        self._writer.stop()
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+
+
+_db: BufferDB | None = None
+_db_lock = threading.Lock()
+
+
+def _get_db() -> BufferDB:
+    if _db is None:
+        init_db()
+    return _db
+
+
+def init_db(path: str = DB_PATH):
+    global _db
     # Ensure the data directory exists with restricted permissions
-    data_dir = Path(DB_PATH).parent
+    data_dir = Path(path).parent
     data_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
 
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    # payload stored as JSON blob so all sensor fields travel together
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS readings (
-            id         INTEGER PRIMARY KEY AUTOINCREMENT,
-            sensor_id  TEXT    NOT NULL,
-            payload    TEXT    NOT NULL,
-            timestamp  TEXT    NOT NULL,
-            synced     INTEGER NOT NULL DEFAULT 0
+    with _db_lock:
+        if _db is not None:
+            if _db.path == path:
+                return
+            _db.close()
+        conn = _connect(path)
+        _ensure_schema(conn)
+        conn.close()
+        _db = BufferDB(path)
+    print(f"[{datetime.now()}] Database initialised at {path}")
+
+
+def _ensure_schema(conn: sqlite3.Connection):
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(readings)")}
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    # Incremental auto-vacuum lets retention hand freed pages back to the SD card
+    # a few at a time. The WAL pragma in _connect() has already written the file
+    # header, so even a fresh file only picks the mode up after one VACUUM.
+    rewrite = False
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        rewrite = True
+    if "payload" in columns:
+        _migrate_json_rows(conn)
+        rewrite = True
+    conn.execute(_CREATE_READINGS_SQL.format(table="readings"))
+    if version < 3:
+        # The old (synced, id) index kept an entry for every synced row, so the
+        # unsynced lookup walked past the whole history. A partial index only
+        # holds the backlog.
+        conn.execute('DROP INDEX IF EXISTS idx_unsynced')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_unsynced ON readings (id) WHERE synced = 0')
+    # Retention picks expired rows by timestamp; ids only follow arrival order,
+    # which a backfill or a clock fix breaks.
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_synced_ts ON readings (timestamp) WHERE synced = 1')
+    conn.execute(_CREATE_SEQUENCES_SQL)
+    if version < 4:
+        add_seq_column(conn)
+        # Row ids already increase per sensor, so they serve as the first
+        # sequence numbers; each sensor continues from its highest one.
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("UPDATE readings SET seq = id WHERE seq IS NULL")
+        conn.execute(
+            "INSERT OR IGNORE INTO sequences (sensor_id, epoch, last_seq) "
+            "SELECT sensor_id, abs(random() % 2147483647), MAX(seq) FROM readings GROUP BY sensor_id"
         )
-    ''')
-    c.execute('CREATE INDEX IF NOT EXISTS idx_unsynced ON readings (synced, id)')
-    conn.commit()
-    conn.close()
-    print(f"[{datetime.now()}] Database initialised at {DB_PATH}")
-
-
-def buffer_reading(sensor_id: str, payload: dict):
-    """Store a full sensor reading locally (offline-first)."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    ts = datetime.now(timezone.utc).isoformat()
-    c.execute(
-        "INSERT INTO readings (sensor_id, payload, timestamp) VALUES (?, ?, ?)",
-        (sensor_id, json.dumps(payload), ts),
-    )
-    conn.commit()
-    conn.close()
-
-
-def get_unsynced(limit: int = 50) -> list:
-    """Return unsynced readings as dicts ready to publish."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    c.execute(
-        "SELECT id, sensor_id, payload, timestamp FROM readings WHERE synced = 0 ORDER BY id LIMIT ?",
-        (limit,),
-    )
+        conn.execute("COMMIT")
+    conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+    if rewrite:
+        # One-off full rewrite: reclaims the migrated JSON blobs and switches the
+        # file to incremental auto-vacuum.
+        conn.execute("VACUUM")
+
+
+def add_seq_column(conn: sqlite3.Connection, schema: str = "main"):
+    """Add `seq` to a readings table created before schema 4 (buffer or history file)."""
+    columns = {row[1] for row in conn.execute(f"PRAGMA {schema}.table_info(readings)")}
+    if "seq" not in columns:
+        conn.execute(f"ALTER TABLE {schema}.readings ADD COLUMN seq INTEGER")
+
+
+def _migrate_json_rows(conn: sqlite3.Connection):
+    """
+    Rewrite the original `payload TEXT` table into the typed layout, in place.
+
+    Row ids and synced flags are preserved so nothing is re-published or lost.
+    Runs as one transaction: an interrupted migration leaves the old table intact
+    and is simply retried on the next start. Payloads that are not JSON objects
+    (capture.py wrote bare floats, PIPELINE_STATUS.md §1) are kept under
+    extra = {"value": ...} rather than dropped.
+    """
+    total = conn.execute("SELECT COUNT(*) FROM readings").fetchone()[0]
+    print(f"[{datetime.now()}] Migrating {total} JSON readings to typed columns…")
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(_CREATE_READINGS_SQL.format(table="readings_typed"))
+        columns = ("id", "synced", *_COLUMNS)
+        insert  = (f"INSERT INTO readings_typed ({', '.join(columns)}) "
+                   f"VALUES ({', '.join('?' * len(columns))})")
+        last_id = 0
+        while True:
+            chunk = conn.execute(
+                "SELECT id, sensor_id, payload, timestamp, synced FROM readings "
+                "WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, _MIGRATION_CHUNK),
+            ).fetchall()
+            if not chunk:
+                break
+            rows = []
+            for rid, sensor_id, payload, ts, synced in chunk:
+                try:
+                    decoded = json.loads(payload)
+                except (TypeError, ValueError):
+                    decoded = payload
+                if not isinstance(decoded, dict):
+                    decoded = {"value": decoded}
+                rows.append((rid, synced, *_to_row(sensor_id, decoded, ts)))
+            conn.executemany(insert, rows)
+            last_id = chunk[-1][0]
+        conn.execute("DROP TABLE readings")
+        conn.execute("ALTER TABLE readings_typed RENAME TO readings")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _to_row(sensor_id: str, payload: dict, default_ts: str) -> tuple:
+    """Split a reading dict into (sensor_id, timestamp, *typed fields, extra)."""
+    values = dict.fromkeys(FIELD_NAMES)
+    extra  = {}
+    for key, value in payload.items():
+        if key in _RESERVED_KEYS:
+            continue
+        name = _ALIASES.get(key, key)
+        if name in values and value is not None:
+            try:
+                # Canonical name wins if a driver sends both it and an alias
+                if values[name] is None or name == key:
+                    values[name] = float(value)
+                continue
+            except (TypeError, ValueError):
+                pass
+        extra[key] = value
+    ts = payload.get("timestamp") or default_ts
+    return (sensor_id, ts, *values.values(), json.dumps(extra) if extra else None)
+
+
+def close_db():
+    """Flush pending writes and close every connection (tests, shutdown)."""
+    global _db
+    with _db_lock:
+        if _db is not None:
+            _db.close()
+            _db = None
+
+
+def _next_seq(conn: sqlite3.Connection, sensor_id: str) -> int:
+    if HAS_RETURNING:
+        return conn.execute(_NEXT_SEQ_SQL, (sensor_id,)).fetchone()[0]
+    conn.execute(_NEW_SEQUENCE_SQL, (sensor_id,))
+    conn.execute(_BUMP_SEQ_SQL, (sensor_id,))
+    return conn.execute(_LAST_SEQ_SQL, (sensor_id,)).fetchone()[0]
+
+
+def _insert(conn: sqlite3.Connection, row: tuple) -> int:
+    """Writer job body: number the reading for its sensor and insert it. Returns the row id."""
+    seq = _next_seq(conn, row[0])
+    return conn.execute(_INSERT_SQL, (*row, seq)).lastrowid
+
+
+def buffer_reading(sensor_id: str, payload: dict, wait: bool = True):
+    """
+    Store a full sensor reading locally (offline-first).
+
+    With `wait=True` (default) this returns once the reading is committed. With
+    `wait=False` it returns the pending Future immediately, so a capture loop can
+    keep sampling while the writer folds its rows into the next group commit.
+    """
+    params = _to_row(sensor_id, payload, datetime.now(timezone.utc).isoformat())
+    future = _get_db().write(lambda conn: _insert(conn, params))
+    return future.result() if wait else future
+
+
+def buffer_readings(readings: list[tuple[str, dict]], wait: bool = True):
+    """
+    Store many readings in one transaction, e.g. every channel of a capture tick.
+
+    `readings` is a list of (sensor_id, payload). Returns the number of rows
+    written (or the pending Future with `wait=False`).
+    """
+    ts     = datetime.now(timezone.utc).isoformat()
+    params = [_to_row(sensor_id, payload, ts) for sensor_id, payload in readings]
+    future = _get_db().write(lambda conn: len([_insert(conn, row) for row in params]))
+    return future.result() if wait else future
+
+
+def get_unsynced(limit: int = 50, after_id: int = 0) -> list:
+    """
+    Return unsynced readings as dicts ready to publish.
+
+    Every known field is present (None when not measured); `extra` keys are
+    merged in only for the rows that have any. `after_id` pages through the
+    backlog while earlier rows are still in flight and not yet marked synced.
+    `seq` and `seq_epoch` identify the reading for the cloud's duplicate check.
+    """
+    c = _get_db().reader().execute(_SELECT_UNSYNCED_SQL, (after_id, limit))
+    keys = ("_row_id", "sensor_id", "timestamp", *FIELD_NAMES, "seq", "seq_epoch")
     rows = []
     for row in c.fetchall():
-        record = json.loads(row["payload"])
-        record["_row_id"]   = row["id"]
-        record["sensor_id"] = row["sensor_id"]
-        record["timestamp"] = record.get("timestamp") or row["timestamp"]
+        record = dict(zip(keys, row))
+        if row[-1] is not None:
+            for key, value in json.loads(row[-1]).items():
+                record.setdefault(key, value)
         rows.append(record)
-    conn.close()
     return rows
 
 
@@ -70,10 +458,8 @@ def mark_synced(reading_ids: list):
     """Mark a batch of row IDs as successfully uploaded."""
     if not reading_ids:
         return
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    placeholders = ','.join('?' * len(reading_ids))
-    c.execute(f"UPDATE readings SET synced = 1 WHERE id IN ({placeholders})", reading_ids)
-    conn.commit()
-    conn.close()
-    print(f"[{datetime.now()}] Marked {len(reading_ids)} records as synced.")
+    # executemany over one prepared statement: no IN (...) list to re-parse per
+    # batch size, and no SQLITE_MAX_VARIABLE_NUMBER ceiling on large drains.
+    params = [(rid,) for rid in reading_ids]
+    _get_db().write(lambda conn: conn.executemany(_MARK_SYNCED_SQL, params)).result()
+    print(f"[{datetime.now()}] Marked {len(params)} records as synced.")
@@ -0,0 +1,65 @@
+"""
+Multi-reading envelope: N readings, one Pub/Sub message, one HMAC.
+
+Wire format (version 1):
+
+    b"AGS" | version (1 byte) | codec (1 byte) | body
+
+    codec 0 = identity, 1 = zlib
+    body    = JSON {"readings": [<reading>, ...]}, each reading in the same
+              schema as a legacy single-reading message
+
+A legacy message is a bare JSON object and always starts with "{", so the
+three-byte magic can never be mistaken for one. The HMAC is computed over the
+whole message exactly as published (after compression).
+
+Keep in sync with cloud/envelope.py, which unpacks this on the ingest side.
+"""
+import json
+import zlib
+
+MAGIC   = b"AGS"
+VERSION = 1
+CODEC_IDENTITY, CODEC_ZLIB = 0, 1
+
+# Both sides refuse anything bigger: a forged zlib stream must not be able to
+# inflate into gigabytes inside a 256 MB Cloud Function.
+MAX_READINGS       = 1000
+MAX_DECODED_BYTES  = 8 * 1024 * 1024
+
+
+def is_envelope(data: bytes) -> bool:
+    return data[:3] == MAGIC
+
+
+def pack(readings: list[dict], compress: bool = True) -> bytes:
+    if not readings or len(readings) > MAX_READINGS:
+        raise ValueError(f"An envelope holds 1..{MAX_READINGS} readings, got {len(readings)}")
+    body  = json.dumps({"readings": readings}, separators=(',', ':')).encode('utf-8')
+    codec = CODEC_IDENTITY
+    if compress:
+        packed = zlib.compress(body, 6)
+        if len(packed) < len(body):
+            body, codec = packed, CODEC_ZLIB
+    return MAGIC + bytes((VERSION, codec)) + body
+
+
+def unpack(data: bytes) -> list[dict]:
+    if not is_envelope(data) or len(data) < 5:
+        raise ValueError("Not an envelope")
+    version, codec, body = data[3], data[4], data[5:]
+    if version != VERSION:
+        raise ValueError(f"Unsupported envelope version {version}")
+    if codec == CODEC_ZLIB:
+        inflater = zlib.decompressobj()
+        body = inflater.decompress(body, MAX_DECODED_BYTES)
+        if inflater.unconsumed_tail or not inflater.eof:
+            raise ValueError("Envelope exceeds the decoded size limit or is truncated")
+    elif codec != CODEC_IDENTITY:
+        raise ValueError(f"Unknown envelope codec {codec}")
+    readings = json.loads(body.decode('utf-8')).get("readings")
+    if not isinstance(readings, list) or not 0 < len(readings) <= MAX_READINGS:
+        raise ValueError("Envelope must carry a non-empty list of readings")
+    if not all(isinstance(r, dict) for r in readings):
+        raise ValueError("Every reading in an envelope must be an object")
+    return readings
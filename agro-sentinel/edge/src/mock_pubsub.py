@@ -0,0 +1,94 @@
+"""
+In-process stand-in for google.cloud.pubsub_v1, for offline throughput tests.
+
+Mirrors the parts of the client sync.py uses: PublisherClient(batch_settings,
+publisher_options), topic_path, publish(..., ordering_key=...) returning a
+future, and resume_publish. Each publish completes after `latency_s` (plus
+optional jitter) on a single timer thread, so a sender that waits on every
+future pays one round trip per message exactly as it would over a real link.
+
+Like the real client, a failed publish pauses its ordering key: later publishes
+with that key fail immediately until resume_publish() is called.
+"""
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+BatchSettings    = namedtuple("BatchSettings", "max_bytes max_latency max_messages",
+                              defaults=(1_000_000, 0.01, 100))
+PublisherOptions = namedtuple("PublisherOptions", "enable_message_ordering",
+                              defaults=(False,))
+types = SimpleNamespace(BatchSettings=BatchSettings, PublisherOptions=PublisherOptions)
+
+
+class PublishError(Exception):
+    pass
+
+
+class PublisherClient:
+    def __init__(self, batch_settings=None, publisher_options=None, *,
+                 latency_s: float = 0.0, jitter_s: float = 0.0,
+                 failure_rate: float = 0.0, seed: int | None = None, **kwargs):
+        self.batch_settings    = batch_settings or BatchSettings()
+        self.publisher_options = publisher_options or PublisherOptions()
+        self.latency_s    = latency_s
+        self.jitter_s     = jitter_s
+        self.failure_rate = failure_rate
+        self.published: list[tuple[str, bytes, dict]] = []   # acked messages, in ack order
+        self._rng     = random.Random(seed)
+        self._paused: set[str] = set()
+        self._last_due: dict[str, float] = {}
+        self._lock    = threading.Lock()
+        self._pending: list = []          # heap of (due, seq, future, message, fail)
+        self._seq     = itertools.count()
+        self._wakeup  = threading.Condition(self._lock)
+        threading.Thread(target=self._complete_loop, name="mock-pubsub", daemon=True).start()
+
+    @staticmethod
+    def topic_path(project: str, topic: str) -> str:
+        return f"projects/{project}/topics/{topic}"
+
+    def publish(self, topic: str, data: bytes, ordering_key: str = "", **attrs) -> Future:
+        future: Future = Future()
+        with self._lock:
+            if ordering_key and ordering_key in self._paused:
+                future.set_exception(PublishError(f"ordering key {ordering_key!r} is paused"))
+                return future
+            fail = self._rng.random() < self.failure_rate
+            due  = time.monotonic() + self.latency_s + self._rng.uniform(0, self.jitter_s)
+            if ordering_key:
+                # Same key never completes out of order, whatever the jitter
+                due = self._last_due[ordering_key] = max(due, self._last_due.get(ordering_key, 0.0))
+            heapq.heappush(self._pending, (due, next(self._seq), future,
+                                           (topic, data, dict(attrs, ordering_key=ordering_key)), fail))
+            self._wakeup.notify()
+        return future
+
+    def resume_publish(self, topic: str, ordering_key: str):
+        with self._lock:
+            self._paused.discard(ordering_key)
+
+    def _complete_loop(self):
+        while True:
+            with self._lock:
+                while not self._pending or self._pending[0][0] > time.monotonic():
+                    timeout = self._pending[0][0] - time.monotonic() if self._pending else None
+                    self._wakeup.wait(timeout)
+                _, seq, future, message, fail = heapq.heappop(self._pending)
+                key = message[2]["ordering_key"]
+                if fail or (key and key in self._paused):
+                    if key:
+                        self._paused.add(key)
+                    result = PublishError("injected failure")
+                else:
+                    self.published.append(message)
+                    result = str(seq)
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
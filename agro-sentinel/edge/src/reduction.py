@@ -0,0 +1,240 @@
+"""
+Edge-side reduction: decide which raw samples are worth storing and sending.
+
+Each (sensor, field) follows one policy:
+
+    raw       every sample is kept
+    deadband  a sample is kept only when it moved more than `band` from the
+              last value kept, or `heartbeat_s` passed since then
+    window    samples are folded into a `seconds`-long window; one value (the
+              window's `stat`: min, max, mean or last) is kept when it closes
+
+Whatever the policy, a sample outside BREACH_LIMITS is kept as-is, so an alarm
+never waits for a window or hides inside a deadband; the capture pipeline wakes
+the sync agent once it is stored.
+
+Every kept record says how it was reduced under a "reduction" key, one entry per
+reduced field, so the cloud can tell a raw sample from a window mean:
+
+    {"temperature_c": "deadband:0.2", "soil_ec": {"mode": "window", "s": 300,
+     "stat": "mean", "n": 60, "min": 1.21, "max": 1.79, "mean": 1.5, "last": 1.4,
+     "start": "<ISO-8601>"}, "co2_ppm": "breach", "par_umol": "missing"}
+
+A field with no entry is a raw sample. "missing" marks a sample the sensor sent
+as null: it rides along with the record as null, where a field that held still
+is simply left out, and the cloud must not fill it in.
+
+Policies come from DEFAULT_POLICIES, overridden per field and per sensor by the
+JSON file in EDGE_REDUCTION_CONFIG:
+
+    {"default": {"soil_ec": {"mode": "window", "seconds": 600, "stat": "mean"}},
+     "sensors": {"GH-TEN-01": {"temperature_c": {"mode": "raw"}}}}
+"""
+import json
+import math
+import os
+import time
+from datetime import datetime, timezone
+
+
+# Off unless set: a reduced record carries only the fields that moved, and the
+# Cloud Function must be recent enough to fill in the rest (cloud/last_known.py).
+REDUCTION_ENABLED = os.environ.get('EDGE_REDUCTION', 'off').lower() in ('on', 'true', '1')
+REDUCTION_CONFIG  = os.environ.get('EDGE_REDUCTION_CONFIG')
+HEARTBEAT_S       = float(os.environ.get('EDGE_REDUCTION_HEARTBEAT_S', 900))
+
+RAW = {"mode": "raw"}
+
+DEFAULT_POLICIES = {
+    "temperature_c": {"mode": "deadband", "band": 0.2},
+    "humidity_rh":   {"mode": "deadband", "band": 1.0},
+    "co2_ppm":       {"mode": "deadband", "band": 20.0},
+    "soil_moisture": {"mode": "deadband", "band": 1.0},
+    "par_umol":      {"mode": "window",   "seconds": 60,  "stat": "mean"},
+    "soil_ec":       {"mode": "window",   "seconds": 300, "stat": "mean"},
+    "soil_temp_c":   {"mode": "deadband", "band": 0.2},
+    "battery_level": {"mode": "window",   "seconds": 300, "stat": "last"},
+    "rssi_dbm":      {"mode": "window",   "seconds": 300, "stat": "mean"},
+}
+
+# Edge copy of the cloud's CRITICAL thresholds (cloud/main.py), by edge field
+# name: (min, max), None = unbounded.
+BREACH_LIMITS = {
+    "temperature_c": (10,  38),
+    "humidity_rh":   (25,  98),
+    "co2_ppm":       (300, 1800),
+    "soil_moisture": (25,  92),
+    "battery_level": (15,  None),
+    "rssi_dbm":      (-90, None),
+}
+
+_STATS = ("min", "max", "mean", "last")
+
+
+def breached(field: str, value, limits: dict = BREACH_LIMITS) -> bool:
+    """True if `value` is a number outside the (min, max) limits for `field`."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return False
+    lo, hi = limits.get(field, (None, None))
+    return (lo is not None and value < lo) or (hi is not None and value > hi)
+
+
+def _validate(field: str, policy: dict) -> dict:
+    mode = policy.get("mode")
+    if mode == "deadband" and float(policy.get("band", -1)) >= 0:
+        return policy
+    if mode == "window" and float(policy.get("seconds", 0)) > 0 and policy.get("stat", "mean") in _STATS:
+        return policy
+    if mode == "raw":
+        return policy
+    raise ValueError(f"Invalid reduction policy for {field}: {policy}")
+
+
+def load_policies(path: str) -> tuple[dict, dict]:
+    """Read EDGE_REDUCTION_CONFIG: (field defaults, per-sensor overrides)."""
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+    defaults = {**DEFAULT_POLICIES, **config.get("default", {})}
+    sensors  = config.get("sensors", {})
+    for field, policy in defaults.items():
+        _validate(field, policy)
+    for overrides in sensors.values():
+        for field, policy in overrides.items():
+            _validate(field, policy)
+    return defaults, sensors
+
+
+class _FieldState:
+    __slots__ = ("kept", "kept_at", "start", "n", "lo", "hi", "total", "last")
+
+    def __init__(self):
+        self.kept = self.kept_at = None
+        self.start = None
+
+    def open_window(self, now: float):
+        self.start, self.n, self.total = now, 0, 0.0
+        self.lo, self.hi, self.last = math.inf, -math.inf, None
+
+    def add(self, value: float):
+        self.n += 1
+        self.total += value
+        self.lo, self.hi, self.last = min(self.lo, value), max(self.hi, value), value
+
+
+class Reducer:
+    """
+    Stateful reduction stage between capture and the buffer.
+
+    Not thread-safe: the capture pipeline's storage thread is its only caller.
+    """
+
+    def __init__(self, policies: dict | None = None, sensor_policies: dict | None = None,
+                 breach_limits: dict | None = None, heartbeat_s: float = HEARTBEAT_S,
+                 clock=time.time):
+        self.policies        = DEFAULT_POLICIES if policies is None else policies
+        self.sensor_policies = sensor_policies or {}
+        self.breach_limits   = BREACH_LIMITS if breach_limits is None else breach_limits
+        self.heartbeat_s     = heartbeat_s
+        self.clock           = clock
+        self._state: dict[tuple[str, str], _FieldState] = {}
+        self.values_in = self.values_out = 0
+
+    @classmethod
+    def from_env(cls) -> "Reducer | None":
+        if not REDUCTION_ENABLED:
+            return None
+        if REDUCTION_CONFIG:
+            return cls(*load_policies(REDUCTION_CONFIG))
+        return cls()
+
+    def policy(self, sensor_id: str, field: str) -> dict:
+        override = self.sensor_policies.get(sensor_id, {}).get(field)
+        return override or self.policies.get(field, RAW)
+
+    def _close(self, st: _FieldState, policy: dict) -> tuple[float, dict]:
+        stat  = policy.get("stat", "mean")
+        stats = {"min": st.lo, "max": st.hi, "mean": round(st.total / st.n, 4), "last": st.last}
+        tag   = {"mode": "window", "s": policy["seconds"], "stat": stat, "n": st.n, **stats,
+                 "start": datetime.fromtimestamp(st.start, timezone.utc).isoformat()}
+        st.start = None
+        return stats[stat], tag
+
+    def offer(self, sensor_id: str, payload: dict, now: float | None = None) -> dict | None:
+        """Reduce one sample. Returns the record to keep, or None."""
+        now  = self.clock() if now is None else now
+        out, tags = {}, {}
+        passthrough = {}      # non-numeric values ride along with whatever is kept
+        for field, value in payload.items():
+            if field in ("sensor_id", "timestamp"):
+                continue
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                passthrough[field] = value
+                if value is None:
+                    tags[field] = "missing"
+                continue
+            self.values_in += 1
+            policy = self.policy(sensor_id, field)
+            st = self._state.get((sensor_id, field))
+            if st is None:
+                st = self._state[(sensor_id, field)] = _FieldState()
+
+            if breached(field, value, self.breach_limits):
+                out[field], tags[field] = value, "breach"
+                st.kept, st.kept_at = value, now
+                if policy["mode"] == "window":
+                    if st.start is None:
+                        st.open_window(now)
+                    st.add(value)
+                continue
+
+            mode = policy["mode"]
+            if mode == "deadband":
+                if (st.kept is None or abs(value - st.kept) > policy["band"]
+                        or now - st.kept_at >= self.heartbeat_s):
+                    out[field], tags[field] = value, f"deadband:{policy['band']}"
+                    st.kept, st.kept_at = value, now
+            elif mode == "window":
+                if st.start is not None and now - st.start >= policy["seconds"]:
+                    out[field], tags[field] = self._close(st, policy)
+                if st.start is None:
+                    st.open_window(now)
+                st.add(value)
+            else:
+                out[field] = value
+
+        if not out:
+            return None
+        self.values_out += len(out)
+        out.update(passthrough)
+        if tags:
+            out["reduction"] = tags
+        if payload.get("timestamp"):
+            out["timestamp"] = payload["timestamp"]
+        return out
+
+    def flush(self, now: float | None = None, force: bool = False) -> list[tuple[str, dict]]:
+        """Close windows that are due (all open windows with `force`), e.g. for silent sensors."""
+        now = self.clock() if now is None else now
+        closed: dict[str, dict] = {}
+        for (sensor_id, field), st in self._state.items():
+            if st.start is None or not st.n:
+                continue
+            policy = self.policy(sensor_id, field)
+            if force or now - st.start >= policy["seconds"]:
+                record = closed.setdefault(sensor_id, {"reduction": {}})
+                record[field], record["reduction"][field] = self._close(st, policy)
+                self.values_out += 1
+        return list(closed.items())
+
+    def reduce(self, samples: list[tuple[str, dict]]) -> list[tuple[str, dict]]:
+        """Reduce a capture batch of (sensor_id, payload); closes overdue windows too."""
+        now  = self.clock()
+        kept = []
+        for sensor_id, payload in samples:
+            record = self.offer(sensor_id, payload, now)
+            if record is not None:
+                kept.append((sensor_id, record))
+        return kept + self.flush(now)
+
+    def stats(self) -> dict:
+        return {"values_in": self.values_in, "values_out": self.values_out}
@@ -0,0 +1,255 @@
+import os
+import re
+import time
+import logging
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+
+from . import database
+
+# ── Config ─────────────────────────────────────────────────────────────────────
+# Synced rows stay in the buffer this long (local look-back for diagnostics),
+# then are deleted — or moved to a per-day history file if EDGE_HISTORY_DIR is set.
+SYNCED_RETENTION_HOURS = float(os.environ.get('EDGE_SYNCED_RETENTION_HOURS', '24'))
+HISTORY_DIR            = os.environ.get('EDGE_HISTORY_DIR', '')
+HISTORY_DAYS           = int(os.environ.get('EDGE_HISTORY_DAYS', '7'))
+
+# Whole footprint (buffer + WAL + history files). 0 disables the quota.
+DISK_QUOTA_MB          = float(os.environ.get('EDGE_DISK_QUOTA_MB', '0'))
+# Unsynced rows are the only copy of a reading. Only drop them to stay under
+# quota if the operator has explicitly chosen "fresh data over old data".
+QUOTA_DROP_UNSYNCED    = os.environ.get('EDGE_QUOTA_DROP_UNSYNCED', 'false').lower() == 'true'
+
+# Rows per delete/move transaction. Small enough that a capture insert queued
+# behind a chunk waits milliseconds, not seconds.
+CHUNK_ROWS             = 2000
+VACUUM_PAGES           = 2048      # pages handed back to the filesystem per pass
+
+_DAY_RE       = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+_FILE_DAY_RE  = re.compile(r'(\d{4}-\d{2}-\d{2})$')
+UNDATED       = "undated"
+# Rows further ahead than this are treated as undated: a gateway with a wrong
+# clock must not pin them in the buffer (or in a future day file) for years.
+MAX_FUTURE    = timedelta(days=1)
+
+# Expired = synced and older than the cutoff, or with a timestamp that is not a
+# date at all / far in the future. Both ranges are served by idx_synced_ts, so
+# the cost of a pass follows the amount of expired data, not the table size.
+_EXPIRED_WHERE = "synced = 1 AND (timestamp < :cutoff OR timestamp > :future)"
+_CHUNK_WHERE   = "id IN (SELECT id FROM temp.retention_chunk)"
+
+
+def _history_path(history_dir: str, day: str) -> Path:
+    return Path(history_dir) / f"readings-{day}.db"
+
+
+def _file_day(path: Path) -> str:
+    """
+    Day a history file holds: readings-<day>.db, or readings-undated-<day>.db
+    for the undated rows archived that day. A legacy readings-undated.db has no
+    day in its name; its last write stands in.
+    """
+    m = _FILE_DAY_RE.search(path.stem)
+    if m:
+        return m.group(1)
+    return datetime.fromtimestamp(path.stat().st_mtime, timezone.utc).date().isoformat()
+
+
+def history_files(history_dir: str = HISTORY_DIR) -> list[Path]:
+    """Per-day history files, oldest first."""
+    if not history_dir or not Path(history_dir).is_dir():
+        return []
+    return sorted(Path(history_dir).glob("readings-*.db"), key=lambda f: (_file_day(f), f.name))
+
+
+def disk_usage(history_dir: str = HISTORY_DIR) -> int:
+    """Bytes used by the buffer (main file, WAL, shm) plus all history files."""
+    path  = _db_path()
+    files = [Path(path + suffix) for suffix in ("", "-wal", "-shm")]
+    files += history_files(history_dir)
+    return sum(f.stat().st_size for f in files if f.exists())
+
+
+def _db_path() -> str:
+    return database._get_db().path
+
+
+def drop_history(keep_days: int = HISTORY_DAYS, history_dir: str = HISTORY_DIR) -> int:
+    """Unlink day files older than `keep_days`. O(1) per day, whatever its size."""
+    cutoff  = (datetime.now(timezone.utc) - timedelta(days=keep_days)).date().isoformat()
+    dropped = 0
+    for f in history_files(history_dir):
+        if _file_day(f) < cutoff:
+            f.unlink(missing_ok=True)
+            dropped += 1
+    return dropped
+
+
+def _select_chunk(conn, bounds: dict, chunk_rows: int) -> int:
+    """Pick the next chunk of expired rows into temp.retention_chunk; returns its size."""
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS retention_chunk (id INTEGER PRIMARY KEY)")
+    conn.execute("DELETE FROM temp.retention_chunk")
+    return conn.execute(
+        f"INSERT INTO temp.retention_chunk SELECT id FROM readings WHERE {_EXPIRED_WHERE} LIMIT :rows",
+        {**bounds, "rows": chunk_rows},
+    ).rowcount
+
+
+def _delete_chunk(bounds: dict, chunk_rows: int):
+    def job(conn):
+        if not _select_chunk(conn, bounds, chunk_rows):
+            return 0
+        return conn.execute(f"DELETE FROM readings WHERE {_CHUNK_WHERE}").rowcount
+    return job
+
+
+def _archive_chunk(bounds: dict, chunk_rows: int, history_dir: str):
+    """Move one chunk of expired rows into their per-day history files."""
+    today = datetime.now(timezone.utc).date().isoformat()
+
+    def job(conn):
+        if not _select_chunk(conn, bounds, chunk_rows):
+            return 0
+        days = [d for (d,) in conn.execute(
+            f"SELECT DISTINCT substr(timestamp, 1, 10) FROM readings WHERE {_CHUNK_WHERE}"
+        )]
+        moved = 0
+        for day in days:
+            # Undated and future rows share one file per archive day, which
+            # drop_history expires like any other day
+            dated  = _DAY_RE.match(day or "") and day <= today
+            target = day if dated else f"{UNDATED}-{today}"
+            params = (day,)
+            # ATTACH is refused inside a transaction, hence own_transaction=True
+            conn.execute("ATTACH DATABASE ? AS hist", (str(_history_path(history_dir, target)),))
+            try:
+                conn.execute(database._CREATE_READINGS_SQL.format(table="hist.readings"))
+                database.add_seq_column(conn, "hist")      # day file written before schema 4
+                conn.execute("BEGIN IMMEDIATE")
+                # OR IGNORE: a move interrupted between the two files is replayed
+                # on the next pass without duplicating history.
+                conn.execute(
+                    f"INSERT OR IGNORE INTO hist.readings SELECT * FROM main.readings "
+                    f"WHERE {_CHUNK_WHERE} AND substr(timestamp, 1, 10) = ?", params,
+                )
+                moved += conn.execute(
+                    f"DELETE FROM main.readings WHERE {_CHUNK_WHERE} AND substr(timestamp, 1, 10) = ?",
+                    params,
+                ).rowcount
+                conn.execute("COMMIT")
+            finally:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                conn.execute("DETACH DATABASE hist")
+        return moved
+    return job
+
+
+def purge_synced(older_than: timedelta | None = None, history_dir: str = HISTORY_DIR,
+                 chunk_rows: int = CHUNK_ROWS) -> int:
+    """
+    Delete (or archive) synced rows older than `older_than` — or undated —
+    CHUNK_ROWS per transaction. Unsynced rows are never touched. Returns rows removed.
+    """
+    if older_than is None:
+        older_than = timedelta(hours=SYNCED_RETENTION_HOURS)
+    db     = database._get_db()
+    now    = datetime.now(timezone.utc)
+    bounds = {"cutoff": (now - older_than).isoformat(), "future": (now + MAX_FUTURE).isoformat()}
+    if history_dir:
+        Path(history_dir).mkdir(mode=0o700, parents=True, exist_ok=True)
+
+    removed = 0
+    while True:
+        if history_dir:
+            moved = db.write(_archive_chunk(bounds, chunk_rows, history_dir), own_transaction=True).result()
+        else:
+            moved = db.write(_delete_chunk(bounds, chunk_rows)).result()
+        if not moved:
+            break
+        removed += moved
+    return removed
+
+
+def reclaim(max_pages: int = VACUUM_PAGES) -> int:
+    """Return up to `max_pages` free pages to the filesystem and truncate the WAL."""
+    def job(conn):
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        # executescript steps the pragma to completion; execute() would stop
+        # after the first row and free a single page.
+        conn.executescript(f"PRAGMA incremental_vacuum({int(max_pages)});")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        return min(free, max_pages)
+    return database._get_db().write(job, own_transaction=True).result()
+
+
+def _drop_oldest_unsynced(rows: int) -> int:
+    sql = ("DELETE FROM readings WHERE id IN "
+           "(SELECT id FROM readings WHERE synced = 0 ORDER BY id LIMIT ?)")
+    return database._get_db().write(lambda conn: conn.execute(sql, (rows,)).rowcount).result()
+
+
+def enforce_quota(quota_bytes: int, history_dir: str = HISTORY_DIR,
+                  drop_unsynced: bool = QUOTA_DROP_UNSYNCED) -> int:
+    """
+    Shrink the footprint below `quota_bytes`, cheapest data first:
+    history days (oldest first), then every synced row, then — only if allowed —
+    the oldest unsynced rows. Returns the resulting usage in bytes.
+    """
+    usage = disk_usage(history_dir)
+    if usage <= quota_bytes:
+        return usage
+
+    for f in history_files(history_dir):
+        f.unlink(missing_ok=True)
+        logging.warning(f"Disk quota: dropped history file {f.name}")
+        usage = disk_usage(history_dir)
+        if usage <= quota_bytes:
+            return usage
+
+    if purge_synced(older_than=timedelta(0), history_dir=""):
+        reclaim(max_pages=1 << 30)
+        usage = disk_usage(history_dir)
+
+    while usage > quota_bytes:
+        if not drop_unsynced:
+            logging.error(
+                f"Disk quota exceeded by unsynced backlog ({usage} > {quota_bytes} bytes); "
+                f"set EDGE_QUOTA_DROP_UNSYNCED=true to discard the oldest readings"
+            )
+            break
+        if not _drop_oldest_unsynced(CHUNK_ROWS):
+            break
+        logging.warning(f"Disk quota: discarded up to {CHUNK_ROWS} oldest unsynced readings")
+        reclaim(max_pages=1 << 30)
+        usage = disk_usage(history_dir)
+    return usage
+
+
+def run_retention() -> dict:
+    """One full retention pass with the configured policy."""
+    stats = {
+        "history_dropped": drop_history() if HISTORY_DIR else 0,
+        "rows_removed":    purge_synced(),
+        "pages_freed":     reclaim(),
+    }
+    if DISK_QUOTA_MB > 0:
+        stats["usage_bytes"] = enforce_quota(int(DISK_QUOTA_MB * 1024 * 1024))
+    return stats
+
+
+def start_retention_agent(interval: int = 300):
+    """Background loop: run a retention pass every `interval` seconds."""
+    logging.info(
+        f"Starting retention agent (keep synced {SYNCED_RETENTION_HOURS}h, "
+        f"history={'%s, %dd' % (HISTORY_DIR, HISTORY_DAYS) if HISTORY_DIR else 'off'}, "
+        f"quota={'%gMB' % DISK_QUOTA_MB if DISK_QUOTA_MB > 0 else 'off'})"
+    )
+    while True:
+        try:
+            stats = run_retention()
+            if stats["rows_removed"] or stats["history_dropped"]:
+                logging.info(f"Retention pass: {stats}")
+        except Exception as exc:
+            logging.error(f"Retention agent error: {exc}")
+        time.sleep(interval)
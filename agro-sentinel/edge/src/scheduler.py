@@ -0,0 +1,102 @@
+import random
+import threading
+import time
+import logging
+from collections import namedtuple
+
+# Outcome of one drain pass, as returned by sync.sync_to_cloud:
+#   synced    rows acked and marked synced
+#   failed    sensors whose publishes failed this pass
+#   exhausted True if the pass reached the end of the backlog
+SyncResult = namedtuple("SyncResult", "synced failed exhausted")
+
+IDLE_INTERVAL_S = 30.0     # nothing to send: wait this long (or for a wake-up)
+MIN_BACKOFF_S   = 2.0
+MAX_BACKOFF_S   = 300.0
+
+# Set by the capture side when it buffers data that must not wait for the next
+# idle tick (a threshold breach). Module-level so capture.py can signal without
+# importing sync.py and, with it, the Pub/Sub client.
+_wake = threading.Event()
+
+
+def request_sync():
+    """Wake the sync agent now, even if it is idling or backing off."""
+    _wake.set()
+
+
+class Connectivity:
+    """
+    Link state learned from publish outcomes, not from probes.
+
+    Every drain pass is already a round trip to Pub/Sub, so its result is a
+    better signal than a TCP connect to 8.8.8.8 — and it costs no extra radio
+    wake-up.
+    """
+
+    def __init__(self):
+        self.online: bool | None = None      # None until the first publish attempt
+        self.failures = 0                    # consecutive failed passes
+        self.since = time.monotonic()
+
+    def record(self, result: SyncResult):
+        if result.synced:
+            self._set(True)
+            self.failures = 0
+        elif result.failed:
+            self._set(False)
+            self.failures += 1
+
+    def _set(self, online: bool):
+        if online != self.online:
+            if self.online is not None:
+                logging.info(f"Link {'restored' if online else 'lost'} "
+                             f"after {time.monotonic() - self.since:.0f}s")
+            self.online, self.since = online, time.monotonic()
+
+
+class SyncScheduler:
+    """
+    Decides when the next drain pass runs:
+
+      · backlog left after a successful pass  → immediately
+      · publishes failing                     → exponential backoff, full jitter
+      · nothing to send                       → IDLE_INTERVAL_S
+      · request_sync() at any point           → immediately
+    """
+
+    def __init__(self, drain, idle_s: float = IDLE_INTERVAL_S,
+                 min_backoff_s: float = MIN_BACKOFF_S, max_backoff_s: float = MAX_BACKOFF_S,
+                 rng: random.Random | None = None):
+        self.drain         = drain
+        self.idle_s        = idle_s
+        self.min_backoff_s = min_backoff_s
+        self.max_backoff_s = max_backoff_s
+        self.link          = Connectivity()
+        self._rng          = rng or random.Random()
+
+    def next_delay(self, result: SyncResult) -> float:
+        self.link.record(result)
+        if result.synced and not result.exhausted:
+            return 0.0
+        if self.link.online is False:
+            ceiling = min(self.max_backoff_s, self.min_backoff_s * 2 ** (self.link.failures - 1))
+            # Full jitter: a fleet that lost the same cell tower must not come
+            # back in lock-step.
+            return self._rng.uniform(self.min_backoff_s, ceiling)
+        return self.idle_s
+
+    def run_once(self) -> float:
+        _wake.clear()
+        try:
+            result = self.drain()
+        except Exception as exc:
+            logging.error(f"Sync agent error: {exc}")
+            result = SyncResult(0, {"*"}, False)
+        return self.next_delay(result)
+
+    def run(self):
+        while True:
+            delay = self.run_once()
+            if delay > 0 and _wake.wait(delay):
+                logging.info("Woken by capture — syncing now")
@@ -4,10 +4,16 @@ import os
 import hmac
 import hashlib
 import logging
+from collections import deque
 from datetime import datetime, timezone
 
-from google.cloud import pubsub_v1  # type: ignore[import]
-from .database import get_unsynced, mark_synced
+if os.environ.get('USE_MOCK_PUBSUB') == 'true':
+    from . import mock_pubsub as pubsub_v1
+else:
+    from google.cloud import pubsub_v1  # type: ignore[import]
+from . import envelope
+from .database import FIELD_NAMES, get_unsynced, mark_synced
+from .scheduler import SyncResult, SyncScheduler
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s [SYNC] %(message)s')
 
@@ -22,6 +28,26 @@ TOPIC_ID   = os.environ.get('PUBSUB_TOPIC_ID', 'sensors')
 # If unset, messages are published unsigned (development only — log a warning).
 HMAC_SECRET = os.environ.get('HMAC_SECRET', '')
 
+# ── Publish pipeline ──────────────────────────────────────────────────────────
+# Up to PUBLISH_WINDOW messages are in flight at once; the client library packs
+# them into batched RPCs per BatchSettings. Over a 300 ms cellular round trip a
+# window of 1 (the old future.result() per message) caps a gateway at ~3 msg/s.
+PUBLISH_WINDOW   = int(os.environ.get('EDGE_PUBLISH_WINDOW', '500'))
+# A publish not acked within this long counts as failed. The client's own retry
+# deadline is minutes; the drain pass must not hang on a dead link that long.
+PUBLISH_TIMEOUT_S = float(os.environ.get('EDGE_PUBLISH_TIMEOUT_S', '30'))
+FETCH_BATCH      = 500                 # rows read from SQLite per page
+MARK_EVERY       = 200                 # acked rows per mark_synced write
+CYCLE_BUDGET_S   = 20.0                # max time one sync_to_cloud call may drain
+BATCH_SETTINGS   = dict(max_messages=100, max_bytes=1_000_000, max_latency=0.05)
+
+# Readings per Pub/Sub message (see envelope.py). One signature, one message and
+# one function invocation per envelope instead of per reading. Set to 1 to keep
+# publishing the legacy single-reading JSON to a Cloud Function that predates
+# envelope support.
+ENVELOPE_SIZE     = int(os.environ.get('EDGE_ENVELOPE_SIZE', '100'))
+ENVELOPE_COMPRESS = os.environ.get('EDGE_ENVELOPE_COMPRESS', 'true').lower() == 'true'
+
 # VULN-17 note: the service account used by this process should be a dedicated
 # least-privilege SA with only roles/pubsub.publisher on the 'sensors' topic.
 # Create it in Terraform:
@@ -35,17 +61,6 @@ HMAC_SECRET = os.environ.get('HMAC_SECRET', '')
 # and set GOOGLE_APPLICATION_CREDENTIALS=/etc/agro-sentinel/credentials.json.
 
 
-def is_online() -> bool:
-    """TCP connectivity check to Google DNS."""
-    import socket
-    try:
-        socket.setdefaulttimeout(2)
-        socket.socket(socket.AF_INET, socket.SOCK_STREAM).connect(('8.8.8.8', 53))
-        return True
-    except OSError:
-        return False
-
-
 def _sign_payload(payload_bytes: bytes) -> str | None:
     """Return HMAC-SHA256 hex digest, or None if HMAC_SECRET is not configured."""
     if not HMAC_SECRET:
@@ -55,69 +70,171 @@ def _sign_payload(payload_bytes: bytes) -> str | None:
 
 
 def _build_pubsub_payload(record: dict) -> dict:
-    """Map SQLite row fields to the Cloud Function's expected schema."""
-    return {
-        "sensor_id":     record.get("sensor_id"),
-        "timestamp":     record.get("timestamp") or datetime.now(timezone.utc).isoformat(),
-        "temperature_c": record.get("temperature_c") or record.get("temperature"),
-        "humidity_rh":   record.get("humidity_rh")   or record.get("humidity"),
-        "co2_ppm":       record.get("co2_ppm")        or record.get("co2"),
-        "soil_moisture": record.get("soil_moisture"),
-        "par_umol":      record.get("par_umol")       or record.get("par"),
-        "soil_ec":       record.get("soil_ec"),
-        "soil_temp_c":   record.get("soil_temp_c")    or record.get("soil_temp"),
-        "battery_level": record.get("battery_level")  or record.get("battery"),
-        "rssi_dbm":      record.get("rssi_dbm")       or record.get("rssi"),
+    """
+    Map a buffered row to the Cloud Function's expected schema.
+
+    Rows already carry the cloud field names (aliases are resolved when the
+    reading is buffered), so this is a projection, not a remap. The edge
+    reduction tag (reduction.py) rides along when present, and so do the
+    sequence number and epoch the cloud de-duplicates on.
+
+    A reduced record leaves out the fields that held still, which the cloud
+    carries forward; a null it sent (tagged "missing") stays an explicit null.
+    """
+    payload = {
+        "sensor_id": record.get("sensor_id"),
+        "timestamp": record.get("timestamp") or datetime.now(timezone.utc).isoformat(),
     }
-
-
-def sync_to_cloud(publisher: pubsub_v1.PublisherClient, topic_path: str):
-    """Push unsynced records to Cloud Pub/Sub, then mark them as synced."""
-    if not is_online():
-        logging.info("Offline — skipping sync.")
-        return
-
-    batch = get_unsynced(limit=50)
-    if not batch:
-        return
-
-    logging.info(f"Syncing {len(batch)} records…")
-    synced_ids = []
-
+    tags = record.get("reduction")
+    for name in FIELD_NAMES:
+        value = record.get(name)
+        if value is not None or not isinstance(tags, dict) or tags.get(name) == "missing":
+            payload[name] = value
+    if tags:
+        payload["reduction"] = tags
+    if record.get("seq") is not None:
+        payload["seq"]       = record["seq"]
+        payload["seq_epoch"] = record.get("seq_epoch")
+    return payload
+
+
+def _encode_message(records: list[dict]) -> bytes:
+    payloads = [_build_pubsub_payload(r) for r in records]
+    if len(payloads) == 1 and ENVELOPE_SIZE <= 1:
+        return json.dumps(payloads[0]).encode('utf-8')
+    return envelope.pack(payloads, compress=ENVELOPE_COMPRESS)
+
+
+def _group_by_sensor(batch: list[dict], size: int) -> list[tuple[str, list[dict]]]:
+    """Split a page into per-sensor runs of at most `size` rows, keeping row order."""
+    runs: dict[str, list[list[dict]]] = {}
     for record in batch:
-        try:
-            payload      = _build_pubsub_payload(record)
-            data_bytes   = json.dumps(payload).encode('utf-8')
-            signature    = _sign_payload(data_bytes)
+        chunks = runs.setdefault(record["sensor_id"], [[]])
+        if len(chunks[-1]) >= size:
+            chunks.append([])
+        chunks[-1].append(record)
+    return [(sensor_id, chunk) for sensor_id, chunks in runs.items() for chunk in chunks]
+
+
+def make_publisher(**kwargs) -> "pubsub_v1.PublisherClient":
+    """
+    Publisher with batching and per-sensor message ordering enabled.
+
+    Ordering keys are the sensor_id, so Pub/Sub delivers each sensor's readings
+    in buffer order however many messages are in flight.
+    """
+    return pubsub_v1.PublisherClient(
+        batch_settings=pubsub_v1.types.BatchSettings(**BATCH_SETTINGS),
+        publisher_options=pubsub_v1.types.PublisherOptions(enable_message_ordering=True),
+        **kwargs,
+    )
 
-            # Include HMAC signature as a Pub/Sub message attribute (VULN-07)
-            attributes = {'x_signature': signature} if signature else {}
 
-            future = publisher.publish(topic_path, data_bytes, **attributes)
-            future.result()   # blocks until ACK or raises
-            synced_ids.append(record["_row_id"])
+def sync_to_cloud(publisher: pubsub_v1.PublisherClient, topic_path: str,
+                  window: int = PUBLISH_WINDOW, budget_s: float = CYCLE_BUDGET_S,
+                  probe: bool = False) -> SyncResult:
+    """
+    Drain the unsynced backlog into Pub/Sub, keeping up to `window` messages in
+    flight, for at most `budget_s` seconds. Each message is an envelope of up to
+    ENVELOPE_SIZE readings from one sensor. Rows are marked synced as their acks
+    arrive.
+
+    A failed publish stops that sensor (its ordering key is paused, and anything
+    later would overtake the failed rows on retry); other sensors keep draining.
+
+    The window only stays open while acks come back. With `probe` (link last
+    seen down, or never tried) the pass starts with a single message, and any
+    failed or timed-out publish shrinks it back to one, so a dead link costs one
+    attempt per sensor instead of a full window of envelopes. The next ack
+    reopens it.
+    """
+    deadline   = time.monotonic() + budget_s
+    in_flight: deque = deque()          # (row_ids, sensor_id, future), publish order
+    acked: list[int] = []
+    failed: set[str] = set()
+    synced, after_id = 0, 0
+    limit = 1 if probe else window
+
+    def reap_oldest():
+        nonlocal synced, limit
+        row_ids, sensor_id, future = in_flight.popleft()
+        try:
+            future.result(timeout=PUBLISH_TIMEOUT_S)   # blocks until ACK or raises
+            acked.extend(row_ids)
+            limit = window
         except Exception as exc:
-            logging.error(f"Failed to publish row {record.get('_row_id')}: {exc}")
-            break             # stop batch on first error
-
-    if synced_ids:
-        mark_synced(synced_ids)
-        logging.info(f"Synced {len(synced_ids)} records.")
+            limit = 1
+            if sensor_id not in failed:
+                logging.error(f"Failed to publish rows {row_ids[0]}..{row_ids[-1]} ({sensor_id}): "
+                              f"{exc or type(exc).__name__}")
+                failed.add(sensor_id)
+        if len(acked) >= MARK_EVERY:
+            mark_synced(acked)
+            synced += len(acked)
+            acked.clear()
+
+    exhausted = False
+    while time.monotonic() < deadline:
+        batch = get_unsynced(limit=FETCH_BATCH, after_id=after_id)
+        if not batch:
+            exhausted = True
+            break
+        after_id = batch[-1]["_row_id"]
+        for sensor_id, records in _group_by_sensor(batch, max(ENVELOPE_SIZE, 1)):
+            # Settle whatever has completed first, so a failure closes the window
+            # before more envelopes are queued behind it
+            while in_flight and in_flight[0][2].done():
+                reap_oldest()
+            if sensor_id in failed:
+                continue
+            while len(in_flight) >= limit:
+                reap_oldest()
+            if sensor_id in failed:
+                continue
+            row_ids = [r["_row_id"] for r in records]
+            try:
+                data_bytes = _encode_message(records)
+                signature  = _sign_payload(data_bytes)
+
+                # Include HMAC signature as a Pub/Sub message attribute (VULN-07);
+                # sensor_id tells the cloud which device key to check it with
+                attributes = {'x_signature': signature, 'sensor_id': sensor_id} if signature else {}
+
+                future = publisher.publish(topic_path, data_bytes,
+                                           ordering_key=sensor_id, **attributes)
+            except Exception as exc:
+                logging.error(f"Failed to publish rows {row_ids[0]}..{row_ids[-1]} ({sensor_id}): {exc}")
+                failed.add(sensor_id)
+                continue
+            in_flight.append((row_ids, sensor_id, future))
+
+    while in_flight:
+        reap_oldest()
+    if acked:
+        mark_synced(acked)
+        synced += len(acked)
+
+    for sensor_id in failed:
+        publisher.resume_publish(topic_path, sensor_id)
+    if synced:
+        logging.info(f"Synced {synced} records.")
+    return SyncResult(synced, failed, exhausted)
 
 
 def start_sync_agent(interval: int = 30):
-    """Background loop: sync every `interval` seconds."""
+    """
+    Background loop. Drains continuously while there is backlog, backs off with
+    jitter while publishes fail, and otherwise waits `interval` seconds or until
+    the capture side calls scheduler.request_sync().
+    """
     logging.info(
         f"Starting Cloud Sync Agent "
-        f"(project={PROJECT_ID} topic={TOPIC_ID} interval={interval}s "
+        f"(project={PROJECT_ID} topic={TOPIC_ID} idle={interval}s window={PUBLISH_WINDOW} "
         f"hmac={'enabled' if HMAC_SECRET else 'DISABLED — set HMAC_SECRET for production'})"
     )
-    publisher  = pubsub_v1.PublisherClient()
+    publisher  = make_publisher()
     topic_path = publisher.topic_path(PROJECT_ID, TOPIC_ID)
-
-    while True:
-        try:
-            sync_to_cloud(publisher, topic_path)
-        except Exception as exc:
-            logging.error(f"Sync agent error: {exc}")
-        time.sleep(interval)
+    scheduler  = SyncScheduler(None, idle_s=interval)
+    scheduler.drain = lambda: sync_to_cloud(publisher, topic_path,
+                                            probe=scheduler.link.online is not True)
+    scheduler.run()
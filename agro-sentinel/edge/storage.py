@@ -1,72 +1,154 @@
 import sqlite3
 import json
 import logging
-from datetime import datetime
+import time
 import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from itertools import islice
 
 DB_PATH = "buffer.sqlite"
 
+# Durability window: a reading can sit in memory for at most FLUSH_ROWS adds or
+# FLUSH_INTERVAL_MS, whichever comes first. That is what a crash can lose; set
+# flush_rows=1 for write-through at the cost of one commit per add.
+FLUSH_ROWS        = 100
+FLUSH_INTERVAL_MS = 500
+CAPACITY          = 10_000     # rows held in memory before add() flushes inline
+
+
 class LocalBuffer:
-    def __init__(self, db_path=DB_PATH):
+    """
+    Offline buffer: a bounded in-memory ring in front of SQLite.
+
+    add() only appends to the ring (microseconds); a background thread writes
+    the ring to SQLite in batches. Ids are assigned in memory, so get_batch()
+    and remove_batch() see one ordered sequence whether a row has been flushed
+    yet or not.
+
+    Locks: `_lock` guards the ring and counters and is held only for O(1) work;
+    `_db_lock` serialises everything that touches SQLite. When both are needed,
+    `_db_lock` is taken first.
+    """
+
+    def __init__(self, db_path=DB_PATH, flush_rows: int = FLUSH_ROWS,
+                 flush_interval_ms: int = FLUSH_INTERVAL_MS, capacity: int = CAPACITY):
         self.db_path = db_path
-        self.lock = threading.Lock()
+        self.flush_rows = max(1, flush_rows)
+        self.flush_interval = flush_interval_ms / 1000
+        self.capacity = max(self.flush_rows, capacity)
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._pending: OrderedDict[int, tuple] = OrderedDict()   # id -> (payload, json, created_at)
+        self._closed = False
         self._init_db()
+        self._flusher = threading.Thread(target=self._flush_loop, name="buffer-flush", daemon=True)
+        self._flusher.start()
 
     def _init_db(self):
-        with self.lock:
-            conn = sqlite3.connect(self.db_path)
-            c = conn.cursor()
-            c.execute('''CREATE TABLE IF NOT EXISTS sensor_data
-                         (id INTEGER PRIMARY KEY AUTOINCREMENT, 
-                          payload TEXT, 
-                          created_at TIMESTAMP)''')
-            conn.commit()
-            conn.close()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        c = self._conn.cursor()
+        c.execute('''CREATE TABLE IF NOT EXISTS sensor_data
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      payload TEXT,
+                      created_at TIMESTAMP)''')
+        self._conn.commit()
+        last_id, rows = c.execute("SELECT MAX(id), COUNT(*) FROM sensor_data").fetchone()
+        self._next_id = (last_id or 0) + 1
+        self._count = rows
 
     def add(self, payload):
-        """Store a JSON payload in the buffer."""
+        """Store a JSON payload in the buffer. Returns its id, or None if it is not JSON."""
+        # Serialised here, not in flush(): one bad payload must not fail the
+        # whole batch and keep every later row in memory.
         try:
-            with self.lock:
-                conn = sqlite3.connect(self.db_path)
-                c = conn.cursor()
-                c.execute("INSERT INTO sensor_data (payload, created_at) VALUES (?, ?)",
-                          (json.dumps(payload), datetime.utcnow()))
-                conn.commit()
-                conn.close()
-                logging.info(f"💾 Buffered data locally. Rows: {self.count()}")
-        except Exception as e:
+            text = json.dumps(payload)
+        except (TypeError, ValueError) as e:
             logging.error(f"Failed to buffer data: {e}")
+            return None
+        with self._lock:
+            row_id = self._next_id
+            self._next_id += 1
+            self._pending[row_id] = (payload, text, time.time())
+            self._count += 1
+            backlog = len(self._pending)
+            if backlog >= self.flush_rows:
+                self._wakeup.notify()
+        if backlog >= self.capacity:
+            # Ring full: the producer pays for one flush rather than losing data
+            self.flush()
+        return row_id
+
+    def flush(self):
+        """Write every row currently in memory to SQLite (one transaction)."""
+        with self._db_lock:
+            with self._lock:
+                items = list(self._pending.items())
+            if not items:
+                return
+            try:
+                self._conn.executemany(
+                    "INSERT INTO sensor_data (id, payload, created_at) VALUES (?, ?, ?)",
+                    [(rid, text, datetime.fromtimestamp(ts, timezone.utc).isoformat())
+                     for rid, (_, text, ts) in items],
+                )
+                self._conn.commit()
+            except Exception as e:
+                self._conn.rollback()
+                logging.error(f"Failed to buffer data: {e}")
+                return
+            # Rows stay in the ring until committed, so a reader never sees a
+            # gap. remove_batch() cannot run meanwhile (it needs _db_lock).
+            with self._lock:
+                for rid, _ in items:
+                    self._pending.pop(rid, None)
+
+    def _flush_loop(self):
+        while True:
+            with self._lock:
+                if not self._closed and len(self._pending) < self.flush_rows:
+                    self._wakeup.wait(self.flush_interval)
+                if self._closed:
+                    return
+            self.flush()
 
     def get_batch(self, limit=50):
         """Retrieve oldest N records."""
-        with self.lock:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
-            c = conn.cursor()
-            c.execute("SELECT id, payload FROM sensor_data ORDER BY id ASC LIMIT ?", (limit,))
-            rows = c.fetchall()
-            conn.close()
-            return [{"id": row["id"], "payload": json.loads(row["payload"])} for row in rows]
+        with self._db_lock:
+            c = self._conn.execute(
+                "SELECT id, payload FROM sensor_data ORDER BY id ASC LIMIT ?", (limit,))
+            batch = [{"id": rid, "payload": json.loads(payload)} for rid, payload in c.fetchall()]
+            if len(batch) < limit:
+                with self._lock:
+                    batch += [{"id": rid, "payload": payload} for rid, (payload, _, _)
+                              in islice(self._pending.items(), limit - len(batch))]
+            return batch
 
     def remove_batch(self, ids):
         """Delete records by ID after successful transmission."""
         if not ids:
             return
-        with self.lock:
-            conn = sqlite3.connect(self.db_path)
-            c = conn.cursor()
-            # safe string formatting for ids
-            placeholders = ','.join('?' for _ in ids)
-            c.execute(f"DELETE FROM sensor_data WHERE id IN ({placeholders})", ids)
-            conn.commit()
-            conn.close()
-            logging.info(f"🗑️ Removed {len(ids)} sent records from buffer.")
+        with self._db_lock:
+            with self._lock:
+                in_memory = sum(self._pending.pop(rid, None) is not None for rid in ids)
+            c = self._conn.executemany("DELETE FROM sensor_data WHERE id = ?", [(rid,) for rid in ids])
+            self._conn.commit()
+            with self._lock:
+                self._count -= in_memory + c.rowcount
+        logging.info(f"🗑️ Removed {len(ids)} sent records from buffer.")
 
     def count(self):
-        with self.lock:
-            conn = sqlite3.connect(self.db_path)
-            c = conn.cursor()
-            c.execute("SELECT COUNT(*) FROM sensor_data")
-            count = c.fetchone()[0]
-            conn.close()
-            return count
+        with self._lock:
+            return self._count
+
+    def close(self):
+        """Flush what is in memory and stop the background writer."""
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify()
+        self._flusher.join()
+        self.flush()
+        self._conn.close()
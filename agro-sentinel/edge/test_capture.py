@@ -0,0 +1,87 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from src import capture, database, reduction, scheduler
+
+
+class TestCapturePipeline(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        database.init_db(str(Path(self.tmp.name) / "edge_buffer.db"))
+        self.drivers = [capture.SimulatedChannel(f"GH-CH-{i:03d}", "temperature_c", 15.0, 30.0)
+                        for i in range(300)]
+
+    def tearDown(self):
+        database.close_db()
+        self.tmp.cleanup()
+
+    def test_ticks_committed_in_one_transaction(self):
+        pipeline = capture.CapturePipeline(self.drivers)
+        for _ in range(3):
+            pipeline.capture_tick()
+        self.assertEqual(pipeline.store_pending(block=False), 900)
+
+        stats = pipeline.stats()
+        self.assertEqual(stats["commits"], 1)
+        self.assertEqual(stats["stored"], 900)
+        self.assertEqual(len(database.get_unsynced(limit=1000)), 900)
+        self.assertIsNotNone(database.get_unsynced(limit=1)[0]["temperature_c"])
+
+    def test_full_queue_sheds_oldest_tick(self):
+        stored = []
+        pipeline = capture.CapturePipeline(self.drivers[:2], queue_ticks=2, store=stored.extend)
+        for _ in range(5):
+            pipeline.capture_tick()
+        pipeline.store_pending(block=False)
+
+        stats = pipeline.stats()
+        self.assertEqual(stats["dropped"], 6)
+        self.assertEqual(stats["queue_high_water"], 2)
+        self.assertEqual(len(stored), 4)
+
+    def test_failed_read_does_not_stall_tick(self):
+        class Broken:
+            sensor_id = "GH-BAD-01"
+
+            def read(self):
+                raise OSError("bus timeout")
+
+        pipeline = capture.CapturePipeline([Broken(), self.drivers[0]])
+        pipeline.capture_tick()
+        self.assertEqual(pipeline.store_pending(block=False), 1)
+        self.assertEqual(pipeline.stats()["read_errors"], 1)
+
+    def test_breach_wakes_sync_after_commit(self):
+        class Fixed:
+            def __init__(self, value):
+                self.sensor_id, self.value = "GH-AMB-01", value
+
+            def read(self):
+                return self.sensor_id, {"temperature_c": self.value}
+
+        for reducer in (None, reduction.Reducer()):
+            woken = []
+            driver = Fixed(20.0)
+            pipeline = capture.CapturePipeline(
+                [driver], reducer=reducer,
+                store=lambda batch: woken.append(scheduler._wake.is_set()))
+            scheduler._wake.clear()
+            pipeline.capture_tick()
+            pipeline.store_pending(block=False)
+            self.assertFalse(scheduler._wake.is_set())
+
+            driver.value = 40.0
+            pipeline.capture_tick()
+            pipeline.store_pending(block=False)
+            self.assertEqual(woken, [False, False])      # not before the commit
+            self.assertTrue(scheduler._wake.is_set())
+
+            scheduler._wake.clear()
+            pipeline.capture_tick()                      # breach goes on: no new wake
+            pipeline.store_pending(block=False)
+            self.assertFalse(scheduler._wake.is_set())
+
+
+if __name__ == "__main__":
+    unittest.main()
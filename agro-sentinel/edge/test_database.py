@@ -0,0 +1,163 @@
+import json
+import sqlite3
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from src import database
+
+
+class TestBufferDatabase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = str(Path(self.tmp.name) / "edge_buffer.db")
+        database.init_db(self.path)
+
+    def tearDown(self):
+        database.close_db()
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        database.buffer_reading("GH-AMB-01", {"temperature_c": 21.5})
+        rows = database.get_unsynced()
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["sensor_id"], "GH-AMB-01")
+        self.assertEqual(rows[0]["temperature_c"], 21.5)
+
+        database.mark_synced([rows[0]["_row_id"]])
+        self.assertEqual(database.get_unsynced(), [])
+
+    def test_aliases_resolved_and_zero_kept(self):
+        database.buffer_reading("GH-AMB-01", {"temperature": 18.0, "battery": 0.0, "rssi": -71})
+        row = database.get_unsynced()[0]
+        self.assertEqual(row["temperature_c"], 18.0)
+        self.assertEqual(row["battery_level"], 0.0)
+        self.assertEqual(row["rssi_dbm"], -71)
+        self.assertIsNone(row["co2_ppm"])
+        self.assertNotIn("battery", row)
+
+    def test_unknown_keys_go_to_extra(self):
+        database.buffer_reading("GH-AMB-01", {"co2_ppm": 500, "leaf_wetness": 0.3, "co2_ppm_raw": "n/a"})
+        row = database.get_unsynced()[0]
+        self.assertEqual(row["co2_ppm"], 500.0)
+        self.assertEqual(row["leaf_wetness"], 0.3)
+        self.assertEqual(row["co2_ppm_raw"], "n/a")
+
+        extra = database._get_db().reader().execute("SELECT extra FROM readings").fetchone()[0]
+        self.assertEqual(json.loads(extra), {"leaf_wetness": 0.3, "co2_ppm_raw": "n/a"})
+
+    def test_wal_mode(self):
+        mode = database._get_db().reader().execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode, "wal")
+
+    def test_concurrent_writers_are_all_committed(self):
+        def producer(n):
+            for i in range(50):
+                database.buffer_reading(f"GH-T{n:02d}", {"i": i})
+
+        threads = [threading.Thread(target=producer, args=(n,)) for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(database.get_unsynced(limit=1000)), 400)
+
+    def test_failed_job_does_not_poison_its_group(self):
+        db = database._get_db()
+        bad  = db.write(lambda conn: conn.execute("INSERT INTO nope VALUES (1)"))
+        good = database.buffer_reading("GH-AMB-01", {"ok": True}, wait=False)
+        self.assertIsNotNone(good.result())
+        with self.assertRaises(Exception):
+            bad.result()
+        self.assertEqual(len(database.get_unsynced()), 1)
+
+    def test_sequence_numbers_per_sensor(self):
+        database.buffer_readings([("GH-AMB-01", {"x": 1}), ("GH-DUR-01", {"x": 1}),
+                                  ("GH-AMB-01", {"x": 2})])
+        database.buffer_reading("GH-AMB-01", {"x": 3})
+        rows = database.get_unsynced()
+        self.assertEqual([(r["sensor_id"], r["seq"]) for r in rows],
+                         [("GH-AMB-01", 1), ("GH-DUR-01", 1), ("GH-AMB-01", 2), ("GH-AMB-01", 3)])
+        self.assertEqual(len({r["seq_epoch"] for r in rows if r["sensor_id"] == "GH-AMB-01"}), 1)
+
+        # Numbering carries on across a restart, even once the rows are purged
+        database.mark_synced([r["_row_id"] for r in rows])
+        database._get_db().write(lambda conn: conn.execute("DELETE FROM readings")).result()
+        database.close_db()
+        database.init_db(self.path)
+        database.buffer_reading("GH-AMB-01", {"x": 4})
+        row = database.get_unsynced()[0]
+        self.assertEqual((row["seq"], row["seq_epoch"]), (4, rows[0]["seq_epoch"]))
+
+    def test_failed_group_gives_its_numbers_back(self):
+        db = database._get_db()
+        bad  = db.write(lambda conn: database._insert(conn, ("GH-AMB-01", None, *[None] * 10)))
+        good = database.buffer_reading("GH-AMB-01", {"x": 1}, wait=False)
+        good.result()
+        with self.assertRaises(sqlite3.IntegrityError):
+            bad.result()
+        self.assertEqual([r["seq"] for r in database.get_unsynced()], [1])
+
+    def test_sequence_numbers_without_returning(self):
+        # SQLite < 3.35 (Debian bullseye) has no RETURNING
+        database.buffer_reading("GH-AMB-01", {"x": 1})
+        with patch.object(database, "HAS_RETURNING", False):
+            database.buffer_readings([("GH-AMB-01", {"x": 2}), ("GH-DUR-01", {"x": 1})])
+            bad  = database._get_db().write(
+                lambda conn: database._insert(conn, ("GH-AMB-01", None, *[None] * 10)))
+            good = database.buffer_reading("GH-AMB-01", {"x": 3}, wait=False)
+            good.result()
+            with self.assertRaises(sqlite3.IntegrityError):
+                bad.result()
+        database.buffer_reading("GH-AMB-01", {"x": 4})
+        rows = database.get_unsynced()
+        self.assertEqual([(r["sensor_id"], r["seq"]) for r in rows],
+                         [("GH-AMB-01", 1), ("GH-AMB-01", 2), ("GH-DUR-01", 1),
+                          ("GH-AMB-01", 3), ("GH-AMB-01", 4)])
+        self.assertEqual(len({r["seq_epoch"] for r in rows if r["sensor_id"] == "GH-AMB-01"}), 1)
+
+    def test_reader_sees_committed_rows_from_other_thread(self):
+        t = threading.Thread(target=database.buffer_reading, args=("GH-AMB-01", {"x": 1}))
+        t.start()
+        t.join()
+        self.assertEqual(len(database.get_unsynced()), 1)
+
+
+class TestJsonMigration(unittest.TestCase):
+    def test_legacy_rows_are_migrated_in_place(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = str(Path(tmp) / "edge_buffer.db")
+            conn = sqlite3.connect(path)
+            conn.execute('''CREATE TABLE readings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, sensor_id TEXT NOT NULL,
+                payload TEXT NOT NULL, timestamp TEXT NOT NULL,
+                synced INTEGER NOT NULL DEFAULT 0)''')
+            conn.executemany(
+                "INSERT INTO readings (sensor_id, payload, timestamp, synced) VALUES (?, ?, ?, ?)",
+                [("GH-AMB-01", json.dumps({"temperature": 20.5, "humidity_rh": 80}), "t1", 1),
+                 ("GH-AMB-01", json.dumps({"temperature_c": 21.0, "timestamp": "t-own"}), "t2", 0),
+                 ("temp_01",   "27.35", "t3", 0)],
+            )
+            conn.commit()
+            conn.close()
+
+            database.init_db(path)
+            try:
+                rows = database.get_unsynced()
+                self.assertEqual([r["_row_id"] for r in rows], [2, 3])
+                self.assertEqual(rows[0]["temperature_c"], 21.0)
+                self.assertEqual(rows[0]["timestamp"], "t-own")
+                self.assertEqual(rows[1]["value"], 27.35)
+                self.assertEqual([r["seq"] for r in rows], [2, 3])
+                database.buffer_reading("GH-AMB-01", {"temperature_c": 22.0})
+                self.assertEqual(database.get_unsynced()[-1]["seq"], 3)
+                version = database._get_db().reader().execute("PRAGMA user_version").fetchone()[0]
+                self.assertEqual(version, database.SCHEMA_VERSION)
+            finally:
+                database.close_db()
+
+
+if __name__ == '__main__':
+    unittest.main()
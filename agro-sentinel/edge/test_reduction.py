@@ -0,0 +1,75 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from src import reduction, scheduler
+
+
+class TestReducer(unittest.TestCase):
+    def setUp(self):
+        scheduler._wake.clear()
+
+    def test_deadband_keeps_only_moves_and_heartbeats(self):
+        r = reduction.Reducer({"temperature_c": {"mode": "deadband", "band": 0.5}}, heartbeat_s=60)
+        kept = [r.offer("GH-AMB-01", {"temperature_c": v}, now=t)
+                for t, v in enumerate([20.0, 20.2, 20.4, 20.6, 20.7])]
+        self.assertEqual([k["temperature_c"] for k in kept if k], [20.0, 20.6])
+        self.assertEqual(kept[0]["reduction"], {"temperature_c": "deadband:0.5"})
+
+        self.assertIsNotNone(r.offer("GH-AMB-01", {"temperature_c": 20.7}, now=70))
+
+    def test_window_emits_aggregate_with_stats(self):
+        r = reduction.Reducer({"soil_ec": {"mode": "window", "seconds": 10, "stat": "mean"}})
+        for t, v in enumerate([1.0, 2.0, 3.0]):
+            self.assertIsNone(r.offer("GH-AMB-01", {"soil_ec": v}, now=t))
+        record = r.offer("GH-AMB-01", {"soil_ec": 9.0}, now=10)
+        self.assertEqual(record["soil_ec"], 2.0)
+        tag = record["reduction"]["soil_ec"]
+        self.assertEqual((tag["n"], tag["min"], tag["max"], tag["last"]), (3, 1.0, 3.0, 3.0))
+
+    def test_silent_sensor_window_is_flushed(self):
+        r = reduction.Reducer({"soil_ec": {"mode": "window", "seconds": 10, "stat": "last"}})
+        r.offer("GH-AMB-01", {"soil_ec": 1.5}, now=0)
+        self.assertEqual(r.flush(now=5), [])
+        [(sensor_id, record)] = r.flush(now=11)
+        self.assertEqual((sensor_id, record["soil_ec"]), ("GH-AMB-01", 1.5))
+
+    def test_breach_passes_through(self):
+        r = reduction.Reducer({"temperature_c": {"mode": "deadband", "band": 5.0}})
+        r.offer("GH-AMB-01", {"temperature_c": 36.0}, now=0)
+        record = r.offer("GH-AMB-01", {"temperature_c": 39.0}, now=1)
+        self.assertEqual(record["reduction"], {"temperature_c": "breach"})
+        # Woken by the capture pipeline once the record is stored, not before
+        self.assertFalse(scheduler._wake.is_set())
+
+    def test_null_sample_is_tagged_missing(self):
+        r = reduction.Reducer({"temperature_c": {"mode": "deadband", "band": 0.5}})
+        r.offer("GH-AMB-01", {"temperature_c": 20.0, "humidity_rh": 60.0}, now=0)
+        record = r.offer("GH-AMB-01", {"temperature_c": 20.1, "humidity_rh": None, "co2_ppm": 500.0}, now=1)
+        self.assertNotIn("temperature_c", record)
+        self.assertIsNone(record["humidity_rh"])
+        self.assertEqual(record["reduction"], {"humidity_rh": "missing"})
+
+    def test_per_sensor_override(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "reduction.json"
+            path.write_text(json.dumps({"sensors": {"GH-TEN-01": {"temperature_c": {"mode": "raw"}}}}))
+            r = reduction.Reducer(*reduction.load_policies(str(path)))
+        self.assertEqual(r.policy("GH-TEN-01", "temperature_c"), {"mode": "raw"})
+        self.assertEqual(r.policy("GH-AMB-01", "temperature_c")["mode"], "deadband")
+
+        r.offer("GH-TEN-01", {"temperature_c": 20.0}, now=0)
+        record = r.offer("GH-TEN-01", {"temperature_c": 20.0}, now=1)
+        self.assertNotIn("reduction", record)
+
+    def test_invalid_policy_rejected(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "reduction.json"
+            path.write_text(json.dumps({"default": {"soil_ec": {"mode": "window", "stat": "median"}}}))
+            with self.assertRaises(ValueError):
+                reduction.load_policies(str(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
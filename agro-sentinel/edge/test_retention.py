@@ -0,0 +1,127 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from src import database, retention
+
+
+def _iso(days_ago: float) -> str:
+    return (datetime.now(timezone.utc) - timedelta(days=days_ago)).isoformat()
+
+
+class TestRetention(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = str(Path(self.tmp.name) / "edge_buffer.db")
+        self.history = str(Path(self.tmp.name) / "history")
+        database.init_db(self.path)
+
+    def tearDown(self):
+        database.close_db()
+        self.tmp.cleanup()
+
+    def _add(self, days_ago: float, synced: bool) -> int:
+        rid = database.buffer_reading("GH-AMB-01", {"temperature_c": 20.0, "timestamp": _iso(days_ago)})
+        if synced:
+            database.mark_synced([rid])
+        return rid
+
+    def test_purge_only_removes_old_synced_rows(self):
+        old_synced   = [self._add(3, True) for _ in range(5)]
+        old_unsynced = self._add(3, False)
+        new_synced   = self._add(0, True)
+
+        removed = retention.purge_synced(older_than=timedelta(days=1), history_dir="", chunk_rows=2)
+        self.assertEqual(removed, len(old_synced))
+        ids = {r[0] for r in database._get_db().reader().execute("SELECT id FROM readings")}
+        self.assertEqual(ids, {old_unsynced, new_synced})
+
+    def test_archive_partitions_by_day_and_drops_in_o1(self):
+        for days_ago in (5, 5, 4):
+            self._add(days_ago, True)
+
+        moved = retention.purge_synced(older_than=timedelta(days=1), history_dir=self.history)
+        self.assertEqual(moved, 3)
+        files = retention.history_files(self.history)
+        self.assertEqual(len(files), 2)
+        with sqlite3.connect(files[0]) as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM readings").fetchone()[0], 2)
+
+        self.assertEqual(retention.drop_history(keep_days=3, history_dir=self.history), 2)
+        self.assertEqual(retention.history_files(self.history), [])
+
+    def test_purge_picks_rows_by_timestamp_not_id(self):
+        new_synced = self._add(0, True)
+        backfill   = self._add(3, True)        # late arrival: high id, old timestamp
+        self.assertGreater(backfill, new_synced)
+
+        self.assertEqual(retention.purge_synced(older_than=timedelta(days=1), history_dir=""), 1)
+        ids = [r[0] for r in database._get_db().reader().execute("SELECT id FROM readings")]
+        self.assertEqual(ids, [new_synced])
+
+    def test_undated_rows_are_archived_and_expire(self):
+        rid = database.buffer_reading("GH-AMB-01", {"temperature_c": 20.0, "timestamp": "unknown"})
+        database.mark_synced([rid])
+        self._add(-30, True)                   # gateway clock far ahead
+
+        self.assertEqual(retention.purge_synced(older_than=timedelta(days=1), history_dir=self.history), 2)
+        today = _iso(0)[:10]
+        self.assertEqual([f.name for f in retention.history_files(self.history)],
+                         [f"readings-undated-{today}.db"])
+        self.assertEqual(retention.drop_history(keep_days=0, history_dir=self.history), 0)
+
+        # A legacy readings-undated.db has no day in its name; its age decides
+        legacy = retention._history_path(self.history, "undated")
+        legacy.touch()
+        old = (datetime.now(timezone.utc) - timedelta(days=10)).timestamp()
+        os.utime(legacy, (old, old))
+        self.assertEqual(retention.history_files(self.history)[0], legacy)
+        self.assertEqual(retention.drop_history(keep_days=3, history_dir=self.history), 1)
+        self.assertEqual(len(retention.history_files(self.history)), 1)
+
+    def test_archive_into_day_file_without_seq_column(self):
+        self._add(5, True)
+        day = _iso(5)[:10]
+        Path(self.history).mkdir()
+        with sqlite3.connect(retention._history_path(self.history, day)) as conn:
+            conn.execute(database._CREATE_READINGS_SQL.format(table="readings").replace(",\n        seq        INTEGER", ""))
+
+        self.assertEqual(retention.purge_synced(older_than=timedelta(days=1), history_dir=self.history), 1)
+        with sqlite3.connect(retention._history_path(self.history, day)) as conn:
+            self.assertEqual(conn.execute("SELECT seq FROM readings").fetchall(), [(1,)])
+
+    def test_unsynced_index_is_partial(self):
+        sql = database._get_db().reader().execute(
+            "SELECT sql FROM sqlite_master WHERE name = 'idx_unsynced'").fetchone()[0]
+        self.assertIn("WHERE synced = 0", sql)
+
+    def test_expired_scan_uses_timestamp_index(self):
+        plan = database._get_db().reader().execute(
+            f"EXPLAIN QUERY PLAN SELECT id FROM readings WHERE {retention._EXPIRED_WHERE}",
+            {"cutoff": _iso(1), "future": _iso(-1)}).fetchall()
+        self.assertTrue(any("idx_synced_ts" in row[-1] for row in plan), plan)
+
+    def test_quota_keeps_unsynced_unless_allowed(self):
+        for _ in range(200):
+            self._add(0, False)
+        retention.reclaim()
+        self.assertGreater(retention.enforce_quota(1, history_dir=""), 1)
+        self.assertEqual(len(database.get_unsynced(limit=1000)), 200)
+
+        retention.enforce_quota(1, history_dir="", drop_unsynced=True)
+        self.assertEqual(database.get_unsynced(limit=1000), [])
+
+    def test_reclaim_frees_pages(self):
+        for _ in range(2000):
+            self._add(3, True)
+        retention.purge_synced(older_than=timedelta(days=1), history_dir="")
+        self.assertGreater(retention.reclaim(), 0)
+        free = database._get_db().reader().execute("PRAGMA freelist_count").fetchone()[0]
+        self.assertEqual(free, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,12 @@
 import unittest
-from simulator import GreenhouseSimulator
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from simulator import (FAULT_DROPOUT, FAULT_OUT_OF_RANGE, FAULT_STUCK, FaultSpec,
+                       FleetGenerator, GreenhouseSimulator, fleet_ids)
+
+START = datetime(2026, 3, 1, tzinfo=timezone.utc)
 
 class TestGreenhouseSimulator(unittest.TestCase):
     def setUp(self):
@@ -23,5 +30,55 @@ class TestGreenhouseSimulator(unittest.TestCase):
             self.assertTrue(0 <= data["battery_level"] <= 100, "Battery out of range")
             self.assertIsInstance(data["temperature_c"], float)
 
+    def test_seed_and_clock_make_it_reproducible(self):
+        noon = START.replace(hour=12)
+        a = GreenhouseSimulator("GH-AMB-01", seed=7, clock=lambda: noon)
+        b = GreenhouseSimulator("GH-AMB-01", seed=7, clock=lambda: noon)
+        self.assertEqual([a.get_data() for _ in range(5)], [b.get_data() for _ in range(5)])
+        self.assertEqual(a.get_data()["timestamp"], "2026-03-01T12:00:00Z")
+        self.assertGreater(a.get_data()["par_umol"], 1500)
+        self.assertEqual(a.get_data(at=START)["par_umol"], 0)
+
+
+class TestFleetGenerator(unittest.TestCase):
+    def test_shape_order_and_determinism(self):
+        gen = FleetGenerator(300, seed=1)
+        batches = list(gen.batches(START, START + timedelta(hours=1), step_s=60, chunk_steps=25))
+        self.assertEqual([len(b) for b in batches], [7500, 7500, 3000])
+        first = batches[0]
+        self.assertEqual(first.sensor_ids[300], first.sensor_ids[0])
+        self.assertEqual(first.timestamps[300] - first.timestamps[0], np.timedelta64(60, 's'))
+
+        again = next(FleetGenerator(300, seed=1).batches(START, START + timedelta(hours=1),
+                                                         step_s=60, chunk_steps=25))
+        np.testing.assert_array_equal(again.fields["temperature_c"], first.fields["temperature_c"])
+
+    def test_diurnal_model_matches_single_simulator(self):
+        batch = next(FleetGenerator(50, seed=2).batches(START, START + timedelta(days=1), step_s=3600))
+        par = batch.fields["par_umol"].reshape(24, 50)
+        self.assertTrue((par[:6] == 0).all())
+        self.assertGreater(par[12].mean(), 1800)
+        co2 = batch.fields["co2_ppm"].reshape(24, 50)
+        self.assertLess(co2[12].mean(), co2[0].mean())
+
+    def test_fault_injection(self):
+        faults = FaultSpec(dropout=0.05, stuck=0.2, out_of_range=0.01)
+        batch = next(FleetGenerator(500, seed=3, faults=faults)
+                     .batches(START, START + timedelta(hours=2), step_s=60))
+        temp, codes = batch.fields["temperature_c"], batch.faults["temperature_c"]
+        self.assertTrue(np.isnan(temp[codes == FAULT_DROPOUT]).all())
+        self.assertTrue((temp[codes == FAULT_OUT_OF_RANGE] == 150.0).all())
+        self.assertGreater((codes == FAULT_STUCK).sum(), 0)
+
+        records = batch.records()
+        self.assertEqual(len(records), len(batch))
+        self.assertTrue(any(r["temperature_c"] is None for r in records))
+
+    def test_ids_match_cloud_format(self):
+        ids = fleet_ids(2700)
+        self.assertEqual((ids[0], ids[99], ids[100], ids[2699]), ("GH-AAA-00", "GH-AAA-99", "GH-AAB-00", "GH-ABA-99"))
+        self.assertEqual(len(set(ids)), 2700)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,108 @@
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+from storage import LocalBuffer
+
+
+class TestLocalBuffer(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = str(Path(self.tmp.name) / "buffer.sqlite")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _on_disk(self):
+        with sqlite3.connect(self.path) as conn:
+            return conn.execute("SELECT COUNT(*) FROM sensor_data").fetchone()[0]
+
+    def test_batch_spans_memory_and_disk_in_order(self):
+        buf = LocalBuffer(self.path, flush_rows=1000, flush_interval_ms=60_000)
+        try:
+            for i in range(5):
+                buf.add({"i": i})
+            buf.flush()
+            for i in range(5, 8):
+                buf.add({"i": i})
+            batch = buf.get_batch(limit=6)
+            self.assertEqual([b["payload"]["i"] for b in batch], [0, 1, 2, 3, 4, 5])
+            self.assertEqual(buf.count(), 8)
+
+            buf.remove_batch([b["id"] for b in batch])
+            self.assertEqual(buf.count(), 2)
+            self.assertEqual([b["payload"]["i"] for b in buf.get_batch()], [6, 7])
+        finally:
+            buf.close()
+        self.assertEqual(self._on_disk(), 2)
+
+    def test_unserializable_payload_is_dropped_alone(self):
+        buf = LocalBuffer(self.path, flush_rows=1000, flush_interval_ms=60_000, capacity=1000)
+        try:
+            with self.assertLogs(level="ERROR"):
+                self.assertIsNone(buf.add({"t": datetime.now()}))
+            ids = [buf.add({"i": i}) for i in range(3)]
+            buf.flush()
+            self.assertEqual(self._on_disk(), 3)
+            self.assertEqual(buf.count(), 3)
+            self.assertEqual([b["id"] for b in buf.get_batch()], ids)
+        finally:
+            buf.close()
+
+    def test_background_flush_by_row_count(self):
+        buf = LocalBuffer(self.path, flush_rows=10, flush_interval_ms=60_000)
+        try:
+            for i in range(10):
+                buf.add({"i": i})
+            deadline = time.monotonic() + 2
+            while self._on_disk() < 10 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(self._on_disk(), 10)
+        finally:
+            buf.close()
+
+    def test_background_flush_by_interval(self):
+        buf = LocalBuffer(self.path, flush_rows=1000, flush_interval_ms=20)
+        try:
+            buf.add({"i": 0})
+            time.sleep(0.2)
+            self.assertEqual(self._on_disk(), 1)
+        finally:
+            buf.close()
+
+    def test_ids_and_count_survive_restart(self):
+        buf = LocalBuffer(self.path)
+        first = buf.add({"i": 0})
+        buf.close()
+        buf = LocalBuffer(self.path)
+        try:
+            self.assertEqual(buf.count(), 1)
+            self.assertGreater(buf.add({"i": 1}), first)
+        finally:
+            buf.close()
+
+    def test_concurrent_add_and_drain(self):
+        buf = LocalBuffer(self.path, flush_rows=7, flush_interval_ms=5, capacity=50)
+        seen = []
+
+        def producer():
+            for i in range(500):
+                buf.add({"i": i})
+
+        t = threading.Thread(target=producer)
+        t.start()
+        while t.is_alive() or buf.count():
+            batch = buf.get_batch(limit=20)
+            seen += [b["payload"]["i"] for b in batch]
+            buf.remove_batch([b["id"] for b in batch])
+        t.join()
+        buf.close()
+        self.assertEqual(seen, list(range(500)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,219 @@
+import json
+import os
+import tempfile
+import unittest
+from concurrent.futures import Future
+from pathlib import Path
+import random
+import time
+from unittest.mock import patch
+
+# sync.py reads its config at import time (VULN-02: no default project)
+os.environ.setdefault('GCP_PROJECT_ID', 'test-project')
+os.environ['USE_MOCK_PUBSUB'] = 'true'
+
+from src import database, envelope, scheduler, sync
+from src.scheduler import SyncResult, SyncScheduler
+
+TOPIC = "projects/test-project/topics/sensors"
+
+
+def _readings(data: bytes) -> list[dict]:
+    return envelope.unpack(data) if envelope.is_envelope(data) else [json.loads(data)]
+
+
+class TestPipelinedSync(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        database.init_db(str(Path(self.tmp.name) / "edge_buffer.db"))
+
+    def tearDown(self):
+        database.close_db()
+        self.tmp.cleanup()
+
+    def _fill(self, per_sensor: int, sensors=("GH-AMB-01", "GH-DUR-01")):
+        for i in range(per_sensor):
+            for sensor_id in sensors:
+                database.buffer_reading(sensor_id, {"temperature_c": float(i)}, wait=False)
+        database.buffer_reading(sensors[0], {"temperature_c": float(per_sensor)})
+
+    def test_drains_whole_backlog_in_one_cycle(self):
+        self._fill(300)
+        publisher = sync.make_publisher(latency_s=0.001)
+        result = sync.sync_to_cloud(publisher, TOPIC, window=64)
+        self.assertEqual(result, SyncResult(601, set(), True))
+        self.assertEqual(database.get_unsynced(), [])
+
+    def test_budget_leaves_backlog_unexhausted(self):
+        self._fill(10)
+        result = sync.sync_to_cloud(sync.make_publisher(), TOPIC, budget_s=0)
+        self.assertEqual(result, SyncResult(0, set(), False))
+
+    def test_order_preserved_per_sensor(self):
+        self._fill(50)
+        publisher = sync.make_publisher(latency_s=0.002, jitter_s=0.01, seed=1)
+        sync.sync_to_cloud(publisher, TOPIC, window=32)
+        temps = {}
+        for _, data, attrs in publisher.published:
+            temps.setdefault(attrs["ordering_key"], []).extend(
+                r["temperature_c"] for r in _readings(data))
+        for series in temps.values():
+            self.assertEqual(series, sorted(series))
+
+    @patch.object(sync, "ENVELOPE_SIZE", 4)
+    def test_failure_stops_only_that_sensor(self):
+        self._fill(20)
+        publisher = sync.make_publisher()
+        real_publish = publisher.publish
+
+        def flaky(topic, data, ordering_key="", **attrs):
+            temps = [r["temperature_c"] for r in _readings(data)]
+            if ordering_key == "GH-DUR-01" and 5.0 in temps:
+                publisher._paused.add(ordering_key)
+            return real_publish(topic, data, ordering_key=ordering_key, **attrs)
+
+        with patch.object(publisher, "publish", side_effect=flaky):
+            synced, failed, _ = sync.sync_to_cloud(publisher, TOPIC, window=8)
+
+        left = database.get_unsynced(limit=1000)
+        self.assertEqual({r["sensor_id"] for r in left}, {"GH-DUR-01"})
+        self.assertEqual(min(r["temperature_c"] for r in left), 4.0)   # whole envelope 4..7 kept
+        self.assertEqual(synced, 41 - len(left))
+        self.assertEqual(failed, {"GH-DUR-01"})
+        self.assertNotIn("GH-DUR-01", publisher._paused)   # resumed for the next cycle
+
+    def _attempts(self, publisher, **kwargs) -> tuple[SyncResult, list[str]]:
+        attempts, real_publish = [], publisher.publish
+
+        def counting(topic, data, ordering_key="", **attrs):
+            attempts.append(ordering_key)
+            return real_publish(topic, data, ordering_key=ordering_key, **attrs)
+
+        with patch.object(publisher, "publish", side_effect=counting):
+            return sync.sync_to_cloud(publisher, TOPIC, **kwargs), attempts
+
+    @patch.object(sync, "ENVELOPE_SIZE", 1)
+    def test_offline_probe_sends_one_message_per_sensor(self):
+        self._fill(300)
+        publisher = sync.make_publisher(latency_s=0.01, failure_rate=1.0)
+        result, attempts = self._attempts(publisher, probe=True)
+        self.assertEqual(result.synced, 0)
+        self.assertEqual(result.failed, {"GH-AMB-01", "GH-DUR-01"})
+        self.assertEqual(sorted(attempts), ["GH-AMB-01", "GH-DUR-01"])
+
+    @patch.object(sync, "ENVELOPE_SIZE", 1)
+    def test_failure_closes_the_window(self):
+        self._fill(300)
+        publisher = sync.make_publisher()
+
+        def refused(*args, **kwargs):
+            future = Future()
+            future.set_exception(ConnectionError("network unreachable"))
+            return future
+
+        with patch.object(sync.pubsub_v1.PublisherClient, "publish", side_effect=refused):
+            result, attempts = self._attempts(publisher)
+        # Not a window's worth of envelopes queued behind the first failure
+        self.assertEqual(result.synced, 0)
+        self.assertEqual(sorted(attempts), ["GH-AMB-01", "GH-DUR-01"])
+
+    def test_probe_reopens_the_window_on_ack(self):
+        self._fill(300)
+        result, _ = self._attempts(sync.make_publisher(latency_s=0.001), probe=True, window=64)
+        self.assertEqual(result, SyncResult(601, set(), True))
+
+    def test_envelopes_cut_message_count(self):
+        self._fill(250)
+        publisher = sync.make_publisher()
+        sync.sync_to_cloud(publisher, TOPIC)
+        # 501 rows over 2 sensors, <= 100 per envelope, pages of 500 rows
+        self.assertLessEqual(len(publisher.published), 8)
+        self.assertEqual(sum(len(_readings(d)) for _, d, _ in publisher.published), 501)
+
+    def test_reduced_record_leaves_out_fields_that_held(self):
+        database.buffer_reading("GH-AMB-01", {"temperature_c": 21.0, "humidity_rh": None,
+                                              "reduction": {"humidity_rh": "missing"}})
+        database.buffer_reading("GH-AMB-01", {"temperature_c": 21.5, "humidity_rh": None})
+        publisher = sync.make_publisher()
+        sync.sync_to_cloud(publisher, TOPIC)
+        reduced, raw = [r for _, d, _ in publisher.published for r in _readings(d)]
+        self.assertEqual({k: v for k, v in reduced.items() if k in database.FIELD_NAMES},
+                         {"temperature_c": 21.0, "humidity_rh": None})
+        self.assertEqual(set(database.FIELD_NAMES) - set(raw), set())        # unreduced: every field
+
+    @patch.object(sync, "ENVELOPE_SIZE", 1)
+    def test_envelope_size_one_publishes_legacy_json(self):
+        self._fill(2)
+        publisher = sync.make_publisher()
+        sync.sync_to_cloud(publisher, TOPIC)
+        self.assertEqual(len(publisher.published), 5)
+        self.assertTrue(all(d.startswith(b"{") for _, d, _ in publisher.published))
+
+    @patch.object(sync, "ENVELOPE_SIZE", 1)
+    def test_window_bounds_in_flight(self):
+        self._fill(100)
+        publisher = sync.make_publisher(latency_s=0.001)
+        in_flight, peak = set(), [0]
+        real_publish = publisher.publish
+
+        def tracking(*args, **kwargs):
+            future = real_publish(*args, **kwargs)
+            in_flight.add(future)
+            peak[0] = max(peak[0], sum(not f.done() for f in in_flight))
+            return future
+
+        with patch.object(publisher, "publish", side_effect=tracking):
+            sync.sync_to_cloud(publisher, TOPIC, window=10)
+        self.assertLessEqual(peak[0], 10)
+
+
+class TestEnvelope(unittest.TestCase):
+    def test_round_trip_compressed(self):
+        readings = [{"sensor_id": "GH-AMB-01", "temperature_c": 20.0 + i} for i in range(50)]
+        data = envelope.pack(readings)
+        self.assertEqual(data[3:5], bytes((1, envelope.CODEC_ZLIB)))
+        self.assertLess(len(data), len(json.dumps(readings)) / 3)
+        self.assertEqual(envelope.unpack(data), readings)
+
+    def test_rejects_inflation_bomb(self):
+        import zlib
+        bomb = envelope.MAGIC + bytes((1, envelope.CODEC_ZLIB)) + zlib.compress(b" " * (envelope.MAX_DECODED_BYTES + 1))
+        with self.assertRaises(ValueError):
+            envelope.unpack(bomb)
+
+
+class TestSyncScheduler(unittest.TestCase):
+    def _scheduler(self):
+        return SyncScheduler(drain=None, idle_s=30, min_backoff_s=2, max_backoff_s=60,
+                             rng=random.Random(0))
+
+    def test_backlog_left_drains_immediately(self):
+        self.assertEqual(self._scheduler().next_delay(SyncResult(500, set(), False)), 0.0)
+
+    def test_idle_when_caught_up(self):
+        self.assertEqual(self._scheduler().next_delay(SyncResult(3, set(), True)), 30)
+        self.assertEqual(self._scheduler().next_delay(SyncResult(0, set(), True)), 30)
+
+    def test_backoff_grows_with_jitter_and_is_capped(self):
+        s = self._scheduler()
+        delays = [s.next_delay(SyncResult(0, {"GH-AMB-01"}, True)) for _ in range(10)]
+        self.assertIs(s.link.online, False)
+        self.assertTrue(all(2 <= d <= 60 for d in delays))
+        self.assertLessEqual(delays[0], 2)
+        self.assertGreater(max(delays[5:]), 8)
+
+        self.assertEqual(s.next_delay(SyncResult(1, set(), True)), 30)
+        self.assertIs(s.link.online, True)
+        self.assertEqual(s.link.failures, 0)
+
+    def test_request_sync_cuts_the_wait_short(self):
+        s = SyncScheduler(drain=lambda: SyncResult(0, set(), True), idle_s=60)
+        delay = s.run_once()
+        scheduler.request_sync()
+        t0 = time.monotonic()
+        self.assertTrue(scheduler._wake.wait(delay))
+        self.assertLess(time.monotonic() - t0, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
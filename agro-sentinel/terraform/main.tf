@@ -58,11 +58,170 @@ resource "google_bigquery_table" "sensor_logs" {
   { "name": "dew_point_c",   "type": "FLOAT",     "mode": "NULLABLE" },
   { "name": "soil_temp_c",   "type": "FLOAT",     "mode": "NULLABLE" },
   { "name": "battery_level", "type": "INTEGER",   "mode": "NULLABLE" },
-  { "name": "rssi_dbm",      "type": "INTEGER",   "mode": "NULLABLE" }
+  { "name": "rssi_dbm",      "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "reduction",     "type": "STRING",    "mode": "NULLABLE" },
+  { "name": "seq",           "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "seq_epoch",     "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "ingested_at",   "type": "TIMESTAMP", "mode": "NULLABLE" }
 ]
 EOF
 }
 
+# Hourly/daily per-sensor rollups (cloud/rollups.py). ask-ai answers aggregate
+# questions from these instead of scanning sensor_logs; a scheduled query keeps
+# them current. After changing rollups.METRICS, regenerate both schemas and
+# sql/refresh_rollups.sql (test_rollups.py checks they match).
+resource "google_bigquery_table" "sensor_rollup_hourly" {
+  dataset_id = google_bigquery_dataset.dataset.dataset_id
+  table_id   = "sensor_rollup_hourly"
+  clustering = ["sensor_id"]
+
+  time_partitioning {
+    type  = "DAY"
+    field = "hour"
+  }
+
+  schema = <<EOF
+[
+  { "name": "sensor_id",                "type": "STRING",    "mode": "REQUIRED" },
+  { "name": "hour",                     "type": "TIMESTAMP", "mode": "REQUIRED" },
+  { "name": "readings",                 "type": "INTEGER",   "mode": "REQUIRED" },
+  { "name": "temperature_min",          "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "temperature_max",          "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "temperature_sum",          "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "temperature_count",        "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "humidity_min",             "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "humidity_max",             "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "humidity_sum",             "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "humidity_count",           "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "vpd_kpa_min",              "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "vpd_kpa_max",              "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "vpd_kpa_sum",              "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "vpd_kpa_count",            "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "co2_ppm_min",              "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "co2_ppm_max",              "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "co2_ppm_sum",              "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "co2_ppm_count",            "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "soil_moisture_min",        "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "soil_moisture_max",        "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "soil_moisture_sum",        "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "soil_moisture_count",      "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "par_umol_min",             "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "par_umol_max",             "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "par_umol_sum",             "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "par_umol_count",           "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "soil_ec_min",              "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "soil_ec_max",              "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "soil_ec_sum",              "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "soil_ec_count",            "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "soil_temp_c_min",          "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "soil_temp_c_max",          "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "soil_temp_c_sum",          "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "soil_temp_c_count",        "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "dew_point_c_min",          "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "dew_point_c_max",          "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "dew_point_c_sum",          "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "dew_point_c_count",        "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "battery_level_min",        "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "battery_level_max",        "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "battery_level_sum",        "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "battery_level_count",      "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "temperature_critical_s",   "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "humidity_critical_s",      "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "vpd_kpa_critical_s",       "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "co2_ppm_critical_s",       "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "soil_moisture_critical_s", "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "battery_level_critical_s", "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "updated_at",               "type": "TIMESTAMP", "mode": "NULLABLE" }
+]
+EOF
+}
+
+resource "google_bigquery_table" "sensor_rollup_daily" {
+  dataset_id = google_bigquery_dataset.dataset.dataset_id
+  table_id   = "sensor_rollup_daily"
+  clustering = ["sensor_id"]
+
+  time_partitioning {
+    type  = "MONTH"
+    field = "day"
+  }
+
+  schema = <<EOF
+[
+  { "name": "sensor_id",                "type": "STRING",    "mode": "REQUIRED" },
+  { "name": "day",                      "type": "DATE",      "mode": "REQUIRED" },
+  { "name": "readings",                 "type": "INTEGER",   "mode": "REQUIRED" },
+  { "name": "temperature_min",          "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "temperature_max",          "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "temperature_sum",          "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "temperature_count",        "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "humidity_min",             "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "humidity_max",             "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "humidity_sum",             "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "humidity_count",           "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "vpd_kpa_min",              "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "vpd_kpa_max",              "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "vpd_kpa_sum",              "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "vpd_kpa_count",            "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "co2_ppm_min",              "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "co2_ppm_max",              "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "co2_ppm_sum",              "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "co2_ppm_count",            "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "soil_moisture_min",        "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "soil_moisture_max",        "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "soil_moisture_sum",        "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "soil_moisture_count",      "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "par_umol_min",             "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "par_umol_max",             "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "par_umol_sum",             "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "par_umol_count",           "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "soil_ec_min",              "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "soil_ec_max",              "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "soil_ec_sum",              "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "soil_ec_count",            "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "soil_temp_c_min",          "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "soil_temp_c_max",          "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "soil_temp_c_sum",          "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "soil_temp_c_count",        "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "dew_point_c_min",          "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "dew_point_c_max",          "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "dew_point_c_sum",          "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "dew_point_c_count",        "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "battery_level_min",        "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "battery_level_max",        "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "battery_level_sum",        "type": "FLOAT",     "mode": "NULLABLE" },
+  { "name": "battery_level_count",      "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "temperature_critical_s",   "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "humidity_critical_s",      "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "vpd_kpa_critical_s",       "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "co2_ppm_critical_s",       "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "soil_moisture_critical_s", "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "battery_level_critical_s", "type": "INTEGER",   "mode": "NULLABLE" },
+  { "name": "updated_at",               "type": "TIMESTAMP", "mode": "NULLABLE" }
+]
+EOF
+}
+
+# Re-aggregates the last ROLLUP_LOOKBACK_HOURS every hour, plus the older hours
+# of rows ingested within it (back to ROLLUP_LATE_DAYS), so late backlogs are
+# folded in; anything older: `python rollups.py --since <date>`.
+resource "google_bigquery_data_transfer_config" "refresh_rollups" {
+  display_name   = "refresh-sensor-rollups"
+  location       = var.region
+  data_source_id = "scheduled_query"
+  schedule       = "every 1 hours"
+
+  params = {
+    query = file("${path.module}/sql/refresh_rollups.sql")
+  }
+
+  depends_on = [
+    google_bigquery_table.sensor_rollup_hourly,
+    google_bigquery_table.sensor_rollup_daily,
+  ]
+}
+
 # ── Cloud Storage — thermal images (user-uploaded content) ────────────────────
 resource "google_storage_bucket" "thermal_images" {
   name          = "${var.project_id}-thermal-images"
@@ -93,6 +252,18 @@ resource "google_app_engine_application" "app" {
   database_type = "CLOUD_FIRESTORE"
 }
 
+# Shared SQL cache of ask-ai (cloud/query_cache.py): expired entries are deleted
+resource "google_firestore_field" "ai_sql_cache_ttl" {
+  project    = var.project_id
+  collection = "ai_sql_cache"
+  field      = "expires_at"
+
+  ttl_config {}
+  index_config {}
+
+  depends_on = [google_app_engine_application.app]
+}
+
 # ── Function source ZIP ───────────────────────────────────────────────────────
 data "archive_file" "source_zip" {
   type        = "zip"
@@ -215,6 +386,7 @@ resource "google_cloudfunctions2_function" "ai_function" {
       PROJECT_ID     = var.project_id
       ALLOWED_ORIGIN = var.allowed_origin   # VULN-06: strict CORS, no wildcard
       REQUIRE_AUTH   = "true"               # VULN-03: app-level Firebase token check
+      AI_SQL_CACHE_SHARED = "true"          # generated SQL shared between instances
     }
   }
 }
@@ -232,3 +404,48 @@ resource "google_cloud_run_service_iam_member" "ask_ai_invoker" {
 output "ai_function_uri" {
   value = google_cloudfunctions2_function.ai_function.service_config[0].uri
 }
+
+# ── Cloud Function — acknowledge-alarm (HTTP) ────────────────────────────────
+# Operators acknowledge a standing alarm here (cloud/alarm_api.py). Same model
+# as ask-ai: public at the IAM level, Firebase ID token checked in the function.
+# The acknowledgement lands in Firestore `alarm_acks`; process-sensor-data
+# applies it with the sensor's next reading.
+resource "google_cloudfunctions2_function" "ack_function" {
+  name        = "acknowledge-alarm"
+  location    = var.region
+  description = "HTTP API to acknowledge alarms — requires Firebase ID token"
+
+  build_config {
+    runtime     = "python311"
+    entry_point = "acknowledge_alarm"
+    source {
+      storage_source {
+        bucket = google_storage_bucket.function_source.name
+        object = google_storage_bucket_object.zip.name
+      }
+    }
+  }
+
+  service_config {
+    max_instance_count = 2
+    available_memory   = "256M"
+    timeout_seconds    = 30
+    environment_variables = {
+      PROJECT_ID     = var.project_id
+      ALLOWED_ORIGIN = var.allowed_origin
+      REQUIRE_AUTH   = "true"
+    }
+  }
+}
+
+resource "google_cloud_run_service_iam_member" "acknowledge_alarm_invoker" {
+  location = var.region
+  project  = var.project_id
+  service  = google_cloudfunctions2_function.ack_function.name
+  role     = "roles/run.invoker"
+  member   = "allUsers"
+}
+
+output "ack_function_uri" {
+  value = google_cloudfunctions2_function.ack_function.service_config[0].uri
+}
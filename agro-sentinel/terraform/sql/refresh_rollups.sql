@@ -0,0 +1,236 @@
+-- Generated by cloud/rollups.py — do not edit; regenerate with `python rollups.py --sql`
+DECLARE run_at TIMESTAMP DEFAULT @run_time;
+DECLARE since_hour TIMESTAMP DEFAULT TIMESTAMP_TRUNC(TIMESTAMP_SUB(run_at, INTERVAL 72 HOUR), HOUR);
+DECLARE since_day DATE DEFAULT DATE(since_hour);
+-- Buckets before since_hour that received rows during the lookback
+DECLARE late_hours ARRAY<STRUCT<sensor_id STRING, hour TIMESTAMP>> DEFAULT ARRAY(
+  SELECT DISTINCT AS STRUCT sensor_id, TIMESTAMP_TRUNC(timestamp, HOUR) AS hour
+  FROM `agro_sentinel_data.sensor_logs`
+  WHERE timestamp >= TIMESTAMP_SUB(run_at, INTERVAL 31 DAY)
+    AND timestamp < since_hour
+    AND ingested_at >= TIMESTAMP_SUB(run_at, INTERVAL 72 HOUR));
+DECLARE late_days ARRAY<DATE> DEFAULT ARRAY(SELECT DISTINCT DATE(hour) FROM UNNEST(late_hours));
+DECLARE first_hour TIMESTAMP DEFAULT LEAST(since_hour,
+  IFNULL((SELECT MIN(hour) FROM UNNEST(late_hours)), since_hour));
+DECLARE first_day DATE DEFAULT DATE(first_hour);
+
+MERGE `agro_sentinel_data.sensor_rollup_hourly` T
+USING (
+  SELECT sensor_id, TIMESTAMP_TRUNC(timestamp, HOUR) AS hour, COUNT(*) AS readings,
+    MIN(temperature) AS temperature_min,
+    MAX(temperature) AS temperature_max,
+    SUM(temperature) AS temperature_sum,
+    COUNT(temperature) AS temperature_count,
+    MIN(humidity) AS humidity_min,
+    MAX(humidity) AS humidity_max,
+    SUM(humidity) AS humidity_sum,
+    COUNT(humidity) AS humidity_count,
+    MIN(vpd_kpa) AS vpd_kpa_min,
+    MAX(vpd_kpa) AS vpd_kpa_max,
+    SUM(vpd_kpa) AS vpd_kpa_sum,
+    COUNT(vpd_kpa) AS vpd_kpa_count,
+    MIN(co2_ppm) AS co2_ppm_min,
+    MAX(co2_ppm) AS co2_ppm_max,
+    SUM(co2_ppm) AS co2_ppm_sum,
+    COUNT(co2_ppm) AS co2_ppm_count,
+    MIN(soil_moisture) AS soil_moisture_min,
+    MAX(soil_moisture) AS soil_moisture_max,
+    SUM(soil_moisture) AS soil_moisture_sum,
+    COUNT(soil_moisture) AS soil_moisture_count,
+    MIN(par_umol) AS par_umol_min,
+    MAX(par_umol) AS par_umol_max,
+    SUM(par_umol) AS par_umol_sum,
+    COUNT(par_umol) AS par_umol_count,
+    MIN(soil_ec) AS soil_ec_min,
+    MAX(soil_ec) AS soil_ec_max,
+    SUM(soil_ec) AS soil_ec_sum,
+    COUNT(soil_ec) AS soil_ec_count,
+    MIN(soil_temp_c) AS soil_temp_c_min,
+    MAX(soil_temp_c) AS soil_temp_c_max,
+    SUM(soil_temp_c) AS soil_temp_c_sum,
+    COUNT(soil_temp_c) AS soil_temp_c_count,
+    MIN(dew_point_c) AS dew_point_c_min,
+    MAX(dew_point_c) AS dew_point_c_max,
+    SUM(dew_point_c) AS dew_point_c_sum,
+    COUNT(dew_point_c) AS dew_point_c_count,
+    MIN(battery_level) AS battery_level_min,
+    MAX(battery_level) AS battery_level_max,
+    SUM(battery_level) AS battery_level_sum,
+    COUNT(battery_level) AS battery_level_count,
+    SUM(IF(temperature > 38 OR temperature < 10, dwell_s, 0)) AS temperature_critical_s,
+    SUM(IF(humidity > 98 OR humidity < 25, dwell_s, 0)) AS humidity_critical_s,
+    SUM(IF(vpd_kpa > 2.0 OR vpd_kpa < 0.2, dwell_s, 0)) AS vpd_kpa_critical_s,
+    SUM(IF(co2_ppm > 1800 OR co2_ppm < 300, dwell_s, 0)) AS co2_ppm_critical_s,
+    SUM(IF(soil_moisture > 92 OR soil_moisture < 25, dwell_s, 0)) AS soil_moisture_critical_s,
+    SUM(IF(battery_level < 15, dwell_s, 0)) AS battery_level_critical_s
+  FROM (
+    SELECT *, LEAST(IFNULL(TIMESTAMP_DIFF(
+        LEAD(timestamp) OVER (PARTITION BY sensor_id ORDER BY timestamp), timestamp, SECOND), 0),
+        900) AS dwell_s
+    FROM `agro_sentinel_data.sensor_logs` r
+    WHERE timestamp >= first_hour AND (timestamp >= since_hour OR EXISTS (SELECT 1 FROM UNNEST(late_hours) l WHERE l.sensor_id = r.sensor_id
+        AND r.timestamp >= l.hour AND r.timestamp < TIMESTAMP_ADD(l.hour, INTERVAL 2 HOUR)))
+  ) r
+  WHERE timestamp >= since_hour OR EXISTS (SELECT 1 FROM UNNEST(late_hours) l WHERE l.sensor_id = r.sensor_id
+        AND r.timestamp >= l.hour AND r.timestamp < TIMESTAMP_ADD(l.hour, INTERVAL 1 HOUR))
+  GROUP BY sensor_id, hour
+) S
+ON T.sensor_id = S.sensor_id AND T.hour = S.hour AND T.hour >= first_hour
+WHEN MATCHED THEN UPDATE SET
+    readings = S.readings,
+    temperature_min = S.temperature_min,
+    temperature_max = S.temperature_max,
+    temperature_sum = S.temperature_sum,
+    temperature_count = S.temperature_count,
+    humidity_min = S.humidity_min,
+    humidity_max = S.humidity_max,
+    humidity_sum = S.humidity_sum,
+    humidity_count = S.humidity_count,
+    vpd_kpa_min = S.vpd_kpa_min,
+    vpd_kpa_max = S.vpd_kpa_max,
+    vpd_kpa_sum = S.vpd_kpa_sum,
+    vpd_kpa_count = S.vpd_kpa_count,
+    co2_ppm_min = S.co2_ppm_min,
+    co2_ppm_max = S.co2_ppm_max,
+    co2_ppm_sum = S.co2_ppm_sum,
+    co2_ppm_count = S.co2_ppm_count,
+    soil_moisture_min = S.soil_moisture_min,
+    soil_moisture_max = S.soil_moisture_max,
+    soil_moisture_sum = S.soil_moisture_sum,
+    soil_moisture_count = S.soil_moisture_count,
+    par_umol_min = S.par_umol_min,
+    par_umol_max = S.par_umol_max,
+    par_umol_sum = S.par_umol_sum,
+    par_umol_count = S.par_umol_count,
+    soil_ec_min = S.soil_ec_min,
+    soil_ec_max = S.soil_ec_max,
+    soil_ec_sum = S.soil_ec_sum,
+    soil_ec_count = S.soil_ec_count,
+    soil_temp_c_min = S.soil_temp_c_min,
+    soil_temp_c_max = S.soil_temp_c_max,
+    soil_temp_c_sum = S.soil_temp_c_sum,
+    soil_temp_c_count = S.soil_temp_c_count,
+    dew_point_c_min = S.dew_point_c_min,
+    dew_point_c_max = S.dew_point_c_max,
+    dew_point_c_sum = S.dew_point_c_sum,
+    dew_point_c_count = S.dew_point_c_count,
+    battery_level_min = S.battery_level_min,
+    battery_level_max = S.battery_level_max,
+    battery_level_sum = S.battery_level_sum,
+    battery_level_count = S.battery_level_count,
+    temperature_critical_s = S.temperature_critical_s,
+    humidity_critical_s = S.humidity_critical_s,
+    vpd_kpa_critical_s = S.vpd_kpa_critical_s,
+    co2_ppm_critical_s = S.co2_ppm_critical_s,
+    soil_moisture_critical_s = S.soil_moisture_critical_s,
+    battery_level_critical_s = S.battery_level_critical_s,
+    updated_at = CURRENT_TIMESTAMP()
+WHEN NOT MATCHED THEN INSERT (sensor_id, hour, readings, temperature_min, temperature_max, temperature_sum, temperature_count, humidity_min, humidity_max, humidity_sum, humidity_count, vpd_kpa_min, vpd_kpa_max, vpd_kpa_sum, vpd_kpa_count, co2_ppm_min, co2_ppm_max, co2_ppm_sum, co2_ppm_count, soil_moisture_min, soil_moisture_max, soil_moisture_sum, soil_moisture_count, par_umol_min, par_umol_max, par_umol_sum, par_umol_count, soil_ec_min, soil_ec_max, soil_ec_sum, soil_ec_count, soil_temp_c_min, soil_temp_c_max, soil_temp_c_sum, soil_temp_c_count, dew_point_c_min, dew_point_c_max, dew_point_c_sum, dew_point_c_count, battery_level_min, battery_level_max, battery_level_sum, battery_level_count, temperature_critical_s, humidity_critical_s, vpd_kpa_critical_s, co2_ppm_critical_s, soil_moisture_critical_s, battery_level_critical_s, updated_at)
+  VALUES (sensor_id, hour, readings, temperature_min, temperature_max, temperature_sum, temperature_count, humidity_min, humidity_max, humidity_sum, humidity_count, vpd_kpa_min, vpd_kpa_max, vpd_kpa_sum, vpd_kpa_count, co2_ppm_min, co2_ppm_max, co2_ppm_sum, co2_ppm_count, soil_moisture_min, soil_moisture_max, soil_moisture_sum, soil_moisture_count, par_umol_min, par_umol_max, par_umol_sum, par_umol_count, soil_ec_min, soil_ec_max, soil_ec_sum, soil_ec_count, soil_temp_c_min, soil_temp_c_max, soil_temp_c_sum, soil_temp_c_count, dew_point_c_min, dew_point_c_max, dew_point_c_sum, dew_point_c_count, battery_level_min, battery_level_max, battery_level_sum, battery_level_count, temperature_critical_s, humidity_critical_s, vpd_kpa_critical_s, co2_ppm_critical_s, soil_moisture_critical_s, battery_level_critical_s, CURRENT_TIMESTAMP());
+
+MERGE `agro_sentinel_data.sensor_rollup_daily` T
+USING (
+  SELECT sensor_id, DATE(hour) AS day,
+    SUM(readings) AS readings,
+    MIN(temperature_min) AS temperature_min,
+    MAX(temperature_max) AS temperature_max,
+    SUM(temperature_sum) AS temperature_sum,
+    SUM(temperature_count) AS temperature_count,
+    MIN(humidity_min) AS humidity_min,
+    MAX(humidity_max) AS humidity_max,
+    SUM(humidity_sum) AS humidity_sum,
+    SUM(humidity_count) AS humidity_count,
+    MIN(vpd_kpa_min) AS vpd_kpa_min,
+    MAX(vpd_kpa_max) AS vpd_kpa_max,
+    SUM(vpd_kpa_sum) AS vpd_kpa_sum,
+    SUM(vpd_kpa_count) AS vpd_kpa_count,
+    MIN(co2_ppm_min) AS co2_ppm_min,
+    MAX(co2_ppm_max) AS co2_ppm_max,
+    SUM(co2_ppm_sum) AS co2_ppm_sum,
+    SUM(co2_ppm_count) AS co2_ppm_count,
+    MIN(soil_moisture_min) AS soil_moisture_min,
+    MAX(soil_moisture_max) AS soil_moisture_max,
+    SUM(soil_moisture_sum) AS soil_moisture_sum,
+    SUM(soil_moisture_count) AS soil_moisture_count,
+    MIN(par_umol_min) AS par_umol_min,
+    MAX(par_umol_max) AS par_umol_max,
+    SUM(par_umol_sum) AS par_umol_sum,
+    SUM(par_umol_count) AS par_umol_count,
+    MIN(soil_ec_min) AS soil_ec_min,
+    MAX(soil_ec_max) AS soil_ec_max,
+    SUM(soil_ec_sum) AS soil_ec_sum,
+    SUM(soil_ec_count) AS soil_ec_count,
+    MIN(soil_temp_c_min) AS soil_temp_c_min,
+    MAX(soil_temp_c_max) AS soil_temp_c_max,
+    SUM(soil_temp_c_sum) AS soil_temp_c_sum,
+    SUM(soil_temp_c_count) AS soil_temp_c_count,
+    MIN(dew_point_c_min) AS dew_point_c_min,
+    MAX(dew_point_c_max) AS dew_point_c_max,
+    SUM(dew_point_c_sum) AS dew_point_c_sum,
+    SUM(dew_point_c_count) AS dew_point_c_count,
+    MIN(battery_level_min) AS battery_level_min,
+    MAX(battery_level_max) AS battery_level_max,
+    SUM(battery_level_sum) AS battery_level_sum,
+    SUM(battery_level_count) AS battery_level_count,
+    SUM(temperature_critical_s) AS temperature_critical_s,
+    SUM(humidity_critical_s) AS humidity_critical_s,
+    SUM(vpd_kpa_critical_s) AS vpd_kpa_critical_s,
+    SUM(co2_ppm_critical_s) AS co2_ppm_critical_s,
+    SUM(soil_moisture_critical_s) AS soil_moisture_critical_s,
+    SUM(battery_level_critical_s) AS battery_level_critical_s
+  FROM `agro_sentinel_data.sensor_rollup_hourly`
+  WHERE hour >= TIMESTAMP(first_day) AND (hour >= TIMESTAMP(since_day) OR DATE(hour) IN UNNEST(late_days))
+  GROUP BY sensor_id, day
+) S
+ON T.sensor_id = S.sensor_id AND T.day = S.day AND T.day >= first_day
+WHEN MATCHED THEN UPDATE SET
+    readings = S.readings,
+    temperature_min = S.temperature_min,
+    temperature_max = S.temperature_max,
+    temperature_sum = S.temperature_sum,
+    temperature_count = S.temperature_count,
+    humidity_min = S.humidity_min,
+    humidity_max = S.humidity_max,
+    humidity_sum = S.humidity_sum,
+    humidity_count = S.humidity_count,
+    vpd_kpa_min = S.vpd_kpa_min,
+    vpd_kpa_max = S.vpd_kpa_max,
+    vpd_kpa_sum = S.vpd_kpa_sum,
+    vpd_kpa_count = S.vpd_kpa_count,
+    co2_ppm_min = S.co2_ppm_min,
+    co2_ppm_max = S.co2_ppm_max,
+    co2_ppm_sum = S.co2_ppm_sum,
+    co2_ppm_count = S.co2_ppm_count,
+    soil_moisture_min = S.soil_moisture_min,
+    soil_moisture_max = S.soil_moisture_max,
+    soil_moisture_sum = S.soil_moisture_sum,
+    soil_moisture_count = S.soil_moisture_count,
+    par_umol_min = S.par_umol_min,
+    par_umol_max = S.par_umol_max,
+    par_umol_sum = S.par_umol_sum,
+    par_umol_count = S.par_umol_count,
+    soil_ec_min = S.soil_ec_min,
+    soil_ec_max = S.soil_ec_max,
+    soil_ec_sum = S.soil_ec_sum,
+    soil_ec_count = S.soil_ec_count,
+    soil_temp_c_min = S.soil_temp_c_min,
+    soil_temp_c_max = S.soil_temp_c_max,
+    soil_temp_c_sum = S.soil_temp_c_sum,
+    soil_temp_c_count = S.soil_temp_c_count,
+    dew_point_c_min = S.dew_point_c_min,
+    dew_point_c_max = S.dew_point_c_max,
+    dew_point_c_sum = S.dew_point_c_sum,
+    dew_point_c_count = S.dew_point_c_count,
+    battery_level_min = S.battery_level_min,
+    battery_level_max = S.battery_level_max,
+    battery_level_sum = S.battery_level_sum,
+    battery_level_count = S.battery_level_count,
+    temperature_critical_s = S.temperature_critical_s,
+    humidity_critical_s = S.humidity_critical_s,
+    vpd_kpa_critical_s = S.vpd_kpa_critical_s,
+    co2_ppm_critical_s = S.co2_ppm_critical_s,
+    soil_moisture_critical_s = S.soil_moisture_critical_s,
+    battery_level_critical_s = S.battery_level_critical_s,
+    updated_at = CURRENT_TIMESTAMP()
+WHEN NOT MATCHED THEN INSERT (sensor_id, day, readings, temperature_min, temperature_max, temperature_sum, temperature_count, humidity_min, humidity_max, humidity_sum, humidity_count, vpd_kpa_min, vpd_kpa_max, vpd_kpa_sum, vpd_kpa_count, co2_ppm_min, co2_ppm_max, co2_ppm_sum, co2_ppm_count, soil_moisture_min, soil_moisture_max, soil_moisture_sum, soil_moisture_count, par_umol_min, par_umol_max, par_umol_sum, par_umol_count, soil_ec_min, soil_ec_max, soil_ec_sum, soil_ec_count, soil_temp_c_min, soil_temp_c_max, soil_temp_c_sum, soil_temp_c_count, dew_point_c_min, dew_point_c_max, dew_point_c_sum, dew_point_c_count, battery_level_min, battery_level_max, battery_level_sum, battery_level_count, temperature_critical_s, humidity_critical_s, vpd_kpa_critical_s, co2_ppm_critical_s, soil_moisture_critical_s, battery_level_critical_s, updated_at)
+  VALUES (sensor_id, day, readings, temperature_min, temperature_max, temperature_sum, temperature_count, humidity_min, humidity_max, humidity_sum, humidity_count, vpd_kpa_min, vpd_kpa_max, vpd_kpa_sum, vpd_kpa_count, co2_ppm_min, co2_ppm_max, co2_ppm_sum, co2_ppm_count, soil_moisture_min, soil_moisture_max, soil_moisture_sum, soil_moisture_count, par_umol_min, par_umol_max, par_umol_sum, par_umol_count, soil_ec_min, soil_ec_max, soil_ec_sum, soil_ec_count, soil_temp_c_min, soil_temp_c_max, soil_temp_c_sum, soil_temp_c_count, dew_point_c_min, dew_point_c_max, dew_point_c_sum, dew_point_c_count, battery_level_min, battery_level_max, battery_level_sum, battery_level_count, temperature_critical_s, humidity_critical_s, vpd_kpa_critical_s, co2_ppm_critical_s, soil_moisture_critical_s, battery_level_critical_s, CURRENT_TIMESTAMP());